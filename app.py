@@ -8,19 +8,35 @@ import requests
 from datetime import datetime
 from pathlib import Path
 import tempfile
+import shutil
 import json
 import base64
-import traceback
+from contextlib import nullcontext
 
 # Importar funciones utilitarias centralizadas
 from utils import (
-    load_history, save_to_history, calculate_item_cost, 
-    load_replicate_token, download_and_save_file, get_logo_base64,
-    HISTORY_DIR, HISTORY_FILE, COST_RATES, BACKUPS_DIR,
-    create_backup, restore_backup, list_available_backups, delete_backup,
-    get_comprehensive_stats, get_cost_breakdown_by_period, 
-    get_model_efficiency_ranking, get_spending_alerts
+    calculate_item_cost, query_history_page,
+    load_replicate_token, get_logo_base64,
+    HISTORY_FILE, COST_RATES, BACKUPS_DIR,
+    create_backup, restore_backup, list_available_backups, delete_backup, verify_backup, list_safety_snapshots,
+    get_analytics_snapshot, get_cost_rollups, get_item_model_id,
+    resolve_media_path, get_history_item, delete_history_item, get_latency_stats,
+    get_generation_stats
 )
+from latency import PHASES, PHASE_LABELS, WINDOWS, WINDOW_LABELS, format_seconds
+from tracing import load_traces, summarize_spans, CATEGORY_LABELS
+from profiling import RerunProfiler
+from metrics import METRICS_PORT, start_metrics_server
+from generation import run_generation
+from jobs import get_job_queue, ACTIVE_STATUSES, SUCCEEDED, FAILED
+from thumbnails import get_thumbnail, THUMBNAIL_SIZES
+from batch import (
+    run_batch, plan_batch, build_prompts, expand_grid, parse_grid_values, get_rate_limit,
+    format_batch_summary, DEFAULT_CONCURRENCY, MAX_CONCURRENCY, VARIATION_PLACEHOLDER
+)
+
+# Filas de la cuadrícula de la Biblioteca por página (items por página = filas x items por fila)
+LIBRARY_ROWS_PER_PAGE = 4
 
 # =============================================================================
 # DEFINICIÓN DE MODALES (deben estar antes de ser utilizados)
@@ -192,18 +208,26 @@ def show_config_modal():
             st.markdown("""
             **El backup incluirá:**
             - 📊 Estadísticas de generación (`generation_stats.json`)
-            - 📋 Historial de contenido (`history.json`)
+            - 📋 Historial de contenido (`history.jsonl`)
             - 🖼️ Imágenes y videos generados
-            - 📄 Metadatos del backup
+            - 📄 Metadatos y manifiesto del backup
+            
+            El backup **incremental** solo añade los archivos nuevos o modificados
+            desde el último backup (necesita los anteriores para restaurarse).
             """)
         
         with col2:
+            backup_mode = st.radio("Tipo de backup", ["Incremental", "Completo"],
+                                   key="backup_mode", horizontal=True)
+            backup_parallel_hashing = st.checkbox("⚡ Hashes en paralelo", value=True, key="backup_parallel_hashing",
+                                          help="Calcula los SHA-256 del manifiesto en varios hilos mientras se escribe el ZIP")
             if st.button("💾 Crear Backup", 
                          type="primary", 
                          use_container_width=True,
                          key="create_backup_btn"):
                 with st.spinner("Creando backup..."):
-                    success, message, backup_path = create_backup()
+                    success, message, backup_path = create_backup(incremental=backup_mode == "Incremental",
+                                                                   parallel_hashing=backup_parallel_hashing)
                     if success:
                         st.success(f"✅ {message}")
                         if backup_path:
@@ -216,6 +240,10 @@ def show_config_modal():
         # Sección de backups disponibles
         st.subheader("📂 Backups Disponibles")
         
+        st.checkbox("🛡️ Copia rápida de los datos actuales antes de restaurar", value=True,
+                    key="restore_safety_snapshot",
+                    help="Enlaza los archivos actuales en backups/safety_snapshot_* en lugar de crear otro ZIP")
+        
         backups = list_available_backups()
         
         if backups:
@@ -230,10 +258,27 @@ def show_config_modal():
                         if backup['metadata']:
                             metadata = backup['metadata']
                             files_info = metadata.get('files_included', {})
+                            if metadata.get('backup_type') == 'incremental':
+                                st.write(f"**🧩 Incremental** sobre `{metadata.get('parent')}` "
+                                         f"({len(metadata.get('chain', [])) - 1} en la cadena)")
+                            else:
+                                st.write("**📦 Completo**")
                             st.write(f"**📁 Archivos incluidos:**")
                             st.write(f"- Stats: {'✅' if files_info.get('generation_stats') else '❌'}")
                             st.write(f"- Historial: {'✅' if files_info.get('history_json') else '❌'}")
-                            st.write(f"- Media: {files_info.get('media_files', 0)} archivos")
+                            if 'media_files_added' in files_info:
+                                st.write(f"- Media: {files_info['media_files_added']} nuevos de "
+                                         f"{files_info.get('media_files', 0)} archivos")
+                            else:
+                                st.write(f"- Media: {files_info.get('media_files', 0)} archivos")
+                            if metadata.get('stats'):
+                                st.write(f"**⏱️ Creación:** {metadata['stats']['seconds']} s "
+                                         f"({metadata['stats']['throughput_mb_s']} MB/s)")
+                        
+                        verification = backup.get('verification')
+                        if verification:
+                            status = "✅ Íntegro" if verification['ok'] else f"❌ {verification['errors']} errores"
+                            st.write(f"**🔍 Verificado:** {status} ({verification['checked_at']})")
                     
                     with col2:
                         if st.button("🔄 Restaurar", 
@@ -241,14 +286,28 @@ def show_config_modal():
                                    type="secondary",
                                    use_container_width=True,
                                    help="Restaurar este backup"):
-                            with st.spinner("Restaurando backup..."):
-                                success, message = restore_backup(backup['full_path'])
-                                if success:
-                                    st.success(f"✅ {message}")
-                                    st.balloons()
-                                    st.info("🔄 Reinicia la aplicación para ver los cambios")
-                                else:
-                                    st.error(f"❌ {message}")
+                            success, message = restore_backup_with_progress(backup['full_path'])
+                            if success:
+                                st.success(f"✅ {message}")
+                                st.balloons()
+                                st.info("🔄 Reinicia la aplicación para ver los cambios")
+                            else:
+                                st.error(f"❌ {message}")
+                        
+                        if st.button("🔍 Verificar",
+                                   key=f"verify_{i}",
+                                   type="secondary",
+                                   use_container_width=True,
+                                   help="Comprobar CRC y SHA-256 de todos los archivos"):
+                            result = verify_backup_with_progress(backup['full_path'])
+                            summary = (f"{result['files']} archivos, {result['bytes'] / (1024 * 1024):.1f} MB "
+                                       f"en {result['seconds']} s ({result['throughput_mb_s']} MB/s)")
+                            if result['ok']:
+                                st.success(f"✅ Backup íntegro: {summary}")
+                            else:
+                                st.error(f"❌ Backup dañado: {summary}")
+                                for error in result['errors'][:10]:
+                                    st.write(f"- {error}")
                     
                     with col3:
                         # Usar una clave única para este backup específico
@@ -330,11 +389,10 @@ def show_config_modal():
                     temp_path = Path(f"temp_{uploaded_file.name}")
                     try:
                         with open(temp_path, "wb") as f:
-                            f.write(uploaded_file.getvalue())
+                            shutil.copyfileobj(uploaded_file, f, 1024 * 1024)
+                        
+                        success, message = restore_backup_with_progress(str(temp_path))
                         
-                        with st.spinner("Restaurando desde archivo..."):
-                            success, message = restore_backup(str(temp_path))
-                            
                         # Limpiar archivo temporal
                         temp_path.unlink()
                         
@@ -350,10 +408,30 @@ def show_config_modal():
                             temp_path.unlink()
                         st.error(f"❌ Error al procesar archivo: {str(e)}")
         
+        # Copias rápidas previas a cada restauración: deshacer una restauración
+        snapshots = list_safety_snapshots()
+        if snapshots:
+            st.subheader("🛡️ Copias previas a restaurar")
+            for i, snapshot in enumerate(snapshots):
+                col_info, col_button = st.columns([3, 1])
+                with col_info:
+                    st.write(f"**{snapshot['name']}** · {snapshot['created']} · "
+                             f"{snapshot['files']} archivos ({snapshot['size_mb']} MB)")
+                with col_button:
+                    if st.button("↩️ Volver a esta copia", key=f"restore_snapshot_{i}", use_container_width=True,
+                                 help="Deshacer la restauración que creó esta copia"):
+                        success, message = restore_backup_with_progress(snapshot['full_path'])
+                        if success:
+                            st.success(f"✅ {message}")
+                            st.info("🔄 Reinicia la aplicación para ver los cambios")
+                        else:
+                            st.error(f"❌ {message}")
+        
         # Información de seguridad
         st.info("""
         ⚠️ **Importante:** 
-        - Se crea automáticamente un backup de seguridad antes de restaurar
+        - Antes de restaurar se guarda una copia rápida de los datos actuales (`backups/safety_snapshot_*`)
+        - Los archivos que ya tienes sin cambios no se vuelven a escribir
         - Los backups incluyen todos tus datos importantes
         - Reinicia la aplicación después de restaurar para ver los cambios
         """)
@@ -500,121 +578,315 @@ st.set_page_config(
 
 # Función eliminada - get_logo_base64() ahora en utils.py
 
-# Función para generar imagen
-def generate_image(prompt, **params):
-    client = replicate.Client()
-    
-    prediction = client.predictions.create(
-        version="black-forest-labs/flux-pro",
-        input={
-            "prompt": prompt,
-            **params
-        }
-    )
-    
-    return prediction
-
-# Función para generar video con Seedance
-def generate_video_seedance(prompt, **params):
-    output = replicate.run(
-        "bytedance/seedance-1-pro",
-        input={
-            "prompt": prompt,
-            **params
-        }
-    )
-    return output
-
-# Función para generar video anime con Pixverse
-def generate_video_pixverse(prompt, **params):
-    output = replicate.run(
-        "pixverse/pixverse-v3.5",
-        input={
-            "prompt": prompt,
-            **params
-        }
-    )
-    return output
-
-
+# Funciones de generación eliminadas - ahora importadas de generation.py:
+# - generate_image(), generate_kandinsky() (predicciones con sondeo)
+# - generate_video_seedance(), generate_video_pixverse(), generate_ssd1b(), generate_video_veo3()
+# - update_generation_stats() -> utils.py
+# El botón GENERAR encola generation.run_generation (lanzar, esperar, descargar,
+# guardar y estadísticas) en la cola de trabajos de jobs.py
 
-# Función para generar imágenes con Kandinsky 2.2
-def generate_kandinsky(prompt, **params):
-    client = replicate.Client()
+def _render_background_jobs():
+    """Lista de trabajos en segundo plano con su progreso y resultado"""
+    queue = get_job_queue()
+    jobs = queue.list_jobs(limit=10)
+    if not jobs:
+        return
     
-    prediction = client.predictions.create(
-        version="ai-forever/kandinsky-2.2:ad9d7879fbffa2874e1d909d1d37d9bc682889cc65b31f7bb00d2362619f194a",
-        input={
-            "prompt": prompt,
-            **params
-        }
-    )
+    st.subheader("🧵 Trabajos en segundo plano")
+    for job in jobs:
+        status = job.get('status')
+        label = job.get('label') or job['id']
+        if status in ACTIVE_STATUSES:
+            st.progress(job.get('progress') or 0.0, text=f"⏳ {label} — {job.get('message', '')}")
+        elif status == SUCCEEDED and job.get('kind') == "batch":
+            summary = job.get('result') or {}
+            st.success(f"📦 {label}: {format_batch_summary(summary)}")
+            for error in summary.get('errores', [])[:3]:
+                st.caption(f"❌ {error['prompt'][:40]} {error['params']}: {error['error']}")
+        elif status == SUCCEEDED:
+            result = job.get('result') or {}
+            st.success(f"✅ {label}")
+            if result.get('archivo_local'):
+                st.caption(f"💾 Guardado como `{result['archivo_local']}`")
+            if result.get('costo') is not None:
+                st.caption(f"💰 Costo estimado: ${result['costo']:.3f}")
+            if result.get('url'):
+                if result.get('tipo') == 'video':
+                    st.video(result['url'])
+                else:
+                    st.image(result['url'], use_container_width=True)
+        elif status == FAILED:
+            st.error(f"❌ {label}: {job.get('error')}")
+        else:
+            st.warning(f"⚠️ {label}: {job.get('error') or status}")
     
-    return prediction
+    if any(job.get('status') not in ACTIVE_STATUSES for job in jobs):
+        if st.button("🧹 Limpiar trabajos terminados", key="clear_finished_jobs"):
+            queue.clear_finished()
+            st.rerun()
 
-# Función para generar con SSD-1B (LucaTaco)
-def generate_ssd1b(prompt, **params):
+def show_background_jobs():
     """
-    Genera imágenes usando el modelo SSD-1B de lucataco
+    Mostrar los trabajos en segundo plano
+
+    Mientras haya trabajos activos la lista se refresca sola cada 2 segundos
+    con st.fragment (sin rerun completo de la página); en versiones antiguas
+    de Streamlit se muestra un botón para actualizar.
     """
-    output = replicate.run(
-        "lucataco/ssd-1b:b19e3639452c59ce8295b82aba70a231404cb062f2eb580ea894b31e8ce5bbb6",
-        input={
-            "prompt": prompt,
-            **params
-        }
-    )
-    return output
+    active = any(job.get('status') in ACTIVE_STATUSES for job in get_job_queue().list_jobs(limit=10))
+    if active and hasattr(st, "fragment"):
+        st.fragment(run_every=2)(_render_background_jobs)()
+    else:
+        _render_background_jobs()
+        if active and st.button("🔄 Actualizar trabajos", key="refresh_jobs"):
+            st.rerun()
 
-# Función para generar video con VEO 3 Fast
-def generate_video_veo3(prompt, **params):
+def show_batch_panel(content_type, prompt, params, selected_template):
     """
-    Genera videos usando el modelo VEO 3 Fast de Google
+    Generación por lotes: prompts x rejilla de parámetros
+
+    Los parámetros del panel lateral son la base; cada línea de la rejilla
+    (nombre=v1,v2) multiplica el lote. El lote se ejecuta como un trabajo en
+    segundo plano y cada resultado se guarda en el historial al terminar.
     """
-    output = replicate.run(
-        "google/veo-3-fast",
-        input={
-            "prompt": prompt,
-            **params
-        }
-    )
-    return output
+    with st.expander("📦 Generación por lotes"):
+        batch_mode = st.radio(
+            "Prompts del lote",
+            ["Plantilla x variaciones", "Lista de prompts"],
+            horizontal=True,
+            help=f"En la plantilla (el prompt actual) {VARIATION_PLACEHOLDER} se sustituye por cada variación; "
+                 "si no aparece, la variación se añade al final"
+        )
+        lines_label = "Variaciones (una por línea)" if batch_mode == "Plantilla x variaciones" else "Prompts (uno por línea)"
+        lines = [line for line in st.text_area(lines_label, height=120, key="batch_lines").splitlines() if line.strip()]
+        
+        grid_text = st.text_area(
+            "Rejilla de parámetros (nombre=valor1,valor2 por línea)",
+            placeholder="width=1024,1440\nsteps=25,50",
+            height=80,
+            key="batch_grid"
+        )
+        
+        col_a, col_b = st.columns(2)
+        with col_a:
+            concurrency = st.slider("Generaciones simultáneas", min_value=1, max_value=MAX_CONCURRENCY,
+                                    value=DEFAULT_CONCURRENCY, key="batch_concurrency")
+        with col_b:
+            rate_limit = st.number_input("Máx. por minuto", min_value=1.0, max_value=600.0,
+                                         value=float(get_rate_limit(content_type)), key="batch_rate_limit")
+        
+        grid = {}
+        for line in grid_text.splitlines():
+            name, sep, values = line.partition("=")
+            if sep and name.strip() and values.strip():
+                grid[name.strip()] = parse_grid_values(values)
+        unknown = [name for name in grid if name not in params]
+        if unknown:
+            st.warning(f"⚠️ Parámetros que no usa {content_type}: {', '.join(unknown)}")
+        
+        prompts = build_prompts(prompt, lines) if batch_mode == "Plantilla x variaciones" else lines
+        tasks = plan_batch(prompts, params, grid)
+        st.caption(f"📋 {len(tasks)} generaciones ({len(prompts)} prompts x {len(expand_grid(grid))} combinaciones)")
+        
+        if st.button("📦 Lanzar lote", disabled=not tasks, use_container_width=True):
+            job_id = get_job_queue().submit(
+                run_batch, content_type, tasks, selected_template,
+                concurrency=concurrency, rate_limit=rate_limit,
+                label=f"Lote {content_type} x{len(tasks)}", kind="batch"
+            )
+            st.success(f"📥 Lote encolado (trabajo `{job_id}`)")
 
-def update_generation_stats(model, time_taken, success):
+def render_library_preview(item, size):
     """
-    Actualiza las estadísticas de generación
+    Vista previa ligera de un item en la cuadrícula de la Biblioteca
+
+    Muestra la miniatura WebP (o la portada del video) cacheada en disco en
+    lugar del archivo original; sin archivo local, las imágenes se cargan
+    desde la URL y los videos se muestran como tarjeta con enlace.
     """
-    stats_file = "generation_stats.json"
+    is_video = item.get('tipo') == 'video'
+    thumb = get_thumbnail(item, size)
+    if thumb:
+        st.image(str(thumb), use_container_width=True)
+        if is_video:
+            st.caption("🎬 Video · abre los detalles para reproducirlo")
+        return
     
-    # Cargar estadísticas existentes
-    if os.path.exists(stats_file):
-        with open(stats_file, "r", encoding="utf-8") as f:
-            stats = json.load(f)
-    else:
-        stats = {}
+    local_path = resolve_media_path(item)
+    has_local = local_path is not None and local_path.exists()
+    url = item.get('url')
+    if not has_local and url and not is_video:
+        st.image(url, use_container_width=True)
+        return
     
-    # Inicializar modelo si no existe
-    if model not in stats:
-        stats[model] = {
-            "total": 0,
-            "exitosas": 0,
-            "tiempo_promedio": 0
-        }
-    
-    # Actualizar estadísticas
-    stats[model]["total"] += 1
-    if success:
-        stats[model]["exitosas"] += 1
-    
-    # Calcular tiempo promedio
-    if stats[model]["tiempo_promedio"] == 0:
-        stats[model]["tiempo_promedio"] = time_taken
+    if has_local:
+        detail = "Abre los detalles para reproducirlo" if is_video else "Vista previa no disponible"
+    elif url:
+        detail = f'<a href="{url}" target="_blank">🔗 Abrir en nueva pestaña</a>'
     else:
-        stats[model]["tiempo_promedio"] = (stats[model]["tiempo_promedio"] + time_taken) / 2
+        detail = "❌ Sin preview disponible"
+    st.markdown(f"""
+    <div style="
+        background: #f8f9fa;
+        border: 2px dashed #dee2e6;
+        border-radius: 10px;
+        padding: 20px;
+        text-align: center;
+    ">
+        <div style="font-size: 48px; margin-bottom: 10px;">{'🎬' if is_video else '🖼️'}</div>
+        <div style="color: #6c757d; font-size: 12px;">{detail}</div>
+    </div>
+    """, unsafe_allow_html=True)
+
+def render_full_preview(item):
+    """Archivo completo de un item (diálogo de detalles), local o desde la URL"""
+    is_video = item.get('tipo') == 'video'
+    local_path = resolve_media_path(item)
+    source = str(local_path) if local_path is not None and local_path.exists() else item.get('url')
+    if not source:
+        return
+    try:
+        if is_video:
+            st.video(source)
+        else:
+            st.image(source, use_container_width=True)
+    except Exception as e:
+        st.warning(f"⚠️ Vista previa no disponible: {str(e)[:50]}")
+
+def restore_backup_with_progress(backup_path):
+    """Restaurar un backup con barra de progreso y la opción de copia previa del panel"""
+    progress_bar = st.progress(0.0, text="Preparando restauración...")
+    success, message = restore_backup(
+        backup_path,
+        safety_snapshot=st.session_state.get("restore_safety_snapshot", True),
+        progress_callback=lambda fraction, text: progress_bar.progress(min(fraction, 1.0), text=text)
+    )
+    progress_bar.empty()
+    return success, message
+
+def verify_backup_with_progress(backup_path):
+    """Verificar un backup con barra de progreso"""
+    progress_bar = st.progress(0.0, text="Verificando backup...")
+    result = verify_backup(
+        backup_path,
+        progress_callback=lambda fraction, text: progress_bar.progress(min(fraction, 1.0), text=text)
+    )
+    progress_bar.empty()
+    return result
+
+def paginate_history(state_key, page_size, **filters):
+    """
+    Página actual de un listado del historial (Biblioteca, Historial)
+
+    La página y el cursor se guardan en st.session_state bajo state_key, así
+    que sobreviven a los reruns; si cambian los filtros, el orden o el tamaño
+    de página se vuelve a la primera página con un cursor nuevo. Solo se
+    cargan los elementos de la página (ver query_history_page).
+    """
+    signature = (page_size, tuple(sorted(filters.items())))
+    state = st.session_state.get(state_key)
+    if not state or state.get('signature') != signature:
+        state = {'signature': signature, 'page': 1, 'cursor': None}
     
-    # Guardar estadísticas
-    with open(stats_file, "w", encoding="utf-8") as f:
-        json.dump(stats, f, indent=2, ensure_ascii=False)
+    result = query_history_page(page=state['page'], page_size=page_size, cursor=state['cursor'], **filters)
+    state.update(page=result['page'], cursor=result['cursor'])
+    st.session_state[state_key] = state
+    return result
+
+def render_pagination_controls(state_key, result, position="top"):
+    """Botones de página anterior/siguiente y aviso de elementos nuevos"""
+    state = st.session_state[state_key]
+    col_prev, col_info, col_next = st.columns([1, 2, 1])
+    with col_prev:
+        if st.button("⬅️ Anterior", key=f"{state_key}_prev_{position}", disabled=result['page'] <= 1,
+                     use_container_width=True):
+            state['page'] = result['page'] - 1
+            st.rerun()
+    with col_info:
+        st.markdown(f"<div style='text-align: center; padding: 8px;'>Página {result['page']} de {result['pages']} "
+                    f"· {result['total']} elementos</div>", unsafe_allow_html=True)
+    with col_next:
+        if st.button("Siguiente ➡️", key=f"{state_key}_next_{position}", disabled=result['page'] >= result['pages'],
+                     use_container_width=True):
+            state['page'] = result['page'] + 1
+            st.rerun()
+    
+    if position == "top" and result['new_items']:
+        if st.button(f"🔄 Ver {result['new_items']} nuevos", key=f"{state_key}_refresh"):
+            state.update(page=1, cursor=None)
+            st.rerun()
+
+def profile_section(name):
+    """
+    Medir una sección de la app en el rerun actual (ver profiling.py)
+
+    Sin el perfilado activado devuelve un contexto vacío.
+    """
+    if st.session_state.get('profiling_enabled', False) and 'rerun_profiler' in st.session_state:
+        return st.session_state.rerun_profiler.section(name)
+    return nullcontext()
+
+def render_profiling_panel(profiler):
+    """Panel de depuración con los tiempos por sección de los últimos reruns"""
+    with st.expander("🐞 Perfilado de reruns", expanded=False):
+        totals = profiler.rerun_totals()
+        if totals['reruns']:
+            col_runs, col_mean, col_p95, col_last = st.columns(4)
+            with col_runs:
+                st.metric("Reruns medidos", totals['reruns'],
+                          help=f"{totals['incomplete']} interrumpidos (st.rerun/st.stop) no cuentan")
+            with col_mean:
+                st.metric("Media", format_seconds(totals['mean_ms'] / 1000))
+            with col_p95:
+                st.metric("p95", format_seconds(totals['p95_ms'] / 1000))
+            with col_last:
+                st.metric("Último", format_seconds(totals['last_ms'] / 1000))
+
+            rows = []
+            for row in profiler.summary():
+                rows.append({
+                    "Sección": "\u2003" * row['depth'] + row['section'].rsplit("/", 1)[-1],
+                    "Reruns": row['reruns'],
+                    "Media (ms)": round(row['mean_ms'], 1),
+                    "p50 (ms)": round(row['p50_ms'], 1),
+                    "p95 (ms)": round(row['p95_ms'], 1),
+                    "Máx. (ms)": round(row['max_ms'], 1),
+                    "Último (ms)": round(row['last_ms'], 1),
+                    "% del rerun": f"{row['share'] * 100:.0f}%",
+                })
+            st.dataframe(rows, hide_index=True, use_container_width=True)
+        else:
+            st.info("Todavía no hay reruns completos medidos. Interactúa con la app para medir.")
+
+        col_sample, col_next, col_reset = st.columns([2, 1, 1])
+        with col_sample:
+            profiler.sample_every = int(st.number_input(
+                "Muestrear con cProfile cada N reruns (0 = solo bajo demanda)",
+                min_value=0, max_value=1000, value=profiler.sample_every, key="profiling_sample_every"
+            ))
+        with col_next:
+            if st.button("🔬 Muestrear el próximo rerun", key="profiling_sample_next"):
+                profiler.sample_next = True
+        with col_reset:
+            if st.button("🗑️ Reiniciar", key="profiling_reset"):
+                profiler.reset()
+                st.rerun()
+
+        col_flame, col_prof = st.columns(2)
+        with col_flame:
+            st.download_button("🔥 Pilas para flame graph", profiler.collapsed_stacks(),
+                               file_name="flamegraph.txt", mime="text/plain",
+                               disabled=not totals['reruns'], key="profiling_flamegraph",
+                               help="Formato collapsed (flamegraph.pl, speedscope, inferno), µs de tiempo propio")
+        with col_prof:
+            st.download_button("📥 Descargar .prof", profiler.cprofile_dump(),
+                               file_name="reruns.prof", mime="application/octet-stream",
+                               disabled=profiler.cprofile_stats is None, key="profiling_prof",
+                               help="Estadísticas de cProfile acumuladas (pstats, snakeviz)")
+
+        if profiler.cprofile_stats is not None:
+            st.caption(f"cProfile: {profiler.sampled_reruns} reruns muestreados")
+            st.code(profiler.cprofile_report(), language="text")
 
 # Tarifas eliminadas - ahora importadas de utils.py
 
@@ -624,16 +896,25 @@ def update_generation_stats(model, time_taken, success):
 if 'current_page' not in st.session_state:
     st.session_state.current_page = 'generator'
 
-if 'selected_item_index' not in st.session_state:
-    st.session_state.selected_item_index = None
+if 'selected_item_id' not in st.session_state:
+    st.session_state.selected_item_id = None
 
 if 'show_config_modal' not in st.session_state:
     st.session_state.show_config_modal = False
 
+# Perfilado de reruns (opcional, casilla "🐞 Perfilar reruns" de la barra lateral)
+if st.session_state.get('profiling_enabled', False):
+    if 'rerun_profiler' not in st.session_state:
+        st.session_state.rerun_profiler = RerunProfiler()
+    st.session_state.rerun_profiler.begin_rerun()
+elif 'rerun_profiler' in st.session_state:
+    # Desactivado: cerrar un rerun que quedara a medias (y su cProfile)
+    st.session_state.rerun_profiler.cancel_rerun()
+
 # Header con título y botón de biblioteca
 header_col1, header_col2 = st.columns([4, 1])
 
-with header_col1:
+with header_col1, profile_section("Cabecera"):
     st.markdown("""
     <div style="text-align: left;">
         <h1 style="margin-bottom: 0;">🦷 Ai Models Pro Generator</h1>
@@ -653,7 +934,7 @@ with header_col1:
     else:
         st.markdown("### Biblioteca de contenido generado")
 
-with header_col2:
+with header_col2, profile_section("Cabecera"):
     st.markdown("<div style='margin-top: 20px;'></div>", unsafe_allow_html=True)
     
     if st.session_state.current_page == 'generator':
@@ -684,8 +965,12 @@ if not token:
 # Configurar token como variable de entorno para replicate.run()
 os.environ["REPLICATE_API_TOKEN"] = token
 
+# Endpoint local de métricas de Prometheus (solo con AI_MODELS_METRICS_PORT, ver metrics.py)
+if METRICS_PORT:
+    start_metrics_server()
+
 # Sidebar para configuración (SIEMPRE VISIBLE)
-with st.sidebar:
+with st.sidebar, profile_section("Sidebar"):
     # Logo en la esquina superior izquierda
     st.markdown("""
     <div style="text-align: center; margin-bottom: 20px;">
@@ -905,20 +1190,23 @@ with st.sidebar:
     with col_config2:
         st.markdown("**Control de App**")
 
+    st.checkbox("🐞 Perfilar reruns", key="profiling_enabled",
+                help="Mide el tiempo de cada sección de la app en cada rerun (panel al final de la página)")
+
 # Navegación por páginas
 if st.session_state.current_page == 'generator':
     # PÁGINA DEL GENERADOR (contenido original)
     # Pestañas principales para el generador
     tab1, tab2, tab3 = st.tabs(["🚀 Generar", "📂 Historial", "📊 Dashboard"])
 
-    with tab1:
+    with tab1, profile_section("Generar"):
         # Área principal de generación
         st.subheader(f"✨ Generar {content_type}")
         
         # Área principal
         col1, col2 = st.columns([2, 1])
     
-    with col1:
+    with col1, profile_section("Generar"), profile_section("Prompt"):
         st.header("📝 Prompt")
         
         # Plantillas predefinidas
@@ -1024,7 +1312,7 @@ if st.session_state.current_page == 'generator':
                 height=150
             )
     
-    with col2:
+    with col2, profile_section("Generar"), profile_section("Panel de control"):
         st.header("🎛️ Panel de Control")
         
         # Información de la configuración
@@ -1035,553 +1323,50 @@ if st.session_state.current_page == 'generator':
         - 📏 Caracteres: {len(prompt) if prompt else 0}
         """)
         
-        # Botón de generación
+        # Botón de generación: se encola como trabajo en segundo plano (ver generation.run_generation),
+        # así la sesión no se bloquea y se pueden lanzar varias generaciones a la vez
         if st.button("🚀 **GENERAR**", type="primary", use_container_width=True):
             if not prompt.strip():
                 st.error("❌ Por favor ingresa un prompt")
             else:
-                with st.spinner("⏳ Generando contenido..."):
-                    try:
-                        start_time = time.time()
-                        start_datetime = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                        
-                        if "Flux Pro" in content_type:
-                            st.info(f"🖼️ Generando imagen con Flux Pro... Iniciado a las {start_datetime}")
-                            prediction = generate_image(prompt, **params)
-                            
-                            # Mostrar ID de predicción
-                            st.code(f"ID de predicción: {prediction.id}")
-                            
-                            # Esperar resultado con progress bar
-                            progress_bar = st.progress(0)
-                            status_text = st.empty()
-                            
-                            timeout = 300  # 5 minutos
-                            
-                            while prediction.status not in ["succeeded", "failed", "canceled"]:
-                                elapsed = int(time.time() - start_time)
-                                if elapsed > timeout:
-                                    st.error("⛔ Tiempo de espera excedido (5 minutos)")
-                                    break
-                                    
-                                progress = min(elapsed / 120, 0.95)  # Estimar progreso
-                                progress_bar.progress(progress)
-                                status_text.text(f"⏱ [{elapsed}s] Estado: {prediction.status}")
-                                time.sleep(2)
-                                
-                                try:
-                                    prediction.reload()
-                                except Exception as reload_error:
-                                    st.error(f"❌ Error al verificar estado: {str(reload_error)}")
-                                    break
-                            
-                            progress_bar.progress(1.0)
-                            
-                            if prediction.status == "succeeded":
-                                st.success("✅ ¡Imagen generada exitosamente!")
-                                
-                                # Mostrar imagen y enlaces
-                                try:
-                                    if prediction.output and len(prediction.output) > 0:
-                                        # Obtener la URL (manejar si es string o lista)
-                                        if isinstance(prediction.output, list):
-                                            image_url = prediction.output[0]
-                                        elif isinstance(prediction.output, str):
-                                            image_url = prediction.output
-                                        else:
-                                            image_url = str(prediction.output)
-                                        
-                                        st.write(f"🔗 **URL de la imagen:** {image_url}")
-                                        
-                                        # Descargar y guardar localmente
-                                        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-                                        filename = f"imagen_{timestamp}.{params['output_format']}"
-                                        local_path = download_and_save_file(image_url, filename, "imagen")
-                                        
-                                        # Guardar en historial
-                                        history_item = {
-                                            "tipo": "imagen",
-                                            "fecha": datetime.now().isoformat(),
-                                            "prompt": prompt,
-                                            "plantilla": selected_template,
-                                            "url": image_url,
-                                            "archivo_local": filename if local_path else None,
-                                            "parametros": params,
-                                            "id_prediccion": prediction.id
-                                        }
-                                        save_to_history(history_item)
-                                        
-                                        if local_path:
-                                            st.success(f"💾 Imagen guardada localmente: `{filename}`")
-                                        
-                                        # Botón para abrir la imagen en nueva pestaña
-                                        st.markdown(f"""
-                                        <a href="{image_url}" target="_blank">
-                                            <button style="
-                                                background-color: #ff6b6b;
-                                                color: white;
-                                                padding: 10px 20px;
-                                                border: none;
-                                                border-radius: 5px;
-                                                cursor: pointer;
-                                                font-size: 16px;
-                                                margin: 10px 0;
-                                            ">🖼️ Ver Imagen en Nueva Pestaña</button>
-                                        </a>
-                                        """, unsafe_allow_html=True)
-                                        
-                                        # Intentar mostrar la imagen directamente
-                                        try:
-                                            st.image(image_url, caption="Imagen generada", use_container_width=True)
-                                        except Exception as img_error:
-                                            st.warning(f"⚠️ No se pudo mostrar la imagen directamente: {str(img_error)}")
-                                            st.info("💡 Usa el botón de arriba para ver la imagen")
-                                
-                                except Exception as e:
-                                    st.error(f"❌ Error al procesar la imagen: {str(e)}")
-                            else:
-                                st.error(f"❌ La generación falló. Estado: {prediction.status}")
-                        
-                        elif "Kandinsky" in content_type:
-                            st.info(f"🎨 Generando imagen con Kandinsky 2.2... Iniciado a las {start_datetime}")
-                            prediction = generate_kandinsky(prompt, **params)
-                            
-                            # Mostrar ID de predicción
-                            st.code(f"ID de predicción: {prediction.id}")
-                            
-                            # Esperar resultado con progress bar
-                            progress_bar = st.progress(0)
-                            status_text = st.empty()
-                            
-                            timeout = 300  # 5 minutos
-                            
-                            while prediction.status not in ["succeeded", "failed", "canceled"]:
-                                elapsed = int(time.time() - start_time)
-                                if elapsed > timeout:
-                                    st.error("⛔ Tiempo de espera excedido (5 minutos)")
-                                    break
-                                    
-                                progress = min(elapsed / 120, 0.95)  # Estimar progreso
-                                progress_bar.progress(progress)
-                                status_text.text(f"⏱ [{elapsed}s] Estado: {prediction.status}")
-                                time.sleep(2)
-                                
-                                try:
-                                    prediction.reload()
-                                except Exception as reload_error:
-                                    st.error(f"❌ Error al verificar estado: {str(reload_error)}")
-                                    break
-                            
-                            progress_bar.progress(1.0)
-                            
-                            if prediction.status == "succeeded":
-                                st.success("✅ ¡Imagen generada exitosamente!")
-                                
-                                # Procesar resultado
-                                try:
-                                    if prediction.output:
-                                        image_url = prediction.output[0] if isinstance(prediction.output, list) else prediction.output
-                                        st.write(f"🔗 **URL de la imagen:** {image_url}")
-                                        
-                                        # Descargar y guardar localmente
-                                        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-                                        filename = f"kandinsky_{timestamp}.jpg"
-                                        local_path = download_and_save_file(image_url, filename, "imagen")
-                                        
-                                        # Guardar en historial
-                                        history_item = {
-                                            "tipo": "imagen",
-                                            "fecha": datetime.now().isoformat(),
-                                            "prompt": prompt,
-                                            "plantilla": selected_template,
-                                            "url": image_url,
-                                            "archivo_local": filename if local_path else None,
-                                            "parametros": params,
-                                            "id_prediccion": prediction.id
-                                        }
-                                        save_to_history(history_item)
-                                        
-                                        if local_path:
-                                            st.success(f"💾 Imagen guardada localmente: `{filename}`")
-                                        
-                                        # Botón para abrir en nueva pestaña
-                                        st.markdown(f"""
-                                        <a href="{image_url}" target="_blank">
-                                            <button style="
-                                                background-color: #4CAF50;
-                                                color: white;
-                                                padding: 10px 20px;
-                                                border: none;
-                                                border-radius: 5px;
-                                                cursor: pointer;
-                                                font-size: 16px;
-                                                margin: 10px 0;
-                                            ">🎨 Ver Imagen en Nueva Pestaña</button>
-                                        </a>
-                                        """, unsafe_allow_html=True)
-                                        
-                                        # Mostrar imagen
-                                        try:
-                                            st.image(image_url, caption="Imagen generada con Kandinsky", use_container_width=True)
-                                        except Exception as img_error:
-                                            st.warning(f"⚠️ No se pudo mostrar la imagen directamente: {str(img_error)}")
-                                            st.info("💡 Usa el botón de arriba para ver la imagen")
-                                
-                                except Exception as e:
-                                    st.error(f"❌ Error al procesar la imagen: {str(e)}")
-                            else:
-                                st.error(f"❌ La generación falló. Estado: {prediction.status}")
-                        
-                        elif "SSD-1B" in content_type:
-                            st.info(f"⚡ Generando imagen rápida con SSD-1B... Iniciado a las {start_datetime}")
-                            
-                            # SSD-1B usa replicate.run() que devuelve resultados directamente
-                            with st.spinner("🚀 Generando imagen rápida..."):
-                                try:
-                                    output = generate_ssd1b(prompt, **params)
-                                    
-                                    # SSD-1B devuelve directamente el resultado
-                                    if output:
-                                        st.success("⚡ ¡Imagen generada exitosamente!")
-                                        
-                                        # Manejar diferentes tipos de output
-                                        try:
-                                            if isinstance(output, list):
-                                                # Si es una lista, tomar el primer elemento
-                                                first_output = output[0]
-                                                if hasattr(first_output, 'url'):
-                                                    # Es un objeto FileOutput
-                                                    image_url = first_output.url
-                                                else:
-                                                    # Es una URL directa
-                                                    image_url = str(first_output)
-                                            elif hasattr(output, 'url'):
-                                                # Es un objeto FileOutput directo
-                                                image_url = output.url
-                                            else:
-                                                # Es una URL directa
-                                                image_url = str(output)
-                                            
-                                            st.write(f"🔗 **URL de la imagen:** {image_url}")
-                                            st.code(f"Tipo de output: {type(output).__name__}")
-                                            
-                                            # Descargar y guardar
-                                            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-                                            filename = f"ssd_{timestamp}.jpg"
-                                            local_path = download_and_save_file(image_url, filename, "imagen")
-                                            
-                                        except Exception as url_error:
-                                            st.error(f"❌ Error al procesar URL: {str(url_error)}")
-                                            st.code(f"Output recibido: {type(output)} - {str(output)[:200]}")
-                                            image_url = None
-                                            local_path = None
-                                        
-                                        # Guardar en historial solo si tenemos URL válida
-                                        if image_url:
-                                            history_item = {
-                                                "tipo": "imagen",
-                                                "fecha": datetime.now().isoformat(),
-                                                "prompt": prompt,
-                                                "plantilla": selected_template,
-                                                "url": image_url,
-                                                "archivo_local": filename if local_path else None,
-                                                "parametros": params,
-                                                "modelo": "SSD-1B",
-                                                "id_prediccion": "N/A (output directo)"
-                                            }
-                                            save_to_history(history_item)
-                                            
-                                            if local_path:
-                                                st.success(f"💾 Imagen guardada: `{filename}`")
-                                            
-                                            # Mostrar imagen
-                                            try:
-                                                st.image(image_url, caption="Imagen SSD-1B", use_container_width=True)
-                                            except Exception as img_error:
-                                                st.warning(f"⚠️ No se pudo mostrar la imagen: {str(img_error)}")
-                                                st.markdown(f'<a href="{image_url}" target="_blank">🔗 Ver imagen en nueva pestaña</a>', unsafe_allow_html=True)
-                                        else:
-                                            st.error("❌ No se pudo obtener URL de la imagen")
-                                    else:
-                                        st.error("❌ SSD-1B no devolvió output")
-                                
-                                except Exception as e:
-                                    st.error(f"❌ Error con SSD-1B: {str(e)}")
-                                    st.error(f"🔍 Tipo de error: {type(e).__name__}")
-                                    st.code(f"Output recibido: {type(output) if 'output' in locals() else 'No definido'}")
-                        
-                        elif "Seedance" in content_type:
-                            st.info(f"💃 Generando con Seedance... Iniciado a las {start_datetime}")
-                            
-                            with st.spinner("💃 Procesando con Seedance..."):
-                                try:
-                                    # Seedance usa replicate.run() que devuelve el resultado directamente
-                                    output = generate_video_seedance(prompt, **params)
-                                    
-                                    if output:
-                                        st.success("💃 ¡Generación exitosa!")
-                                        
-                                        # Manejar diferentes tipos de output
-                                        try:
-                                            if isinstance(output, list):
-                                                result_url = output[0]
-                                            elif hasattr(output, 'url'):
-                                                result_url = output.url
-                                            else:
-                                                result_url = str(output)
-                                            
-                                            st.write(f"🔗 **URL del resultado:** {result_url}")
-                                            
-                                            # Determinar tipo de archivo
-                                            file_ext = "mp4"
-                                            if result_url.lower().endswith(('.jpg', '.jpeg', '.png')):
-                                                file_ext = "jpg"
-                                            
-                                            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-                                            filename = f"seedance_{timestamp}.{file_ext}"
-                                            local_path = download_and_save_file(result_url, filename, "video")
-                                            
-                                            # Guardar en historial
-                                            history_item = {
-                                                "tipo": "video",
-                                                "modelo": "seedance",
-                                                "fecha": datetime.now().isoformat(),
-                                                "prompt": prompt,
-                                                "plantilla": selected_template,
-                                                "url": result_url,
-                                                "archivo_local": filename if local_path else None,
-                                                "parametros": params,
-                                                "video_duration": params.get('duration', 5),
-                                                "processing_time": int(time.time() - start_time)
-                                            }
-                                            save_to_history(history_item)
-                                            
-                                            if local_path:
-                                                st.success(f"💾 Video guardado: `{filename}`")
-                                            
-                                            # Mostrar según tipo
-                                            if file_ext == "mp4":
-                                                st.video(result_url)
-                                            else:
-                                                st.image(result_url, caption="Resultado Seedance", use_container_width=True)
-                                        
-                                        except Exception as url_error:
-                                            st.error(f"❌ Error procesando URL: {str(url_error)}")
-                                            st.code(f"Output recibido: {type(output).__name__}")
-                                    else:
-                                        st.error("❌ Seedance no devolvió output")
-                                
-                                except Exception as e:
-                                    st.error(f"❌ Error con Seedance: {str(e)}")
-                                    st.code(f"Tipo de error: {type(e).__name__}")
-                        
-                        elif "Pixverse" in content_type:
-                            st.info(f"🎬 Generando video con Pixverse... Iniciado a las {start_datetime}")
-                            
-                            # Pixverse usa replicate.run() que devuelve resultados directamente
-                            with st.spinner("🎬 Generando video con Pixverse..."):
-                                try:
-                                    output = generate_video_pixverse(prompt, **params)
-                                    
-                                    # Pixverse devuelve directamente el resultado
-                                    if output:
-                                        st.success("🎬 ¡Video generado exitosamente!")
-                                        
-                                        # Manejar diferentes tipos de output
-                                        video_url = None
-                                        local_path = None
-                                        
-                                        try:
-                                            if isinstance(output, list):
-                                                # Si es una lista, tomar el primer elemento
-                                                first_output = output[0]
-                                                if hasattr(first_output, 'url'):
-                                                    # Es un objeto FileOutput
-                                                    video_url = first_output.url
-                                                else:
-                                                    # Es una URL directa
-                                                    video_url = str(first_output)
-                                            elif hasattr(output, 'url'):
-                                                # Es un objeto FileOutput directo
-                                                video_url = output.url
-                                            else:
-                                                # Es una URL directa
-                                                video_url = str(output)
-                                            
-                                            # Descargar inmediatamente para evitar que expire la URL
-                                            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-                                            filename = f"pixverse_{timestamp}.mp4"
-                                            
-                                            if video_url:
-                                                st.write(f"🔗 **URL del video:** {video_url}")
-                                                st.info("💾 Descargando video para conservar acceso...")
-                                                local_path = download_and_save_file(video_url, filename, "video")
-                                                
-                                                if local_path:
-                                                    st.success(f"✅ Video guardado: `{filename}`")
-                                                else:
-                                                    st.warning("⚠️ La descarga falló, pero la URL puede funcionar temporalmente")
-                                            
-                                        except Exception as url_error:
-                                            st.error(f"❌ Error al procesar URL: {str(url_error)}")
-                                            st.code(f"Output recibido: {type(output)} - {str(output)[:200]}")
-                                        
-                                        # Calcular units estimadas para Pixverse basado en duración y resolución
-                                        duration_num = params.get('duration', 5)
-                                        quality = params.get('quality', '720p')
-                                        
-                                        # Estimar units basado en duración y resolución
-                                        base_units = duration_num * 6  # Base: 6 units por segundo
-                                        if '1080p' in quality:
-                                            estimated_units = base_units * 1.5  # 50% más para 1080p
-                                        elif '540p' in quality:
-                                            estimated_units = base_units * 0.7  # 30% menos para 540p
-                                        else:  # 720p
-                                            estimated_units = base_units
-                                        
-                                        estimated_units = round(estimated_units, 1)
-                                        
-                                        # Guardar en historial con prioridad al archivo local
-                                        if video_url or local_path:
-                                            history_item = {
-                                                "tipo": "video",
-                                                "fecha": datetime.now().isoformat(),
-                                                "prompt": prompt,
-                                                "plantilla": selected_template,
-                                                "url": video_url,
-                                                "archivo_local": filename if local_path else None,
-                                                "parametros": params,
-                                                "modelo": "Pixverse",
-                                                "id_prediccion": "N/A (output directo)",
-                                                "video_duration": duration_num,  # Duración real del video
-                                                "pixverse_units": estimated_units,  # Units estimadas para cálculo de costo
-                                                "processing_time": None  # No disponible para Pixverse (output directo)
-                                            }
-                                            save_to_history(history_item)
-                                            
-                                            # Mostrar video priorizando archivo local
-                                            try:
-                                                if local_path and local_path.exists():
-                                                    st.info("🎬 Reproduciendo desde archivo local (más confiable)")
-                                                    st.video(str(local_path))
-                                                elif video_url:
-                                                    st.warning("⚠️ Reproduciendo desde URL externa (puede expirar)")
-                                                    st.video(video_url)
-                                                else:
-                                                    st.error("❌ No hay fuente disponible para reproducir")
-                                            except Exception as video_error:
-                                                st.warning(f"⚠️ Error al reproducir: {str(video_error)}")
-                                                if video_url:
-                                                    st.markdown(f'<a href="{video_url}" target="_blank">🔗 Intentar ver en nueva pestaña</a>', unsafe_allow_html=True)
-                                        else:
-                                            st.error("❌ No se pudo obtener URL del video")
-                                    else:
-                                        st.error("❌ Pixverse no devolvió output")
-                                
-                                except Exception as e:
-                                    st.error(f"❌ Error con Pixverse: {str(e)}")
-                                    st.error(f"🔍 Tipo de error: {type(e).__name__}")
-                                    st.code(f"Output recibido: {type(output) if 'output' in locals() else 'No definido'}")
-                        
-                        elif "VEO 3 Fast" in content_type:
-                            st.info(f"🚀 Generando video con VEO 3 Fast... Iniciado a las {start_datetime}")
-                            
-                            with st.spinner("🚀 Generando video con VEO 3 Fast..."):
-                                try:
-                                    output = generate_video_veo3(prompt, **params)
-                                    
-                                    # VEO 3 Fast devuelve directamente el resultado
-                                    if output:
-                                        # Manejar el output que puede ser FileOutput o URL directa
-                                        try:
-                                            if hasattr(output, 'url'):
-                                                video_url = output.url
-                                            elif isinstance(output, str):
-                                                video_url = output
-                                            else:
-                                                video_url = str(output)
-                                            
-                                            st.success("🚀 ¡Video VEO 3 Fast generado exitosamente!")
-                                            st.write(f"🔗 **URL del video:** {video_url}")
-                                            
-                                            # Descargar video
-                                            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-                                            filename = f"veo3_{timestamp}.mp4"
-                                            local_path = download_and_save_file(video_url, filename, "video")
-                                            
-                                            # Guardar en historial
-                                            history_item = {
-                                                "tipo": "video",
-                                                "fecha": datetime.now().isoformat(),
-                                                "prompt": prompt,
-                                                "plantilla": selected_template,
-                                                "url": video_url,
-                                                "archivo_local": filename if local_path else None,
-                                                "parametros": params,
-                                                "modelo": "VEO 3 Fast"
-                                            }
-                                            save_to_history(history_item)
-                                            
-                                            if local_path:
-                                                st.success(f"💾 Video guardado: `{filename}`")
-                                            
-                                            # Mostrar video
-                                            st.video(video_url)
-                                            
-                                            # Información técnica
-                                            st.info("📊 **VEO 3 Fast**: Modelo de última generación para generación rápida de videos de alta calidad")
-                                            
-                                        except Exception as output_error:
-                                            st.error(f"❌ Error al procesar output de VEO 3 Fast: {str(output_error)}")
-                                            st.write(f"🔍 **Tipo de output:** {type(output)}")
-                                            st.write(f"🔍 **Output raw:** {output}")
-                                    else:
-                                        st.error("❌ VEO 3 Fast no devolvió output")
-                                        
-                                except Exception as e:
-                                    st.error(f"❌ Error con VEO 3 Fast: {str(e)}")
-                                    st.error(f"🔍 Detalles: {type(e).__name__}")
-                                    st.code(traceback.format_exc())
-                        
-                        # Estadísticas finales
-                        end_time = time.time()
-                        total_time = end_time - start_time
-                        end_datetime = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-                        
-                        st.success(f"⏱️ **Proceso completado en {total_time:.1f} segundos**")
-                        st.info(f"🕐 **Inicio:** {start_datetime} | **Fin:** {end_datetime}")
-                        
-                        # Actualizar estadísticas globales
-                        # Para VEO 3 Fast, asumimos éxito si llegamos aquí sin excepción
-                        if "VEO 3 Fast" in content_type:
-                            success = True  # Si llegamos aquí, fue exitoso
-                        else:
-                            success = hasattr(locals(), 'prediction') and prediction.status == "succeeded"
-                        
-                        update_generation_stats(content_type, total_time, success)
+                job_id = get_job_queue().submit(
+                    run_generation, content_type, prompt, dict(params), selected_template,
+                    label=f"{content_type} · {prompt[:40]}", kind="generation"
+                )
+                st.success(f"📥 Generación encolada (trabajo `{job_id}`): el progreso y el resultado aparecen abajo")
 
-                    except Exception as e:
-                        st.error(f"❌ Error durante la generación: {str(e)}")
-                        st.error(f"🔍 Detalles del error: {type(e).__name__}")
-                        st.code(traceback.format_exc())
+        # Lotes: varios prompts x rejilla de parámetros, se ejecutan en segundo plano
+        with profile_section("Lotes"):
+            show_batch_panel(content_type, prompt, params, selected_template)
+        
+        # Trabajos en segundo plano (se refresca solo mientras haya alguno activo)
+        with profile_section("Trabajos"):
+            show_background_jobs()
 
         # Información adicional en la barra lateral
-        with st.sidebar:
+        with st.sidebar, profile_section("Estadísticas"):
             st.header("📊 Información")
             
             # Estadísticas de uso
-            if os.path.exists("generation_stats.json"):
-                with open("generation_stats.json", "r", encoding="utf-8") as f:
-                    stats = json.load(f)
-                
+            stats = get_generation_stats()
+            if stats:
                 st.subheader("📈 Estadísticas de Rendimiento")
                 
+                # Percentiles de la latencia total de cada modelo (histogramas de latency.py)
+                latency_stats = get_latency_stats("todo")
+                
                 # Crear métricas visuales compactas y modernas para cada modelo
                 models_data = list(stats.items())
                 
                 for i, (model, data) in enumerate(models_data):
                     success_rate = (data["exitosas"] / data["total"] * 100) if data["total"] > 0 else 0
-                    avg_time = data.get("tiempo_promedio", 0)
+                    total_latency = latency_stats.get(model, {}).get("phases", {}).get("total")
+                    if total_latency:
+                        latency_text = (f"p50 {format_seconds(total_latency['p50'])} · "
+                                        f"p95 {format_seconds(total_latency['p95'])} · "
+                                        f"p99 {format_seconds(total_latency['p99'])}")
+                    else:
+                        latency_text = format_seconds(data.get("tiempo_promedio") or None)
                     
                     # Determinar icono basado en el modelo
                     if "flux" in model.lower():
@@ -1634,7 +1419,7 @@ if st.session_state.current_page == 'generator':
                             </div>
                             <div style="margin-top: 8px; display: flex; justify-content: space-between; font-size: 12px;">
                                 <span>{success_emoji} {success_rate:.1f}% éxito</span>
-                                <span>⏱️ {avg_time:.1f}s</span>
+                                <span>⏱️ {latency_text}</span>
                             </div>
                         </div>
                         """, unsafe_allow_html=True)
@@ -1657,44 +1442,18 @@ if st.session_state.current_page == 'generator':
                 st.rerun()
 
     # Sección de historial avanzado
-    with tab2:
+    with tab2, profile_section("Historial"):
         st.header("📊 Historial de Generaciones")
         
-        history = load_history()
+        # Totales mantenidos al guardar cada generación (sin recorrer el historial)
+        rollups = get_cost_rollups()
         
-        if history:
-            # Calcular estadísticas generales - corregir detección de tipos de video
-            total_items = len(history)
-            total_imagenes = len([h for h in history if h.get('tipo') == 'imagen'])
-            
-            # Detectar videos por tipo o archivo_local (algunos tienen tipo "video_seedance" incorrecto)
-            total_videos_seedance = len([h for h in history if 
-                (h.get('tipo') == 'video' and ('seedance' in h.get('archivo_local', '').lower() or 'seedance' in h.get('modelo', '').lower())) or
-                h.get('tipo') == 'video_seedance'
-            ])
-            total_videos_anime = len([h for h in history if 
-                h.get('tipo') == 'video' and ('pixverse' in h.get('archivo_local', '').lower() or 'pixverse' in h.get('modelo', '').lower())
-            ])
-            total_videos_veo = len([h for h in history if 
-                h.get('tipo') == 'video' and ('veo3' in h.get('archivo_local', '').lower() or 'veo' in h.get('modelo', '').lower())
-            ])
-            
-            # Usar la función calculate_item_cost de utils.py para calcular costos
-            # Los valores de tarifas están centralizados en utils.COST_RATES
-            
-            # Calcular costo total
-            total_cost_usd = 0
-            cost_breakdown = []
-            
-            for item in history:
-                item_cost, model_info, calculation_details = calculate_item_cost(item)
-                total_cost_usd += item_cost
-                cost_breakdown.append({
-                    'fecha': item.get('fecha', ''),
-                    'modelo': model_info,
-                    'costo': item_cost,
-                    'calculo': calculation_details
-                })
+        if rollups['count']:
+            total_items = rollups['count']
+            total_imagenes = rollups['by_type'].get('imagen', {}).get('count', 0)
+            # Los tipos antiguos (video_seedance, video_anime) ya se normalizan a "video"
+            total_videos = rollups['by_type'].get('video', {}).get('count', 0)
+            total_cost_usd = rollups['total_cost']
             
             total_cost_eur = total_cost_usd * 0.92  # Conversión aproximada
             
@@ -1721,7 +1480,6 @@ if st.session_state.current_page == 'generator':
                 """, unsafe_allow_html=True)
             
             with col2:
-                total_videos = total_videos_seedance + total_videos_anime + total_videos_veo
                 st.markdown(f"""
                 <div style="
                     background: linear-gradient(135deg, #4ECDC4, #44A08D);
@@ -1783,48 +1541,50 @@ if st.session_state.current_page == 'generator':
             with col1:
                 filter_type = st.selectbox(
                     "Filtrar por tipo:",
-                    ["Todos", "imagen", "video", "media"]
+                    ["Todos", "imagen", "video", "media"],
+                    key="history_filter_type"
                 )
             
             with col2:
                 search_prompt = st.text_input(
                     "Buscar en prompts:",
-                    placeholder="Escribe palabras clave..."
+                    placeholder="Escribe palabras clave...",
+                    key="history_search"
                 )
             
             with col3:
-                show_count = st.selectbox(
-                    "Total de generaciones",
-                    [10, 20, 50, 100, "Todos"],
-                    index=1
+                page_size = st.selectbox(
+                    "Generaciones por página",
+                    [10, 20, 50, 100],
+                    index=1,
+                    key="history_page_size"
                 )
             
-            # Aplicar filtros
-            filtered_history = history.copy()
-            
-            # Filtro por tipo
-            if filter_type != "Todos":
-                filtered_history = [item for item in filtered_history if item.get("tipo") == filter_type]
-            
-            # Filtro por búsqueda en prompt
-            if search_prompt:
-                search_terms = search_prompt.lower().split()
-                filtered_history = [
-                    item for item in filtered_history 
-                    if any(term in item.get('prompt', '').lower() for term in search_terms)
-                ]
-            
-            # Ordenar por fecha (más reciente primero)
-            filtered_history.sort(key=lambda x: x.get("fecha", ""), reverse=True)
+            # Filtros, búsqueda y orden (más reciente primero) en el índice; solo se carga la página visible
+            history_page = paginate_history(
+                "history_pagination", page_size,
+                tipo=filter_type if filter_type != "Todos" else None,
+                text=search_prompt.strip() or None,
+                order='desc'
+            )
+            filtered_history = history_page['items']
             
-            # Limitar cantidad si no es "Todos"
-            if show_count != "Todos":
-                filtered_history = filtered_history[:show_count]
+            st.subheader(f"📋 Resultados ({history_page['total']} elementos)")
+            render_pagination_controls("history_pagination", history_page)
             
-            st.subheader(f"📋 Resultados ({len(filtered_history)} elementos)")
+            # Iconos por modelo (get_item_model_id)
+            history_icons = {
+                'flux_pro': "🖼️",
+                'kandinsky': "🎨",
+                'ssd_1b': "⚡",
+                'seedance': "🎬",       # Seedance - clapperboard profesional
+                'pixverse': "🎭",       # Pixverse - anime/artístico
+                'veo3': "🎥",           # VEO 3 Fast - cámara profesional
+                'video_generico': "📹"  # Video genérico - videocámara
+            }
             
             # Mostrar elementos del historial con diseño avanzado
-            for i, item in enumerate(filtered_history):
+            for item in filtered_history:
                 # Obtener información del elemento
                 fecha = item.get('fecha', 'Sin fecha')
                 prompt = item.get('prompt', 'Sin prompt')
@@ -1836,27 +1596,8 @@ if st.session_state.current_page == 'generator':
                 id_prediccion = item.get('id_prediccion', '')
                 modelo = item.get('modelo', '')
                 
-                # Asignar icono según el tipo y modelo
-                if tipo.lower() == 'imagen':
-                    if 'kandinsky' in archivo_local.lower() if archivo_local else False or 'kandinsky' in modelo.lower():
-                        icon = "🎨"
-                    elif 'ssd' in archivo_local.lower() if archivo_local else False or 'ssd' in modelo.lower():
-                        icon = "⚡"
-                    else:
-                        icon = "🖼️"  # Flux Pro por defecto
-                elif tipo.lower() == 'video':
-                    if 'seedance' in archivo_local.lower() if archivo_local else False or 'seedance' in modelo.lower():
-                        icon = "🎬"  # Seedance - clapperboard profesional
-                    elif 'pixverse' in archivo_local.lower() if archivo_local else False or 'pixverse' in modelo.lower():
-                        icon = "🎭"  # Pixverse - anime/artístico
-                    elif 'veo' in modelo.lower() or 'veo3' in archivo_local.lower() if archivo_local else False:
-                        icon = "🎥"  # VEO 3 Fast - cámara profesional
-                    else:
-                        icon = "📹"  # Video genérico - videocámara
-                elif tipo.lower() == 'media':
-                    icon = "📄"
-                else:
-                    icon = "📄"  # Por defecto
+                # Asignar icono según el modelo guardado en el item
+                icon = history_icons.get(get_item_model_id(item), "📄")
                 
                 # Crear expandible con información resumida
                 fecha_formatted = fecha[:16] if len(fecha) > 16 else fecha
@@ -1871,7 +1612,7 @@ if st.session_state.current_page == 'generator':
                         
                         # Prompt completo en área expandible
                         with st.expander("📝 Prompt completo", expanded=False):
-                            st.text_area("Prompt:", value=prompt, height=100, disabled=True, key=f"prompt_{i}", label_visibility="collapsed")
+                            st.text_area("Prompt:", value=prompt, height=100, disabled=True, key=f"prompt_{item['id']}", label_visibility="collapsed")
                         
                         st.write(f"**Plantilla:** {plantilla}")
                         
@@ -1961,7 +1702,7 @@ if st.session_state.current_page == 'generator':
                     with col2:
                         # Preview y botones de acción - priorizar archivo local para videos
                         archivo_local = item.get('archivo_local')
-                        local_path = HISTORY_DIR / archivo_local if archivo_local else None
+                        local_path = resolve_media_path(item)
                         
                         # Mostrar preview priorizando archivo local
                         preview_shown = False
@@ -2003,9 +1744,8 @@ if st.session_state.current_page == 'generator':
                         with col_btn1:
                             # Botón archivo local
                             if archivo_local:
-                                local_path = HISTORY_DIR / archivo_local
                                 if local_path.exists():
-                                    if st.button("📁 Archivo Local", key=f"local_{i}", use_container_width=True, type="primary"):
+                                    if st.button("📁 Archivo Local", key=f"local_{item['id']}", use_container_width=True, type="primary"):
                                         import subprocess
                                         import os
                                         # Abrir el archivo con el programa predeterminado del sistema
@@ -2030,7 +1770,7 @@ if st.session_state.current_page == 'generator':
                                 st.button("🔗 Sin URL Replicate", disabled=True, use_container_width=True, help="No hay URL de Replicate disponible")
                         
                         # Indicadores de estado
-                        if archivo_local and (HISTORY_DIR / archivo_local).exists():
+                        if archivo_local and local_path.exists():
                             st.success("🟢 Archivo disponible localmente")
                         else:
                             st.info("� Solo disponible en Replicate")
@@ -2043,20 +1783,25 @@ if st.session_state.current_page == 'generator':
             
             # Información adicional
             if filtered_history:
-                st.info(f"📈 **Total mostrado:** {len(filtered_history)} de {total_items} generaciones")
+                if history_page['pages'] > 1:
+                    render_pagination_controls("history_pagination", history_page, position="bottom")
+                first = (history_page['page'] - 1) * page_size + 1
+                st.info(f"📈 **Total mostrado:** {first}-{first + len(filtered_history) - 1} de "
+                        f"{history_page['total']} ({total_items} generaciones)")
             
         else:
             st.info("📝 No hay elementos en el historial aún. ¡Genera tu primer contenido!")
 
     # Sección del Dashboard de Control
-    with tab3:
+    with tab3, profile_section("Dashboard"):
         st.header("📊 Dashboard de Control de Gastos")
         
-        # Obtener estadísticas completas
-        stats = get_comprehensive_stats()
+        # Obtener todas las estadísticas en un único snapshot (una pasada por el historial)
+        analytics = get_analytics_snapshot()
+        stats = analytics['stats']
         
         # Alertas de gasto
-        alerts = get_spending_alerts()
+        alerts = analytics['alerts']
         if alerts:
             st.subheader("🚨 Alertas")
             for alert in alerts:
@@ -2140,11 +1885,11 @@ if st.session_state.current_page == 'generator':
         st.divider()
         
         # Pestañas del dashboard
-        dash_tab1, dash_tab2, dash_tab3, dash_tab4 = st.tabs([
-            "📊 Por Tipo", "🤖 Por Modelo", "📅 Temporal", "🎯 Eficiencia"
+        dash_tab1, dash_tab2, dash_tab3, dash_tab4, dash_tab5, dash_tab6 = st.tabs([
+            "📊 Por Tipo", "🤖 Por Modelo", "📅 Temporal", "🎯 Eficiencia", "⏱️ Latencia", "🔎 Trazas"
         ])
         
-        with dash_tab1:
+        with dash_tab1, profile_section("Por tipo"):
             st.subheader("📊 Análisis por Tipo de Contenido")
             
             # Gráfico de distribución por tipo
@@ -2203,11 +1948,11 @@ if st.session_state.current_page == 'generator':
                         </div>
                         """, unsafe_allow_html=True)
         
-        with dash_tab2:
+        with dash_tab2, profile_section("Por modelo"):
             st.subheader("🤖 Análisis por Modelo")
             
             # Ranking de modelos
-            ranking = get_model_efficiency_ranking()
+            ranking = analytics['ranking']
             
             model_col1, model_col2 = st.columns([3, 1])
             
@@ -2299,7 +2044,7 @@ if st.session_state.current_page == 'generator':
                         </div>
                         """, unsafe_allow_html=True)
         
-        with dash_tab3:
+        with dash_tab3, profile_section("Temporal"):
             st.subheader("📅 Análisis Temporal")
             
             # Selector de período
@@ -2313,7 +2058,7 @@ if st.session_state.current_page == 'generator':
                 )
             
             # Obtener datos temporales
-            temporal_data = get_cost_breakdown_by_period(period)
+            temporal_data = analytics['by_period'][period]
             
             with period_col2:
                 if temporal_data:
@@ -2338,7 +2083,7 @@ if st.session_state.current_page == 'generator':
                 else:
                     st.info("No hay datos temporales disponibles")
         
-        with dash_tab4:
+        with dash_tab4, profile_section("Eficiencia"):
             st.subheader("🎯 Análisis de Eficiencia")
             
             efficiency_col1, efficiency_col2 = st.columns([2, 1])
@@ -2395,7 +2140,7 @@ if st.session_state.current_page == 'generator':
                 
                 # Proyección de gastos
                 st.markdown("**📈 Proyección de Gastos**")
-                monthly_data = get_cost_breakdown_by_period('month')
+                monthly_data = analytics['by_period']['month']
                 if monthly_data:
                     current_month = list(monthly_data.values())[0]
                     current_cost = current_month['total_cost']
@@ -2441,15 +2186,138 @@ if st.session_state.current_page == 'generator':
                     </div>
                     """, unsafe_allow_html=True)
 
+        with dash_tab5, profile_section("Latencia"):
+            st.subheader("⏱️ Latencia por Modelo")
+
+            latency_col1, latency_col2 = st.columns([1, 3])
+
+            with latency_col1:
+                latency_window = st.selectbox(
+                    "Ventana:",
+                    list(WINDOWS),
+                    index=1,
+                    format_func=lambda x: WINDOW_LABELS[x],
+                    key="latency_window"
+                )
+
+            with latency_col2:
+                st.caption("Percentiles de las generaciones correctas. La cola y la ejecución vienen de las "
+                           "marcas de tiempo de Replicate; en los modelos de salida directa la cola va incluida "
+                           "en la ejecución.")
+
+            latency_stats = get_latency_stats(latency_window)
+
+            if latency_stats:
+                for model, summary in sorted(latency_stats.items()):
+                    st.markdown(f"**{model}**")
+
+                    metric_col1, metric_col2, metric_col3 = st.columns(3)
+                    with metric_col1:
+                        st.metric("📊 Generaciones", summary['n'])
+                    with metric_col2:
+                        success_rate = summary['ok'] / summary['n'] * 100 if summary['n'] else 0
+                        st.metric("✅ Éxito", f"{success_rate:.1f}%")
+                    with metric_col3:
+                        throughput = summary['throughput_per_hour']
+                        st.metric("🚀 Rendimiento", f"{throughput:.2f}/h" if throughput is not None else "—")
+
+                    rows = [
+                        {
+                            "Fase": PHASE_LABELS[phase],
+                            "Muestras": summary['phases'][phase]['n'],
+                            "Media": format_seconds(summary['phases'][phase]['mean']),
+                            "p50": format_seconds(summary['phases'][phase]['p50']),
+                            "p95": format_seconds(summary['phases'][phase]['p95']),
+                            "p99": format_seconds(summary['phases'][phase]['p99']),
+                        }
+                        for phase in PHASES if phase in summary['phases']
+                    ]
+                    if rows:
+                        st.dataframe(rows, hide_index=True, use_container_width=True)
+                    else:
+                        st.caption("Sin generaciones correctas en esta ventana")
+                    st.divider()
+            else:
+                st.info("No hay generaciones en esta ventana")
+
+        with dash_tab6, profile_section("Trazas"):
+            st.subheader("🔎 Trazas de Generación")
+
+            trace_col1, trace_col2 = st.columns([1, 3])
+
+            with trace_col1:
+                trace_limit = st.selectbox("Últimas:", [10, 25, 50, 100], index=1, key="trace_limit")
+
+            with trace_col2:
+                st.caption("Cada generación registra sus etapas en historial/traces.jsonl: envío y sondeo "
+                           "(modelo), descargas (red), historial y estadísticas (disco) y vista previa (interfaz).")
+
+            traces = load_traces(limit=trace_limit)
+
+            if traces:
+                # Reparto del tiempo entre modelo, red, disco e interfaz
+                totals = {}
+                for trace in traces:
+                    for category, ms in trace['breakdown'].items():
+                        totals[category] = totals.get(category, 0) + ms
+                total_ms = sum(totals.values()) or 1
+
+                category_cols = st.columns(len(CATEGORY_LABELS))
+                for column, (category, label) in zip(category_cols, CATEGORY_LABELS.items()):
+                    with column:
+                        st.metric(label, format_seconds(totals.get(category, 0) / 1000),
+                                  f"{totals.get(category, 0) / total_ms * 100:.0f}%", delta_color="off")
+
+                st.markdown("**📋 Etapas**")
+                st.dataframe([
+                    {
+                        "Etapa": row['name'],
+                        "Categoría": CATEGORY_LABELS[row['category']],
+                        "Veces": row['count'],
+                        "Total": format_seconds(row['total_ms'] / 1000),
+                        "Media": format_seconds(row['mean_ms'] / 1000),
+                        "p50": format_seconds(row['p50_ms'] / 1000),
+                        "p95": format_seconds(row['p95_ms'] / 1000),
+                    }
+                    for row in summarize_spans(traces)
+                ], hide_index=True, use_container_width=True)
+
+                st.markdown("**🧵 Trazas recientes**")
+                for trace in traces:
+                    root = trace['root']
+                    started = datetime.fromtimestamp(root['start_time_unix_nano'] / 1e9).strftime('%Y-%m-%d %H:%M:%S')
+                    status_icon = "✅" if root.get('status') == 'ok' else "❌"
+                    model_name = root.get('attributes', {}).get('modelo', root['name'])
+                    with st.expander(f"{status_icon} {started} · {model_name} · "
+                                     f"{format_seconds(trace['duration_ms'] / 1000)}"):
+                        # Profundidad de cada span para mostrarlos como árbol
+                        depths = {}
+                        rows = []
+                        for data in trace['spans']:
+                            depth = depths.get(data.get('parent_span_id'), -1) + 1
+                            depths[data['span_id']] = depth
+                            offset_ms = (data['start_time_unix_nano'] - root['start_time_unix_nano']) / 1e6
+                            rows.append({
+                                "Etapa": ("  " * (depth - 1) + "↳ " if depth else "") + data['name'],
+                                "Inicio": f"+{offset_ms:.0f} ms",
+                                "Duración": format_seconds(data['duration_ms'] / 1000),
+                                "Estado": data.get('status', ''),
+                                "Atributos": ", ".join(f"{k}={v}" for k, v in data.get('attributes', {}).items()),
+                            })
+                        st.dataframe(rows, hide_index=True, use_container_width=True)
+            else:
+                st.info("Todavía no hay trazas. Se registran al generar contenido.")
+
     # Verificar si se debe mostrar el modal de configuración (solo en la página del generador)
     if st.session_state.get('show_config_modal', False):
-        show_config_modal()
+        with profile_section("Modal configuración"):
+            show_config_modal()
 
 elif st.session_state.current_page == 'biblioteca':
     # PÁGINA DE LA BIBLIOTECA
     
     # Sidebar con controles para la biblioteca
-    with st.sidebar:
+    with st.sidebar, profile_section("Sidebar biblioteca"):
         st.header("📚 Biblioteca")
         st.divider()
         
@@ -2469,372 +2337,288 @@ elif st.session_state.current_page == 'biblioteca':
         st.subheader("📊 Info Rápida")
         st.info("💡 Tip: Haz clic en 'Ver detalles' de cualquier item para más información")
     
-    # Cargar historial para la biblioteca
-    history = load_history()
+    with profile_section("Biblioteca"):
+        # Totales del historial desde los rollups (sin cargar el historial completo)
+        rollups = get_cost_rollups()
     
-    if history:
-        # CONTENIDO PRINCIPAL
-        # Estadísticas rápidas en la parte superior
-        stats_col1, stats_col2, stats_col3 = st.columns(3)
-        total_items = len(history)
-        total_imagenes = len([h for h in history if h.get('tipo') == 'imagen'])
-        total_videos = len([h for h in history if h.get('tipo') == 'video'])
-        total_cost_usd = sum(calculate_item_cost(h)[0] for h in history)
-        
-        with stats_col1:
-            st.metric("📊 Total", total_items)
-        with stats_col2:
-            st.metric("🖼️ Imágenes", total_imagenes)
-        with stats_col3:
-            st.markdown(f"""
-            <div style="text-align: center; padding: 15px; background: linear-gradient(135deg, #28a745, #20c997); border-radius: 10px; color: white;">
-                <div style="font-size: 14px; opacity: 0.9;">💰 COSTO TOTAL</div>
-                <div style="font-size: 32px; font-weight: bold; margin: 8px 0;">${total_cost_usd:.2f}</div>
-                <div style="font-size: 12px; opacity: 0.8;">Estimado USD</div>
-            </div>
-            """, unsafe_allow_html=True)
-        
-        st.divider()
-        
-        # Filtros rápidos
-        filter_col1, filter_col2, filter_col3, filter_col4 = st.columns(4)
+        if rollups['count']:
+            # CONTENIDO PRINCIPAL
+            # Estadísticas rápidas en la parte superior
+            stats_col1, stats_col2, stats_col3 = st.columns(3)
+            total_items = rollups['count']
+            total_imagenes = rollups['by_type'].get('imagen', {}).get('count', 0)
+            total_videos = rollups['by_type'].get('video', {}).get('count', 0)
+            total_cost_usd = rollups['total_cost']
+        
+            with stats_col1:
+                st.metric("📊 Total", total_items)
+            with stats_col2:
+                st.metric("🖼️ Imágenes", total_imagenes)
+            with stats_col3:
+                st.markdown(f"""
+                <div style="text-align: center; padding: 15px; background: linear-gradient(135deg, #28a745, #20c997); border-radius: 10px; color: white;">
+                    <div style="font-size: 14px; opacity: 0.9;">💰 COSTO TOTAL</div>
+                    <div style="font-size: 32px; font-weight: bold; margin: 8px 0;">${total_cost_usd:.2f}</div>
+                    <div style="font-size: 12px; opacity: 0.8;">Estimado USD</div>
+                </div>
+                """, unsafe_allow_html=True)
         
-        with filter_col1:
-            filter_type = st.selectbox("Filtrar por tipo:", ["Todos", "imagen", "video"])
+            st.divider()
         
-        with filter_col2:
-            sort_order = st.selectbox("Ordenar por:", ["Más reciente", "Más antiguo", "Tipo"])
+            # Filtros rápidos
+            filter_col1, filter_col2, filter_col3, filter_col4 = st.columns(4)
         
-        with filter_col3:
-            items_per_row = st.slider("Items por fila:", 2, 6, 6)
+            with filter_col1:
+                filter_type = st.selectbox("Filtrar por tipo:", ["Todos", "imagen", "video"], key="library_filter_type")
         
-        with filter_col4:
-            image_size = st.selectbox("Tamaño de vista previa:", ["Pequeño", "Mediano", "Grande", "Extra Grande"], index=1)
+            with filter_col2:
+                sort_order = st.selectbox("Ordenar por:", ["Más reciente", "Más antiguo", "Tipo"], key="library_sort_order")
         
-        # Aplicar filtros
-        filtered_items = history.copy()
+            with filter_col3:
+                items_per_row = st.slider("Items por fila:", 2, 6, 6, key="library_items_per_row")
         
-        if filter_type != "Todos":
-            filtered_items = [item for item in filtered_items if item.get('tipo') == filter_type]
+            with filter_col4:
+                image_size = st.selectbox("Tamaño de vista previa:", ["Pequeño", "Mediano", "Grande", "Extra Grande"],
+                                          index=1, key="library_image_size")
         
-        # Ordenar
-        if sort_order == "Más reciente":
-            filtered_items.sort(key=lambda x: x.get("fecha", ""), reverse=True)
-        elif sort_order == "Más antiguo":
-            filtered_items.sort(key=lambda x: x.get("fecha", ""))
-        elif sort_order == "Tipo":
-            filtered_items.sort(key=lambda x: x.get("tipo", ""))
+            # Aplicar filtros y orden en el índice; solo se cargan los items de la página visible
+            sort_orders = {"Más reciente": 'desc', "Más antiguo": 'asc', "Tipo": 'tipo'}
+            library_page_size = items_per_row * LIBRARY_ROWS_PER_PAGE
+            library_page = paginate_history(
+                "library_pagination", library_page_size,
+                tipo=filter_type if filter_type != "Todos" else None,
+                order=sort_orders[sort_order]
+            )
+            filtered_items = library_page['items']
         
-        # Mostrar items en grid
-        if filtered_items:
-            # Dividir en filas
-            for i in range(0, len(filtered_items), items_per_row):
-                cols = st.columns(items_per_row)
+            # Mostrar items en grid
+            if filtered_items:
+                render_pagination_controls("library_pagination", library_page)
+            
+                # Dividir en filas
+                for i in range(0, len(filtered_items), items_per_row):
+                    cols = st.columns(items_per_row)
                 
-                for j in range(items_per_row):
-                    if i + j < len(filtered_items):
-                        item = filtered_items[i + j]
-                        original_index = history.index(item)
+                    for j in range(items_per_row):
+                        if i + j < len(filtered_items):
+                            item = filtered_items[i + j]
+                            position = (library_page['page'] - 1) * library_page_size + i + j + 1
                         
-                        with cols[j]:
-                            # Card del item
-                            st.markdown(f"""
-                            <div style="
-                                border: 2px solid #e0e0e0;
-                                border-radius: 10px;
-                                padding: 10px;
-                                margin: 5px 0;
-                                background: linear-gradient(135deg, #f8f9fa 0%, #e9ecef 100%);
-                                box-shadow: 0 4px 6px rgba(0,0,0,0.1);
-                            ">
-                                <div style="display: flex; flex-direction: column; gap: 4px;">
-                                    <h6 style="margin: 0; color: #2c3e50; font-size: 14px; font-weight: 600;">
-                                        {item.get('tipo', 'Item').title()} #{original_index + 1}
-                                    </h6>
-                                    <p style="margin: 0; font-size: 11px; color: #666;">
-                                        📅 {item.get('fecha', 'N/A')[:10]} | 🔗 {item.get('modelo', 'Modelo desconocido')[:15]}{'...' if len(item.get('modelo', 'Modelo desconocido')) > 15 else ''}
-                                    </p>
+                            with cols[j]:
+                                # Card del item
+                                st.markdown(f"""
+                                <div style="
+                                    border: 2px solid #e0e0e0;
+                                    border-radius: 10px;
+                                    padding: 10px;
+                                    margin: 5px 0;
+                                    background: linear-gradient(135deg, #f8f9fa 0%, #e9ecef 100%);
+                                    box-shadow: 0 4px 6px rgba(0,0,0,0.1);
+                                ">
+                                    <div style="display: flex; flex-direction: column; gap: 4px;">
+                                        <h6 style="margin: 0; color: #2c3e50; font-size: 14px; font-weight: 600;">
+                                            {item.get('tipo', 'Item').title()} #{position}
+                                        </h6>
+                                        <p style="margin: 0; font-size: 11px; color: #666;">
+                                            📅 {item.get('fecha', 'N/A')[:10]} | 🔗 {item.get('modelo', 'Modelo desconocido')[:15]}{'...' if len(item.get('modelo', 'Modelo desconocido')) > 15 else ''}
+                                        </p>
+                                    </div>
                                 </div>
-                            </div>
-                            """, unsafe_allow_html=True)
+                                """, unsafe_allow_html=True)
                             
-                            # Mostrar preview de la imagen/video
-                            url = item.get('url')
-                            archivo_local = item.get('archivo_local')
+                                # Miniatura / portada (el archivo completo solo se carga en los detalles)
+                                render_library_preview(item, THUMBNAIL_SIZES[image_size])
                             
-                            # Priorizar archivo local para videos de Pixverse y VEO que pueden tener URLs expiradas
-                            if archivo_local:
-                                local_path = HISTORY_DIR / archivo_local
-                                if local_path.exists():
-                                    try:
-                                        if item.get('tipo') == 'video':
-                                            # Para archivos locales, usar st.video funciona mejor
-                                            st.video(str(local_path))
-                                            st.success(f"🎬 Reproduciendo desde archivo local: {archivo_local}")
-                                        else:
-                                            st.image(str(local_path), use_container_width=True)
-                                    except Exception as e:
-                                        st.markdown(f"""
-                                        <div style="
-                                            background: #f8f9fa;
-                                            border: 2px dashed #dee2e6;
-                                            border-radius: 10px;
-                                            padding: 20px;
-                                            text-align: center;
-                                        ">
-                                            <div style="font-size: 48px; margin-bottom: 10px;">🎬</div>
-                                            <div style="color: #6c757d;">Video local: {archivo_local}</div>
-                                            <div style="color: #dc3545; font-size: 12px;">Error: {str(e)[:50]}</div>
-                                        </div>
-                                        """, unsafe_allow_html=True)
-                                else:
-                                    # Archivo local no existe, intentar con URL
-                                    if url:
-                                        st.warning(f"⚠️ Archivo local no encontrado: {archivo_local}")
-                                        st.info("🔗 Intentando cargar desde URL externa...")
-                                        try:
-                                            if item.get('tipo') == 'video':
-                                                st.markdown(f"""
-                                                <div style="text-align: center; margin: 20px 0;">
-                                                    <video width="100%" height="400" controls style="border-radius: 10px; box-shadow: 0 4px 15px rgba(0,0,0,0.2);">
-                                                        <source src="{url}" type="video/mp4">
-                                                        <source src="{url}" type="video/webm">
-                                                        <source src="{url}" type="video/quicktime">
-                                                        Tu navegador no soporta el elemento video.
-                                                    </video>
-                                                </div>
-                                                """, unsafe_allow_html=True)
-                                            else:
-                                                st.image(url, use_container_width=True)
-                                        except:
-                                            st.error("❌ Tanto el archivo local como la URL externa fallaron")
-                                    else:
-                                        st.warning(f"⚠️ Archivo local no encontrado: {archivo_local}")
-                                        st.error("❌ No hay URL de respaldo disponible")
-                            elif url:
-                                try:
-                                    if item.get('tipo') == 'video':
-                                        # Para videos, usar HTML personalizado para mejor compatibilidad
-                                        st.markdown(f"""
-                                        <div style="text-align: center; margin: 20px 0;">
-                                            <video width="100%" height="400" controls style="border-radius: 10px; box-shadow: 0 4px 15px rgba(0,0,0,0.2);">
-                                                <source src="{url}" type="video/mp4">
-                                                <source src="{url}" type="video/webm">
-                                                <source src="{url}" type="video/quicktime">
-                                                Tu navegador no soporta el elemento video.
-                                                <br><br>
-                                                <a href="{url}" target="_blank" style="color: #1f77b4; text-decoration: none;">
-                                                    🔗 Abrir video en nueva pestaña
-                                                </a>
-                                            </video>
-                                        </div>
-                                        """, unsafe_allow_html=True)
-                                        
-                                        # Advertencia específica para el botón de nueva pestaña
-                                        st.markdown(f"""
-                                        <div style="text-align: center; margin: 10px 0;">
-                                            <a href="{url}" target="_blank" style="
-                                                background: linear-gradient(135deg, #667eea, #764ba2);
-                                                color: white;
-                                                padding: 8px 16px;
-                                                text-decoration: none;
-                                                border-radius: 6px;
-                                                font-size: 14px;
-                                            ">
-                                                🎬 Abrir video en nueva pestaña
-                                            </a>
-                                        </div>
-                                        """, unsafe_allow_html=True)
-                                    else:
-                                        st.image(url, use_container_width=True)
-                                except Exception as e:
-                                    st.markdown(f"""
-                                    <div style="
-                                        background: #f8f9fa;
-                                        border: 2px dashed #dee2e6;
-                                        border-radius: 10px;
-                                        padding: 20px;
-                                        text-align: center;
-                                        margin: 20px 0;
-                                    ">
-                                        <div style="font-size: 48px; margin-bottom: 10px;">🎬</div>
-                                        <div style="color: #6c757d; margin-bottom: 15px;">Vista previa no disponible</div>
-                                        <div style="color: #dc3545; font-size: 12px; margin-bottom: 15px;">Error: {str(e)[:50]}</div>
-                                        <a href="{url}" target="_blank" style="
-                                            background: #007bff;
-                                            color: white;
-                                            padding: 10px 20px;
-                                            text-decoration: none;
-                                            border-radius: 6px;
-                                        ">
-                                            Ver contenido original
-                                        </a>
-                                    </div>
-                                    """, unsafe_allow_html=True)
-                            else:
-                                st.markdown("❌ Sin preview disponible")
+                                # Prompt truncado
+                                prompt = item.get('prompt', '')
+                                if prompt:
+                                    prompt_preview = prompt[:80] + "..." if len(prompt) > 80 else prompt
+                                    st.caption(f"💬 {prompt_preview}")
                             
-                            # Prompt truncado
-                            prompt = item.get('prompt', '')
-                            if prompt:
-                                prompt_preview = prompt[:80] + "..." if len(prompt) > 80 else prompt
-                                st.caption(f"💬 {prompt_preview}")
-                            
-                            # Botón Ver detalles
-                            if st.button("👁️ Ver detalles", key=f"details_{original_index}", use_container_width=True):
-                                st.session_state.selected_item_index = original_index
-                                st.rerun()
+                                # Botón Ver detalles
+                                if st.button("👁️ Ver detalles", key=f"details_{item['id']}", use_container_width=True):
+                                    st.session_state.selected_item_id = item['id']
+                                    st.rerun()
             
-            st.markdown(f"---")
-            st.info(f"📊 Mostrando {len(filtered_items)} de {len(history)} items")
+                st.markdown(f"---")
+                if library_page['pages'] > 1:
+                    render_pagination_controls("library_pagination", library_page, position="bottom")
+                st.info(f"📊 Mostrando {len(filtered_items)} de {library_page['total']} items ({rollups['count']} en total)")
             
-        else:
-            st.info("🔍 No se encontraron items con los filtros seleccionados")
+            else:
+                st.info("🔍 No se encontraron items con los filtros seleccionados")
         
-        # POPUP DE DETALLES
-        if st.session_state.selected_item_index is not None and st.session_state.selected_item_index < len(history):
-            selected_item = history[st.session_state.selected_item_index]
+            # POPUP DE DETALLES
+            selected_item = get_history_item(st.session_state.selected_item_id)
+            if selected_item is not None:
             
-            # Crear popup con st.dialog
-            @st.dialog("📋 Detalles del Item", width="large")
-            def show_item_details():
-                # Fila superior: Info básica + Botón cerrar
-                col1, col2, col3 = st.columns([3, 3, 1])
-                with col1:
-                    st.markdown(f"<div style='text-align: center; padding: 8px;'><h5 style='margin: 0; color: #2c3e50;'>🎯 {selected_item.get('tipo', 'N/A').title()}</h5><small style='color: #6c757d;'>📅 {selected_item.get('fecha', 'N/A')[:10]}</small></div>", unsafe_allow_html=True)
-                with col2:
-                    # Usar la función de cálculo real en lugar del hardcodeado
-                    cost_usd, model_info, calculation_details = calculate_item_cost(selected_item)
-                    st.markdown(f"<div style='text-align: center; padding: 8px;'><h5 style='margin: 0; color: #495057;'>🔗 {selected_item.get('modelo', 'N/A')[:15]}</h5><div style='font-size: 18px; font-weight: bold; color: #28a745; margin-top: 5px;'>💰 ${cost_usd:.3f}</div></div>", unsafe_allow_html=True)
-                with col3:
-                    st.markdown("<div style='text-align: center; padding: 8px;'>", unsafe_allow_html=True)
-                    if st.button("❌", key="close_popup", help="Cerrar"):
-                        st.session_state.selected_item_index = None
-                        st.rerun()
-                    st.markdown("</div>", unsafe_allow_html=True)
+                # Crear popup con st.dialog
+                @st.dialog("📋 Detalles del Item", width="large")
+                def show_item_details():
+                    # Fila superior: Info básica + Botón cerrar
+                    col1, col2, col3 = st.columns([3, 3, 1])
+                    with col1:
+                        st.markdown(f"<div style='text-align: center; padding: 8px;'><h5 style='margin: 0; color: #2c3e50;'>🎯 {selected_item.get('tipo', 'N/A').title()}</h5><small style='color: #6c757d;'>📅 {selected_item.get('fecha', 'N/A')[:10]}</small></div>", unsafe_allow_html=True)
+                    with col2:
+                        # Usar la función de cálculo real en lugar del hardcodeado
+                        cost_usd, model_info, calculation_details = calculate_item_cost(selected_item)
+                        st.markdown(f"<div style='text-align: center; padding: 8px;'><h5 style='margin: 0; color: #495057;'>🔗 {selected_item.get('modelo', 'N/A')[:15]}</h5><div style='font-size: 18px; font-weight: bold; color: #28a745; margin-top: 5px;'>💰 ${cost_usd:.3f}</div></div>", unsafe_allow_html=True)
+                    with col3:
+                        st.markdown("<div style='text-align: center; padding: 8px;'>", unsafe_allow_html=True)
+                        if st.button("❌", key="close_popup", help="Cerrar"):
+                            st.session_state.selected_item_id = None
+                            st.rerun()
+                        st.markdown("</div>", unsafe_allow_html=True)
                 
-                # Separador visual
-                st.markdown("<hr style='margin: 10px 0; border: 1px solid #e9ecef;'>", unsafe_allow_html=True)
+                    # Separador visual
+                    st.markdown("<hr style='margin: 10px 0; border: 1px solid #e9ecef;'>", unsafe_allow_html=True)
                 
-                # Fila de datos económicos con fuente más grande y simétrica
-                eco_col1, eco_col2, eco_col3, eco_col4 = st.columns(4)
-                with eco_col1:
-                    cost_eur = cost_usd * 0.92
-                    st.markdown(f"""
-                    <div style='text-align: center; padding: 12px; background: #f8f9fa; border-radius: 8px; margin: 4px;'>
-                        <h2 style='margin: 0; color: #28a745; font-weight: bold;'>💵 ${cost_usd:.3f}</h2>
-                        <small style='color: #6c757d; font-weight: 500;'>Costo USD</small>
-                    </div>
-                    """, unsafe_allow_html=True)
-                with eco_col2:
-                    st.markdown(f"""
-                    <div style='text-align: center; padding: 12px; background: #f8f9fa; border-radius: 8px; margin: 4px;'>
-                        <h2 style='margin: 0; color: #007bff; font-weight: bold;'>💶 €{cost_eur:.3f}</h2>
-                        <small style='color: #6c757d; font-weight: 500;'>Costo EUR</small>
-                    </div>
-                    """, unsafe_allow_html=True)
-                with eco_col3:
-                    plantilla = selected_item.get('plantilla', 'Sin plantilla')
-                    plantilla_short = plantilla[:10] + "..." if len(plantilla) > 10 else plantilla
-                    st.markdown(f"""
-                    <div style='text-align: center; padding: 12px; background: #f8f9fa; border-radius: 8px; margin: 4px;'>
-                        <h5 style='margin: 0; color: #6c757d; font-weight: bold;'>🎨 {plantilla_short}</h5>
-                        <small style='color: #6c757d; font-weight: 500;'>Plantilla</small>
-                    </div>
-                    """, unsafe_allow_html=True)
-                with eco_col4:
-                    fecha = selected_item.get('fecha', '')
-                    if fecha:
-                        try:
-                            fecha_obj = datetime.fromisoformat(fecha.replace('Z', '+00:00'))
-                            ahora = datetime.now()
-                            diferencia = ahora - fecha_obj.replace(tzinfo=None)
-                            if diferencia.days > 0:
-                                antiguedad = f"{diferencia.days}d"
-                            elif diferencia.seconds > 3600:
-                                antiguedad = f"{diferencia.seconds // 3600}h"
-                            else:
-                                antiguedad = f"{diferencia.seconds // 60}m"
-                            st.markdown(f"""
-                            <div style='text-align: center; padding: 12px; background: #f8f9fa; border-radius: 8px; margin: 4px;'>
-                                <h5 style='margin: 0; color: #fd7e14; font-weight: bold;'>⏰ {antiguedad}</h5>
-                                <small style='color: #6c757d; font-weight: 500;'>Antigüedad</small>
-                            </div>
-                            """, unsafe_allow_html=True)
-                        except:
-                            st.markdown(f"""
-                            <div style='text-align: center; padding: 12px; background: #f8f9fa; border-radius: 8px; margin: 4px;'>
-                                <h5 style='margin: 0; color: #6c757d; font-weight: bold;'>⏰ N/A</h5>
-                                <small style='color: #6c757d; font-weight: 500;'>Antigüedad</small>
-                            </div>
-                            """, unsafe_allow_html=True)
+                    # Fila de datos económicos con fuente más grande y simétrica
+                    eco_col1, eco_col2, eco_col3, eco_col4 = st.columns(4)
+                    with eco_col1:
+                        cost_eur = cost_usd * 0.92
+                        st.markdown(f"""
+                        <div style='text-align: center; padding: 12px; background: #f8f9fa; border-radius: 8px; margin: 4px;'>
+                            <h2 style='margin: 0; color: #28a745; font-weight: bold;'>💵 ${cost_usd:.3f}</h2>
+                            <small style='color: #6c757d; font-weight: 500;'>Costo USD</small>
+                        </div>
+                        """, unsafe_allow_html=True)
+                    with eco_col2:
+                        st.markdown(f"""
+                        <div style='text-align: center; padding: 12px; background: #f8f9fa; border-radius: 8px; margin: 4px;'>
+                            <h2 style='margin: 0; color: #007bff; font-weight: bold;'>💶 €{cost_eur:.3f}</h2>
+                            <small style='color: #6c757d; font-weight: 500;'>Costo EUR</small>
+                        </div>
+                        """, unsafe_allow_html=True)
+                    with eco_col3:
+                        plantilla = selected_item.get('plantilla', 'Sin plantilla')
+                        plantilla_short = plantilla[:10] + "..." if len(plantilla) > 10 else plantilla
+                        st.markdown(f"""
+                        <div style='text-align: center; padding: 12px; background: #f8f9fa; border-radius: 8px; margin: 4px;'>
+                            <h5 style='margin: 0; color: #6c757d; font-weight: bold;'>🎨 {plantilla_short}</h5>
+                            <small style='color: #6c757d; font-weight: 500;'>Plantilla</small>
+                        </div>
+                        """, unsafe_allow_html=True)
+                    with eco_col4:
+                        fecha = selected_item.get('fecha', '')
+                        if fecha:
+                            try:
+                                fecha_obj = datetime.fromisoformat(fecha.replace('Z', '+00:00'))
+                                ahora = datetime.now()
+                                diferencia = ahora - fecha_obj.replace(tzinfo=None)
+                                if diferencia.days > 0:
+                                    antiguedad = f"{diferencia.days}d"
+                                elif diferencia.seconds > 3600:
+                                    antiguedad = f"{diferencia.seconds // 3600}h"
+                                else:
+                                    antiguedad = f"{diferencia.seconds // 60}m"
+                                st.markdown(f"""
+                                <div style='text-align: center; padding: 12px; background: #f8f9fa; border-radius: 8px; margin: 4px;'>
+                                    <h5 style='margin: 0; color: #fd7e14; font-weight: bold;'>⏰ {antiguedad}</h5>
+                                    <small style='color: #6c757d; font-weight: 500;'>Antigüedad</small>
+                                </div>
+                                """, unsafe_allow_html=True)
+                            except:
+                                st.markdown(f"""
+                                <div style='text-align: center; padding: 12px; background: #f8f9fa; border-radius: 8px; margin: 4px;'>
+                                    <h5 style='margin: 0; color: #6c757d; font-weight: bold;'>⏰ N/A</h5>
+                                    <small style='color: #6c757d; font-weight: 500;'>Antigüedad</small>
+                                </div>
+                                """, unsafe_allow_html=True)
+                
+                    # Separador visual
+                    st.markdown("<hr style='margin: 10px 0; border: 1px solid #e9ecef;'>", unsafe_allow_html=True)
                 
-                # Separador visual
-                st.markdown("<hr style='margin: 10px 0; border: 1px solid #e9ecef;'>", unsafe_allow_html=True)
+                    # Archivo completo (en la cuadrícula solo se muestra la miniatura)
+                    render_full_preview(selected_item)
                 
-                # Prompt en área más pequeña
-                st.markdown("**📝 Prompt:**")
-                st.text_area("Prompt completo", value=selected_item.get('prompt', 'Sin prompt disponible'), height=80, disabled=True, label_visibility="collapsed")
+                    # Prompt en área más pequeña
+                    st.markdown("**📝 Prompt:**")
+                    st.text_area("Prompt completo", value=selected_item.get('prompt', 'Sin prompt disponible'), height=80, disabled=True, label_visibility="collapsed")
                 
-                # Detalles del cálculo de costo
-                st.markdown("**💰 Detalles del Costo:**")
-                st.caption(f"🔢 **Modelo:** {model_info}")
-                st.caption(f"📊 **Cálculo:** {calculation_details}")
+                    # Detalles del cálculo de costo
+                    st.markdown("**💰 Detalles del Costo:**")
+                    st.caption(f"🔢 **Modelo:** {model_info}")
+                    st.caption(f"📊 **Cálculo:** {calculation_details}")
                 
-                # Fila inferior: Botones de acceso estandarizados
-                archivo_local = selected_item.get('archivo_local', '')
-                url = selected_item.get('url', '')
+                    # Fila inferior: Botones de acceso estandarizados
+                    archivo_local = selected_item.get('archivo_local', '')
+                    url = selected_item.get('url', '')
+                
+                    col1, col2 = st.columns(2)
+                    with col1:
+                        # Botón archivo local
+                        if archivo_local:
+                            local_path = resolve_media_path(selected_item)
+                            if local_path.exists():
+                                if st.button("📁 Abrir Archivo Local", key="popup_local", use_container_width=True, type="primary"):
+                                    import subprocess
+                                    import os
+                                    # Abrir el archivo con el programa predeterminado del sistema
+                                    if os.name == 'nt':  # Windows
+                                        os.startfile(str(local_path))
+                                    elif os.name == 'posix':  # macOS y Linux
+                                        subprocess.call(['open' if 'darwin' in os.uname().sysname.lower() else 'xdg-open', str(local_path)])
+                                file_size = local_path.stat().st_size / (1024 * 1024)
+                                st.success(f"📁 Disponible • {file_size:.1f}MB")
+                            else:
+                                st.button("📁 Local No Disponible", disabled=True, use_container_width=True, help="El archivo local no existe")
+                                st.error("❌ Archivo no encontrado")
+                        else:
+                            st.button("📁 Sin Archivo Local", disabled=True, use_container_width=True, help="No hay archivo local guardado")
+                            st.info("📁 No guardado localmente")
                 
-                col1, col2 = st.columns(2)
-                with col1:
-                    # Botón archivo local
-                    if archivo_local:
-                        local_path = HISTORY_DIR / archivo_local
-                        if local_path.exists():
-                            if st.button("📁 Abrir Archivo Local", key="popup_local", use_container_width=True, type="primary"):
-                                import subprocess
-                                import os
-                                # Abrir el archivo con el programa predeterminado del sistema
-                                if os.name == 'nt':  # Windows
-                                    os.startfile(str(local_path))
-                                elif os.name == 'posix':  # macOS y Linux
-                                    subprocess.call(['open' if 'darwin' in os.uname().sysname.lower() else 'xdg-open', str(local_path)])
-                            file_size = local_path.stat().st_size / (1024 * 1024)
-                            st.success(f"📁 Disponible • {file_size:.1f}MB")
+                    with col2:
+                        # Botón URL Replicate
+                        if url:
+                            st.link_button("� Ver en Replicate", url, use_container_width=True)
+                            st.success("🔗 URL disponible")
                         else:
-                            st.button("📁 Local No Disponible", disabled=True, use_container_width=True, help="El archivo local no existe")
-                            st.error("❌ Archivo no encontrado")
-                    else:
-                        st.button("📁 Sin Archivo Local", disabled=True, use_container_width=True, help="No hay archivo local guardado")
-                        st.info("📁 No guardado localmente")
+                            st.button("🔗 Sin URL Replicate", disabled=True, use_container_width=True, help="No hay URL de Replicate disponible")
+                            st.info("🔗 URL no disponible")
                 
-                with col2:
-                    # Botón URL Replicate
-                    if url:
-                        st.link_button("� Ver en Replicate", url, use_container_width=True)
-                        st.success("🔗 URL disponible")
+                    # Eliminar del historial (con confirmación) y cerrar
+                    confirm_key = f"confirm_delete_item_{selected_item['id']}"
+                    if st.session_state.get(confirm_key):
+                        st.warning("⚠️ ¿Eliminar este item del historial?")
+                        col_yes, col_no = st.columns(2)
+                        with col_yes:
+                            if st.button("✅ Sí, eliminar", key="confirm_delete_item", use_container_width=True, type="primary"):
+                                if delete_history_item(selected_item['id']):
+                                    st.session_state.selected_item_id = None
+                                else:
+                                    st.error("❌ No se pudo eliminar el item")
+                                st.session_state.pop(confirm_key, None)
+                                st.rerun()
+                        with col_no:
+                            if st.button("❌ Cancelar", key="cancel_delete_item", use_container_width=True):
+                                st.session_state.pop(confirm_key, None)
+                                st.rerun()
                     else:
-                        st.button("🔗 Sin URL Replicate", disabled=True, use_container_width=True, help="No hay URL de Replicate disponible")
-                        st.info("🔗 URL no disponible")
-                
-                # Botón de cerrar compacto
-                if st.button("✅ Cerrar", key="close_bottom", use_container_width=True, type="primary"):
-                    st.session_state.selected_item_index = None
-                    st.rerun()
+                        col_close, col_delete = st.columns([3, 1])
+                        with col_close:
+                            if st.button("✅ Cerrar", key="close_bottom", use_container_width=True, type="primary"):
+                                st.session_state.selected_item_id = None
+                                st.rerun()
+                        with col_delete:
+                            if st.button("🗑️ Eliminar", key="delete_item", use_container_width=True):
+                                st.session_state[confirm_key] = True
+                                st.rerun()
             
-            # Mostrar el popup
-            show_item_details()
+                # Mostrar el popup
+                show_item_details()
     
-    else:
-        st.info("📝 No hay contenido en la biblioteca aún. ¡Genera tu primer contenido en el Generador!")
+        else:
+            st.info("📝 No hay contenido en la biblioteca aún. ¡Genera tu primer contenido en el Generador!")
         
-        if st.button("🚀 Ir al Generador"):
-            st.session_state.current_page = 'generator'
-            st.rerun()
+            if st.button("🚀 Ir al Generador"):
+                st.session_state.current_page = 'generator'
+                st.rerun()
 
     # Verificar si se debe mostrar el modal de configuración (en la biblioteca)
     if st.session_state.get('show_config_modal', False):
-        show_config_modal()
+        with profile_section("Modal configuración"):
+            show_config_modal()
 
 # Verificar qué modal mostrar
 if st.session_state.get('show_restart_modal', False):
@@ -3013,18 +2797,26 @@ def show_config_modal():
             st.markdown("""
             **El backup incluirá:**
             - 📊 Estadísticas de generación (`generation_stats.json`)
-            - 📋 Historial de contenido (`history.json`)
+            - 📋 Historial de contenido (`history.jsonl`)
             - 🖼️ Imágenes y videos generados
-            - 📄 Metadatos del backup
+            - 📄 Metadatos y manifiesto del backup
+            
+            El backup **incremental** solo añade los archivos nuevos o modificados
+            desde el último backup (necesita los anteriores para restaurarse).
             """)
         
         with col2:
+            backup_mode = st.radio("Tipo de backup", ["Incremental", "Completo"],
+                                   key="backup_mode", horizontal=True)
+            backup_parallel_hashing = st.checkbox("⚡ Hashes en paralelo", value=True, key="backup_parallel_hashing",
+                                          help="Calcula los SHA-256 del manifiesto en varios hilos mientras se escribe el ZIP")
             if st.button("💾 Crear Backup", 
                          type="primary", 
                          use_container_width=True,
                          key="create_backup_btn"):
                 with st.spinner("Creando backup..."):
-                    success, message, backup_path = create_backup()
+                    success, message, backup_path = create_backup(incremental=backup_mode == "Incremental",
+                                                                   parallel_hashing=backup_parallel_hashing)
                     if success:
                         st.success(f"✅ {message}")
                         if backup_path:
@@ -3037,6 +2829,10 @@ def show_config_modal():
         # Sección de backups disponibles
         st.subheader("📂 Backups Disponibles")
         
+        st.checkbox("🛡️ Copia rápida de los datos actuales antes de restaurar", value=True,
+                    key="restore_safety_snapshot",
+                    help="Enlaza los archivos actuales en backups/safety_snapshot_* en lugar de crear otro ZIP")
+        
         backups = list_available_backups()
         
         if backups:
@@ -3051,10 +2847,27 @@ def show_config_modal():
                         if backup['metadata']:
                             metadata = backup['metadata']
                             files_info = metadata.get('files_included', {})
+                            if metadata.get('backup_type') == 'incremental':
+                                st.write(f"**🧩 Incremental** sobre `{metadata.get('parent')}` "
+                                         f"({len(metadata.get('chain', [])) - 1} en la cadena)")
+                            else:
+                                st.write("**📦 Completo**")
                             st.write(f"**📁 Archivos incluidos:**")
                             st.write(f"- Stats: {'✅' if files_info.get('generation_stats') else '❌'}")
                             st.write(f"- Historial: {'✅' if files_info.get('history_json') else '❌'}")
-                            st.write(f"- Media: {files_info.get('media_files', 0)} archivos")
+                            if 'media_files_added' in files_info:
+                                st.write(f"- Media: {files_info['media_files_added']} nuevos de "
+                                         f"{files_info.get('media_files', 0)} archivos")
+                            else:
+                                st.write(f"- Media: {files_info.get('media_files', 0)} archivos")
+                            if metadata.get('stats'):
+                                st.write(f"**⏱️ Creación:** {metadata['stats']['seconds']} s "
+                                         f"({metadata['stats']['throughput_mb_s']} MB/s)")
+                        
+                        verification = backup.get('verification')
+                        if verification:
+                            status = "✅ Íntegro" if verification['ok'] else f"❌ {verification['errors']} errores"
+                            st.write(f"**🔍 Verificado:** {status} ({verification['checked_at']})")
                     
                     with col2:
                         if st.button("🔄 Restaurar", 
@@ -3062,14 +2875,28 @@ def show_config_modal():
                                    type="secondary",
                                    use_container_width=True,
                                    help="Restaurar este backup"):
-                            with st.spinner("Restaurando backup..."):
-                                success, message = restore_backup(backup['full_path'])
-                                if success:
-                                    st.success(f"✅ {message}")
-                                    st.balloons()
-                                    st.info("🔄 Reinicia la aplicación para ver los cambios")
-                                else:
-                                    st.error(f"❌ {message}")
+                            success, message = restore_backup_with_progress(backup['full_path'])
+                            if success:
+                                st.success(f"✅ {message}")
+                                st.balloons()
+                                st.info("🔄 Reinicia la aplicación para ver los cambios")
+                            else:
+                                st.error(f"❌ {message}")
+                        
+                        if st.button("🔍 Verificar",
+                                   key=f"verify_{i}",
+                                   type="secondary",
+                                   use_container_width=True,
+                                   help="Comprobar CRC y SHA-256 de todos los archivos"):
+                            result = verify_backup_with_progress(backup['full_path'])
+                            summary = (f"{result['files']} archivos, {result['bytes'] / (1024 * 1024):.1f} MB "
+                                       f"en {result['seconds']} s ({result['throughput_mb_s']} MB/s)")
+                            if result['ok']:
+                                st.success(f"✅ Backup íntegro: {summary}")
+                            else:
+                                st.error(f"❌ Backup dañado: {summary}")
+                                for error in result['errors'][:10]:
+                                    st.write(f"- {error}")
                     
                     with col3:
                         # Usar una clave única para este backup específico
@@ -3151,11 +2978,10 @@ def show_config_modal():
                     temp_path = Path(f"temp_{uploaded_file.name}")
                     try:
                         with open(temp_path, "wb") as f:
-                            f.write(uploaded_file.getvalue())
+                            shutil.copyfileobj(uploaded_file, f, 1024 * 1024)
+                        
+                        success, message = restore_backup_with_progress(str(temp_path))
                         
-                        with st.spinner("Restaurando desde archivo..."):
-                            success, message = restore_backup(str(temp_path))
-                            
                         # Limpiar archivo temporal
                         temp_path.unlink()
                         
@@ -3171,10 +2997,30 @@ def show_config_modal():
                             temp_path.unlink()
                         st.error(f"❌ Error al procesar archivo: {str(e)}")
         
+        # Copias rápidas previas a cada restauración: deshacer una restauración
+        snapshots = list_safety_snapshots()
+        if snapshots:
+            st.subheader("🛡️ Copias previas a restaurar")
+            for i, snapshot in enumerate(snapshots):
+                col_info, col_button = st.columns([3, 1])
+                with col_info:
+                    st.write(f"**{snapshot['name']}** · {snapshot['created']} · "
+                             f"{snapshot['files']} archivos ({snapshot['size_mb']} MB)")
+                with col_button:
+                    if st.button("↩️ Volver a esta copia", key=f"restore_snapshot_{i}", use_container_width=True,
+                                 help="Deshacer la restauración que creó esta copia"):
+                        success, message = restore_backup_with_progress(snapshot['full_path'])
+                        if success:
+                            st.success(f"✅ {message}")
+                            st.info("🔄 Reinicia la aplicación para ver los cambios")
+                        else:
+                            st.error(f"❌ {message}")
+        
         # Información de seguridad
         st.info("""
         ⚠️ **Importante:** 
-        - Se crea automáticamente un backup de seguridad antes de restaurar
+        - Antes de restaurar se guarda una copia rápida de los datos actuales (`backups/safety_snapshot_*`)
+        - Los archivos que ya tienes sin cambios no se vuelven a escribir
         - Los backups incluyen todos tus datos importantes
         - Reinicia la aplicación después de restaurar para ver los cambios
         """)
@@ -3322,3 +3168,8 @@ if st.session_state.get('show_stop_modal', False):
 if st.session_state.get('show_shutdown_modal', False):
     show_shutdown_modal()
     st.session_state.show_shutdown_modal = False
+
+# Panel de perfilado (al final, para que el rerun medido esté completo)
+if st.session_state.get('profiling_enabled', False) and 'rerun_profiler' in st.session_state:
+    st.session_state.rerun_profiler.end_rerun()
+    render_profiling_panel(st.session_state.rerun_profiler)
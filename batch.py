@@ -0,0 +1,363 @@
+#!/usr/bin/env python3
+"""
+Generación por lotes: varios prompts x una rejilla de parámetros
+
+Cada combinación se ejecuta con run_generation() en un pool de hilos con un
+límite de concurrencia y un límite de ritmo por modelo. Los resultados se
+guardan en el historial a medida que terminan y al final se devuelve un
+resumen con rendimiento y costo.
+
+Uso:
+    python batch.py --model flux-pro --prompt "molar con caries" --prompt "implante dental" \\
+        --grid width=1024,1440 --grid steps=25,50
+    python batch.py --model flux-pro --template "ilustración de {variacion}, estilo médico" \\
+        --variation "un molar" --variation "una encía" --param output_format=png
+    python batch.py --model ssd-1b --prompts-file prompts.txt --concurrency 4 --dry-run
+"""
+
+import argparse
+import itertools
+import json
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from generation import run_generation
+
+
+# ===============================
+# CONFIGURACIÓN
+# ===============================
+
+# Generaciones simultáneas por defecto dentro de un lote
+DEFAULT_CONCURRENCY = 3
+MAX_CONCURRENCY = 10
+
+# Generaciones iniciadas por minuto como máximo, por modelo
+MODEL_RATE_LIMITS = {
+    "Flux Pro": 30,
+    "Kandinsky": 30,
+    "SSD-1B": 60,
+    "Seedance": 6,
+    "Pixverse": 6,
+    "VEO 3 Fast": 6,
+}
+DEFAULT_RATE_LIMIT = 10
+
+# Marcador de las plantillas de lote
+VARIATION_PLACEHOLDER = "{variacion}"
+
+# Opciones del selector de la app, por nombre corto para la línea de comandos
+CONTENT_TYPES = {
+    "flux-pro": "🖼️ Imagen (Flux Pro)",
+    "kandinsky": "🎨 Imagen (Kandinsky 2.2)",
+    "ssd-1b": "⚡ Imagen (SSD-1B)",
+    "seedance": "🎬 Video (Seedance)",
+    "pixverse": "🎭 Video Anime (Pixverse)",
+    "veo3": "🚀 Video (VEO 3 Fast)",
+}
+
+
+# ===============================
+# LÍMITE DE RITMO
+# ===============================
+
+class RateLimiter:
+    """
+    Espaciado mínimo entre inicios de generación, seguro entre hilos
+
+    Cada acquire() reserva el siguiente hueco libre y espera hasta él fuera
+    del lock, así varios hilos pueden esperar a la vez sin bloquearse.
+    """
+
+    def __init__(self, per_minute: float):
+        self.interval = 60.0 / per_minute if per_minute and per_minute > 0 else 0.0
+        self._lock = threading.Lock()
+        self._next_slot = 0.0
+
+    def acquire(self) -> None:
+        """Esperar hasta el siguiente hueco disponible"""
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+_rate_limiters: Dict[str, RateLimiter] = {}
+_rate_limiters_lock = threading.Lock()
+
+
+def get_rate_limit(content_type: str) -> float:
+    """Generaciones por minuto permitidas para un tipo de contenido"""
+    for model, per_minute in MODEL_RATE_LIMITS.items():
+        if model in content_type:
+            return per_minute
+    return DEFAULT_RATE_LIMIT
+
+
+def get_rate_limiter(content_type: str, per_minute: Optional[float] = None) -> RateLimiter:
+    """
+    Limitador compartido del proceso para un tipo de contenido
+
+    Los lotes simultáneos del mismo modelo (p. ej. dos lotes lanzados desde la
+    app) comparten el limitador. Si se pasa per_minute distinto del actual se
+    sustituye.
+    """
+    per_minute = per_minute or get_rate_limit(content_type)
+    with _rate_limiters_lock:
+        limiter = _rate_limiters.get(content_type)
+        if limiter is None or limiter.interval != 60.0 / per_minute:
+            limiter = _rate_limiters[content_type] = RateLimiter(per_minute)
+        return limiter
+
+
+# ===============================
+# PLANIFICACIÓN
+# ===============================
+
+def parse_param_value(text: str) -> Any:
+    """Convertir un valor de texto a número/booleano si es JSON válido ("25" -> 25, "true" -> True)"""
+    text = text.strip()
+    try:
+        return json.loads(text)
+    except ValueError:
+        return text
+
+
+def parse_grid_values(text: str) -> List[Any]:
+    """
+    Valores de un eje de la rejilla separados por comas
+
+    Ejemplo: "1024, 1440" -> [1024, 1440]; "webp,png" -> ["webp", "png"]
+    """
+    return [parse_param_value(value) for value in text.split(",") if value.strip()]
+
+
+def build_prompts(template: str, variations: Iterable[str]) -> List[str]:
+    """
+    Prompts a partir de una plantilla y sus variaciones
+
+    Si la plantilla contiene {variacion} se sustituye; si no, la variación se
+    añade al final separada por una coma.
+    """
+    prompts = []
+    for variation in variations:
+        variation = variation.strip()
+        if not variation:
+            continue
+        if VARIATION_PLACEHOLDER in template:
+            prompts.append(template.replace(VARIATION_PLACEHOLDER, variation))
+        else:
+            prompts.append(f"{template.rstrip().rstrip(',')}, {variation}")
+    return prompts
+
+
+def expand_grid(grid: Optional[Dict[str, List[Any]]]) -> List[Dict[str, Any]]:
+    """
+    Producto cartesiano de la rejilla de parámetros
+
+    Ejemplo: {"width": [1024, 1440], "steps": [25, 50]} -> 4 combinaciones.
+    Una rejilla vacía produce una única combinación vacía.
+    """
+    grid = {name: values for name, values in (grid or {}).items() if values}
+    names = list(grid)
+    return [dict(zip(names, combo)) for combo in itertools.product(*(grid[name] for name in names))]
+
+
+def plan_batch(prompts: Iterable[str], base_params: Optional[Dict[str, Any]] = None,
+               grid: Optional[Dict[str, List[Any]]] = None) -> List[Dict[str, Any]]:
+    """
+    Lista de tareas del lote: cada prompt con cada combinación de la rejilla
+
+    Returns:
+        List[Dict]: Tareas con 'prompt' y 'params' (base_params + combinación)
+    """
+    combos = expand_grid(grid)
+    return [
+        {"prompt": prompt, "params": {**(base_params or {}), **combo}}
+        for prompt in prompts if prompt.strip()
+        for combo in combos
+    ]
+
+
+# ===============================
+# EJECUCIÓN
+# ===============================
+
+def run_batch(job: Optional[Any], content_type: str, tasks: List[Dict[str, Any]], template: str = "",
+              concurrency: int = DEFAULT_CONCURRENCY, rate_limit: Optional[float] = None,
+              timeout: int = 300,
+              on_result: Optional[Callable[[Dict[str, Any]], None]] = None) -> Dict[str, Any]:
+    """
+    Ejecutar un lote de generaciones
+
+    Cada tarea pasa por run_generation(), que la guarda en el historial en
+    cuanto termina. Los fallos no detienen el resto del lote.
+
+    Args:
+        job: JobHandle para publicar el progreso (o None)
+        content_type: Opción del selector de la app
+        tasks: Tareas de plan_batch()
+        template: Plantilla usada (se guarda en el historial)
+        concurrency: Generaciones simultáneas
+        rate_limit: Generaciones iniciadas por minuto (por defecto MODEL_RATE_LIMITS)
+        timeout: Segundos máximos de espera de cada predicción
+        on_result: Callback con el resultado de cada tarea al terminar
+
+    Returns:
+        Dict: Resumen con total, exitosas, fallidas, duración, rendimiento y costo
+    """
+    concurrency = max(1, min(int(concurrency), MAX_CONCURRENCY))
+    limiter = get_rate_limiter(content_type, rate_limit)
+    start_time = time.monotonic()
+
+    def run_task(task: Dict[str, Any]) -> Dict[str, Any]:
+        limiter.acquire()
+        task_start = time.monotonic()
+        result = run_generation(None, content_type, task["prompt"], task["params"], template, timeout)
+        result["duracion"] = round(time.monotonic() - task_start, 1)
+        return result
+
+    results = []
+    if job is not None:
+        job.update(0.0, f"0/{len(tasks)} completadas")
+
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="batch") as pool:
+        futures = {pool.submit(run_task, task): task for task in tasks}
+        for future in as_completed(futures):
+            task = futures[future]
+            try:
+                result = {**task, **future.result(), "ok": True}
+            except Exception as e:
+                result = {**task, "ok": False, "error": f"{type(e).__name__}: {e}"}
+            results.append(result)
+
+            if on_result:
+                on_result(result)
+            if job is not None:
+                failed = sum(1 for r in results if not r["ok"])
+                job.update(len(results) / len(tasks),
+                           f"{len(results)}/{len(tasks)} completadas" + (f" ({failed} fallidas)" if failed else ""))
+
+    return summarize_batch(results, time.monotonic() - start_time)
+
+
+def summarize_batch(results: List[Dict[str, Any]], elapsed: float) -> Dict[str, Any]:
+    """
+    Resumen de un lote terminado
+
+    Args:
+        results: Resultados de las tareas (con 'ok', 'costo', 'duracion', 'error')
+        elapsed: Duración total del lote en segundos
+
+    Returns:
+        Dict: total, exitosas, fallidas, duracion, por_minuto, costo_total,
+        costo_medio, latencia_media y errores
+    """
+    succeeded = [r for r in results if r.get("ok")]
+    total_cost = round(sum(r.get("costo") or 0.0 for r in succeeded), 3)
+    return {
+        "total": len(results),
+        "exitosas": len(succeeded),
+        "fallidas": len(results) - len(succeeded),
+        "duracion": round(elapsed, 1),
+        "por_minuto": round(len(succeeded) / elapsed * 60, 2) if elapsed > 0 else 0.0,
+        "costo_total": total_cost,
+        "costo_medio": round(total_cost / len(succeeded), 3) if succeeded else 0.0,
+        "latencia_media": round(sum(r.get("duracion") or 0.0 for r in succeeded) / len(succeeded), 1)
+        if succeeded else 0.0,
+        "errores": [{"prompt": r["prompt"], "params": r["params"], "error": r["error"]}
+                    for r in results if not r.get("ok")],
+    }
+
+
+def format_batch_summary(summary: Dict[str, Any]) -> str:
+    """Resumen de un lote en una línea legible"""
+    return (f"{summary['exitosas']}/{summary['total']} generadas en {summary['duracion']:.0f}s "
+            f"({summary['por_minuto']:.1f}/min) · ${summary['costo_total']:.3f} USD")
+
+
+# ===============================
+# LÍNEA DE COMANDOS
+# ===============================
+
+def _parse_assignment(text: str) -> tuple:
+    """Dividir "nombre=valor" de --param y --grid"""
+    name, sep, value = text.partition("=")
+    if not sep or not name.strip():
+        raise argparse.ArgumentTypeError(f"Se esperaba nombre=valor: {text!r}")
+    return name.strip(), value
+
+
+def build_parser() -> argparse.ArgumentParser:
+    """Construir el parser de la línea de comandos"""
+    parser = argparse.ArgumentParser(description="Generación por lotes de AI Models Pro Generator")
+    parser.add_argument("--model", required=True, choices=sorted(CONTENT_TYPES), help="Modelo a usar")
+
+    prompts = parser.add_argument_group("prompts")
+    prompts.add_argument("--prompt", action="append", default=[], help="Prompt (repetible)")
+    prompts.add_argument("--prompts-file", help="Archivo con un prompt por línea")
+    prompts.add_argument("--template", help=f"Plantilla; {VARIATION_PLACEHOLDER} se sustituye por cada --variation")
+    prompts.add_argument("--variation", action="append", default=[], help="Variación de la plantilla (repetible)")
+
+    parser.add_argument("--param", action="append", default=[], type=_parse_assignment, metavar="NOMBRE=VALOR",
+                        help="Parámetro fijo del modelo (repetible)")
+    parser.add_argument("--grid", action="append", default=[], type=_parse_assignment, metavar="NOMBRE=V1,V2",
+                        help="Eje de la rejilla de parámetros (repetible)")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY, help="Generaciones simultáneas")
+    parser.add_argument("--rate-limit", type=float, help="Generaciones por minuto (por defecto, según el modelo)")
+    parser.add_argument("--timeout", type=int, default=300, help="Segundos máximos por generación")
+    parser.add_argument("--dry-run", action="store_true", help="Mostrar el plan sin generar")
+    return parser
+
+
+def main(argv=None):
+    """Función principal"""
+    args = build_parser().parse_args(argv)
+    content_type = CONTENT_TYPES[args.model]
+
+    prompts = list(args.prompt)
+    if args.prompts_file:
+        with open(args.prompts_file, 'r', encoding='utf-8') as f:
+            prompts.extend(line.strip() for line in f if line.strip())
+    if args.template:
+        prompts.extend(build_prompts(args.template, args.variation) if args.variation else [args.template])
+
+    base_params = {name: parse_param_value(value) for name, value in args.param}
+    grid = {name: parse_grid_values(values) for name, values in args.grid}
+    tasks = plan_batch(prompts, base_params, grid)
+    if not tasks:
+        print("❌ No hay prompts: usa --prompt, --prompts-file o --template")
+        sys.exit(1)
+
+    rate_limit = args.rate_limit or get_rate_limit(content_type)
+    print(f"📋 {len(tasks)} generaciones con {content_type} "
+          f"(concurrencia {args.concurrency}, máx. {rate_limit:g}/min)")
+    if args.dry_run:
+        for task in tasks:
+            print(f"  • {task['prompt'][:60]} {json.dumps(task['params'], ensure_ascii=False)}")
+        return
+
+    def show_result(result):
+        if result["ok"]:
+            print(f"✅ {result['prompt'][:50]} → {result.get('archivo_local') or result['url']} "
+                  f"({result['duracion']}s, ${result['costo']:.3f})")
+        else:
+            print(f"❌ {result['prompt'][:50]}: {result['error']}")
+
+    summary = run_batch(None, content_type, tasks, template=args.template or "Lote",
+                        concurrency=args.concurrency, rate_limit=rate_limit,
+                        timeout=args.timeout, on_result=show_result)
+
+    print(f"\n📊 {format_batch_summary(summary)}")
+    print(f"   Coste medio ${summary['costo_medio']:.3f} · latencia media {summary['latencia_media']}s")
+    if summary["fallidas"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+Benchmark: cálculo de costos item a item vs calculate_costs() vectorizado
+
+Uso:
+    python benchmarks/bench_costs.py
+    python benchmarks/bench_costs.py --sizes 10000 100000 1000000
+"""
+import argparse
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from utils import calculate_item_cost, calculate_costs, _stamp_item_cost  # noqa: E402
+
+
+def make_history(size: int, seed: int = 42):
+    """Historial sintético con la mezcla de modelos y parámetros de la app"""
+    rng = random.Random(seed)
+    templates = [
+        lambda: {'tipo': 'imagen', 'modelo': 'flux_pro', 'archivo_local': 'flux_pro_1.webp', 'parametros': {}},
+        lambda: {'tipo': 'imagen', 'modelo': 'kandinsky', 'archivo_local': 'kandinsky_1.png',
+                 'parametros': {'num_inference_steps': rng.randint(10, 50)}},
+        lambda: {'tipo': 'imagen', 'modelo': 'SSD-1B', 'archivo_local': 'ssd_1.png',
+                 'processing_time': rng.uniform(3, 9), 'parametros': {}},
+        lambda: {'tipo': 'video', 'modelo': 'Seedance', 'archivo_local': 'seedance_1.mp4',
+                 'parametros': {'duration': rng.choice([5, 10])}},
+        lambda: {'tipo': 'video', 'modelo': 'Pixverse', 'archivo_local': 'pixverse_1.mp4',
+                 'parametros': {'duration': rng.choice(['5s', '8s']),
+                                'resolution': rng.choice(['540p', '720p', '1080p'])}},
+        lambda: {'tipo': 'video', 'modelo': 'VEO 3 Fast', 'archivo_local': 'veo3_1.mp4',
+                 'parametros': {'duration': rng.choice([4, 6, 8])}},
+    ]
+    return [rng.choice(templates)() for _ in range(size)]
+
+
+def main():
+    """Función principal"""
+    parser = argparse.ArgumentParser(description="Benchmark del cálculo de costos")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    args = parser.parse_args()
+
+    print(f"{'items':>10} {'escalar (s)':>12} {'vectorizado (s)':>16} {'speedup':>8} {'con costo guardado (s)':>23}")
+    for size in args.sizes:
+        history = make_history(size)
+
+        start = time.perf_counter()
+        scalar = [calculate_item_cost(item)[0] for item in history]
+        scalar_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        vector = calculate_costs(history)
+        vector_time = time.perf_counter() - start
+
+        # Items sellados por save_to_history: no se recalcula nada
+        stamped = [_stamp_item_cost(dict(item)) for item in history]
+        start = time.perf_counter()
+        stored = calculate_costs(stamped)
+        stored_time = time.perf_counter() - start
+
+        if vector.tolist() != scalar or stored.tolist() != scalar:
+            print(f"❌ Resultados distintos con {size} items")
+            sys.exit(1)
+
+        print(f"{size:>10} {scalar_time:>12.3f} {vector_time:>16.3f} {scalar_time / vector_time:>7.1f}x "
+              f"{stored_time:>23.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""
+Gestor de descargas concurrentes de los resultados generados
+
+Descarga varios archivos a la vez (salidas múltiples de una predicción,
+resultados de un lote) sobre la sesión HTTP compartida de utils, con un
+máximo de transferencias simultáneas en total y otro por host para no
+saturar el CDN de Replicate ni la conexión local.
+"""
+
+import contextvars
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, List, Optional, Sequence, Tuple
+from urllib.parse import urlsplit
+
+from utils import download_and_save_file
+
+
+# ===============================
+# CONFIGURACIÓN
+# ===============================
+
+# Transferencias simultáneas en total y por host
+MAX_PARALLEL_DOWNLOADS = 4
+MAX_DOWNLOADS_PER_HOST = 2
+
+
+# ===============================
+# GESTOR DE DESCARGAS
+# ===============================
+
+class DownloadManager:
+    """
+    Descargas concurrentes con límite global y por host
+
+    download() bloquea hasta terminar (para código que ya corre en su propio
+    hilo, como run_generation); submit() y download_many() reparten las
+    descargas en el pool del gestor. En ambos casos se respetan los límites.
+    """
+
+    def __init__(self, max_parallel: int = MAX_PARALLEL_DOWNLOADS, per_host: int = MAX_DOWNLOADS_PER_HOST):
+        self.max_parallel = max_parallel
+        self.per_host = per_host
+        self._slots = threading.BoundedSemaphore(max_parallel)
+        self._host_slots: Dict[str, threading.BoundedSemaphore] = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_parallel, thread_name_prefix="download")
+
+    def _host_semaphore(self, url: str) -> threading.BoundedSemaphore:
+        host = urlsplit(url).netloc.lower()
+        with self._lock:
+            if host not in self._host_slots:
+                self._host_slots[host] = threading.BoundedSemaphore(self.per_host)
+            return self._host_slots[host]
+
+    def download(self, url: str, filename: str, file_type: str) -> Optional[str]:
+        """
+        Descargar un archivo esperando turno según los límites
+
+        Mismos argumentos y resultado que utils.download_and_save_file.
+        """
+        # Primero el host: una descarga esperando a un host ocupado no ocupa un hueco global
+        with self._host_semaphore(url), self._slots:
+            return download_and_save_file(url, filename, file_type)
+
+    def submit(self, url: str, filename: str, file_type: str) -> "Future[Optional[str]]":
+        """Encolar una descarga; el Future devuelve la ruta local o None"""
+        # Copiar el contexto para que la descarga siga en la traza de quien la pidió
+        return self._executor.submit(contextvars.copy_context().run, self.download, url, filename, file_type)
+
+    def download_many(self, files: Sequence[Tuple[str, str, str]]) -> List[Optional[str]]:
+        """
+        Descargar varios archivos concurrentemente
+
+        Args:
+            files: Tuplas (url, filename, file_type)
+
+        Returns:
+            List[Optional[str]]: Ruta local de cada archivo (None si falló), en el mismo orden
+        """
+        if len(files) == 1:
+            return [self.download(*files[0])]
+        futures = [self.submit(*entry) for entry in files]
+        return [future.result() for future in futures]
+
+    def shutdown(self, wait: bool = True) -> None:
+        """Detener el pool de descargas"""
+        self._executor.shutdown(wait=wait)
+
+
+_default_manager: Optional[DownloadManager] = None
+_default_manager_lock = threading.Lock()
+
+
+def get_download_manager() -> DownloadManager:
+    """Gestor compartido del proceso (los límites se aplican a todas las descargas)"""
+    global _default_manager
+    with _default_manager_lock:
+        if _default_manager is None:
+            _default_manager = DownloadManager()
+        return _default_manager
@@ -4,6 +4,8 @@ import replicate
 import requests
 from datetime import datetime
 
+from polling import poll_prediction, get_expected_latency, TIMEOUT_STATUS
+
 # Importar configuración del token
 try:
     from config import REPLICATE_API_TOKEN
@@ -56,16 +58,21 @@ print("⏳ Esperando respuesta del modelo...")
 # Temporizador
 timeout = 2400  # 40 minutos
 
-# Bucle de espera con contador en segundos
-while prediction.status not in ["succeeded", "failed", "canceled"]:
-    elapsed = int(time.time() - start_time)
+
+def mostrar_estado(prediction, elapsed):
     estado_legible = "waiting response" if prediction.status == "starting" else prediction.status
-    print(f"\r⏱ [{elapsed}s] Estado: {estado_legible}...", end="", flush=True)
-    if elapsed > timeout:
-        print("\n⛔ Tiempo de espera excedido. Abortando.")
-        break
-    time.sleep(2)
-    prediction.reload()
+    print(f"\r⏱ [{int(elapsed)}s] Estado: {estado_legible}...", end="", flush=True)
+
+
+# Espera con backoff adaptativo según la latencia histórica de Flux Pro
+estado_final = poll_prediction(
+    prediction,
+    deadline=timeout,
+    expected_latency=get_expected_latency("Flux Pro"),
+    on_update=mostrar_estado
+)
+if estado_final == TIMEOUT_STATUS:
+    print("\n⛔ Tiempo de espera excedido. Abortando.")
 
 # Resultado final
 print()  # Salto de línea después del bucle
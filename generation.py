@@ -0,0 +1,329 @@
+"""
+Generación de contenido con los modelos de Replicate
+
+Contiene las llamadas a cada modelo (usadas por app.py) y un pipeline sin
+interfaz, run_generation(), que genera, espera, descarga y guarda en el
+historial. Es el que ejecutan los trabajos en segundo plano (jobs.py).
+"""
+
+import os
+import threading
+import time
+import uuid
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+import replicate
+
+from downloads import get_download_manager
+from latency import prediction_phases
+from tracing import annotate, span, traced
+from polling import poll_prediction, get_expected_latency
+from utils import (
+    save_to_history, update_generation_stats, estimate_pixverse_units, calculate_item_cost,
+    get_media_hash
+)
+
+
+# ===============================
+# CLIENTE DE REPLICATE
+# ===============================
+
+_replicate_client: Optional[replicate.Client] = None
+_replicate_client_token: Optional[str] = None
+_replicate_client_lock = threading.Lock()
+
+
+def get_replicate_client() -> replicate.Client:
+    """
+    Cliente de Replicate compartido del proceso
+
+    Reutiliza el pool de conexiones HTTP entre generaciones (antes se creaba
+    un cliente por llamada). Se vuelve a crear si cambia REPLICATE_API_TOKEN,
+    p. ej. tras configurar el token desde la app.
+    """
+    global _replicate_client, _replicate_client_token
+    token = os.environ.get("REPLICATE_API_TOKEN")
+    with _replicate_client_lock:
+        if _replicate_client is None or token != _replicate_client_token:
+            _replicate_client = replicate.Client(api_token=token)
+            _replicate_client_token = token
+        return _replicate_client
+
+
+# ===============================
+# LLAMADAS A LOS MODELOS
+# ===============================
+
+# Función para generar imagen
+@traced("submit", modelo="flux_pro")
+def generate_image(prompt, **params):
+    client = get_replicate_client()
+    
+    prediction = client.predictions.create(
+        version="black-forest-labs/flux-pro",
+        input={
+            "prompt": prompt,
+            **params
+        }
+    )
+    
+    return prediction
+
+# Función para generar video con Seedance
+@traced("run", modelo="seedance")
+def generate_video_seedance(prompt, **params):
+    output = get_replicate_client().run(
+        "bytedance/seedance-1-pro",
+        input={
+            "prompt": prompt,
+            **params
+        }
+    )
+    return output
+
+# Función para generar video anime con Pixverse
+@traced("run", modelo="pixverse")
+def generate_video_pixverse(prompt, **params):
+    output = get_replicate_client().run(
+        "pixverse/pixverse-v3.5",
+        input={
+            "prompt": prompt,
+            **params
+        }
+    )
+    return output
+
+
+
+# Función para generar imágenes con Kandinsky 2.2
+@traced("submit", modelo="kandinsky")
+def generate_kandinsky(prompt, **params):
+    client = get_replicate_client()
+    
+    prediction = client.predictions.create(
+        version="ai-forever/kandinsky-2.2:ad9d7879fbffa2874e1d909d1d37d9bc682889cc65b31f7bb00d2362619f194a",
+        input={
+            "prompt": prompt,
+            **params
+        }
+    )
+    
+    return prediction
+
+# Función para generar con SSD-1B (LucaTaco)
+@traced("run", modelo="ssd_1b")
+def generate_ssd1b(prompt, **params):
+    """
+    Genera imágenes usando el modelo SSD-1B de lucataco
+    """
+    output = get_replicate_client().run(
+        "lucataco/ssd-1b:b19e3639452c59ce8295b82aba70a231404cb062f2eb580ea894b31e8ce5bbb6",
+        input={
+            "prompt": prompt,
+            **params
+        }
+    )
+    return output
+
+# Función para generar video con VEO 3 Fast
+@traced("run", modelo="veo3")
+def generate_video_veo3(prompt, **params):
+    """
+    Genera videos usando el modelo VEO 3 Fast de Google
+    """
+    output = get_replicate_client().run(
+        "google/veo-3-fast",
+        input={
+            "prompt": prompt,
+            **params
+        }
+    )
+    return output
+
+
+# ===============================
+# PIPELINE SIN INTERFAZ
+# ===============================
+
+def extract_output_urls(output: Any) -> List[str]:
+    """
+    Obtener las URLs de todos los resultados de un modelo
+
+    Args:
+        output: Lista, FileOutput (con .url) o URL directa
+
+    Returns:
+        List[str]: URL de cada resultado
+    """
+    outputs = output if isinstance(output, list) else [output]
+    return [item.url if hasattr(item, 'url') else str(item) for item in outputs]
+
+
+def extract_output_url(output: Any) -> str:
+    """
+    Obtener la URL del resultado de un modelo
+
+    Args:
+        output: Lista, FileOutput (con .url) o URL directa
+
+    Returns:
+        str: URL del primer resultado
+    """
+    return extract_output_urls(output)[0]
+
+
+def _unique_filename(prefix: str, ext: str) -> str:
+    """Nombre {prefijo}_{YYYYMMDD_HHMMSS}_{sufijo}.{ext}, sin colisiones entre generaciones paralelas"""
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    return f"{prefix}_{timestamp}_{uuid.uuid4().hex[:6]}.{ext}"
+
+
+def run_generation(job: Optional[Any], content_type: str, prompt: str, params: Dict[str, Any],
+                   template: str = "", timeout: int = 300) -> Dict[str, Any]:
+    """
+    Generar contenido de principio a fin sin interfaz
+
+    Lanza la generación, espera el resultado (con sondeo adaptativo en Flux
+    Pro y Kandinsky), descarga el archivo, lo guarda en el historial y
+    actualiza generation_stats.json.
+
+    Args:
+        job: JobHandle para publicar el progreso (o None)
+        content_type: Opción del selector de la app (p. ej. "🎬 Video (Seedance)")
+        prompt: Prompt de la generación
+        params: Parámetros del modelo
+        template: Plantilla usada (se guarda en el historial)
+        timeout: Segundos máximos de espera de las predicciones
+
+    Returns:
+        Dict: tipo, url, archivo_local y costo (USD) del resultado
+
+    Raises:
+        RuntimeError: Si la generación falla o no devuelve resultado
+    """
+    def report(progress: float, message: str) -> None:
+        if job is not None:
+            job.update(progress, message)
+
+    with span("generacion", modelo=content_type,
+              origen="trabajo" if job is not None else "directo"):
+        start_time = time.time()
+        success = False
+        # Segundos por fase para los histogramas de latencia (ver latency.py)
+        phases: Dict[str, float] = {}
+        # Archivos y bytes descargados (métricas de descarga, ver metrics.py)
+        downloaded: List[str] = []
+        download_bytes = 0
+        history_item = {
+            "fecha": datetime.now().isoformat(),
+            "prompt": prompt,
+            "plantilla": template,
+            "parametros": params,
+        }
+
+        try:
+            if "Flux Pro" in content_type or "Kandinsky" in content_type:
+                is_flux = "Flux Pro" in content_type
+                prediction = (generate_image if is_flux else generate_kandinsky)(prompt, **params)
+                report(0.05, f"Predicción {prediction.id} creada")
+                annotate(prediction_id=prediction.id)
+
+                expected_latency = get_expected_latency(content_type)
+                status = poll_prediction(
+                    prediction, deadline=timeout, expected_latency=expected_latency,
+                    on_update=lambda p, elapsed: report(min(elapsed / (expected_latency or 120), 0.9),
+                                                        f"Estado: {p.status}")
+                )
+                if status != "succeeded" or not prediction.output:
+                    raise RuntimeError(f"La generación falló. Estado: {status}")
+                phases.update(prediction_phases(prediction))
+
+                urls = extract_output_urls(prediction.output)
+                if is_flux:
+                    filename = _unique_filename("imagen", params.get('output_format', 'webp'))
+                else:
+                    filename = _unique_filename("kandinsky", "jpg")
+                history_item.update(tipo="imagen", id_prediccion=prediction.id)
+
+            else:
+                report(0.1, "Generando...")
+                run_start = time.time()
+                if "SSD-1B" in content_type:
+                    output = generate_ssd1b(prompt, **params)
+                elif "Seedance" in content_type:
+                    output = generate_video_seedance(prompt, **params)
+                elif "Pixverse" in content_type:
+                    output = generate_video_pixverse(prompt, **params)
+                elif "VEO 3 Fast" in content_type:
+                    output = generate_video_veo3(prompt, **params)
+                else:
+                    raise ValueError(f"Tipo de contenido no soportado: {content_type}")
+
+                if not output:
+                    raise RuntimeError(f"{content_type} no devolvió output")
+                # replicate.run bloquea hasta el final: la cola va incluida en la ejecución
+                phases["ejecucion"] = time.time() - run_start
+                urls = extract_output_urls(output)
+                url = urls[0]
+
+                if "SSD-1B" in content_type:
+                    filename = _unique_filename("ssd", "jpg")
+                    history_item.update(tipo="imagen", modelo="SSD-1B", id_prediccion="N/A (output directo)")
+                elif "Seedance" in content_type:
+                    file_ext = "jpg" if url.lower().endswith(('.jpg', '.jpeg', '.png')) else "mp4"
+                    filename = _unique_filename("seedance", file_ext)
+                    history_item.update(tipo="video", modelo="seedance",
+                                        video_duration=params.get('duration', 5),
+                                        processing_time=int(time.time() - start_time))
+                elif "Pixverse" in content_type:
+                    filename = _unique_filename("pixverse", "mp4")
+                    history_item.update(tipo="video", modelo="Pixverse", id_prediccion="N/A (output directo)",
+                                        video_duration=params.get('duration', 5),
+                                        pixverse_units=estimate_pixverse_units(params.get('duration', 5),
+                                                                               params.get('quality', '720p')),
+                                        processing_time=None)
+                else:
+                    filename = _unique_filename("veo3", "mp4")
+                    history_item.update(tipo="video", modelo="VEO 3 Fast")
+
+            # Salidas múltiples (p. ej. num_outputs > 1): se descargan en paralelo
+            # y las adicionales se guardan como {nombre}_2, {nombre}_3...
+            url = urls[0]
+            stem, _, ext = filename.rpartition(".")
+            filenames = [filename] + [f"{stem}_{i}.{ext}" for i in range(2, len(urls) + 1)]
+            report(0.92, "Descargando resultado" if len(urls) == 1 else f"Descargando {len(urls)} resultados")
+            download_start = time.time()
+            local_paths = get_download_manager().download_many(
+                [(output_url, name, history_item["tipo"]) for output_url, name in zip(urls, filenames)]
+            )
+            phases["descarga"] = time.time() - download_start
+            downloaded = [path for path in local_paths if path]
+            download_bytes = sum(os.path.getsize(path) for path in downloaded if os.path.isfile(path))
+            history_item.update(url=url, archivo_local=filename if local_paths[0] else None,
+                                media_hash=get_media_hash(local_paths[0]))
+            if len(urls) > 1:
+                history_item["archivos_extra"] = [
+                    {"archivo_local": name, "url": output_url, "media_hash": get_media_hash(path)}
+                    for name, output_url, path in zip(filenames[1:], urls[1:], local_paths[1:]) if path
+                ]
+            # save_to_history no lanza: devuelve False (y su st.error no se ve desde un worker)
+            if not save_to_history(history_item):
+                raise RuntimeError("No se pudo guardar la generación en el historial")
+            success = True
+            annotate(archivos=len(urls), descargados=len(downloaded))
+
+            return {
+                "tipo": history_item["tipo"],
+                "url": url,
+                "archivo_local": history_item["archivo_local"],
+                "costo": calculate_item_cost(history_item)[0],
+            }
+        finally:
+            try:
+                update_generation_stats(content_type, time.time() - start_time, success, phases,
+                                        downloads=len(downloaded), download_bytes=download_bytes)
+            except Exception as e:
+                # Un generation_stats.json ilegible no convierte en fallo una generación
+                # ya guardada; la actualización queda pendiente para la siguiente
+                annotate(stats_error=str(e))
@@ -0,0 +1,236 @@
+"""
+Cola local de trabajos en segundo plano
+
+Las generaciones largas (videos de 40-110 s) se ejecutan en un pool de hilos
+en lugar de bloquear el rerun de Streamlit. El estado, progreso y resultado de
+cada trabajo se guarda en ``jobs/<id>.json`` para que la interfaz lo consulte
+en cada rerun (y sobreviva a recargas de la página).
+"""
+
+import json
+import os
+import tempfile
+import threading
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+
+# ===============================
+# CONFIGURACIÓN
+# ===============================
+
+JOBS_DIR = Path("jobs")
+
+# Generaciones simultáneas (cada una es sobre todo espera de red)
+MAX_WORKERS = 3
+
+# Estados de un trabajo
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+# El proceso que lo ejecutaba terminó antes de que acabara
+INTERRUPTED = "interrupted"
+
+ACTIVE_STATUSES = (QUEUED, RUNNING)
+FINISHED_STATUSES = (SUCCEEDED, FAILED, INTERRUPTED)
+
+
+def _pid_alive(pid: Any) -> bool:
+    """Comprobar si un proceso sigue en ejecución"""
+    if not isinstance(pid, int) or pid <= 0:
+        return False
+    if pid == os.getpid():
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except (PermissionError, OSError):
+        return True
+    return True
+
+
+# ===============================
+# TRABAJOS
+# ===============================
+
+class JobHandle:
+    """Acceso de un trabajo en ejecución a su propio estado"""
+
+    def __init__(self, queue: "JobQueue", job_id: str):
+        self._queue = queue
+        self.id = job_id
+
+    def update(self, progress: Optional[float] = None, message: Optional[str] = None) -> None:
+        """
+        Publicar el progreso del trabajo
+
+        Args:
+            progress: Fracción completada (0-1)
+            message: Descripción breve del paso actual
+        """
+        changes = {}
+        if progress is not None:
+            changes['progress'] = max(0.0, min(1.0, float(progress)))
+        if message is not None:
+            changes['message'] = message
+        if changes:
+            self._queue._update(self.id, **changes)
+
+
+class JobQueue:
+    """
+    Cola de trabajos con un pool de hilos y estado persistido en disco
+
+    Cada trabajo es una función ``target(job, *args, **kwargs)`` que recibe un
+    JobHandle para informar del progreso y devuelve un resultado
+    serializable a JSON.
+    """
+
+    def __init__(self, jobs_dir: Optional[Path] = None, max_workers: int = MAX_WORKERS):
+        self.jobs_dir = Path(jobs_dir or JOBS_DIR)
+        self.jobs_dir.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job")
+        self._mark_orphaned_jobs()
+
+    # --- Persistencia ---
+
+    def _job_file(self, job_id: str) -> Path:
+        return self.jobs_dir / f"{job_id}.json"
+
+    def _write(self, job: Dict[str, Any]) -> None:
+        """Guardar el estado de un trabajo de forma atómica"""
+        fd, temp_path = tempfile.mkstemp(dir=self.jobs_dir, prefix=".job_", suffix=".tmp")
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(job, f, ensure_ascii=False, indent=2, default=str)
+            os.replace(temp_path, self._job_file(job['id']))
+        except Exception:
+            if os.path.exists(temp_path):
+                os.unlink(temp_path)
+            raise
+
+    def _read(self, job_file: Path) -> Optional[Dict[str, Any]]:
+        try:
+            with open(job_file, 'r', encoding='utf-8') as f:
+                job = json.load(f)
+            return job if isinstance(job, dict) else None
+        except (OSError, ValueError):
+            return None
+
+    def _update(self, job_id: str, **changes) -> Dict[str, Any]:
+        with self._lock:
+            job = self._read(self._job_file(job_id)) or {'id': job_id}
+            job.update(changes)
+            self._write(job)
+            return job
+
+    def _mark_orphaned_jobs(self) -> None:
+        """Marcar como interrumpidos los trabajos de procesos que ya no existen"""
+        for job in self.list_jobs():
+            if job.get('status') in ACTIVE_STATUSES and not _pid_alive(job.get('pid')):
+                self._update(job['id'], status=INTERRUPTED, finished=datetime.now().isoformat(),
+                             error="El proceso terminó antes de completar el trabajo")
+
+    # --- API ---
+
+    def submit(self, target: Callable[..., Any], *args, label: str = "", kind: str = "", **kwargs) -> str:
+        """
+        Encolar un trabajo
+
+        Args:
+            target: Función a ejecutar, recibe el JobHandle como primer argumento
+            *args, **kwargs: Argumentos para target (se guardan en el estado)
+            label: Descripción para la interfaz
+            kind: Tipo de trabajo (p. ej. "generation")
+
+        Returns:
+            str: Id del trabajo
+        """
+        job_id = uuid.uuid4().hex[:12]
+        with self._lock:
+            self._write({
+                'id': job_id,
+                'kind': kind,
+                'label': label,
+                'status': QUEUED,
+                'progress': 0.0,
+                'message': "En cola",
+                'result': None,
+                'error': None,
+                'created': datetime.now().isoformat(),
+                'started': None,
+                'finished': None,
+                'pid': os.getpid(),
+            })
+        self._executor.submit(self._run, job_id, target, args, kwargs)
+        return job_id
+
+    def _run(self, job_id: str, target: Callable[..., Any], args, kwargs) -> None:
+        self._update(job_id, status=RUNNING, started=datetime.now().isoformat(), message="Iniciando")
+        try:
+            result = target(JobHandle(self, job_id), *args, **kwargs)
+        except Exception as e:
+            self._update(job_id, status=FAILED, finished=datetime.now().isoformat(),
+                         error=f"{type(e).__name__}: {e}", traceback=traceback.format_exc())
+        else:
+            self._update(job_id, status=SUCCEEDED, progress=1.0, finished=datetime.now().isoformat(),
+                         message="Completado", result=result)
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Estado actual de un trabajo (None si no existe)"""
+        return self._read(self._job_file(job_id))
+
+    def list_jobs(self, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """
+        Listar trabajos, más reciente primero
+
+        Args:
+            limit: Máximo de trabajos a devolver
+        """
+        jobs = [job for job in (self._read(f) for f in self.jobs_dir.glob("*.json")) if job]
+        jobs.sort(key=lambda job: job.get('created') or '', reverse=True)
+        return jobs[:limit] if limit else jobs
+
+    def clear_finished(self) -> int:
+        """
+        Borrar los trabajos terminados
+
+        Returns:
+            int: Número de trabajos borrados
+        """
+        removed = 0
+        with self._lock:
+            for job in self.list_jobs():
+                if job.get('status') in FINISHED_STATUSES:
+                    self._job_file(job['id']).unlink(missing_ok=True)
+                    removed += 1
+        return removed
+
+    def shutdown(self, wait: bool = True) -> None:
+        """Detener el pool (espera a los trabajos en curso si wait=True)"""
+        self._executor.shutdown(wait=wait)
+
+
+_default_queue: Optional[JobQueue] = None
+_default_queue_lock = threading.Lock()
+
+
+def get_job_queue() -> JobQueue:
+    """
+    Cola compartida del proceso
+
+    Se crea una sola vez y sobrevive a los reruns de Streamlit (el módulo
+    queda cargado), así los trabajos siguen ejecutándose entre reruns.
+    """
+    global _default_queue
+    with _default_queue_lock:
+        if _default_queue is None:
+            _default_queue = JobQueue()
+        return _default_queue
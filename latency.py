@@ -0,0 +1,329 @@
+"""
+Histogramas de latencia por modelo
+
+Sustituye el ``tiempo_promedio`` de generation_stats.json (una media por
+pares que olvida las generaciones antiguas y no dice nada de la cola) por
+histogramas con cubetas logarítmicas: cada cubeta cubre un crecimiento de
+LATENCY_BUCKET_GROWTH sobre la anterior, así que los percentiles tienen un
+error relativo acotado (~2.5%) con unas decenas de contadores por modelo.
+
+Cada generación se separa en fases (cola, ejecución, descarga y total). Se
+guarda un histograma acumulado por fase y otro por fase en franjas horarias
+de las últimas LATENCY_WINDOW_RETENTION_HOURS horas, que permiten calcular
+percentiles y rendimiento (generaciones/hora) por ventana de tiempo.
+
+Formato dentro de cada modelo de generation_stats.json::
+
+    "latencia": {"total": {"n": 3, "sum": 31.2, "min": 9.1, "max": 12.4,
+                           "b": {"139": 2, "142": 1}}, ...},
+    "ventanas": {"2025-07-17T19": {"n": 2, "ok": 2, "latencia": {...}}, ...}
+"""
+
+import math
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Mapping, Optional, Sequence
+
+
+# ===============================
+# CONFIGURACIÓN
+# ===============================
+
+# Fases de una generación (en el orden en que se muestran)
+PHASES = ("total", "cola", "ejecucion", "descarga")
+PHASE_LABELS = {
+    "total": "Total",
+    "cola": "Cola",
+    "ejecucion": "Ejecución",
+    "descarga": "Descarga",
+}
+
+# Límite inferior de la primera cubeta (segundos) y crecimiento entre cubetas
+LATENCY_MIN_VALUE = 0.01
+LATENCY_BUCKET_GROWTH = 1.05
+
+PERCENTILES = (50, 95, 99)
+
+# Franjas horarias conservadas para las ventanas de tiempo
+LATENCY_WINDOW_RETENTION_HOURS = 7 * 24
+_SLOT_FORMAT = "%Y-%m-%dT%H"
+
+# Ventanas disponibles (horas; None = todo el historial acumulado)
+WINDOWS = {
+    "1h": 1,
+    "24h": 24,
+    "7d": 7 * 24,
+    "todo": None,
+}
+WINDOW_LABELS = {
+    "1h": "Última hora",
+    "24h": "Últimas 24 h",
+    "7d": "Últimos 7 días",
+    "todo": "Todo",
+}
+
+
+# ===============================
+# HISTOGRAMA
+# ===============================
+
+class LatencyHistogram:
+    """Histograma de latencias con cubetas logarítmicas (dispersas)"""
+
+    def __init__(self) -> None:
+        self.count = 0
+        self.total = 0.0
+        self.min: Optional[float] = None
+        self.max: Optional[float] = None
+        self.buckets: Dict[int, int] = {}
+
+    @staticmethod
+    def bucket_index(value: float) -> int:
+        """Cubeta de un valor (la 0 agrupa todo lo menor que LATENCY_MIN_VALUE)"""
+        if value <= LATENCY_MIN_VALUE:
+            return 0
+        return math.ceil(math.log(value / LATENCY_MIN_VALUE) / math.log(LATENCY_BUCKET_GROWTH))
+
+    @staticmethod
+    def bucket_value(index: int) -> float:
+        """Valor representativo de una cubeta (media geométrica de sus límites)"""
+        if index <= 0:
+            return LATENCY_MIN_VALUE
+        return LATENCY_MIN_VALUE * LATENCY_BUCKET_GROWTH ** (index - 0.5)
+
+    def record(self, value: float) -> None:
+        """Añadir una latencia en segundos"""
+        value = max(float(value), 0.0)
+        index = self.bucket_index(value)
+        self.buckets[index] = self.buckets.get(index, 0) + 1
+        self.count += 1
+        self.total += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def merge(self, other: "LatencyHistogram") -> "LatencyHistogram":
+        """Sumar otro histograma a este (devuelve self)"""
+        for index, count in other.buckets.items():
+            self.buckets[index] = self.buckets.get(index, 0) + count
+        self.count += other.count
+        self.total += other.total
+        if other.min is not None:
+            self.min = other.min if self.min is None else min(self.min, other.min)
+        if other.max is not None:
+            self.max = other.max if self.max is None else max(self.max, other.max)
+        return self
+
+    def percentile(self, q: float) -> Optional[float]:
+        """
+        Percentil q (0-100) por rango más cercano
+
+        Returns:
+            Optional[float]: Segundos (acotados a min/max), o None sin datos
+        """
+        if not self.count:
+            return None
+        rank = max(1, math.ceil(q / 100 * self.count))
+        seen = 0
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if seen >= rank:
+                return min(max(self.bucket_value(index), self.min), self.max)
+        return self.max
+
+    def cumulative_counts(self, bounds: Sequence[float]) -> List[int]:
+        """
+        Muestras menores o iguales que cada límite (cubetas "le" de Prometheus)
+
+        Una cubeta cuenta para un límite cuando su límite superior no lo
+        supera, así que los valores cercanos al límite pueden contarse en
+        el siguiente (error relativo de una cubeta).
+        """
+        uppers = [(LATENCY_MIN_VALUE * LATENCY_BUCKET_GROWTH ** max(index, 0), count)
+                  for index, count in self.buckets.items()]
+        return [sum(count for upper, count in uppers if upper <= bound * (1 + 1e-9)) for bound in bounds]
+
+    @property
+    def mean(self) -> Optional[float]:
+        """Media exacta (None sin datos)"""
+        return self.total / self.count if self.count else None
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Forma compacta para JSON"""
+        return {
+            "n": self.count,
+            "sum": round(self.total, 3),
+            "min": None if self.min is None else round(self.min, 3),
+            "max": None if self.max is None else round(self.max, 3),
+            "b": {str(index): count for index, count in sorted(self.buckets.items())},
+        }
+
+    @classmethod
+    def from_dict(cls, data: Optional[Mapping[str, Any]]) -> "LatencyHistogram":
+        """Reconstruir desde to_dict (vacío si data no es válido)"""
+        histogram = cls()
+        if not isinstance(data, Mapping):
+            return histogram
+        try:
+            histogram.buckets = {int(index): int(count) for index, count in (data.get("b") or {}).items()}
+            histogram.count = int(data.get("n", sum(histogram.buckets.values())))
+            histogram.total = float(data.get("sum", 0.0))
+            histogram.min = None if data.get("min") is None else float(data["min"])
+            histogram.max = None if data.get("max") is None else float(data["max"])
+        except (AttributeError, TypeError, ValueError):
+            return cls()
+        return histogram
+
+
+# ===============================
+# REGISTRO EN generation_stats.json
+# ===============================
+
+def _slot_key(moment: datetime) -> str:
+    return moment.strftime(_SLOT_FORMAT)
+
+
+def _record_phases(latency: Dict[str, Any], phases: Mapping[str, Optional[float]]) -> None:
+    """Añadir las fases medidas a un dict {fase: histograma serializado}"""
+    for phase in PHASES:
+        value = phases.get(phase)
+        if value is None:
+            continue
+        histogram = LatencyHistogram.from_dict(latency.get(phase))
+        histogram.record(value)
+        latency[phase] = histogram.to_dict()
+
+
+def record_generation(entry: Dict[str, Any], phases: Mapping[str, Optional[float]], success: bool,
+                      now: Optional[datetime] = None) -> None:
+    """
+    Registrar una generación en la entrada de un modelo de generation_stats.json
+
+    Las latencias solo se registran para las generaciones correctas (las
+    fallidas cuentan en el total de su franja, no en los percentiles). Se
+    descartan las franjas más antiguas que la retención.
+
+    Args:
+        entry: Entrada del modelo (se modifica)
+        phases: Segundos por fase ("total" obligatorio; las demás si se midieron)
+        success: Si la generación terminó correctamente
+        now: Momento de la generación (por defecto ahora)
+    """
+    now = now or datetime.now()
+    windows = entry.setdefault("ventanas", {})
+    slot = windows.setdefault(_slot_key(now), {"n": 0, "ok": 0, "latencia": {}})
+    slot["n"] += 1
+    if success:
+        slot["ok"] += 1
+        _record_phases(slot["latencia"], phases)
+        _record_phases(entry.setdefault("latencia", {}), phases)
+
+    oldest = _slot_key(now - timedelta(hours=LATENCY_WINDOW_RETENTION_HOURS))
+    for key in [key for key in windows if key < oldest]:
+        del windows[key]
+
+
+def total_histogram(entry: Mapping[str, Any]) -> LatencyHistogram:
+    """Histograma acumulado de la latencia total de un modelo"""
+    return LatencyHistogram.from_dict((entry.get("latencia") or {}).get("total"))
+
+
+def summarize(entry: Mapping[str, Any], window: str = "todo",
+              now: Optional[datetime] = None) -> Dict[str, Any]:
+    """
+    Percentiles y rendimiento de un modelo en una ventana de tiempo
+
+    Args:
+        entry: Entrada del modelo en generation_stats.json
+        window: Clave de WINDOWS
+        now: Momento de referencia (por defecto ahora)
+
+    Returns:
+        Dict: generaciones ('n'), correctas ('ok'), 'throughput_per_hour'
+        (None en "todo") y 'phases' {fase: {n, mean, p50, p95, p99}} solo
+        con las fases que tienen datos
+    """
+    hours = WINDOWS[window]
+    if hours is None:
+        histograms = {phase: LatencyHistogram.from_dict((entry.get("latencia") or {}).get(phase))
+                      for phase in PHASES}
+        count, ok = entry.get("total", 0), entry.get("exitosas", 0)
+    else:
+        now = now or datetime.now()
+        # Franjas horarias completas más la actual
+        first = _slot_key(now - timedelta(hours=hours - 1))
+        histograms = {phase: LatencyHistogram() for phase in PHASES}
+        count = ok = 0
+        for key, slot in (entry.get("ventanas") or {}).items():
+            if key < first:
+                continue
+            count += slot.get("n", 0)
+            ok += slot.get("ok", 0)
+            for phase in PHASES:
+                histograms[phase].merge(LatencyHistogram.from_dict((slot.get("latencia") or {}).get(phase)))
+
+    phases = {}
+    for phase, histogram in histograms.items():
+        if histogram.count:
+            phases[phase] = {
+                "n": histogram.count,
+                "mean": histogram.mean,
+                **{f"p{q}": histogram.percentile(q) for q in PERCENTILES},
+            }
+    return {
+        "n": count,
+        "ok": ok,
+        "throughput_per_hour": None if hours is None else ok / hours,
+        "phases": phases,
+    }
+
+
+# ===============================
+# FASES DE UNA PREDICCIÓN
+# ===============================
+
+def _parse_timestamp(value: Any) -> Optional[datetime]:
+    if isinstance(value, datetime):
+        return value
+    if not isinstance(value, str) or not value:
+        return None
+    try:
+        return datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except ValueError:
+        return None
+
+
+def prediction_phases(prediction: Any) -> Dict[str, float]:
+    """
+    Tiempo en cola y de ejecución de una predicción de Replicate
+
+    Se calculan con created_at/started_at/completed_at; si falta started_at
+    se usa metrics.predict_time como tiempo de ejecución.
+
+    Returns:
+        Dict[str, float]: 'cola' y/o 'ejecucion' en segundos (vacío si la
+        predicción no trae marcas de tiempo)
+    """
+    created = _parse_timestamp(getattr(prediction, "created_at", None))
+    started = _parse_timestamp(getattr(prediction, "started_at", None))
+    completed = _parse_timestamp(getattr(prediction, "completed_at", None))
+
+    phases = {}
+    if created and started:
+        phases["cola"] = max((started - created).total_seconds(), 0.0)
+    if started and completed:
+        phases["ejecucion"] = max((completed - started).total_seconds(), 0.0)
+    else:
+        predict_time = (getattr(prediction, "metrics", None) or {}).get("predict_time")
+        if isinstance(predict_time, (int, float)):
+            phases["ejecucion"] = float(predict_time)
+    return phases
+
+
+def format_seconds(value: Optional[float]) -> str:
+    """Latencia legible: ms por debajo de 1 s, minutos por encima de 100 s"""
+    if value is None:
+        return "—"
+    if value < 1:
+        return f"{value * 1000:.0f} ms"
+    if value < 100:
+        return f"{value:.1f} s"
+    return f"{value / 60:.1f} min"
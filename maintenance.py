@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+"""
+Tareas de mantenimiento de los datos locales (historial, índices, rollups)
+
+Uso:
+    python maintenance.py rebuild-rollups
+    python maintenance.py rebuild-index
+    python maintenance.py rebuild-backup-catalog
+    python maintenance.py compact-history
+    python maintenance.py stamp-costs [--force]
+    python maintenance.py assign-ids
+    python maintenance.py migrate-media
+    python maintenance.py gc-media [--dry-run]
+    python maintenance.py thumbnails [--prune]
+    python maintenance.py backup [--full] [--sequential-hashing]
+    python maintenance.py verify-backup [ARCHIVO ...] [--workers N]
+    python maintenance.py restore ARCHIVO|SNAPSHOT [--no-snapshot]
+    python maintenance.py metrics [--textfile RUTA.prom | --serve [--port N] [--host H]]
+"""
+import argparse
+import sys
+from pathlib import Path
+
+import metrics
+import thumbnails
+import utils
+
+
+def cmd_rebuild_rollups(args) -> bool:
+    """Recalcular los rollups de costo desde el historial completo"""
+    if not utils.rebuild_cost_rollups():
+        print("❌ Error al reconstruir los rollups de costo")
+        return False
+
+    rollups = utils.get_cost_rollups()
+    print(f"✅ Rollups reconstruidos: {rollups['count']} generaciones, ${rollups['total_cost']:.3f} USD")
+    return True
+
+
+def cmd_rebuild_index(args) -> bool:
+    """Reconstruir el índice SQLite del historial"""
+    if not utils.rebuild_history_index():
+        print("❌ Error al reconstruir el índice del historial")
+        return False
+
+    print("✅ Índice del historial reconstruido")
+    return True
+
+
+def cmd_rebuild_backup_catalog(args) -> bool:
+    """Reconstruir el catálogo de backups leyendo cada ZIP"""
+    if not utils.rebuild_backup_catalog():
+        print("❌ Error al reconstruir el catálogo de backups")
+        return False
+
+    print(f"✅ Catálogo reconstruido: {len(utils.list_available_backups())} backups")
+    return True
+
+
+def cmd_compact_history(args) -> bool:
+    """Reescribir el log del historial descartando líneas corruptas"""
+    if not utils.compact_history():
+        print("❌ No se pudo compactar el historial")
+        return False
+
+    print("✅ Historial compactado")
+    return True
+
+
+def cmd_stamp_costs(args) -> bool:
+    """Guardar costo y modelo normalizado en los items del historial que no los tienen"""
+    updated = utils.stamp_history_costs(force=args.force)
+    if updated < 0:
+        print("❌ Error al sellar los costos del historial")
+        return False
+
+    print(f"✅ {updated} elementos actualizados (tarifas v{utils.COST_RATES_VERSION})")
+    return True
+
+
+def cmd_assign_ids(args) -> bool:
+    """Guardar el id de los items antiguos del historial que no lo tienen"""
+    updated = utils.assign_history_ids()
+    if updated < 0:
+        print("❌ Error al asignar ids al historial")
+        return False
+
+    print(f"✅ {updated} elementos con id asignado")
+    return True
+
+
+def cmd_migrate_media(args) -> bool:
+    """Mover al almacén de medios los archivos de items antiguos"""
+    updated = utils.migrate_media_to_store()
+    if updated < 0:
+        print("❌ Error al migrar los archivos al almacén de medios")
+        return False
+
+    print(f"✅ {updated} elementos apuntan ahora al almacén de medios")
+    return True
+
+
+def cmd_gc_media(args) -> bool:
+    """Borrar del almacén los archivos que ningún item del historial referencia"""
+    removed, freed = utils.gc_media_store(dry_run=args.dry_run)
+    action = "se borrarían" if args.dry_run else "borrados"
+    print(f"✅ {removed} archivos sin referencias {action} ({utils.format_file_size(freed)})")
+    return True
+
+
+def cmd_thumbnails(args) -> bool:
+    """Generar las miniaturas que falten de la Biblioteca (y borrar las huérfanas)"""
+    available = thumbnails.generate_missing_thumbnails()
+    print(f"✅ {available} elementos con miniatura")
+    if args.prune:
+        print(f"🧹 {thumbnails.prune_thumbnails()} miniaturas huérfanas borradas")
+    return True
+
+
+def cmd_backup(args) -> bool:
+    """Crear un backup (incremental sobre el último salvo --full)"""
+    success, message, _ = utils.create_backup(incremental=not args.full,
+                                              parallel_hashing=not args.sequential_hashing)
+    print(f"{'✅' if success else '❌'} {message}")
+    return success
+
+
+def cmd_verify_backup(args) -> bool:
+    """Verificar CRC y SHA-256 de los backups indicados (por defecto todos)"""
+    paths = [name if Path(name).exists() else utils.BACKUPS_DIR / name for name in args.files] or \
+        [backup['full_path'] for backup in utils.list_available_backups()]
+    if not paths:
+        print("📭 No hay backups que verificar")
+        return True
+
+    all_ok = True
+    for path in paths:
+        result = utils.verify_backup(str(path), workers=args.workers)
+        size = utils.format_file_size(result['bytes'])
+        summary = (f"{result['filename']}: {result['files']} archivos, {size} en {result['seconds']:.1f}s "
+                   f"({result['throughput_mb_s']} MB/s)")
+        if result['ok']:
+            print(f"✅ {summary}")
+        else:
+            all_ok = False
+            print(f"❌ {summary}")
+            for error in result['errors']:
+                print(f"   - {error}")
+    return all_ok
+
+
+def cmd_restore(args) -> bool:
+    """Restaurar un backup ZIP o una copia previa (safety_snapshot_*)"""
+    path = Path(args.backup)
+    if not path.exists():
+        path = utils.BACKUPS_DIR / args.backup
+    success, message = utils.restore_backup(str(path), safety_snapshot=not args.no_snapshot)
+    print(f"{'✅' if success else '❌'} {message}")
+    return success
+
+
+def cmd_metrics(args) -> bool:
+    """Mostrar, escribir (textfile collector) o servir las métricas de Prometheus"""
+    if args.serve:
+        server = metrics.make_metrics_server(args.port, args.host)
+        host, port = server.server_address[:2]
+        print(f"📈 Métricas en http://{host}:{port}{metrics.METRICS_PATH} (Ctrl+C para salir)")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+        return True
+
+    if args.textfile:
+        path = metrics.write_textfile(Path(args.textfile))
+        print(f"✅ Métricas escritas en {path}")
+        return True
+
+    print(metrics.render_metrics(), end="")
+    return True
+
+
+def build_parser() -> argparse.ArgumentParser:
+    """Construir el parser de la línea de comandos"""
+    parser = argparse.ArgumentParser(description="Mantenimiento de AI Models Pro Generator")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    subparsers.add_parser("rebuild-rollups", help="Recalcular los totales de costo del historial") \
+        .set_defaults(func=cmd_rebuild_rollups)
+    subparsers.add_parser("rebuild-index", help="Reconstruir el índice SQLite del historial") \
+        .set_defaults(func=cmd_rebuild_index)
+    subparsers.add_parser("rebuild-backup-catalog", help="Reconstruir el catálogo de backups desde los ZIP") \
+        .set_defaults(func=cmd_rebuild_backup_catalog)
+    subparsers.add_parser("compact-history", help="Compactar el log del historial") \
+        .set_defaults(func=cmd_compact_history)
+    stamp = subparsers.add_parser("stamp-costs", help="Guardar el costo calculado en cada item del historial")
+    stamp.add_argument("--force", action="store_true", help="Recalcular también los items ya sellados")
+    stamp.set_defaults(func=cmd_stamp_costs)
+    subparsers.add_parser("assign-ids", help="Guardar un id estable en los items antiguos del historial") \
+        .set_defaults(func=cmd_assign_ids)
+    subparsers.add_parser("migrate-media", help="Mover los archivos antiguos al almacén de medios") \
+        .set_defaults(func=cmd_migrate_media)
+    gc_media = subparsers.add_parser("gc-media", help="Borrar archivos del almacén sin referencias")
+    gc_media.add_argument("--dry-run", action="store_true", help="Solo mostrar lo que se borraría")
+    gc_media.set_defaults(func=cmd_gc_media)
+    thumbs = subparsers.add_parser("thumbnails", help="Generar las miniaturas de la Biblioteca")
+    thumbs.add_argument("--prune", action="store_true", help="Borrar miniaturas de archivos que ya no existen")
+    thumbs.set_defaults(func=cmd_thumbnails)
+    backup = subparsers.add_parser("backup", help="Crear un backup de los datos")
+    backup.add_argument("--full", action="store_true", help="Backup completo en lugar de incremental")
+    backup.add_argument("--sequential-hashing", action="store_true",
+                        help="Calcular los hashes en el hilo principal (la compresión siempre es secuencial)")
+    backup.set_defaults(func=cmd_backup)
+    verify = subparsers.add_parser("verify-backup", help="Verificar la integridad de los backups")
+    verify.add_argument("files", nargs="*", help="Backups a verificar (nombre o ruta; por defecto todos)")
+    verify.add_argument("--workers", type=int, default=utils.BACKUP_WORKERS, help="Hilos de verificación")
+    verify.set_defaults(func=cmd_verify_backup)
+    restore = subparsers.add_parser("restore", help="Restaurar un backup o una copia previa a restaurar")
+    restore.add_argument("backup", help="Backup ZIP o directorio safety_snapshot_* (nombre o ruta)")
+    restore.add_argument("--no-snapshot", action="store_true",
+                         help="No guardar antes una copia rápida de los datos actuales")
+    restore.set_defaults(func=cmd_restore)
+    metrics_parser = subparsers.add_parser("metrics", help="Métricas en formato de Prometheus")
+    output = metrics_parser.add_mutually_exclusive_group()
+    output.add_argument("--textfile", help="Escribir en este archivo .prom (textfile collector de node_exporter)")
+    output.add_argument("--serve", action="store_true", help="Servir /metrics por HTTP hasta Ctrl+C")
+    metrics_parser.add_argument("--port", type=int, default=metrics.METRICS_PORT or 9464, help="Puerto de --serve")
+    metrics_parser.add_argument("--host", default=metrics.METRICS_HOST, help="Dirección de --serve")
+    metrics_parser.set_defaults(func=cmd_metrics)
+
+    return parser
+
+
+def main(argv=None):
+    """Función principal"""
+    args = build_parser().parse_args(argv)
+    if not args.func(args):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,382 @@
+"""
+Métricas en formato de texto de Prometheus (sin servicios externos)
+
+Publica el estado de la app para monitorizarla en una máquina compartida:
+
+- generaciones por modelo y resultado, y su duración por fase (los
+  histogramas de latency.py pasados a cubetas "le");
+- descargas y bytes descargados por modelo (la duración de las descargas
+  es la fase "descarga" del histograma de generación);
+- costo acumulado por modelo e items y tamaño del historial;
+- tamaño del almacén de medios, del historial y de los backups;
+- backups por tipo, duración de su creación, último backup y verificaciones
+  fallidas.
+
+Todo se lee de los archivos que ya mantiene la app (generation_stats.json,
+los rollups de costo y el catálogo de backups), así que cualquier proceso
+ve los mismos valores: el endpoint de la app, otro worker o la línea de
+comandos. Dos formas de exponerlas:
+
+- endpoint HTTP local: ``AI_MODELS_METRICS_PORT=9464 streamlit run app.py``
+  (o ``python maintenance.py metrics --serve``) y http://127.0.0.1:9464/metrics;
+- textfile collector de node_exporter: ``python maintenance.py metrics
+  --textfile /ruta/ai_models.prom`` desde cron (escritura atómica).
+"""
+
+import os
+import tempfile
+import threading
+import time
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import latency
+import utils
+
+
+# ===============================
+# CONFIGURACIÓN
+# ===============================
+
+# Endpoint HTTP (puerto 0 = desactivado en la app)
+METRICS_HOST = os.environ.get("AI_MODELS_METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.environ.get("AI_MODELS_METRICS_PORT", "0") or 0)
+METRICS_PATH = "/metrics"
+METRICS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+METRIC_PREFIX = "ai_models"
+
+# Límites (segundos) de las cubetas de los histogramas
+GENERATION_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300, 600)
+BACKUP_BUCKETS = (1, 5, 10, 30, 60, 120, 300, 600, 1800)
+
+# Recorrer los directorios es lo más caro: se reutiliza el resultado unos segundos
+DIRECTORY_SCAN_TTL = 60
+
+# Una muestra: (nombre completo, etiquetas, valor)
+Sample = Tuple[str, Dict[str, str], float]
+
+_directory_cache: Dict[str, Tuple[float, int, int]] = {}
+_directory_cache_lock = threading.Lock()
+
+
+# ===============================
+# FORMATO DE TEXTO
+# ===============================
+
+class MetricFamily:
+    """Una métrica con su ayuda, tipo y muestras"""
+
+    def __init__(self, name: str, kind: str, help_text: str) -> None:
+        self.name = f"{METRIC_PREFIX}_{name}"
+        self.kind = kind
+        self.help_text = help_text
+        self.samples: List[Sample] = []
+
+    def add(self, value: float, **labels: Any) -> None:
+        """Añadir una muestra (contador o gauge)"""
+        self.samples.append((self.name, {k: str(v) for k, v in labels.items()}, value))
+
+    def add_histogram(self, bounds: Sequence[float], cumulative: Sequence[int], count: int,
+                      total: float, **labels: Any) -> None:
+        """Añadir las series _bucket, _sum y _count de un histograma"""
+        labels = {k: str(v) for k, v in labels.items()}
+        for bound, value in zip(bounds, cumulative):
+            self.samples.append((f"{self.name}_bucket", {**labels, "le": _format_value(bound)}, value))
+        self.samples.append((f"{self.name}_bucket", {**labels, "le": "+Inf"}, count))
+        self.samples.append((f"{self.name}_sum", labels, total))
+        self.samples.append((f"{self.name}_count", labels, count))
+
+    def render(self) -> str:
+        help_text = self.help_text.replace("\\", "\\\\").replace("\n", "\\n")
+        lines = [f"# HELP {self.name} {help_text}", f"# TYPE {self.name} {self.kind}"]
+        for name, labels, value in self.samples:
+            if labels:
+                label_text = ",".join(f'{key}="{_escape_label(val)}"' for key, val in labels.items())
+                lines.append(f"{name}{{{label_text}}} {_format_value(value)}")
+            else:
+                lines.append(f"{name} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+def _escape_label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _histogram_from_values(family: MetricFamily, bounds: Sequence[float], values: Sequence[float],
+                           **labels: Any) -> None:
+    """Añadir a una familia el histograma de una lista de valores"""
+    cumulative = [sum(1 for value in values if value <= bound) for bound in bounds]
+    family.add_histogram(bounds, cumulative, len(values), sum(values), **labels)
+
+
+# ===============================
+# COLECTORES
+# ===============================
+
+def _collect_generations() -> List[MetricFamily]:
+    """Generaciones, duración por fase y descargas por modelo (generation_stats.json)"""
+    generations = MetricFamily("generations_total", "counter",
+                               "Generaciones por modelo y resultado")
+    duration = MetricFamily("generation_duration_seconds", "histogram",
+                            "Duración de las generaciones correctas por modelo y fase "
+                            "(total, cola, ejecucion, descarga)")
+    downloads = MetricFamily("downloads_total", "counter", "Archivos descargados por modelo")
+    download_bytes = MetricFamily("download_bytes_total", "counter", "Bytes descargados por modelo")
+
+    for model, entry in sorted(utils.get_generation_stats().items()):
+        if not isinstance(entry, dict):
+            continue
+        total, ok = entry.get("total", 0), entry.get("exitosas", 0)
+        generations.add(ok, model=model, status="success")
+        generations.add(max(total - ok, 0), model=model, status="failure")
+
+        for phase in latency.PHASES:
+            histogram = latency.LatencyHistogram.from_dict((entry.get("latencia") or {}).get(phase))
+            if histogram.count:
+                duration.add_histogram(GENERATION_BUCKETS, histogram.cumulative_counts(GENERATION_BUCKETS),
+                                       histogram.count, histogram.total, model=model, phase=phase)
+
+        downloads.add(entry.get("descargas", 0), model=model)
+        download_bytes.add(entry.get("bytes_descargados", 0), model=model)
+
+    return [generations, duration, downloads, download_bytes]
+
+
+def _collect_costs() -> List[MetricFamily]:
+    """Costo acumulado por modelo e items del historial (rollups de costo)"""
+    rollups = utils.get_cost_rollups()
+
+    # Gauge: baja al eliminar items o restaurar un backup
+    cost = MetricFamily("cost_usd", "gauge", "Costo estimado del historial en USD por tipo y modelo")
+    for group in sorted(rollups['by_model'].values(), key=lambda g: (g['type'], g['model'])):
+        cost.add(group['total_cost'], type=group['type'], model=group['model'])
+
+    items = MetricFamily("history_items", "gauge", "Items del historial por tipo")
+    for item_type, group in sorted(rollups['by_type'].items()):
+        items.add(group['count'], type=item_type)
+
+    history_bytes = MetricFamily("history_bytes", "gauge", "Tamaño del log del historial (history.jsonl)")
+    try:
+        history_bytes.add(utils.HISTORY_FILE.stat().st_size)
+    except OSError:
+        history_bytes.add(0)
+
+    return [cost, items, history_bytes]
+
+
+def _scan_directory(directory: Path) -> Tuple[int, int]:
+    """(archivos, bytes) bajo un directorio, reutilizando el recorrido DIRECTORY_SCAN_TTL segundos"""
+    key = str(directory.resolve())
+    now = time.monotonic()
+    with _directory_cache_lock:
+        cached = _directory_cache.get(key)
+        if cached and now - cached[0] < DIRECTORY_SCAN_TTL:
+            return cached[1], cached[2]
+
+    files = size = 0
+    for root, _, names in os.walk(directory):
+        for name in names:
+            try:
+                size += os.stat(os.path.join(root, name)).st_size
+                files += 1
+            except OSError:
+                continue  # Borrado durante el recorrido
+
+    with _directory_cache_lock:
+        _directory_cache[key] = (now, files, size)
+    return files, size
+
+
+def _collect_storage() -> List[MetricFamily]:
+    """Archivos y bytes del almacén de medios, el historial y los backups"""
+    files = MetricFamily("directory_files", "gauge", "Archivos por directorio de datos")
+    size = MetricFamily("directory_bytes", "gauge", "Bytes por directorio de datos")
+
+    directories = {
+        "media": utils.HISTORY_DIR / utils.MEDIA_DIR_NAME,
+        "historial": utils.HISTORY_DIR,
+        "backups": utils.BACKUPS_DIR,
+    }
+    for name, directory in directories.items():
+        count, total = _scan_directory(directory)
+        files.add(count, directory=name)
+        size.add(total, directory=name)
+    return [files, size]
+
+
+def _collect_backups() -> List[MetricFamily]:
+    """Backups por tipo, duración de su creación, último backup y verificaciones (catálogo)"""
+    backups = utils.list_available_backups()
+
+    count = MetricFamily("backups", "gauge", "Backups disponibles por tipo")
+    duration = MetricFamily("backup_duration_seconds", "histogram", "Duración de la creación de los backups")
+    last_time = MetricFamily("backup_last_timestamp_seconds", "gauge", "Fecha del último backup (epoch)")
+    last_duration = MetricFamily("backup_last_duration_seconds", "gauge", "Duración del último backup")
+    failed = MetricFamily("backup_verification_failures", "gauge",
+                          "Backups cuya última verificación falló")
+
+    by_type: Dict[str, int] = {}
+    durations: List[float] = []
+    for backup in backups:
+        metadata = backup.get('metadata') or {}
+        backup_type = metadata.get('backup_type', 'full')
+        by_type[backup_type] = by_type.get(backup_type, 0) + 1
+        seconds = (metadata.get('stats') or {}).get('seconds')
+        if isinstance(seconds, (int, float)):
+            durations.append(float(seconds))
+
+    for backup_type in ("full", "incremental"):
+        count.add(by_type.pop(backup_type, 0), type=backup_type)
+    for backup_type, value in sorted(by_type.items()):
+        count.add(value, type=backup_type)
+    _histogram_from_values(duration, BACKUP_BUCKETS, durations)
+    failed.add(sum(1 for backup in backups if (backup.get('verification') or {}).get('ok') is False))
+
+    families = [count, duration, failed]
+    if backups:
+        # list_available_backups ordena del más reciente al más antiguo
+        latest = backups[0]
+        try:
+            last_time.add(datetime.strptime(latest['created'], "%Y-%m-%d %H:%M:%S").timestamp())
+            families.append(last_time)
+        except (KeyError, ValueError):
+            pass
+        seconds = ((latest.get('metadata') or {}).get('stats') or {}).get('seconds')
+        if isinstance(seconds, (int, float)):
+            last_duration.add(seconds)
+            families.append(last_duration)
+    return families
+
+
+COLLECTORS: Dict[str, Callable[[], List[MetricFamily]]] = {
+    "generations": _collect_generations,
+    "costs": _collect_costs,
+    "storage": _collect_storage,
+    "backups": _collect_backups,
+}
+
+
+# ===============================
+# EXPOSICIÓN
+# ===============================
+
+def collect() -> List[MetricFamily]:
+    """
+    Todas las métricas, más collector_up por colector
+
+    Un colector que falla (archivo ilegible, permisos...) no impide publicar
+    el resto: su collector_up vale 0.
+    """
+    started = time.monotonic()
+    families: List[MetricFamily] = []
+    up = MetricFamily("collector_up", "gauge", "1 si el colector se leyó correctamente")
+    for name, collector in COLLECTORS.items():
+        try:
+            families.extend(collector())
+            up.add(1, collector=name)
+        except Exception:
+            up.add(0, collector=name)
+
+    elapsed = MetricFamily("collect_duration_seconds", "gauge", "Tiempo en reunir las métricas")
+    elapsed.add(round(time.monotonic() - started, 6))
+    return families + [up, elapsed]
+
+
+def render_metrics() -> str:
+    """Métricas en el formato de texto de Prometheus (versión 0.0.4)"""
+    return "".join(family.render() for family in collect())
+
+
+def write_textfile(path: Path) -> Path:
+    """
+    Escribir las métricas para el textfile collector de node_exporter
+
+    Se escribe en un temporal del mismo directorio y se renombra, así el
+    collector nunca lee un archivo a medias. El nombre debe acabar en .prom.
+
+    Returns:
+        Path: Ruta escrita
+    """
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    content = render_metrics()
+    fd, temp_path = tempfile.mkstemp(dir=path.parent, prefix=".metrics_", suffix=".tmp")
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(content)
+        os.replace(temp_path, path)
+    except Exception:
+        if os.path.exists(temp_path):
+            os.unlink(temp_path)
+        raise
+    return path
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    """GET /metrics; el resto 404"""
+
+    def do_GET(self) -> None:
+        if self.path.split("?", 1)[0] != METRICS_PATH:
+            self.send_error(404, f"Solo {METRICS_PATH}")
+            return
+        try:
+            body = render_metrics().encode('utf-8')
+        except Exception as e:
+            self.send_error(500, str(e))
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", METRICS_CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args: Any) -> None:
+        pass  # Sin una línea en la consola de Streamlit por cada scrape
+
+
+_server: Optional[ThreadingHTTPServer] = None
+_server_attempted = False
+_server_lock = threading.Lock()
+
+
+def make_metrics_server(port: Optional[int] = None, host: Optional[str] = None) -> ThreadingHTTPServer:
+    """Crear (sin arrancar) el servidor HTTP de métricas"""
+    server = ThreadingHTTPServer((host or METRICS_HOST, METRICS_PORT if port is None else port), _MetricsHandler)
+    server.daemon_threads = True
+    return server
+
+
+def start_metrics_server(port: Optional[int] = None, host: Optional[str] = None) -> Optional[ThreadingHTTPServer]:
+    """
+    Arrancar el endpoint en un hilo de fondo (una vez por proceso)
+
+    Streamlit ejecuta app.py en cada rerun: las llamadas siguientes
+    devuelven el mismo servidor. Si el puerto ya está ocupado (p. ej. por
+    otro worker, que publica los mismos valores) devuelve None y no lo
+    vuelve a intentar.
+
+    Returns:
+        Optional[ThreadingHTTPServer]: El servidor, o None si no se pudo abrir
+    """
+    global _server, _server_attempted
+    with _server_lock:
+        if _server is not None or _server_attempted:
+            return _server
+        _server_attempted = True
+        try:
+            _server = make_metrics_server(port, host)
+        except OSError:
+            return None
+        threading.Thread(target=_server.serve_forever, name="metrics-server", daemon=True).start()
+        return _server
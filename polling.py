@@ -0,0 +1,253 @@
+"""
+Motor de sondeo (polling) de predicciones de Replicate
+
+Sustituye los bucles ``while prediction.status ...`` con ``time.sleep(2)``
+fijo por un sondeo con backoff adaptativo: empieza con intervalos cortos y
+los alarga hasta un máximo proporcional a la latencia histórica del modelo
+(mediana del histograma de generation_stats.json), con un plazo máximo.
+
+Incluye una versión síncrona (script de Streamlit, scripts de consola) y una
+asíncrona que permite sondear muchas predicciones a la vez en un único event
+loop.
+"""
+
+import asyncio
+import time
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+import utils
+from latency import total_histogram
+from tracing import annotate, traced
+
+
+# ===============================
+# CONFIGURACIÓN
+# ===============================
+
+# Estados finales de una predicción de Replicate
+TERMINAL_STATUSES = ("succeeded", "failed", "canceled")
+
+# Estado devuelto cuando se alcanza el plazo sin estado final
+TIMEOUT_STATUS = "timeout"
+
+# Primer intervalo y crecimiento del backoff (segundos)
+MIN_POLL_INTERVAL = 0.5
+BACKOFF_FACTOR = 1.5
+
+# Límites del intervalo máximo derivado de la latencia histórica
+MAX_POLL_INTERVAL_FLOOR = 2.0
+MAX_POLL_INTERVAL_CEILING = 30.0
+
+# Intervalo máximo si no hay latencia histórica
+DEFAULT_MAX_POLL_INTERVAL = 5.0
+
+# Errores consecutivos de reload() tolerados antes de abortar
+MAX_RELOAD_ERRORS = 3
+
+
+# ===============================
+# BACKOFF
+# ===============================
+
+def get_expected_latency(model: str) -> Optional[float]:
+    """
+    Latencia histórica de un modelo según generation_stats.json
+
+    Es la mediana del histograma de latencia total (ver latency.py); las
+    estadísticas anteriores a los histogramas usan tiempo_promedio.
+
+    Args:
+        model: Clave de las estadísticas (p. ej. "🖼️ Imagen (Flux Pro)") o parte
+            de ella (p. ej. "Flux Pro")
+
+    Returns:
+        Optional[float]: Latencia en segundos, o None si no hay datos
+    """
+    stats = utils.get_generation_stats()
+    entry = stats.get(model)
+    if entry is None:
+        matches = [value for key, value in stats.items() if model.lower() in key.lower()]
+        entry = matches[0] if len(matches) == 1 else None
+
+    if isinstance(entry, dict):
+        median = total_histogram(entry).percentile(50)
+        if median:
+            return median
+        latency = entry.get("tiempo_promedio")
+        if isinstance(latency, (int, float)) and latency > 0:
+            return float(latency)
+    return None
+
+
+def backoff_intervals(expected_latency: Optional[float] = None,
+                      min_interval: float = MIN_POLL_INTERVAL,
+                      factor: float = BACKOFF_FACTOR) -> Iterator[float]:
+    """
+    Generar los intervalos de espera entre sondeos
+
+    Crecen geométricamente desde min_interval hasta un máximo de un cuarto
+    de la latencia esperada (acotado entre MAX_POLL_INTERVAL_FLOOR y
+    MAX_POLL_INTERVAL_CEILING): un modelo de 10 s se sondea cada ~2 s como
+    mucho y uno de 2 minutos cada ~30 s.
+
+    Args:
+        expected_latency: Latencia histórica del modelo en segundos
+        min_interval: Primer intervalo
+        factor: Crecimiento entre intervalos consecutivos
+
+    Yields:
+        float: Segundos a esperar antes del siguiente sondeo
+    """
+    if expected_latency:
+        max_interval = min(MAX_POLL_INTERVAL_CEILING, max(MAX_POLL_INTERVAL_FLOOR, expected_latency / 4))
+    else:
+        max_interval = DEFAULT_MAX_POLL_INTERVAL
+    max_interval = max(max_interval, min_interval)
+
+    interval = min_interval
+    while True:
+        yield interval
+        interval = min(max_interval, interval * factor)
+
+
+# ===============================
+# SONDEO
+# ===============================
+
+@traced("poll")
+def poll_prediction(prediction: Any, deadline: float = 300,
+                    expected_latency: Optional[float] = None,
+                    on_update: Optional[Callable[[Any, float], None]] = None,
+                    min_interval: float = MIN_POLL_INTERVAL) -> str:
+    """
+    Esperar (bloqueando) a que una predicción llegue a un estado final
+
+    Args:
+        prediction: Predicción de Replicate (con .status y .reload())
+        deadline: Segundos máximos de espera desde la llamada
+        expected_latency: Latencia histórica del modelo (ver get_expected_latency)
+        on_update: Callback (prediction, segundos_transcurridos) tras cada sondeo
+        min_interval: Primer intervalo del backoff
+
+    Returns:
+        str: Estado final de la predicción, o TIMEOUT_STATUS si venció el plazo
+
+    Raises:
+        Exception: El error de reload() si falla MAX_RELOAD_ERRORS veces seguidas
+    """
+    start = time.monotonic()
+    intervals = backoff_intervals(expected_latency, min_interval)
+    errors = 0
+    reloads = 0
+    annotate(prediction_id=getattr(prediction, "id", None))
+
+    while prediction.status not in TERMINAL_STATUSES:
+        elapsed = time.monotonic() - start
+        if on_update:
+            on_update(prediction, elapsed)
+
+        remaining = deadline - elapsed
+        if remaining <= 0:
+            annotate(status=TIMEOUT_STATUS, reloads=reloads)
+            return TIMEOUT_STATUS
+        time.sleep(min(next(intervals), remaining))
+
+        try:
+            reloads += 1
+            prediction.reload()
+            errors = 0
+        except Exception:
+            errors += 1
+            if errors >= MAX_RELOAD_ERRORS:
+                raise
+
+    if on_update:
+        on_update(prediction, time.monotonic() - start)
+    annotate(status=prediction.status, reloads=reloads)
+    return prediction.status
+
+
+async def _reload_async(prediction: Any) -> None:
+    """Recargar sin bloquear el event loop (async_reload si el cliente lo tiene)"""
+    async_reload = getattr(prediction, "async_reload", None)
+    if async_reload is not None:
+        await async_reload()
+    else:
+        await asyncio.to_thread(prediction.reload)
+
+
+async def poll_prediction_async(prediction: Any, deadline: float = 300,
+                                expected_latency: Optional[float] = None,
+                                on_update: Optional[Callable[[Any, float], None]] = None,
+                                min_interval: float = MIN_POLL_INTERVAL) -> str:
+    """
+    Versión asíncrona de poll_prediction (las esperas no ocupan un hilo)
+
+    Mismos argumentos y resultado que poll_prediction.
+    """
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    intervals = backoff_intervals(expected_latency, min_interval)
+    errors = 0
+
+    while prediction.status not in TERMINAL_STATUSES:
+        elapsed = loop.time() - start
+        if on_update:
+            on_update(prediction, elapsed)
+
+        remaining = deadline - elapsed
+        if remaining <= 0:
+            return TIMEOUT_STATUS
+        await asyncio.sleep(min(next(intervals), remaining))
+
+        try:
+            await _reload_async(prediction)
+            errors = 0
+        except Exception:
+            errors += 1
+            if errors >= MAX_RELOAD_ERRORS:
+                raise
+
+    if on_update:
+        on_update(prediction, loop.time() - start)
+    return prediction.status
+
+
+async def poll_many_async(predictions: List[Any], deadline: float = 300,
+                          expected_latency: Optional[float] = None,
+                          on_update: Optional[Callable[[Any, float], None]] = None,
+                          min_interval: float = MIN_POLL_INTERVAL) -> Dict[str, str]:
+    """
+    Sondear varias predicciones a la vez en el event loop actual
+
+    Un error de reload() en una predicción no detiene las demás: su estado
+    se devuelve como "error".
+
+    Returns:
+        Dict[str, str]: Estado final por id de predicción
+    """
+    results = await asyncio.gather(*[
+        poll_prediction_async(prediction, deadline, expected_latency, on_update, min_interval)
+        for prediction in predictions
+    ], return_exceptions=True)
+
+    return {
+        prediction.id: "error" if isinstance(result, BaseException) else result
+        for prediction, result in zip(predictions, results)
+    }
+
+
+def poll_many(predictions: List[Any], deadline: float = 300,
+              expected_latency: Optional[float] = None,
+              on_update: Optional[Callable[[Any, float], None]] = None,
+              min_interval: float = MIN_POLL_INTERVAL) -> Dict[str, str]:
+    """
+    Sondear varias predicciones concurrentemente desde código síncrono
+
+    Crea un event loop propio; no llamar desde dentro de un loop en marcha
+    (usar poll_many_async).
+
+    Returns:
+        Dict[str, str]: Estado final por id de predicción
+    """
+    return asyncio.run(poll_many_async(predictions, deadline, expected_latency, on_update, min_interval))
@@ -0,0 +1,273 @@
+"""
+Perfilado opcional de los reruns de Streamlit
+
+Streamlit vuelve a ejecutar app.py completo en cada interacción. Con el
+perfilado activado (casilla "🐞 Perfilar reruns" de la barra lateral) cada
+sección con nombre de la app (barra lateral, pestañas, Dashboard, Biblioteca,
+modales...) mide su tiempo en cada rerun y el panel de depuración muestra:
+
+- una tabla por sección con media, p50, p95 y máximo de los últimos reruns
+  y la parte del rerun que se lleva;
+- las pilas en formato "collapsed" (``rerun;Dashboard;Latencia 1234``, en
+  microsegundos de tiempo propio) que leen flamegraph.pl, speedscope o
+  inferno para dibujar un flame graph;
+- cada CPROFILE_SAMPLE_EVERY reruns (o bajo demanda) el rerun completo se
+  ejecuta con cProfile; las funciones más costosas se acumulan y se pueden
+  descargar como .prof (pstats, snakeviz).
+
+El perfilador vive en st.session_state, así que solo afecta a la sesión que
+lo activa. No importa streamlit: app.py crea las secciones con
+profiler.section(nombre).
+"""
+
+import cProfile
+import io
+import marshal
+import pstats
+import time
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Deque, Dict, Iterator, List, Optional
+
+
+# ===============================
+# CONFIGURACIÓN
+# ===============================
+
+# Reruns conservados para la tabla y el flame graph
+PROFILE_HISTORY_RERUNS = 50
+
+# Muestrear con cProfile uno de cada N reruns (0 = solo bajo demanda)
+CPROFILE_SAMPLE_EVERY = 10
+
+# Funciones mostradas en el informe de cProfile
+CPROFILE_REPORT_LIMIT = 30
+
+ROOT_SECTION = "rerun"
+
+
+# ===============================
+# PERFILADOR
+# ===============================
+
+class RerunProfiler:
+    """
+    Tiempos por sección de los últimos reruns de una sesión
+
+    Uso por rerun: begin_rerun() al principio del script, secciones con
+    ``with profiler.section("Dashboard"):`` (se pueden anidar) y end_rerun()
+    al final. Un rerun interrumpido (st.rerun, st.stop) se guarda como
+    incompleto al empezar el siguiente.
+    """
+
+    def __init__(self, keep: int = PROFILE_HISTORY_RERUNS, sample_every: int = CPROFILE_SAMPLE_EVERY) -> None:
+        self.sample_every = sample_every
+        self.reruns: Deque[Dict[str, Any]] = deque(maxlen=keep)
+        self.rerun_count = 0
+        self.sample_next = False
+        self.cprofile_stats: Optional[pstats.Stats] = None
+        self.sampled_reruns = 0
+        self._current: Optional[Dict[str, Any]] = None
+        self._stack: List[str] = []
+        self._profile: Optional[cProfile.Profile] = None
+
+    # --- Ciclo de un rerun ---
+
+    def begin_rerun(self) -> None:
+        """Empezar a medir un rerun (cierra el anterior si quedó a medias)"""
+        if self._current is not None:
+            self._finish(complete=False)
+
+        self.rerun_count += 1
+        self._stack = []
+        self._current = {
+            'started_at': datetime.now().isoformat(timespec='seconds'),
+            'start': time.perf_counter(),
+            'sections': {},
+            'sampled': False,
+        }
+
+        if self.sample_next or (self.sample_every and self.rerun_count % self.sample_every == 0):
+            self.sample_next = False
+            profile = cProfile.Profile()
+            try:
+                profile.enable()
+            except ValueError:
+                # Ya hay otro perfilador activo en este hilo
+                return
+            self._profile = profile
+            self._current['sampled'] = True
+
+    def end_rerun(self) -> None:
+        """Terminar el rerun actual y guardarlo"""
+        if self._current is not None:
+            self._finish(complete=True)
+
+    def cancel_rerun(self) -> None:
+        """Cerrar como incompleto un rerun a medias (p. ej. al desactivar el perfilado)"""
+        if self._current is not None:
+            self._finish(complete=False)
+
+    def _finish(self, complete: bool) -> None:
+        if self._profile is not None:
+            self._profile.disable()
+            if complete:
+                stats = pstats.Stats(self._profile)
+                if self.cprofile_stats is None:
+                    self.cprofile_stats = stats
+                else:
+                    self.cprofile_stats.add(stats)
+                self.sampled_reruns += 1
+            self._profile = None
+
+        current = self._current
+        self._current = None
+        self.reruns.append({
+            'started_at': current['started_at'],
+            'total_ms': (time.perf_counter() - current['start']) * 1000,
+            'sections': current['sections'],
+            'sampled': current['sampled'] and complete,
+            'complete': complete,
+        })
+
+    @contextmanager
+    def section(self, name: str) -> Iterator[None]:
+        """
+        Medir una sección del rerun actual
+
+        Las secciones anidadas se guardan como "Padre/Hija"; una sección que
+        se ejecuta varias veces en el mismo rerun suma sus tiempos.
+        """
+        if self._current is None:
+            yield
+            return
+
+        self._stack.append(name)
+        path = "/".join(self._stack)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = (time.perf_counter() - start) * 1000
+            if self._current is not None:
+                sections = self._current['sections']
+                sections[path] = sections.get(path, 0.0) + elapsed
+            if self._stack and self._stack[-1] == name:
+                self._stack.pop()
+
+    # --- Resultados ---
+
+    def summary(self) -> List[Dict[str, Any]]:
+        """
+        Estadísticas por sección de los reruns completos guardados
+
+        Returns:
+            List[Dict]: section, depth, reruns, mean_ms, p50_ms, p95_ms,
+            max_ms, last_ms y share (fracción media del rerun), en orden de
+            árbol (cada sección tras su padre, hermanas de mayor a menor)
+        """
+        reruns = [rerun for rerun in self.reruns if rerun['complete']]
+        if not reruns:
+            return []
+
+        values: Dict[str, List[float]] = {}
+        for rerun in reruns:
+            for path, ms in rerun['sections'].items():
+                values.setdefault(path, []).append(ms)
+        mean_total = sum(rerun['total_ms'] for rerun in reruns) / len(reruns)
+
+        rows = {}
+        for path, samples in values.items():
+            ordered = sorted(samples)
+            mean = sum(samples) / len(reruns)  # Los reruns sin la sección cuentan como 0
+            rows[path] = {
+                'section': path,
+                'depth': path.count("/"),
+                'reruns': len(samples),
+                'mean_ms': mean,
+                'p50_ms': _percentile(ordered, 50),
+                'p95_ms': _percentile(ordered, 95),
+                'max_ms': ordered[-1],
+                'last_ms': reruns[-1]['sections'].get(path, 0.0),
+                'share': mean / mean_total if mean_total else 0.0,
+            }
+
+        # Orden de árbol: hermanas de mayor a menor media, hijas tras su padre
+        def sort_key(path: str) -> List[Any]:
+            key = []
+            parts = path.split("/")
+            for depth in range(1, len(parts) + 1):
+                prefix = "/".join(parts[:depth])
+                mean = rows[prefix]['mean_ms'] if prefix in rows else 0.0
+                key.extend([-mean, prefix])
+            return key
+
+        return [rows[path] for path in sorted(rows, key=sort_key)]
+
+    def rerun_totals(self) -> Dict[str, Optional[float]]:
+        """Reruns medidos y media/p95/último de su duración total (ms)"""
+        totals = sorted(rerun['total_ms'] for rerun in self.reruns if rerun['complete'])
+        complete = [rerun for rerun in self.reruns if rerun['complete']]
+        return {
+            'reruns': len(totals),
+            'incomplete': len(self.reruns) - len(totals),
+            'mean_ms': sum(totals) / len(totals) if totals else None,
+            'p95_ms': _percentile(totals, 95) if totals else None,
+            'last_ms': complete[-1]['total_ms'] if complete else None,
+        }
+
+    def collapsed_stacks(self) -> str:
+        """
+        Pilas en formato collapsed para flame graphs
+
+        Una línea "rerun;Sección;Subsección microsegundos" por sección con
+        su tiempo propio (sin las subsecciones) sumado en todos los reruns
+        completos; "rerun" lleva el tiempo fuera de las secciones.
+        """
+        self_us: Dict[str, float] = {}
+        for rerun in self.reruns:
+            if not rerun['complete']:
+                continue
+            sections = rerun['sections']
+            children_ms: Dict[str, float] = {}
+            for path, ms in sections.items():
+                parent = path.rsplit("/", 1)[0] if "/" in path else ""
+                children_ms[parent] = children_ms.get(parent, 0.0) + ms
+            for path, ms in sections.items():
+                stack = f"{ROOT_SECTION};" + path.replace("/", ";")
+                self_us[stack] = self_us.get(stack, 0.0) + max(ms - children_ms.get(path, 0.0), 0.0) * 1000
+            self_us[ROOT_SECTION] = self_us.get(ROOT_SECTION, 0.0) + \
+                max(rerun['total_ms'] - children_ms.get("", 0.0), 0.0) * 1000
+
+        return "\n".join(f"{stack} {round(us)}" for stack, us in sorted(self_us.items()) if round(us) > 0)
+
+    def cprofile_report(self, limit: int = CPROFILE_REPORT_LIMIT, sort: str = "cumulative") -> str:
+        """Funciones más costosas de los reruns muestreados (texto de pstats)"""
+        if self.cprofile_stats is None:
+            return ""
+        output = io.StringIO()
+        # Copia para que strip_dirs no altere las estadísticas acumuladas
+        stats = pstats.Stats(stream=output)
+        stats.add(self.cprofile_stats)
+        stats.strip_dirs().sort_stats(sort).print_stats(limit)
+        return output.getvalue()
+
+    def cprofile_dump(self) -> bytes:
+        """Estadísticas de cProfile acumuladas en formato .prof (pstats/snakeviz)"""
+        if self.cprofile_stats is None:
+            return b""
+        # Es lo que escribe pstats.Stats.dump_stats, sin pasar por un archivo
+        return marshal.dumps(self.cprofile_stats.stats)
+
+    def reset(self) -> None:
+        """Olvidar los reruns medidos y las muestras de cProfile"""
+        self.reruns.clear()
+        self.cprofile_stats = None
+        self.sampled_reruns = 0
+
+
+def _percentile(ordered: List[float], q: float) -> float:
+    """Percentil q (0-100) por rango más cercano de una lista ordenada"""
+    index = max(0, -(-len(ordered) * q // 100) - 1)
+    return ordered[int(min(index, len(ordered) - 1))]
@@ -0,0 +1,24 @@
+"""
+Fixtures compartidas para las pruebas
+"""
+import pytest
+
+import utils
+
+
+@pytest.fixture
+def temp_history_dir(tmp_path, monkeypatch):
+    """Redirigir historial y backups a un directorio temporal"""
+    history_dir = tmp_path / "historial"
+    backups_dir = tmp_path / "backups"
+    history_dir.mkdir()
+    backups_dir.mkdir()
+
+    monkeypatch.setattr(utils, "HISTORY_DIR", history_dir)
+    monkeypatch.setattr(utils, "HISTORY_FILE", history_dir / "history.jsonl")
+    monkeypatch.setattr(utils, "LEGACY_HISTORY_FILE", history_dir / "history.json")
+    monkeypatch.setattr(utils, "HISTORY_INDEX_FILE", history_dir / "history_index.db")
+    monkeypatch.setattr(utils, "COST_ROLLUPS_FILE", history_dir / "cost_rollups.json")
+    monkeypatch.setattr(utils, "BACKUPS_DIR", backups_dir)
+
+    return history_dir
@@ -0,0 +1,340 @@
+"""
+Pruebas para los backups completos e incrementales
+"""
+import threading
+import time
+import zipfile
+
+import pytest
+
+import maintenance
+import utils
+from utils import create_backup, restore_backup, delete_backup
+
+
+@pytest.fixture
+def backup_env(temp_history_dir, tmp_path, monkeypatch):
+    """Historial con dos medios en el almacén y estadísticas en el directorio temporal"""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(utils, "GENERATION_STATS_FILE", tmp_path / "generation_stats.json")
+    utils.GENERATION_STATS_FILE.write_text('{"total": 2}', encoding='utf-8')
+    for n in range(2):
+        _add_media(temp_history_dir, n)
+    return temp_history_dir
+
+
+def _add_media(history_dir, n):
+    source = history_dir / f"imagen_{n}.webp"
+    source.write_bytes(bytes([n]) * 2048)
+    stored = utils.add_to_media_store(source)
+    utils.save_to_history({'tipo': 'imagen', 'fecha': f"2025-07-17T19:23:{n:02d}", 'prompt': f"prompt {n}",
+                           'archivo_local': source.name, 'media_hash': stored.stem})
+    return stored
+
+
+def _media_members(backup_path):
+    with zipfile.ZipFile(backup_path) as zipf:
+        return sorted(name for name in zipf.namelist() if "/media/" in name)
+
+
+class TestIncrementalBackup:
+    """Pruebas para create_backup completo e incremental"""
+
+    def test_incremental_only_adds_new_media(self, backup_env):
+        """El incremental guarda solo los medios nuevos y enlaza con su padre"""
+        ok, _, full_path = create_backup(incremental=True)  # Sin padre: completo
+        assert ok
+        stored = _add_media(backup_env, 2)
+
+        ok, message, inc_path = create_backup(incremental=True)
+
+        assert ok and "incremental" in message
+        assert _media_members(inc_path) == [f"historial/{stored.relative_to(backup_env).as_posix()}"]
+        metadata = utils._read_backup_json(utils.Path(inc_path), utils.BACKUP_METADATA_NAME)
+        assert metadata['backup_type'] == 'incremental'
+        assert metadata['chain'] == [utils.Path(full_path).name, utils.Path(inc_path).name]
+        assert metadata['files_included']['media_files'] == 3
+
+    def test_media_count_includes_flat_and_stored_files(self, backup_env):
+        """media_files cuenta a la vez los medios sueltos de historial/ y los del almacén"""
+        (backup_env / "antiguo.png").write_bytes(b"p" * 512)
+
+        _, _, backup_path = create_backup()
+
+        with zipfile.ZipFile(backup_path) as zipf:
+            media = [name for name in zipf.namelist()
+                     if name.startswith("historial/") and not name.endswith(utils.HISTORY_FILE.name)]
+        metadata = utils._read_backup_json(utils.Path(backup_path), utils.BACKUP_METADATA_NAME)
+        assert "historial/antiguo.png" in media
+        assert len(_media_members(backup_path)) == 2
+        assert metadata['files_included']['media_files'] == len(media)
+
+    def test_media_is_stored_without_recompression(self, backup_env):
+        """Las imágenes van con ZIP_STORED y el JSON se comprime"""
+        _, _, backup_path = create_backup()
+
+        with zipfile.ZipFile(backup_path) as zipf:
+            compression = {info.filename: info.compress_type for info in zipf.infolist()}
+        assert all(compression[name] == zipfile.ZIP_STORED for name in _media_members(backup_path))
+        assert compression["historial/history.jsonl"] == zipfile.ZIP_DEFLATED
+
+    def test_chain_limit_forces_full_backup(self, backup_env, monkeypatch):
+        """Al llegar al máximo de incrementales se crea un backup completo"""
+        monkeypatch.setattr(utils, "BACKUP_MAX_CHAIN", 1)
+        create_backup()
+        create_backup(incremental=True)
+
+        ok, message, _ = create_backup(incremental=True)
+
+        assert ok and "completo" in message
+
+
+class TestIncrementalRestore:
+    """Pruebas para restaurar y eliminar backups de una cadena"""
+
+    def test_restore_incremental_uses_parent_archives(self, backup_env):
+        """Restaurar un incremental recupera también los medios guardados en el completo"""
+        create_backup()
+        _add_media(backup_env, 2)
+        _, _, inc_path = create_backup(incremental=True)
+        # Vaciar el almacén como si se restaurara en otra máquina
+        for path in (backup_env / utils.MEDIA_DIR_NAME).rglob("*.webp"):
+            path.unlink()
+
+        ok, message = restore_backup(inc_path)
+
+        assert ok, message
+        assert len(list((backup_env / utils.MEDIA_DIR_NAME).rglob("*.webp"))) == 3
+
+    def test_restore_fails_when_chain_is_incomplete(self, backup_env):
+        """Sin el backup completo, el incremental no se puede restaurar"""
+        _, _, full_path = create_backup()
+        _add_media(backup_env, 2)
+        _, _, inc_path = create_backup(incremental=True)
+        utils.Path(full_path).unlink()
+
+        ok, message = restore_backup(inc_path)
+
+        assert not ok and utils.Path(full_path).name in message
+
+    def test_parent_cannot_be_deleted(self, backup_env):
+        """No se elimina un backup del que depende un incremental"""
+        _, _, full_path = create_backup()
+        _, _, inc_path = create_backup(incremental=True)
+
+        assert not delete_backup(utils.Path(full_path).name)[0]
+        assert delete_backup(utils.Path(inc_path).name)[0]
+        assert delete_backup(utils.Path(full_path).name)[0]
+
+
+class TestStreamingRestore:
+    """Pruebas para la restauración sin extraer el ZIP completo"""
+
+    def test_unchanged_files_are_not_rewritten(self, backup_env, monkeypatch):
+        """Restaurar sobre los mismos datos no reescribe ningún archivo"""
+        _, _, backup_path = create_backup()
+        monkeypatch.setattr(utils, "_stream_backup_member",
+                            lambda *args: pytest.fail("No debería reescribirse ningún archivo"))
+
+        ok, message = restore_backup(backup_path, safety_snapshot=False)
+
+        assert ok, message
+        assert "0 restaurados" in message
+
+    def test_changed_files_are_replaced_and_progress_reported(self, backup_env, tmp_path):
+        """Los archivos modificados se reemplazan sin extraer a temp_restore y el progreso llega a 1"""
+        _, _, backup_path = create_backup()
+        utils.GENERATION_STATS_FILE.write_text('{"total": 99}', encoding='utf-8')
+        utils.save_to_history({'tipo': 'imagen', 'prompt': 'posterior al backup'})
+        progress = []
+
+        ok, message = restore_backup(backup_path, safety_snapshot=False,
+                                     progress_callback=lambda fraction, text: progress.append(fraction))
+
+        assert ok, message
+        assert utils.GENERATION_STATS_FILE.read_text(encoding='utf-8') == '{"total": 2}'
+        assert [h['prompt'] for h in utils.load_history()] == ['prompt 1', 'prompt 0']
+        assert progress[-1] == 1.0
+        assert not (tmp_path / "temp_restore").exists()
+
+    def test_safety_snapshot_links_current_files(self, backup_env):
+        """La copia previa conserva los datos actuales sin crear otro ZIP"""
+        loose = backup_env / "imagen_suelta.png"
+        loose.write_bytes(b"png" * 100)
+        _, _, backup_path = create_backup()
+        backups_before = len(list(utils.BACKUPS_DIR.glob("*.zip")))
+
+        ok, message = restore_backup(backup_path)
+
+        snapshot = next(utils.BACKUPS_DIR.glob(f"{utils.SAFETY_SNAPSHOT_PREFIX}*"))
+        assert ok and snapshot.name in message
+        assert len(list(utils.BACKUPS_DIR.glob("*.zip"))) == backups_before
+        assert (snapshot / "historial" / "history.jsonl").exists()
+        assert (snapshot / "historial" / loose.name).read_bytes() == b"png" * 100
+
+    def test_safety_snapshot_survives_gc_and_can_be_restored(self, backup_env, monkeypatch):
+        """Tras restaurar un backup antiguo y pasar gc-media, la copia previa devuelve los datos"""
+        _, _, backup_path = create_backup()
+        stored = _add_media(backup_env, 2)
+        ok, _ = restore_backup(backup_path)
+        assert ok
+
+        monkeypatch.setattr(utils, "MEDIA_GC_GRACE_SECONDS", -1)
+        assert utils.gc_media_store() == (1, 2048)
+        assert not stored.exists()
+
+        snapshot = utils.list_safety_snapshots()[0]
+        maintenance.main(["restore", snapshot['name'], "--no-snapshot"])
+
+        assert stored.read_bytes() == bytes([2]) * 2048
+        assert [h['prompt'] for h in utils.load_history()] == ['prompt 2', 'prompt 1', 'prompt 0']
+
+    def test_restoring_a_snapshot_keeps_it(self, backup_env, monkeypatch):
+        """La copia que se restaura no se borra al podar las copias previas"""
+        monkeypatch.setattr(utils, "SAFETY_SNAPSHOTS_KEEP", 1)
+        first = utils.create_safety_snapshot()
+        utils.save_to_history({'tipo': 'imagen', 'prompt': 'posterior'})
+
+        ok, message = restore_backup(str(first))
+
+        assert ok, message
+        assert first.exists() and len(utils.list_safety_snapshots()) == 2
+        assert [h['prompt'] for h in utils.load_history()] == ['prompt 1', 'prompt 0']
+        assert not restore_backup(str(utils.BACKUPS_DIR))[0]
+
+    def test_save_during_restore_is_not_lost(self, backup_env, monkeypatch):
+        """Un guardado mientras se restaura queda en el log restaurado, no entre la copia previa y el reemplazo"""
+        _, _, backup_path = create_backup()
+        original_snapshot = utils.create_safety_snapshot
+        writers = []
+
+        def snapshot_with_concurrent_save(*args, **kwargs):
+            snapshot = original_snapshot(*args, **kwargs)
+            writer = threading.Thread(target=utils.save_to_history, args=({'tipo': 'imagen', 'prompt': 'durante'},))
+            writer.start()
+            writers.append(writer)
+            time.sleep(0.2)
+            return snapshot
+
+        monkeypatch.setattr(utils, "create_safety_snapshot", snapshot_with_concurrent_save)
+        assert restore_backup(backup_path)[0]
+        writers[0].join()
+
+        assert [h['prompt'] for h in utils.load_history()] == ['durante', 'prompt 1', 'prompt 0']
+
+    def test_unsafe_member_paths_are_ignored(self, backup_env, tmp_path):
+        """Las rutas fuera de los directorios de datos no se escriben"""
+        _, _, backup_path = create_backup()
+        with zipfile.ZipFile(backup_path, 'a') as zipf:
+            zipf.writestr("historial/../../fuera.png", b"x")
+            zipf.writestr("otro/script.py", b"x")
+
+        ok, message = restore_backup(backup_path, safety_snapshot=False)
+
+        assert ok, message
+        assert not (tmp_path / "fuera.png").exists()
+        assert not (tmp_path / "otro").exists()
+
+
+class TestBackupCatalog:
+    """Pruebas para el catálogo de backups"""
+
+    def test_listing_does_not_open_catalogued_zips(self, backup_env, monkeypatch):
+        """Los backups creados se listan desde el catálogo sin abrir los ZIP"""
+        _, _, full_path = create_backup()
+        create_backup(incremental=True)
+        monkeypatch.setattr(utils, "_backup_catalog_entry",
+                            lambda *args, **kwargs: pytest.fail("No debería abrirse ningún ZIP"))
+
+        backups = utils.list_available_backups()
+
+        assert len(backups) == 2
+        full = next(b for b in backups if b['full_path'] == full_path)
+        assert full['metadata']['backup_type'] == 'full'
+        assert full['manifest_sha256'] and full['verification'] is None
+
+    def test_catalog_follows_disk_changes(self, backup_env):
+        """Los ZIP copiados a mano se catalogan y los borrados desaparecen"""
+        _, _, backup_path = create_backup()
+        copied = utils.BACKUPS_DIR / "ai_models_backup_20200101_000000.zip"
+        copied.write_bytes(utils.Path(backup_path).read_bytes())
+        utils.Path(backup_path).unlink()
+
+        assert [b['filename'] for b in utils.list_available_backups()] == [copied.name]
+
+    def test_delete_and_rebuild(self, backup_env):
+        """delete_backup actualiza el catálogo y se puede reconstruir desde el disco"""
+        _, _, first = create_backup()
+        _, _, second = create_backup()
+        assert delete_backup(utils.Path(first).name)[0]
+        assert [b['filename'] for b in utils.list_available_backups()] == [utils.Path(second).name]
+
+        utils._backup_catalog_file().write_text("{dañado", encoding='utf-8')
+        assert utils.rebuild_backup_catalog()
+        assert [b['filename'] for b in utils.list_available_backups()] == [utils.Path(second).name]
+
+
+class TestVerifyBackup:
+    """Pruebas para verify_backup"""
+
+    def test_fresh_backup_is_valid_and_recorded(self, backup_env):
+        """Un backup recién creado se verifica y el resultado queda en el catálogo"""
+        _, _, backup_path = create_backup()
+
+        result = utils.verify_backup(backup_path, workers=2)
+
+        assert result['ok'], result['errors']
+        assert result['files'] == 6 and result['bytes'] > 4096
+        verification = utils.list_available_backups()[0]['verification']
+        assert verification['ok'] and verification['errors'] == 0
+
+    def test_corrupted_member_is_detected(self, backup_env):
+        """Un medio alterado dentro del ZIP se detecta por CRC o SHA-256"""
+        _, _, backup_path = create_backup()
+        data = bytearray(utils.Path(backup_path).read_bytes())
+        offset = data.index(bytes([1]) * 2048)  # Contenido del segundo medio (ZIP_STORED)
+        data[offset] = 0xFF
+        utils.Path(backup_path).write_bytes(bytes(data))
+
+        result = utils.verify_backup(backup_path)
+
+        assert not result['ok']
+        assert any("media/" in error for error in result['errors'])
+
+    def test_replaced_manifest_is_detected(self, backup_env):
+        """Un manifiesto distinto del registrado en el catálogo se detecta"""
+        _, _, backup_path = create_backup()
+        utils.list_available_backups()
+        with zipfile.ZipFile(backup_path) as zipf:
+            members = {name: zipf.read(name) for name in zipf.namelist()}
+        members[utils.BACKUP_MANIFEST_NAME] = b'{"files": {}}'
+        with zipfile.ZipFile(backup_path, 'w') as zipf:
+            for name, content in members.items():
+                zipf.writestr(name, content)
+
+        result = utils.verify_backup(backup_path)
+
+        assert not result['ok']
+        assert any("manifiesto" in error for error in result['errors'])
+
+    def test_cli_reports_throughput_and_exit_code(self, backup_env, capsys):
+        """maintenance verify-backup verifica todos los backups e informa del MB/s"""
+        import maintenance
+        maintenance.main(["backup"])
+        capsys.readouterr()
+
+        maintenance.main(["verify-backup", "--workers", "2"])
+        assert "MB/s" in capsys.readouterr().out
+
+        with pytest.raises(SystemExit):
+            maintenance.main(["verify-backup", "no_existe.zip"])
+
+    def test_parallel_hashing_is_recorded(self, backup_env, monkeypatch):
+        """El modo de cálculo de hashes queda en las estadísticas del backup"""
+        import maintenance
+        monkeypatch.setattr(utils, "BACKUP_WORKERS", 2)
+        maintenance.main(["backup", "--full", "--sequential-hashing"])
+        create_backup(incremental=False, parallel_hashing=True)
+
+        stats = [backup['metadata']['stats'] for backup in utils.list_available_backups()]
+        assert sorted(entry['parallel_hashing'] for entry in stats) == [False, True]
@@ -0,0 +1,116 @@
+"""
+Pruebas para la generación por lotes
+"""
+import threading
+import time
+
+import pytest
+
+import batch
+
+
+class TestBatchPlan:
+    """Pruebas para la planificación del lote"""
+
+    def test_grid_is_cartesian_product(self):
+        """Cada prompt se combina con cada combinación de la rejilla sobre los parámetros base"""
+        tasks = batch.plan_batch(["molar", "encía"], {"steps": 25, "width": 512},
+                                 {"width": [1024, 1440], "output_format": ["png", "webp"]})
+
+        assert len(tasks) == 8
+        assert tasks[0] == {"prompt": "molar", "params": {"steps": 25, "width": 1024, "output_format": "png"}}
+        assert {task["params"]["width"] for task in tasks} == {1024, 1440}
+
+    def test_empty_grid_and_blank_prompts(self):
+        """Sin rejilla hay una tarea por prompt y los prompts vacíos se ignoran"""
+        assert batch.expand_grid({}) == [{}]
+        assert batch.plan_batch(["molar", "  "], {"steps": 25}) == [{"prompt": "molar", "params": {"steps": 25}}]
+
+    def test_template_variations(self):
+        """{variacion} se sustituye; sin marcador la variación se añade al final"""
+        assert batch.build_prompts("ilustración de {variacion}, estilo médico", ["un molar", ""]) == \
+            ["ilustración de un molar, estilo médico"]
+        assert batch.build_prompts("ilustración dental,", ["corte lateral"]) == ["ilustración dental, corte lateral"]
+
+    def test_grid_values_are_typed(self):
+        """Los valores numéricos y booleanos se convierten"""
+        assert batch.parse_grid_values("1024, 1440") == [1024, 1440]
+        assert batch.parse_grid_values("webp,png,") == ["webp", "png"]
+        assert batch.parse_grid_values("true,3.5") == [True, 3.5]
+
+
+class TestRunBatch:
+    """Pruebas para la ejecución del lote"""
+
+    def test_concurrency_limit_and_summary(self, monkeypatch):
+        """No se superan las generaciones simultáneas y el resumen suma costos y fallos"""
+        running = 0
+        peak = 0
+        lock = threading.Lock()
+
+        def fake_generation(job, content_type, prompt, params, template, timeout):
+            nonlocal running, peak
+            with lock:
+                running += 1
+                peak = max(peak, running)
+            time.sleep(0.02)
+            with lock:
+                running -= 1
+            if params["steps"] == 50:
+                raise RuntimeError("sin output")
+            return {"tipo": "imagen", "url": "https://example.com/x.png", "archivo_local": "x.png", "costo": 0.055}
+
+        monkeypatch.setattr(batch, "run_generation", fake_generation)
+        tasks = batch.plan_batch(["a", "b", "c"], {}, {"steps": [25, 50], "width": [512, 1024]})
+        streamed = []
+
+        summary = batch.run_batch(None, "🖼️ Imagen (Flux Pro)", tasks, concurrency=2, rate_limit=60000,
+                                  on_result=streamed.append)
+
+        assert peak == 2
+        assert len(streamed) == 12
+        assert summary["total"] == 12
+        assert summary["exitosas"] == 6
+        assert summary["fallidas"] == 6
+        assert summary["costo_total"] == pytest.approx(0.33)
+        assert summary["errores"][0]["error"] == "RuntimeError: sin output"
+
+    def test_rate_limiter_spaces_starts(self):
+        """Los inicios se espacian según las generaciones por minuto"""
+        limiter = batch.RateLimiter(per_minute=1200)  # 50 ms
+        starts = []
+
+        threads = [threading.Thread(target=lambda: (limiter.acquire(), starts.append(time.monotonic())))
+                   for _ in range(3)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        starts.sort()
+        assert starts[2] - starts[0] >= 0.09
+
+    def test_rate_limit_per_model(self):
+        """Cada modelo tiene su límite y su limitador compartido"""
+        assert batch.get_rate_limit("🚀 Video (VEO 3 Fast)") == batch.MODEL_RATE_LIMITS["VEO 3 Fast"]
+        assert batch.get_rate_limit("Otro modelo") == batch.DEFAULT_RATE_LIMIT
+        assert batch.get_rate_limiter("⚡ Imagen (SSD-1B)") is batch.get_rate_limiter("⚡ Imagen (SSD-1B)")
+
+
+class TestBatchCli:
+    """Pruebas para la línea de comandos"""
+
+    def test_dry_run_prints_plan(self, capsys):
+        """--dry-run muestra las tareas sin generar"""
+        batch.main(["--model", "flux-pro", "--template", "dibujo de {variacion}",
+                    "--variation", "un molar", "--variation", "una muela",
+                    "--param", "steps=25", "--grid", "width=1024,1440", "--dry-run"])
+
+        output = capsys.readouterr().out
+        assert "4 generaciones" in output
+        assert '"width": 1440' in output
+
+    def test_no_prompts_exits_with_error(self):
+        """Sin prompts la orden termina con error"""
+        with pytest.raises(SystemExit):
+            batch.main(["--model", "ssd-1b"])
@@ -2,6 +2,7 @@
 Pruebas para cálculos de costos de modelos de IA
 """
 import pytest
+import utils
 from utils import calculate_item_cost, COST_RATES, get_model_from_filename
 
 class TestCostCalculation:
@@ -163,3 +164,148 @@ class TestCostCalculation:
         # Verificar case-insensitive
         assert get_model_from_filename('FLUX_IMAGE.PNG') == 'Flux Pro'
         assert get_model_from_filename('VEO3_VIDEO.MP4') == 'VEO 3 Fast'
+
+
+class TestVectorizedCosts:
+    """Pruebas para calculate_costs (cálculo vectorizado sobre todo el historial)"""
+
+    ITEMS = [
+        {'tipo': 'imagen', 'modelo': 'flux_pro', 'archivo_local': 'flux.png'},
+        {'tipo': 'imagen', 'archivo_local': 'kandinsky_1.png', 'parametros': {'num_inference_steps': 25}},
+        {'tipo': 'imagen', 'modelo': 'kandinsky', 'processing_time': 10},
+        {'tipo': 'imagen', 'modelo': 'SSD-1B', 'parametros': {'num_inference_steps': 60}},
+        {'tipo': 'imagen', 'archivo_local': 'ssd_2.png', 'processing_time': 7.3},
+        {'tipo': 'video_seedance', 'parametros': {'video_length': 10, 'duration': 5}},
+        {'tipo': 'video', 'modelo': 'Seedance', 'video_duration': 8},
+        {'tipo': 'video', 'modelo': 'Pixverse', 'parametros': {'duration': '8s', 'resolution': '1080p'}},
+        {'tipo': 'video', 'archivo_local': 'pixverse_2.mp4', 'parametros': {'duration': 5, 'resolution': '540p'}},
+        {'tipo': 'video', 'modelo': 'Pixverse', 'pixverse_units': 33.5, 'parametros': {'duration': '5s'}},
+        {'tipo': 'video', 'modelo': 'VEO 3 Fast', 'parametros': {'video_length': 10, 'duration': 6}},
+        {'tipo': 'video', 'archivo_local': 'otro.mp4'},
+        {'tipo': 'media'},
+    ]
+
+    def test_matches_scalar_function(self):
+        """Cada costo coincide exactamente con calculate_item_cost"""
+        costs = utils.calculate_costs(self.ITEMS)
+
+        assert costs.tolist() == [calculate_item_cost(item)[0] for item in self.ITEMS]
+
+    def test_rounding_ties_match_python_round(self):
+        """Los empates de redondeo se resuelven como round() y no como np.round()"""
+        # 0.00925 × 22s = 0.2035: round() da 0.203, np.round() daría 0.204
+        item = {'tipo': 'imagen', 'modelo': 'kandinsky', 'processing_time': 22}
+
+        assert utils.calculate_costs([item])[0] == calculate_item_cost(item)[0] == 0.203
+
+    def test_non_numeric_values_use_scalar_path(self):
+        """Valores no numéricos se delegan en la función escalar (mismo error)"""
+        item = {'tipo': 'video', 'modelo': 'Seedance', 'parametros': {'duration': '5s'}}
+
+        with pytest.raises(TypeError):
+            calculate_item_cost(item)
+        with pytest.raises(TypeError):
+            utils.calculate_costs([item])
+
+    def test_empty_history(self):
+        """Un historial vacío devuelve un array vacío"""
+        assert len(utils.calculate_costs([])) == 0
+
+
+class TestCostRollups:
+    """Pruebas para los rollups de costo mantenidos al guardar en el historial"""
+
+    ITEMS = [
+        {'tipo': 'imagen', 'modelo': 'flux_pro', 'fecha': '2025-06-30T10:00:00'},
+        {'tipo': 'imagen', 'modelo': 'flux_pro', 'fecha': '2025-07-01T10:00:00'},
+        {'tipo': 'video', 'modelo': 'veo3', 'fecha': '2025-07-02T10:00:00', 'parametros': {'duration': 4}},
+        {'tipo': 'media', 'fecha': '2025-07-03T10:00:00'},
+    ]
+
+    @pytest.fixture
+    def saved_history(self, temp_history_dir):
+        for item in self.ITEMS:
+            utils.save_to_history(item)
+        return temp_history_dir
+
+    def test_rollups_match_full_recompute(self, saved_history):
+        """Los rollups coinciden con recorrer el historial completo"""
+        history = utils.load_history()
+        rollups = utils.get_cost_rollups()
+
+        assert rollups['count'] == 4
+        assert rollups['total_cost'] == utils.calculate_total_cost(history)
+        assert rollups['by_model'] == utils.calculate_cost_breakdown(history)
+        assert rollups['by_type']['imagen'] == {'count': 2, 'total_cost': 0.11}
+        assert rollups['by_month']['2025-07']['count'] == 3
+        assert utils.calculate_total_cost() == rollups['total_cost']
+
+    def test_save_updates_rollups_without_recompute(self, saved_history, monkeypatch):
+        """Guardar solo costea el item nuevo y leer los totales no costea nada"""
+        calls = []
+        original = utils.calculate_item_cost
+        monkeypatch.setattr(utils, "calculate_item_cost", lambda item: calls.append(1) or original(item))
+
+        utils.save_to_history({'tipo': 'imagen', 'modelo': 'flux_pro', 'fecha': '2025-07-04T10:00:00'})
+        assert len(calls) == 1
+
+        rollups = utils.get_cost_rollups()
+        assert len(calls) == 1
+        assert rollups['count'] == 5
+        assert rollups['total_cost'] == pytest.approx(0.055 * 3 + 0.25 * 4)
+
+    def test_replaced_log_and_rebuild(self, saved_history):
+        """Un log reemplazado se recalcula; rebuild_cost_rollups parte de cero"""
+        utils._write_history_log([self.ITEMS[2]], utils.HISTORY_FILE)
+        assert utils.get_cost_rollups()['total_cost'] == 1.0
+
+        utils.COST_ROLLUPS_FILE.write_text('{"version": 1, "corrupto": true', encoding='utf-8')
+        assert utils.rebuild_cost_rollups()
+        assert utils.get_cost_rollups()['count'] == 1
+
+
+class TestStoredCosts:
+    """Pruebas para el costo y modelo guardados en cada item al crearlo"""
+
+    def test_save_stamps_model_and_cost(self, temp_history_dir):
+        """save_to_history guarda modelo normalizado, costo y versión de tarifas"""
+        utils.save_to_history({'tipo': 'video', 'modelo': 'VEO 3 Fast', 'parametros': {'duration': 4}})
+
+        stored = utils.load_history()[0]['cost']
+        assert stored['model_id'] == 'veo3'
+        assert stored['usd'] == 1.0
+        assert stored['model_info'] == 'VEO 3 Fast (4s)'
+        assert stored['rates_version'] == utils.COST_RATES_VERSION
+        assert utils.get_item_model_id(utils.load_history()[0]) == 'veo3'
+
+    def test_readers_use_stored_cost(self, temp_history_dir, monkeypatch):
+        """Con la versión actual no se vuelve a calcular el costo"""
+        utils.save_to_history({'tipo': 'imagen', 'modelo': 'flux_pro'})
+        item = utils.load_history()[0]
+
+        monkeypatch.setattr(utils, "_compute_item_cost", lambda item: pytest.fail("recálculo"))
+        assert calculate_item_cost(item) == (0.055, 'Flux Pro', '$0.055 por imagen')
+        assert utils.calculate_costs([item]).tolist() == [0.055]
+
+    def test_rates_version_change_recomputes(self, temp_history_dir, monkeypatch):
+        """Al cambiar la versión de tarifas se recalculan costos y rollups"""
+        utils.save_to_history({'tipo': 'imagen', 'modelo': 'flux_pro'})
+        assert utils.get_cost_rollups()['total_cost'] == 0.055
+
+        rates = {**COST_RATES, 'imagen': {**COST_RATES['imagen'], 'flux_pro': {'rate': 0.04, 'unit': 'per_image'}}}
+        monkeypatch.setattr(utils, "COST_RATES", rates)
+        monkeypatch.setattr(utils, "COST_RATES_VERSION", utils.COST_RATES_VERSION + 1)
+
+        item = utils.load_history()[0]
+        assert calculate_item_cost(item)[0] == 0.04
+        assert utils.calculate_costs([item]).tolist() == [0.04]
+        assert utils.get_cost_rollups()['total_cost'] == 0.04
+
+    def test_stamp_history_costs_updates_old_items(self, temp_history_dir):
+        """Los items sin costo guardado se sellan reescribiendo el log"""
+        utils._write_history_log([{'tipo': 'imagen', 'modelo': 'kandinsky', 'processing_time': 10}],
+                                 utils.HISTORY_FILE)
+
+        assert utils.stamp_history_costs() == 1
+        assert utils.load_history()[0]['cost']['model_id'] == 'kandinsky'
+        assert utils.stamp_history_costs() == 0
@@ -0,0 +1,102 @@
+"""
+Pruebas para el gestor de descargas concurrentes y los clientes HTTP compartidos
+"""
+import threading
+import time
+from urllib.parse import urlsplit
+
+import downloads
+import generation
+import utils
+
+
+class TestDownloadManager:
+    """Pruebas para DownloadManager"""
+
+    def test_global_and_per_host_limits(self, monkeypatch):
+        """No se superan las transferencias simultáneas totales ni por host"""
+        lock = threading.Lock()
+        running = {}
+        peaks = {'total': 0}
+
+        def fake_download(url, filename, file_type):
+            host = urlsplit(url).netloc
+            with lock:
+                running[host] = running.get(host, 0) + 1
+                peaks[host] = max(peaks.get(host, 0), running[host])
+                peaks['total'] = max(peaks['total'], sum(running.values()))
+            time.sleep(0.02)
+            with lock:
+                running[host] -= 1
+            return f"historial/{filename}"
+
+        monkeypatch.setattr(downloads, "download_and_save_file", fake_download)
+        manager = downloads.DownloadManager(max_parallel=3, per_host=2)
+        files = [(f"https://{host}/{i}.png", f"{host}_{i}.png", "imagen")
+                 for i in range(4) for host in ("a.example.com", "b.example.com")]
+
+        try:
+            paths = manager.download_many(files)
+        finally:
+            manager.shutdown()
+
+        assert paths == [f"historial/{filename}" for _, filename, _ in files]
+        assert peaks['total'] == 3
+        assert peaks['a.example.com'] == 2
+        assert peaks['b.example.com'] <= 2
+
+    def test_failed_download_keeps_position(self, monkeypatch):
+        """Una descarga fallida devuelve None en su posición"""
+        monkeypatch.setattr(downloads, "download_and_save_file",
+                            lambda url, filename, file_type: None if "roto" in url else filename)
+        manager = downloads.DownloadManager()
+
+        try:
+            paths = manager.download_many([("https://x/1.png", "1.png", "imagen"),
+                                           ("https://x/roto.png", "2.png", "imagen")])
+        finally:
+            manager.shutdown()
+
+        assert paths == ["1.png", None]
+
+
+class TestSharedClients:
+    """Pruebas para la sesión HTTP y el cliente de Replicate compartidos"""
+
+    def test_http_session_is_reused_with_pool(self):
+        """La sesión se crea una vez con el pool configurado"""
+        session = utils.get_http_session()
+
+        assert utils.get_http_session() is session
+        assert session.get_adapter("https://replicate.delivery")._pool_maxsize == utils.HTTP_POOL_MAXSIZE
+
+    def test_replicate_client_is_reused_until_token_changes(self, monkeypatch):
+        """El cliente se reutiliza y se recrea al cambiar el token"""
+        monkeypatch.setenv("REPLICATE_API_TOKEN", "r8_uno")
+        client = generation.get_replicate_client()
+        assert generation.get_replicate_client() is client
+
+        monkeypatch.setenv("REPLICATE_API_TOKEN", "r8_dos")
+        assert generation.get_replicate_client() is not client
+
+
+class TestMultipleOutputs:
+    """Pruebas para predicciones con varias salidas"""
+
+    def test_all_outputs_are_downloaded(self, temp_history_dir, tmp_path, monkeypatch):
+        """La primera salida es archivo_local y el resto va a archivos_extra con su hash"""
+        monkeypatch.setattr(utils, "GENERATION_STATS_FILE", tmp_path / "generation_stats.json")
+        monkeypatch.setattr(generation, "generate_ssd1b",
+                            lambda prompt, **params: [f"https://example.com/{i}.png" for i in range(3)])
+        downloaded = []
+        monkeypatch.setattr(downloads, "download_and_save_file",
+                            lambda url, filename, file_type: downloaded.append(url) or filename)
+
+        result = generation.run_generation(None, "⚡ Imagen (SSD-1B)", "molar", {"num_outputs": 3})
+
+        item = utils.load_history()[0]
+        stem = result['archivo_local'].rsplit(".", 1)[0]
+        assert sorted(downloaded) == [f"https://example.com/{i}.png" for i in range(3)]
+        assert item['url'] == "https://example.com/0.png"
+        assert [extra['archivo_local'] for extra in item['archivos_extra']] == [f"{stem}_2.jpg", f"{stem}_3.jpg"]
+        assert [extra['url'] for extra in item['archivos_extra']] == [f"https://example.com/{i}.png" for i in (1, 2)]
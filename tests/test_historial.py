@@ -0,0 +1,359 @@
+"""
+Pruebas para el sistema de historial
+"""
+import json
+import multiprocessing
+
+import pytest
+
+import utils
+from utils import load_history, save_to_history, migrate_legacy_history, compact_history
+
+
+def _item(n, tipo='imagen'):
+    return {
+        'tipo': tipo,
+        'fecha': f"2025-07-17T19:23:{n:02d}",
+        'prompt': f"prompt {n}",
+        'plantilla': 'Personalizado',
+        'url': f"https://example.com/{n}.webp",
+        'archivo_local': f"imagen_{n}.webp",
+        'parametros': {}
+    }
+
+
+class TestHistoryStore:
+    """Pruebas para el log append-only del historial"""
+
+    def test_save_appends_single_line(self, temp_history_dir):
+        """Cada guardado añade exactamente una línea al log"""
+        assert save_to_history(_item(1))
+        assert save_to_history(_item(2))
+
+        lines = utils.HISTORY_FILE.read_text(encoding='utf-8').splitlines()
+        assert len(lines) == 2
+        assert json.loads(lines[1])['prompt'] == 'prompt 2'
+
+    def test_load_returns_most_recent_first(self, temp_history_dir):
+        """El historial se devuelve en orden cronológico inverso"""
+        for n in range(3):
+            save_to_history(_item(n))
+
+        history = load_history()
+        assert [h['prompt'] for h in history] == ['prompt 2', 'prompt 1', 'prompt 0']
+
+    def test_history_has_no_item_limit(self, temp_history_dir):
+        """El historial conserva más de 100 elementos"""
+        for n in range(150):
+            save_to_history(_item(n % 60))
+
+        assert len(load_history()) == 150
+
+    def test_non_serializable_values_are_stringified(self, temp_history_dir):
+        """Los objetos no serializables se guardan como string"""
+        item = _item(1)
+        item['url'] = object()
+        assert save_to_history(item)
+
+        assert isinstance(load_history()[0]['url'], str)
+
+    def test_truncated_last_line_is_ignored(self, temp_history_dir):
+        """Una escritura interrumpida no invalida el resto del historial"""
+        save_to_history(_item(1))
+        with open(utils.HISTORY_FILE, 'a', encoding='utf-8') as f:
+            f.write('{"tipo": "imagen", "prom')
+
+        history = load_history()
+        assert len(history) == 1
+
+        assert compact_history()
+        assert len(utils.HISTORY_FILE.read_text(encoding='utf-8').splitlines()) == 1
+
+    def test_legacy_video_types_are_normalized(self, temp_history_dir):
+        """Los tipos video_seedance/video_anime se normalizan a video"""
+        save_to_history(_item(1, tipo='video_seedance'))
+
+        assert load_history()[0]['tipo'] == 'video'
+
+
+class TestHistoryIds:
+    """Pruebas para los ids estables de los items del historial"""
+
+    def test_save_assigns_unique_id(self, temp_history_dir):
+        """Cada item guardado recibe un id distinto que se conserva en el log"""
+        save_to_history(_item(1))
+        save_to_history(_item(1))
+
+        history = load_history()
+        assert history[0]['id'] != history[1]['id']
+        assert json.loads(utils.HISTORY_FILE.read_text(encoding='utf-8').splitlines()[0])['id'] == history[1]['id']
+
+    def test_legacy_items_get_stable_id(self, temp_history_dir):
+        """Los items sin id reciben el mismo id derivado en cada carga y al persistirlo"""
+        utils._write_history_log([_item(1), _item(2)], utils.HISTORY_FILE)
+        ids = [h['id'] for h in load_history()]
+        utils.invalidate_history_cache()
+        assert [h['id'] for h in load_history()] == ids
+
+        assert utils.assign_history_ids() == 2
+        assert utils.assign_history_ids() == 0
+        assert [h['id'] for h in load_history()] == ids
+
+    def test_get_history_item_by_id(self, temp_history_dir):
+        """Se encuentra el item por id, también el recién guardado"""
+        save_to_history(_item(1))
+        first_id = load_history()[0]['id']
+        assert utils.get_history_item(first_id)['prompt'] == 'prompt 1'
+
+        save_to_history(_item(2))
+        assert utils.get_history_item(load_history()[0]['id'])['prompt'] == 'prompt 2'
+        assert utils.get_history_item('no-existe') is None
+        assert utils.get_history_item(None) is None
+
+    def test_delete_history_item(self, temp_history_dir):
+        """Eliminar por id quita solo ese item y actualiza los rollups"""
+        save_to_history(_item(1))
+        save_to_history(_item(2))
+        target = load_history()[1]['id']
+
+        assert utils.delete_history_item(target)
+        assert [h['prompt'] for h in load_history()] == ['prompt 2']
+        assert utils.get_history_item(target) is None
+        assert utils.get_cost_rollups()['count'] == 1
+        assert not utils.delete_history_item(target)
+
+    def test_identical_legacy_items_get_distinct_ids(self, temp_history_dir):
+        """Dos líneas antiguas idénticas tienen ids distintos y se eliminan por separado"""
+        utils._write_history_log([_item(1), _item(1), _item(2)], utils.HISTORY_FILE)
+        ids = [h['id'] for h in load_history()]
+        assert len(set(ids)) == 3
+        # La primera aparición conserva el id de siempre
+        assert ids[-1] == utils._legacy_history_id(_item(1))
+
+        assert utils.delete_history_item(ids[1])
+        assert [h['id'] for h in load_history()] == [ids[0], ids[2]]
+        assert utils.delete_history_item(ids[2])
+        assert [h['prompt'] for h in load_history()] == ['prompt 2']
+
+    @pytest.mark.skipif("fork" not in multiprocessing.get_all_start_methods(), reason="Requiere fork")
+    def test_rewrites_do_not_lose_appends_from_other_processes(self, temp_history_dir):
+        """Compactar en un proceso mientras otros guardan no pierde ninguna línea"""
+        context = multiprocessing.get_context("fork")
+        writers = [context.Process(target=_save_many, args=(worker, 20)) for worker in range(3)]
+        compactor = context.Process(target=_compact_many, args=(40,))
+        for process in writers + [compactor]:
+            process.start()
+        for process in writers + [compactor]:
+            process.join()
+
+        assert len(load_history()) == 60
+
+
+def _save_many(worker, count):
+    for n in range(count):
+        save_to_history(_item(n, tipo=f"imagen_{worker}"))
+
+
+def _compact_many(count):
+    for _ in range(count):
+        compact_history()
+
+
+class TestLegacyMigration:
+    """Pruebas para la migración desde history.json"""
+
+    def test_legacy_file_is_migrated_on_first_load(self, temp_history_dir):
+        """history.json se importa al log y se renombra"""
+        legacy = [_item(2), _item(1)]  # Formato antiguo: más reciente primero
+        utils.LEGACY_HISTORY_FILE.write_text(json.dumps(legacy), encoding='utf-8')
+
+        history = load_history()
+
+        assert [h['prompt'] for h in history] == ['prompt 2', 'prompt 1']
+        assert utils.HISTORY_FILE.exists()
+        assert not utils.LEGACY_HISTORY_FILE.exists()
+        assert (temp_history_dir / "history.json.migrated").exists()
+
+    def test_save_after_migration_keeps_legacy_items(self, temp_history_dir):
+        """Guardar sobre un historial antiguo conserva sus elementos"""
+        utils.LEGACY_HISTORY_FILE.write_text(json.dumps([_item(1)]), encoding='utf-8')
+
+        save_to_history(_item(2))
+
+        assert [h['prompt'] for h in load_history()] == ['prompt 2', 'prompt 1']
+
+    def test_migration_does_not_overwrite_existing_log(self, temp_history_dir):
+        """Sin overwrite no se reemplaza un log existente"""
+        save_to_history(_item(1))
+        utils.LEGACY_HISTORY_FILE.write_text(json.dumps([_item(9)]), encoding='utf-8')
+
+        assert not migrate_legacy_history()
+        assert [h['prompt'] for h in load_history()] == ['prompt 1']
+
+
+class TestQueryHistory:
+    """Pruebas para la consulta del historial (índice SQLite y fallback en memoria)"""
+
+    @pytest.fixture(params=['fts', 'sqlite', 'memoria'])
+    def populated_history(self, request, temp_history_dir, monkeypatch):
+        monkeypatch.setattr(utils, "USE_HISTORY_INDEX", request.param != 'memoria')
+        if request.param == 'sqlite':
+            monkeypatch.setattr(utils, "_fts5_available", lambda conn: False)
+        save_to_history({**_item(1), 'prompt': 'dental crown ceramic', 'modelo': 'flux_pro'})
+        save_to_history({**_item(2, tipo='video'), 'prompt': 'molar inlay animation', 'modelo': 'Seedance'})
+        save_to_history({**_item(3), 'prompt': 'gum tissue closeup', 'modelo': 'SSD-1B'})
+        save_to_history({**_item(4, tipo='video'), 'prompt': 'crown placement', 'modelo': 'VEO 3 Fast'})
+        return temp_history_dir
+
+    def test_default_order_is_most_recent_first(self, populated_history):
+        """Sin filtros devuelve todo, más reciente primero"""
+        assert [h['fecha'][-2:] for h in utils.query_history()] == ['04', '03', '02', '01']
+
+    def test_filter_by_tipo_and_modelo(self, populated_history):
+        """Filtra por tipo y por modelo sin distinguir mayúsculas"""
+        assert [h['prompt'] for h in utils.query_history(tipo='video')] == ['crown placement', 'molar inlay animation']
+        assert [h['prompt'] for h in utils.query_history(modelo='seedance')] == ['molar inlay animation']
+
+    def test_text_search_matches_any_term(self, populated_history):
+        """La búsqueda encuentra prompts con cualquiera de los términos"""
+        results = utils.query_history(text='crown gum')
+        assert [h['prompt'] for h in results] == ['crown placement', 'gum tissue closeup', 'dental crown ceramic']
+
+    @pytest.mark.parametrize("text, expected", [
+        ("cer", ['dental crown ceramic']),
+        ("ramic", []),
+        ("CROWN", ['crown placement', 'dental crown ceramic']),
+        ("cerámica", []),
+        ("ceramic,", ['dental crown ceramic']),
+        ("dental-cr", ['dental crown ceramic']),
+        ("crown-dental", []),
+        ("!!", []),
+    ])
+    def test_text_search_is_token_prefix(self, populated_history, text, expected):
+        """Todos los backends buscan por prefijo de token, sin mayúsculas ni acentos"""
+        assert [h['prompt'] for h in utils.query_history(text=text)] == expected
+        assert utils.query_history_page(text=text)['total'] == len(expected)
+
+    def test_text_search_ignores_accents(self, populated_history):
+        """Los acentos no cuentan ni en el prompt ni en la búsqueda"""
+        save_to_history({**_item(5), 'prompt': 'Corona cerámica para niño'})
+
+        assert [h['prompt'] for h in utils.query_history(text='ceram')] == [
+            'Corona cerámica para niño', 'dental crown ceramic']
+        assert [h['prompt'] for h in utils.query_history(text='NIÑO')] == ['Corona cerámica para niño']
+        assert [h['prompt'] for h in utils.query_history(text='nino')] == ['Corona cerámica para niño']
+
+    def test_date_range_order_and_paging(self, populated_history):
+        """Rango de fechas, orden ascendente y paginación"""
+        results = utils.query_history(since='2025-07-17T19:23:02', until='2025-07-17T19:23:04', order='asc')
+        assert [h['fecha'][-2:] for h in results] == ['02', '03', '04']
+
+        page = utils.query_history(order='asc', limit=2, offset=1)
+        assert [h['fecha'][-2:] for h in page] == ['02', '03']
+
+    def test_index_picks_up_new_items(self, populated_history):
+        """Los elementos guardados después de consultar aparecen en la siguiente consulta"""
+        utils.query_history()
+        save_to_history({**_item(5), 'prompt': 'new crown'})
+
+        assert utils.query_history(limit=1)[0]['prompt'] == 'new crown'
+
+    def test_index_is_rebuilt_when_log_is_replaced(self, populated_history):
+        """Si el log se reemplaza (compactación/restauración) el índice se reconstruye"""
+        utils.query_history()
+        utils._write_history_log([_item(9)], utils.HISTORY_FILE)
+
+        assert [h['prompt'] for h in utils.query_history()] == ['prompt 9']
+
+    def test_page_totals_and_clamping(self, populated_history):
+        """La página trae solo sus elementos con el total filtrado; las páginas fuera de rango se ajustan"""
+        page = utils.query_history_page(page=2, page_size=3)
+        assert [h['fecha'][-2:] for h in page['items']] == ['01']
+        assert (page['page'], page['pages'], page['total'], page['new_items']) == (2, 2, 4, 0)
+
+        page = utils.query_history_page(tipo='video', page=5, page_size=1)
+        assert [h['prompt'] for h in page['items']] == ['molar inlay animation']
+        assert (page['page'], page['pages']) == (2, 2)
+
+    def test_cursor_keeps_pages_stable(self, populated_history):
+        """Con el cursor de la primera página, las generaciones nuevas no desplazan las páginas"""
+        first = utils.query_history_page(page=1, page_size=2)
+        save_to_history({**_item(5), 'prompt': 'new crown'})
+
+        second = utils.query_history_page(page=2, page_size=2, cursor=first['cursor'])
+        assert [h['fecha'][-2:] for h in second['items']] == ['02', '01']
+        assert (second['total'], second['new_items']) == (4, 1)
+
+        fresh = utils.query_history_page(page=1, page_size=2)
+        assert fresh['items'][0]['prompt'] == 'new crown'
+
+
+class TestHistoryCache:
+    """Pruebas para la caché del historial en memoria"""
+
+    def test_unchanged_file_is_not_reparsed(self, temp_history_dir, monkeypatch):
+        """Mientras el archivo no cambia no se vuelve a parsear"""
+        save_to_history(_item(1))
+        load_history()
+
+        calls = []
+        original = utils._read_history_log
+        monkeypatch.setattr(utils, "_read_history_log", lambda f: calls.append(f) or original(f))
+
+        load_history()
+        load_history()
+        assert calls == []
+
+    def test_save_updates_cache_without_reparse(self, temp_history_dir, monkeypatch):
+        """save_to_history actualiza la caché sin releer el log"""
+        save_to_history(_item(1))
+        load_history()
+
+        monkeypatch.setattr(utils, "_read_history_log", lambda f: pytest.fail("reparse"))
+        save_to_history(_item(2))
+
+        assert [h['prompt'] for h in load_history()] == ['prompt 2', 'prompt 1']
+
+    def test_concurrent_append_is_not_lost(self, temp_history_dir, monkeypatch):
+        """Si otro proceso añade una línea durante el guardado se descarta la caché"""
+        save_to_history(_item(1))
+        load_history()
+
+        original_open = utils.os.open
+        foreign = [json.dumps({**_item(9), 'id': 'externo'}) + "\n"]
+
+        def open_after_foreign_append(path, *args):
+            if foreign and str(path) == str(utils.HISTORY_FILE):
+                with open(utils.HISTORY_FILE, 'a', encoding='utf-8') as f:
+                    f.write(foreign.pop())
+            return original_open(path, *args)
+
+        monkeypatch.setattr(utils.os, "open", open_after_foreign_append)
+        save_to_history(_item(2))
+
+        assert [h['prompt'] for h in load_history()] == ['prompt 2', 'prompt 9', 'prompt 1']
+        assert utils.get_history_item('externo')['prompt'] == 'prompt 9'
+
+    def test_external_change_invalidates_cache(self, temp_history_dir):
+        """Un cambio del archivo fuera de save_to_history se detecta"""
+        save_to_history(_item(1))
+        load_history()
+
+        utils._write_history_log([_item(7), _item(8)], utils.HISTORY_FILE)
+
+        assert [h['prompt'] for h in load_history()] == ['prompt 8', 'prompt 7']
+
+    def test_items_are_read_only(self, temp_history_dir):
+        """Los elementos devueltos no se pueden modificar"""
+        save_to_history({**_item(1), 'parametros': {'steps': 25}})
+        item = load_history()[0]
+
+        with pytest.raises(TypeError):
+            item['prompt'] = 'otro'
+        with pytest.raises(TypeError):
+            item['parametros']['steps'] = 50
+
+        mutable = utils.thaw_history_item(item)
+        mutable['parametros']['steps'] = 50
+        assert json.loads(json.dumps(mutable))['parametros']['steps'] == 50
+        assert load_history()[0]['parametros']['steps'] == 25
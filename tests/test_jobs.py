@@ -0,0 +1,156 @@
+"""
+Pruebas para la cola de trabajos en segundo plano y el pipeline de generación
+"""
+import json
+import threading
+import time
+
+import pytest
+
+import downloads
+import generation
+import jobs
+import utils
+
+
+def _wait_for(queue, job_id, timeout=5):
+    """Esperar a que un trabajo termine"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = queue.get(job_id)
+        if job and job['status'] in jobs.FINISHED_STATUSES:
+            return job
+        time.sleep(0.01)
+    pytest.fail(f"El trabajo {job_id} no terminó")
+
+
+@pytest.fixture
+def queue(tmp_path):
+    job_queue = jobs.JobQueue(tmp_path / "jobs", max_workers=2)
+    yield job_queue
+    job_queue.shutdown()
+
+
+class TestJobQueue:
+    """Pruebas para JobQueue"""
+
+    def test_job_result_and_progress_are_persisted(self, queue):
+        """El resultado y el progreso quedan en el archivo del trabajo"""
+        def target(job, value):
+            job.update(0.5, "a mitad")
+            return {"doble": value * 2}
+
+        job_id = queue.submit(target, 21, label="prueba", kind="test")
+        job = _wait_for(queue, job_id)
+
+        assert job['status'] == jobs.SUCCEEDED
+        assert job['result'] == {"doble": 42}
+        assert job['progress'] == 1.0
+        stored = json.loads((queue.jobs_dir / f"{job_id}.json").read_text(encoding='utf-8'))
+        assert stored['label'] == "prueba"
+
+    def test_failed_job_records_error(self, queue):
+        """Una excepción del trabajo se guarda como error"""
+        def target(job):
+            raise RuntimeError("sin output")
+
+        job = _wait_for(queue, queue.submit(target))
+
+        assert job['status'] == jobs.FAILED
+        assert job['error'] == "RuntimeError: sin output"
+
+    def test_jobs_run_in_parallel(self, queue):
+        """Varios trabajos se ejecutan a la vez en el pool"""
+        barrier = threading.Barrier(2, timeout=5)
+
+        job_ids = [queue.submit(lambda job: barrier.wait()) for _ in range(2)]
+
+        assert [_wait_for(queue, job_id)['status'] for job_id in job_ids] == [jobs.SUCCEEDED] * 2
+
+    def test_orphaned_jobs_are_marked_interrupted(self, tmp_path):
+        """Los trabajos activos de un proceso que ya no existe se marcan interrumpidos"""
+        jobs_dir = tmp_path / "jobs"
+        jobs_dir.mkdir()
+        (jobs_dir / "viejo.json").write_text(json.dumps({
+            'id': "viejo", 'status': jobs.RUNNING, 'created': "2025-07-01T10:00:00", 'pid': 2 ** 22 + 12345
+        }), encoding='utf-8')
+
+        job_queue = jobs.JobQueue(jobs_dir)
+        try:
+            assert job_queue.get("viejo")['status'] == jobs.INTERRUPTED
+        finally:
+            job_queue.shutdown()
+
+    def test_list_and_clear_finished(self, queue):
+        """La lista va de más reciente a más antiguo y se pueden borrar los terminados"""
+        first = queue.submit(lambda job: 1)
+        _wait_for(queue, first)
+        second = queue.submit(lambda job: 2)
+        _wait_for(queue, second)
+
+        assert [job['id'] for job in queue.list_jobs()] == [second, first]
+        assert queue.clear_finished() == 2
+        assert queue.list_jobs() == []
+
+
+class TestRunGeneration:
+    """Pruebas para el pipeline de generación sin interfaz"""
+
+    def test_direct_output_model_saves_history_and_stats(self, temp_history_dir, tmp_path, monkeypatch):
+        """Genera, descarga, guarda en el historial y actualiza las estadísticas"""
+        monkeypatch.setattr(utils, "GENERATION_STATS_FILE", tmp_path / "generation_stats.json")
+        monkeypatch.setattr(generation, "generate_video_veo3", lambda prompt, **params: "https://example.com/v.mp4")
+        monkeypatch.setattr(downloads, "download_and_save_file", lambda url, filename, file_type: filename)
+
+        result = generation.run_generation(None, "🚀 Video (VEO 3 Fast)", "olas", {"duration": 4}, "Personalizado")
+
+        assert result['tipo'] == 'video'
+        assert result['archivo_local'].startswith("veo3_")
+        item = utils.load_history()[0]
+        assert item['modelo'] == "VEO 3 Fast"
+        assert item['cost']['usd'] == 1.0
+        stats = json.loads(utils.GENERATION_STATS_FILE.read_text(encoding='utf-8'))
+        assert stats["🚀 Video (VEO 3 Fast)"]["exitosas"] == 1
+
+    def test_unreadable_stats_do_not_fail_a_saved_generation(self, temp_history_dir, tmp_path, monkeypatch):
+        """Si generation_stats.json no se puede leer la generación guardada sigue siendo correcta"""
+        stats_file = tmp_path / "generation_stats.json"
+        stats_file.write_text('{"roto', encoding='utf-8')
+        monkeypatch.setattr(utils, "GENERATION_STATS_FILE", stats_file)
+        monkeypatch.setattr(utils, "_stats_pending", [])
+        monkeypatch.setattr(generation, "generate_video_veo3", lambda prompt, **params: "https://example.com/v.mp4")
+        monkeypatch.setattr(downloads, "download_and_save_file", lambda url, filename, file_type: filename)
+
+        result = generation.run_generation(None, "🚀 Video (VEO 3 Fast)", "olas", {"duration": 4})
+
+        assert result['tipo'] == 'video'
+        assert len(utils.load_history()) == 1
+        assert stats_file.read_text(encoding='utf-8') == '{"roto'
+        assert len(utils._stats_pending) == 1
+
+    def test_failed_history_save_fails_the_generation(self, temp_history_dir, tmp_path, monkeypatch):
+        """Si no se puede guardar en el historial la generación se informa como fallida"""
+        monkeypatch.setattr(utils, "GENERATION_STATS_FILE", tmp_path / "generation_stats.json")
+        monkeypatch.setattr(generation, "generate_video_veo3", lambda prompt, **params: "https://example.com/v.mp4")
+        monkeypatch.setattr(downloads, "download_and_save_file", lambda url, filename, file_type: filename)
+        monkeypatch.setattr(generation, "save_to_history", lambda item: False)
+
+        with pytest.raises(RuntimeError):
+            generation.run_generation(None, "🚀 Video (VEO 3 Fast)", "olas", {"duration": 4})
+
+        entry = utils.get_generation_stats()["🚀 Video (VEO 3 Fast)"]
+        assert (entry["total"], entry["exitosas"]) == (1, 0)
+
+    def test_failure_is_counted_and_raised(self, temp_history_dir, tmp_path, monkeypatch):
+        """Sin output se lanza un error y la generación cuenta como fallida"""
+        monkeypatch.setattr(utils, "GENERATION_STATS_FILE", tmp_path / "generation_stats.json")
+        monkeypatch.setattr(generation, "generate_ssd1b", lambda prompt, **params: None)
+
+        with pytest.raises(RuntimeError):
+            generation.run_generation(None, "⚡ Imagen (SSD-1B)", "gato", {})
+
+        stats = json.loads(utils.GENERATION_STATS_FILE.read_text(encoding='utf-8'))
+        entry = stats["⚡ Imagen (SSD-1B)"]
+        assert (entry["total"], entry["exitosas"], entry["tiempo_promedio"]) == (1, 0, 0)
+        assert "latencia" not in entry
+        assert utils.load_history() == []
@@ -0,0 +1,130 @@
+"""
+Pruebas para los histogramas de latencia por modelo
+"""
+import json
+import random
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import pytest
+
+import latency
+import polling
+import utils
+from latency import LatencyHistogram
+
+
+class TestLatencyHistogram:
+    """Pruebas para LatencyHistogram"""
+
+    def test_percentiles_have_bounded_relative_error(self):
+        """p50/p95/p99 quedan a menos de un 5% de los percentiles exactos"""
+        rng = random.Random(7)
+        values = sorted(rng.lognormvariate(2.5, 0.8) for _ in range(5000))
+        histogram = LatencyHistogram()
+        for value in values:
+            histogram.record(value)
+
+        for q in latency.PERCENTILES:
+            exact = values[int(q / 100 * len(values)) - 1]
+            assert histogram.percentile(q) == pytest.approx(exact, rel=0.05)
+        assert histogram.mean == pytest.approx(sum(values) / len(values))
+        assert len(histogram.buckets) < 150
+
+    def test_roundtrip_and_merge(self):
+        """La forma JSON conserva el histograma y merge suma las muestras"""
+        first, second = LatencyHistogram(), LatencyHistogram()
+        for value in (0.004, 1.0, 2.0):
+            first.record(value)
+        second.record(30.0)
+
+        restored = LatencyHistogram.from_dict(json.loads(json.dumps(first.to_dict())))
+        assert restored.buckets == first.buckets
+        assert (restored.count, restored.min, restored.max) == (3, 0.004, 2.0)
+
+        merged = restored.merge(second)
+        assert merged.count == 4 and merged.max == 30.0
+        assert merged.percentile(100) == 30.0
+        assert LatencyHistogram().percentile(50) is None
+        assert LatencyHistogram.from_dict({"b": "no válido"}).count == 0
+
+
+class TestLatencyStats:
+    """Pruebas para el registro en generation_stats.json"""
+
+    def test_windows_and_throughput(self):
+        """Cada ventana solo incluye sus franjas y las fallidas no cuentan en los percentiles"""
+        now = datetime(2025, 7, 17, 19, 30)
+        entry = {"total": 0, "exitosas": 0}
+        for hours_ago, seconds in ((0, 10.0), (0, 20.0), (5, 40.0), (48, 80.0)):
+            entry["total"] += 1
+            entry["exitosas"] += 1
+            latency.record_generation(entry, {"total": seconds, "cola": 1.0}, True,
+                                      now=now - timedelta(hours=hours_ago))
+        entry["total"] += 1
+        latency.record_generation(entry, {"total": 500.0}, False, now=now)
+
+        last_hour = latency.summarize(entry, "1h", now=now)
+        assert (last_hour["n"], last_hour["ok"], last_hour["throughput_per_hour"]) == (3, 2, 2.0)
+        assert last_hour["phases"]["total"]["p99"] == pytest.approx(20.0, rel=0.05)
+        assert last_hour["phases"]["cola"]["n"] == 2
+        assert "descarga" not in last_hour["phases"]
+
+        assert latency.summarize(entry, "24h", now=now)["phases"]["total"]["n"] == 3
+        everything = latency.summarize(entry, "todo", now=now)
+        assert everything["phases"]["total"]["n"] == 4
+        assert everything["phases"]["total"]["p99"] == pytest.approx(80.0, rel=0.05)
+
+    def test_old_windows_are_pruned(self):
+        """Las franjas más antiguas que la retención se descartan"""
+        now = datetime(2025, 7, 17, 19, 30)
+        entry = {}
+        latency.record_generation(entry, {"total": 1.0}, True, now=now - timedelta(days=30))
+        latency.record_generation(entry, {"total": 1.0}, True, now=now)
+
+        assert list(entry["ventanas"]) == ["2025-07-17T19"]
+        assert entry["latencia"]["total"]["n"] == 2
+
+    def test_update_generation_stats_records_phases(self, tmp_path, monkeypatch):
+        """update_generation_stats guarda los histogramas y tiempo_promedio es la media exacta"""
+        monkeypatch.setattr(utils, "GENERATION_STATS_FILE", tmp_path / "generation_stats.json")
+        for seconds in (10.0, 20.0, 60.0):
+            utils.update_generation_stats("🖼️ Imagen (Flux Pro)", seconds, True,
+                                          {"cola": 2.0, "ejecucion": seconds - 3, "descarga": 1.0})
+
+        entry = utils._load_generation_stats()["🖼️ Imagen (Flux Pro)"]
+        assert entry["tiempo_promedio"] == pytest.approx(30.0)
+        assert set(entry["latencia"]) == {"total", "cola", "ejecucion", "descarga"}
+
+        summary = utils.get_latency_stats("24h")["🖼️ Imagen (Flux Pro)"]
+        assert summary["phases"]["total"]["p50"] == pytest.approx(20.0, rel=0.05)
+        assert polling.get_expected_latency("Flux Pro") == pytest.approx(20.0, rel=0.05)
+
+    def test_legacy_average_is_kept(self, tmp_path, monkeypatch):
+        """La media de una entrada sin histogramas no se pierde al registrar nuevas generaciones"""
+        stats_file = tmp_path / "generation_stats.json"
+        stats_file.write_text(json.dumps({
+            "🖼️ Imagen (Flux Pro)": {"total": 3, "exitosas": 3, "tiempo_promedio": 30.0}
+        }), encoding="utf-8")
+        monkeypatch.setattr(utils, "GENERATION_STATS_FILE", stats_file)
+
+        utils.update_generation_stats("🖼️ Imagen (Flux Pro)", 5.0, False)
+        entry = utils.get_generation_stats()["🖼️ Imagen (Flux Pro)"]
+        assert entry["tiempo_promedio"] == pytest.approx(30.0)
+        assert polling.get_expected_latency("Flux Pro") == pytest.approx(30.0)
+
+        # Una generación correcta se promedia con las tres anteriores
+        utils.update_generation_stats("🖼️ Imagen (Flux Pro)", 10.0, True)
+        entry = utils.get_generation_stats()["🖼️ Imagen (Flux Pro)"]
+        assert entry["tiempo_promedio"] == pytest.approx(25.0)
+        assert (entry["total"], entry["exitosas"]) == (5, 4)
+
+    def test_prediction_phases(self):
+        """Cola y ejecución salen de las marcas de tiempo de Replicate"""
+        prediction = SimpleNamespace(created_at="2025-07-17T19:23:00.000Z",
+                                     started_at="2025-07-17T19:23:04.500Z",
+                                     completed_at="2025-07-17T19:23:14.500Z")
+        assert latency.prediction_phases(prediction) == {"cola": 4.5, "ejecucion": 10.0}
+
+        without_start = SimpleNamespace(created_at=None, metrics={"predict_time": 3.2})
+        assert latency.prediction_phases(without_start) == {"ejecucion": 3.2}
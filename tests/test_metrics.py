@@ -0,0 +1,143 @@
+"""
+Pruebas para el exportador de métricas de Prometheus
+"""
+import re
+import threading
+import urllib.error
+import urllib.request
+
+import pytest
+
+import latency
+import metrics
+import utils
+
+
+@pytest.fixture
+def metrics_env(temp_history_dir, tmp_path, monkeypatch):
+    """Historial, estadísticas y backups en el directorio temporal"""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(utils, "GENERATION_STATS_FILE", tmp_path / "generation_stats.json")
+    monkeypatch.setattr(metrics, "_directory_cache", {})
+    return temp_history_dir
+
+
+def parse_samples(text):
+    """{(nombre, etiquetas ordenadas): valor} de un texto de exposición"""
+    samples = {}
+    for line in text.splitlines():
+        if not line or line.startswith("#"):
+            continue
+        match = re.fullmatch(r'(\w+)(?:\{(.*)\})? (\S+)', line)
+        assert match, line
+        labels = tuple(sorted(re.findall(r'(\w+)="((?:[^"\\]|\\.)*)"', match.group(2) or "")))
+        samples[(match.group(1), labels)] = float(match.group(3))
+    return samples
+
+
+class TestMetricsExposition:
+    """Pruebas para render_metrics"""
+
+    def test_generations_downloads_and_latency_histogram(self, metrics_env):
+        """Contadores por modelo y resultado, descargas y cubetas "le" acumuladas"""
+        model = "🖼️ Imagen (Flux Pro)"
+        for seconds in (0.8, 4.0, 45.0):
+            utils.update_generation_stats(model, seconds, True, {"descarga": 0.3},
+                                          downloads=2, download_bytes=1000)
+        utils.update_generation_stats(model, 3.0, False)
+
+        samples = parse_samples(metrics.render_metrics())
+        prefix = metrics.METRIC_PREFIX
+        assert samples[(f"{prefix}_generations_total", (("model", model), ("status", "success")))] == 3
+        assert samples[(f"{prefix}_generations_total", (("model", model), ("status", "failure")))] == 1
+        assert samples[(f"{prefix}_downloads_total", (("model", model),))] == 6
+        assert samples[(f"{prefix}_download_bytes_total", (("model", model),))] == 3000
+
+        def bucket(le, phase="total"):
+            return samples[(f"{prefix}_generation_duration_seconds_bucket",
+                            (("le", le), ("model", model), ("phase", phase)))]
+        assert (bucket("1"), bucket("5"), bucket("60"), bucket("+Inf")) == (1, 2, 3, 3)
+        assert bucket("0.5", phase="descarga") == 3
+        assert samples[(f"{prefix}_generation_duration_seconds_sum",
+                        (("model", model), ("phase", "total")))] == pytest.approx(49.8)
+        assert all(value == 1 for (name, _), value in samples.items() if name == f"{prefix}_collector_up")
+
+    def test_costs_storage_and_backups(self, metrics_env):
+        """Costo por modelo, tamaño de los directorios y duración de los backups"""
+        source = metrics_env / "imagen.webp"
+        source.write_bytes(b"x" * 4096)
+        stored = utils.add_to_media_store(source)
+        utils.save_to_history({'tipo': 'imagen', 'fecha': "2025-07-17T19:23:00", 'prompt': "p",
+                               'modelo': "Flux Pro", 'archivo_local': source.name, 'media_hash': stored.stem})
+        ok, _, _ = utils.create_backup()
+        assert ok
+
+        samples = parse_samples(metrics.render_metrics())
+        prefix = metrics.METRIC_PREFIX
+        costs = {labels: value for (name, labels), value in samples.items() if name == f"{prefix}_cost_usd"}
+        assert sum(costs.values()) == pytest.approx(utils.get_cost_rollups()['total_cost'])
+
+        assert samples[(f"{prefix}_history_items", (("type", "imagen"),))] == 1
+        assert samples[(f"{prefix}_history_bytes", ())] == utils.HISTORY_FILE.stat().st_size
+        assert samples[(f"{prefix}_directory_bytes", (("directory", "media"),))] >= 4096
+        assert samples[(f"{prefix}_backups", (("type", "full"),))] == 1
+        assert samples[(f"{prefix}_backup_duration_seconds_count", ())] == 1
+        assert (f"{prefix}_backup_last_timestamp_seconds", ()) in samples
+
+        # El costo baja al eliminar items, así que se publica como gauge
+        assert f"# TYPE {prefix}_cost_usd gauge" in metrics.render_metrics()
+        assert utils.delete_history_item(utils.load_history()[0]['id'])
+        samples = parse_samples(metrics.render_metrics())
+        assert not [name for name, _ in samples if name == f"{prefix}_cost_usd"]
+
+    def test_failing_collector_does_not_hide_the_rest(self, metrics_env, monkeypatch):
+        """Un colector que falla publica collector_up 0 y el resto sigue"""
+        def broken():
+            raise OSError("sin permisos")
+        monkeypatch.setitem(metrics.COLLECTORS, "backups", broken)
+
+        samples = parse_samples(metrics.render_metrics())
+        assert samples[(f"{metrics.METRIC_PREFIX}_collector_up", (("collector", "backups"),))] == 0
+        assert samples[(f"{metrics.METRIC_PREFIX}_collector_up", (("collector", "generations"),))] == 1
+
+    def test_label_escaping(self):
+        """Comillas, barras y saltos de línea se escapan en las etiquetas"""
+        family = metrics.MetricFamily("prueba", "gauge", "Prueba")
+        family.add(1.5, model='a "b"\\c\nd')
+        assert family.render().splitlines()[-1] == 'ai_models_prueba{model="a \\"b\\"\\\\c\\nd"} 1.5'
+
+    def test_cumulative_counts_match_bounds(self):
+        """Las cubetas "le" cuentan los valores por debajo de cada límite"""
+        histogram = latency.LatencyHistogram()
+        for value in (0.005, 0.9, 1.1, 9.0, 700.0):
+            histogram.record(value)
+        assert histogram.cumulative_counts((0.01, 1, 10, 600)) == [1, 2, 4, 4]
+
+
+class TestMetricsOutputs:
+    """Pruebas para el textfile collector y el endpoint HTTP"""
+
+    def test_write_textfile(self, metrics_env, tmp_path):
+        """El archivo .prom se escribe completo y sin temporales"""
+        path = metrics.write_textfile(tmp_path / "collector" / "ai_models.prom")
+        written = parse_samples(path.read_text(encoding='utf-8'))
+        assert written.keys() == parse_samples(metrics.render_metrics()).keys()
+        assert [p.name for p in path.parent.iterdir()] == ["ai_models.prom"]
+
+    def test_http_endpoint(self, metrics_env):
+        """GET /metrics devuelve el texto de exposición y otras rutas 404"""
+        server = metrics.make_metrics_server(port=0, host="127.0.0.1")
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        try:
+            base = f"http://127.0.0.1:{server.server_address[1]}"
+            with urllib.request.urlopen(base + metrics.METRICS_PATH, timeout=5) as response:
+                assert response.headers["Content-Type"] == metrics.METRICS_CONTENT_TYPE
+                body = response.read().decode('utf-8')
+            assert "# TYPE ai_models_generations_total counter" in body
+            with pytest.raises(urllib.error.HTTPError) as error:
+                urllib.request.urlopen(base + "/otra", timeout=5)
+            assert error.value.code == 404
+        finally:
+            server.shutdown()
+            server.server_close()
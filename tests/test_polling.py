@@ -0,0 +1,120 @@
+"""
+Pruebas para el motor de sondeo de predicciones
+"""
+import asyncio
+import itertools
+import json
+
+import pytest
+
+import polling
+import utils
+
+
+class FakePrediction:
+    """Predicción simulada que avanza un estado en cada reload()"""
+
+    def __init__(self, statuses, prediction_id="pred", fail_reloads=0):
+        self.id = prediction_id
+        self._statuses = iter(statuses)
+        self.status = next(self._statuses)
+        self.reloads = 0
+        self._fail_reloads = fail_reloads
+
+    def reload(self):
+        self.reloads += 1
+        if self._fail_reloads:
+            self._fail_reloads -= 1
+            raise ConnectionError("sin red")
+        self.status = next(self._statuses, self.status)
+
+
+class TestBackoff:
+    """Pruebas para los intervalos de espera"""
+
+    def test_intervals_grow_up_to_latency_based_cap(self):
+        """Empiezan cortos y crecen hasta un cuarto de la latencia esperada"""
+        intervals = list(itertools.islice(polling.backoff_intervals(expected_latency=40), 12))
+
+        assert intervals[0] == polling.MIN_POLL_INTERVAL
+        assert intervals == sorted(intervals)
+        assert intervals[-1] == 10
+
+    def test_cap_is_bounded(self):
+        """El máximo se acota para modelos muy rápidos o muy lentos"""
+        fast = list(itertools.islice(polling.backoff_intervals(expected_latency=1), 20))
+        slow = list(itertools.islice(polling.backoff_intervals(expected_latency=3600), 20))
+        unknown = list(itertools.islice(polling.backoff_intervals(), 20))
+
+        assert fast[-1] == polling.MAX_POLL_INTERVAL_FLOOR
+        assert slow[-1] == polling.MAX_POLL_INTERVAL_CEILING
+        assert unknown[-1] == polling.DEFAULT_MAX_POLL_INTERVAL
+
+    def test_expected_latency_from_generation_stats(self, tmp_path, monkeypatch):
+        """La latencia se lee de generation_stats.json por clave exacta o parcial"""
+        stats_file = tmp_path / "generation_stats.json"
+        stats_file.write_text(json.dumps({
+            "🖼️ Imagen (Flux Pro)": {"total": 3, "exitosas": 3, "tiempo_promedio": 9.5},
+            "🚀 Video (VEO 3 Fast)": {"total": 1, "exitosas": 1, "tiempo_promedio": 0},
+        }), encoding="utf-8")
+        monkeypatch.setattr(utils, "GENERATION_STATS_FILE", stats_file)
+
+        assert polling.get_expected_latency("🖼️ Imagen (Flux Pro)") == 9.5
+        assert polling.get_expected_latency("flux pro") == 9.5
+        assert polling.get_expected_latency("VEO 3 Fast") is None
+        assert polling.get_expected_latency("Kandinsky") is None
+
+
+class TestPollPrediction:
+    """Pruebas para el sondeo síncrono y asíncrono"""
+
+    def test_waits_until_terminal_status(self):
+        """Sondea hasta un estado final e informa del progreso"""
+        prediction = FakePrediction(["starting", "processing", "succeeded"])
+        updates = []
+
+        status = polling.poll_prediction(prediction, min_interval=0.001,
+                                         on_update=lambda p, elapsed: updates.append(p.status))
+
+        assert status == "succeeded"
+        assert prediction.reloads == 2
+        assert updates == ["starting", "processing", "succeeded"]
+
+    def test_deadline_returns_timeout(self):
+        """Al vencer el plazo devuelve TIMEOUT_STATUS sin esperar más"""
+        prediction = FakePrediction(["processing"])
+
+        assert polling.poll_prediction(prediction, deadline=0.02, min_interval=0.005) == polling.TIMEOUT_STATUS
+
+    def test_transient_reload_errors_are_retried(self):
+        """Los errores aislados de reload() se reintentan; los persistentes se propagan"""
+        prediction = FakePrediction(["processing", "succeeded"], fail_reloads=polling.MAX_RELOAD_ERRORS - 1)
+        assert polling.poll_prediction(prediction, min_interval=0.001) == "succeeded"
+
+        prediction = FakePrediction(["processing", "succeeded"], fail_reloads=polling.MAX_RELOAD_ERRORS)
+        with pytest.raises(ConnectionError):
+            polling.poll_prediction(prediction, min_interval=0.001)
+
+    def test_many_predictions_on_one_event_loop(self):
+        """Varias predicciones se sondean concurrentemente; un fallo no afecta al resto"""
+        predictions = [
+            FakePrediction(["starting", "processing", "succeeded"], "a"),
+            FakePrediction(["processing", "failed"], "b"),
+            FakePrediction(["processing"], "c", fail_reloads=polling.MAX_RELOAD_ERRORS),
+        ]
+
+        results = polling.poll_many(predictions, deadline=5, min_interval=0.001)
+
+        assert results == {"a": "succeeded", "b": "failed", "c": "error"}
+
+    def test_async_reload_is_preferred(self):
+        """Si el cliente ofrece async_reload se usa en lugar de reload en un hilo"""
+        prediction = FakePrediction(["processing", "succeeded"])
+
+        async def async_reload():
+            prediction.status = "succeeded"
+
+        prediction.async_reload = async_reload
+
+        assert asyncio.run(polling.poll_prediction_async(prediction, min_interval=0.001)) == "succeeded"
+        assert prediction.reloads == 0
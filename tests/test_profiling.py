@@ -0,0 +1,116 @@
+"""
+Pruebas para el perfilado de reruns
+"""
+import marshal
+import time
+
+import profiling
+from profiling import RerunProfiler
+
+
+def busy_function():
+    time.sleep(0.002)
+
+
+class TestRerunProfiler:
+    """Pruebas para RerunProfiler"""
+
+    def test_nested_sections_and_tree_order(self):
+        """Las secciones anidadas se guardan como rutas y la tabla sigue el árbol"""
+        profiler = RerunProfiler(sample_every=0)
+        for _ in range(3):
+            profiler.begin_rerun()
+            with profiler.section("Sidebar"):
+                time.sleep(0.001)
+            with profiler.section("Dashboard"):
+                with profiler.section("Latencia"):
+                    time.sleep(0.004)
+                with profiler.section("Trazas"):
+                    time.sleep(0.001)
+            with profiler.section("Sidebar"):
+                time.sleep(0.001)
+            profiler.end_rerun()
+
+        rows = profiler.summary()
+        assert [row['section'] for row in rows] == \
+            ["Dashboard", "Dashboard/Latencia", "Dashboard/Trazas", "Sidebar"]
+        assert [row['depth'] for row in rows] == [0, 1, 1, 0]
+        assert all(row['reruns'] == 3 for row in rows)
+        sidebar = rows[-1]
+        assert sidebar['mean_ms'] >= 2.0  # Las dos apariciones se suman
+        assert 0 < rows[0]['share'] <= 1
+        assert profiler.rerun_totals()['reruns'] == 3
+
+    def test_interrupted_rerun_is_not_counted(self):
+        """Un rerun sin end_rerun (st.rerun, st.stop) queda como incompleto"""
+        profiler = RerunProfiler(sample_every=0)
+        profiler.begin_rerun()
+        with profiler.section("Generar"):
+            pass
+        profiler.begin_rerun()
+        profiler.end_rerun()
+
+        totals = profiler.rerun_totals()
+        assert (totals['reruns'], totals['incomplete']) == (1, 1)
+        assert profiler.summary() == []
+
+        profiler.begin_rerun()
+        profiler.cancel_rerun()
+        assert profiler.rerun_totals()['incomplete'] == 2
+
+    def test_sections_outside_a_rerun_are_ignored(self):
+        """Sin begin_rerun las secciones no miden nada"""
+        profiler = RerunProfiler()
+        with profiler.section("Sidebar"):
+            pass
+        assert profiler.summary() == [] and len(profiler.reruns) == 0
+
+    def test_collapsed_stacks_use_self_time(self):
+        """Cada línea lleva el tiempo propio en µs, sin el de las subsecciones"""
+        profiler = RerunProfiler(sample_every=0)
+        profiler.reruns.append({
+            'started_at': '', 'total_ms': 10.0, 'sampled': False, 'complete': True,
+            'sections': {"Dashboard": 6.0, "Dashboard/Latencia": 4.0, "Sidebar": 1.0},
+        })
+        profiler.reruns.append({
+            'started_at': '', 'total_ms': 99.0, 'sampled': False, 'complete': False,
+            'sections': {"Sidebar": 99.0},
+        })
+
+        lines = dict(line.rsplit(" ", 1) for line in profiler.collapsed_stacks().splitlines())
+        assert lines == {
+            "rerun": "3000",
+            "rerun;Dashboard": "2000",
+            "rerun;Dashboard;Latencia": "4000",
+            "rerun;Sidebar": "1000",
+        }
+
+    def test_cprofile_sampling(self):
+        """Los reruns muestreados acumulan estadísticas de cProfile"""
+        profiler = RerunProfiler(sample_every=2)
+        for _ in range(4):
+            profiler.begin_rerun()
+            busy_function()
+            profiler.end_rerun()
+
+        assert profiler.sampled_reruns == 2
+        assert [rerun['sampled'] for rerun in profiler.reruns] == [False, True, False, True]
+        assert "busy_function" in profiler.cprofile_report()
+
+        stats = marshal.loads(profiler.cprofile_dump())
+        assert any(func[2] == "busy_function" for func in stats)
+
+        profiler.sample_next = True
+        profiler.begin_rerun()
+        profiler.end_rerun()
+        assert profiler.sampled_reruns == 3
+
+        profiler.reset()
+        assert profiler.cprofile_report() == "" and profiler.cprofile_dump() == b""
+
+    def test_percentile(self):
+        """Percentil por rango más cercano"""
+        values = [float(v) for v in range(1, 21)]
+        assert profiling._percentile(values, 50) == 10.0
+        assert profiling._percentile(values, 95) == 19.0
+        assert profiling._percentile([3.0], 95) == 3.0
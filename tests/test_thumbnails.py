@@ -0,0 +1,66 @@
+"""
+Pruebas para las miniaturas de la Biblioteca
+"""
+import pytest
+from PIL import Image
+
+import thumbnails
+import utils
+
+
+def _save_image(path, size=(1600, 900), color=(200, 30, 30)):
+    Image.new("RGB", size, color).save(path)
+    return path
+
+
+class TestThumbnails:
+    """Pruebas para get_thumbnail y la caché en disco"""
+
+    def test_image_thumbnail_is_small_webp(self, temp_history_dir):
+        """La miniatura conserva la proporción y no supera el tamaño pedido"""
+        stored = utils.add_to_media_store(_save_image(temp_history_dir / "imagen_1.png"))
+        item = {'tipo': 'imagen', 'archivo_local': 'imagen_1.png', 'media_hash': stored.stem}
+
+        thumb = thumbnails.get_thumbnail(item, 320)
+
+        assert thumb == thumbnails.thumbnail_path(stored.stem, 320)
+        with Image.open(thumb) as image:
+            assert image.format == "WEBP"
+            assert image.size == (320, 180)
+
+    def test_thumbnail_is_generated_once(self, temp_history_dir, monkeypatch):
+        """Los reruns reutilizan la miniatura guardada"""
+        _save_image(temp_history_dir / "imagen_1.png")
+        item = {'tipo': 'imagen', 'archivo_local': 'imagen_1.png'}
+        first = thumbnails.get_thumbnail(item)
+
+        monkeypatch.setattr(thumbnails, "create_thumbnail", lambda *args: pytest.fail("La miniatura no debería regenerarse"))
+
+        assert thumbnails.get_thumbnail(item) == first
+
+    def test_video_without_ffmpeg_has_no_poster(self, temp_history_dir, monkeypatch):
+        """Sin ffmpeg los videos no tienen portada"""
+        (temp_history_dir / "veo3_1.mp4").write_bytes(b"\x00" * 64)
+        monkeypatch.setattr(thumbnails.shutil, "which", lambda name: None)
+
+        assert thumbnails.get_thumbnail({'tipo': 'video', 'archivo_local': 'veo3_1.mp4'}) is None
+
+    def test_missing_or_broken_source(self, temp_history_dir):
+        """Sin archivo local o con un archivo ilegible no hay miniatura"""
+        (temp_history_dir / "rota.png").write_bytes(b"no es una imagen")
+
+        assert thumbnails.get_thumbnail({'tipo': 'imagen', 'archivo_local': 'no_existe.png'}) is None
+        assert thumbnails.get_thumbnail({'tipo': 'imagen'}) is None
+        assert thumbnails.get_thumbnail({'tipo': 'imagen', 'archivo_local': 'rota.png'}) is None
+
+    def test_prune_removes_orphaned_thumbnails(self, temp_history_dir):
+        """Solo se borran las miniaturas de archivos que ya no están en el historial"""
+        _save_image(temp_history_dir / "a.png")
+        _save_image(temp_history_dir / "b.png", color=(0, 0, 255))
+        kept = {'tipo': 'imagen', 'prompt': 'a', 'archivo_local': 'a.png'}
+        utils.save_to_history(kept)
+        kept_thumb = thumbnails.get_thumbnail(kept)
+        orphan_thumb = thumbnails.get_thumbnail({'tipo': 'imagen', 'archivo_local': 'b.png'})
+
+        assert thumbnails.prune_thumbnails() == 1
+        assert kept_thumb.exists() and not orphan_thumb.exists()
@@ -0,0 +1,122 @@
+"""
+Pruebas para las trazas de las generaciones
+"""
+import json
+
+import pytest
+
+import downloads
+import generation
+import tracing
+import utils
+from tracing import span, traced
+
+
+def _spans(history_dir):
+    lines = (history_dir / tracing.TRACES_FILE_NAME).read_text(encoding='utf-8').splitlines()
+    return [json.loads(line) for line in lines]
+
+
+class TestSpans:
+    """Pruebas para span() y traced()"""
+
+    def test_nested_spans_share_trace(self, temp_history_dir):
+        """Los hijos llevan la traza y el span padre; la raíz se escribe al terminar"""
+        with span("generacion", modelo="flux") as root:
+            with span("download", bytes=10) as child:
+                child.set(host="example.com")
+
+        spans = {data['name']: data for data in _spans(temp_history_dir)}
+        assert spans['download']['trace_id'] == spans['generacion']['trace_id'] == root.trace_id
+        assert spans['download']['parent_span_id'] == spans['generacion']['span_id']
+        assert spans['download']['attributes'] == {'bytes': 10, 'host': 'example.com'}
+        assert spans['generacion']['parent_span_id'] is None
+        assert spans['generacion']['duration_ms'] >= spans['download']['duration_ms']
+
+    def test_errors_are_recorded_and_raised(self, temp_history_dir):
+        """Una excepción marca el span como error sin ocultarla"""
+        with pytest.raises(ValueError):
+            with span("generacion"):
+                raise ValueError("sin output")
+
+        assert _spans(temp_history_dir)[0]['status'] == 'error'
+        assert "sin output" in _spans(temp_history_dir)[0]['attributes']['error']
+
+    def test_traced_only_records_inside_a_trace(self, temp_history_dir):
+        """Las funciones decoradas no crean trazas sueltas"""
+        utils.save_to_history({'tipo': 'imagen', 'prompt': 'suelto'})
+        assert not (temp_history_dir / tracing.TRACES_FILE_NAME).exists()
+
+        with span("generacion"):
+            utils.save_to_history({'tipo': 'imagen', 'prompt': 'en traza'})
+
+        persist = next(data for data in _spans(temp_history_dir) if data['name'] == 'persist')
+        assert persist['attributes']['history_bytes'] > 0
+
+    def test_download_pool_continues_trace(self, temp_history_dir, monkeypatch):
+        """Las descargas en el pool quedan dentro de la traza de quien las pidió"""
+        seen = []
+        monkeypatch.setattr(downloads, "download_and_save_file",
+                            lambda url, filename, file_type: seen.append(tracing.current_span()) or filename)
+        manager = downloads.DownloadManager()
+
+        try:
+            with span("generacion") as root:
+                manager.download_many([("https://x/1.png", "1.png", "imagen"), ("https://x/2.png", "2.png", "imagen")])
+        finally:
+            manager.shutdown()
+
+        assert seen == [root, root]
+
+    def test_disabled_tracing_writes_nothing(self, temp_history_dir, monkeypatch):
+        """Con TRACING_ENABLED a False no se escribe nada"""
+        monkeypatch.setattr(tracing, "TRACING_ENABLED", False)
+        with span("generacion") as root:
+            assert root is None
+        assert not (temp_history_dir / tracing.TRACES_FILE_NAME).exists()
+
+
+class TestTraceViewer:
+    """Pruebas para la lectura de trazas del Dashboard"""
+
+    def test_run_generation_trace_and_breakdown(self, temp_history_dir, tmp_path, monkeypatch):
+        """Una generación deja su traza con etapas de modelo y disco"""
+        monkeypatch.setattr(utils, "GENERATION_STATS_FILE", tmp_path / "generation_stats.json")
+        monkeypatch.setattr(generation, "get_replicate_client",
+                            lambda: type("Client", (), {"run": lambda self, *a, **k: "https://x/v.mp4"})())
+        monkeypatch.setattr(downloads, "download_and_save_file", lambda url, filename, file_type: filename)
+
+        generation.run_generation(None, "🚀 Video (VEO 3 Fast)", "olas", {"duration": 4})
+
+        trace = tracing.load_traces()[0]
+        assert trace['root']['name'] == 'generacion'
+        assert trace['root']['attributes']['modelo'] == "🚀 Video (VEO 3 Fast)"
+        assert {data['name'] for data in trace['spans']} == {'generacion', 'run', 'persist', 'stats'}
+        assert set(trace['breakdown']) == {'modelo', 'disco', 'otros'}
+        assert sum(trace['breakdown'].values()) == pytest.approx(trace['duration_ms'], abs=0.01)
+
+    def test_breakdown_merges_parallel_downloads(self):
+        """Las descargas solapadas cuentan por su intervalo conjunto"""
+        ms = 1_000_000
+        root = {'span_id': 'r', 'name': 'generacion', 'start_time_unix_nano': 0,
+                'end_time_unix_nano': 100 * ms, 'duration_ms': 100}
+        spans = [root] + [
+            {'span_id': span_id, 'parent_span_id': 'r', 'name': 'download',
+             'start_time_unix_nano': start * ms, 'end_time_unix_nano': end * ms}
+            for span_id, start, end in (('a', 10, 50), ('b', 20, 60), ('c', 80, 90))
+        ]
+
+        assert tracing.breakdown(spans, root) == {'red': 60.0, 'otros': 40.0}
+
+    def test_truncated_lines_and_rotation(self, temp_history_dir, monkeypatch):
+        """Las líneas cortadas se ignoran y al rotar se siguen leyendo las trazas anteriores"""
+        monkeypatch.setattr(tracing, "TRACE_MAX_BYTES", 1)
+        with span("generacion", n=1):
+            pass
+        with open(temp_history_dir / tracing.TRACES_FILE_NAME, 'a', encoding='utf-8') as f:
+            f.write('{"trace_id": "cort')
+        with span("generacion", n=2):
+            pass
+
+        assert (temp_history_dir / tracing.TRACES_ROTATED_NAME).exists()
+        assert [t['root']['attributes']['n'] for t in tracing.load_traces()] == [2, 1]
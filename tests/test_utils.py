@@ -0,0 +1,364 @@
+"""
+Pruebas para las funciones utilitarias (estadísticas del Dashboard y más)
+"""
+import hashlib
+import multiprocessing
+import os
+import threading
+import time
+
+import pytest
+import requests
+
+import utils
+from utils import save_to_history, get_analytics_snapshot, download_and_save_file
+
+
+@pytest.fixture
+def dashboard_history(temp_history_dir, tmp_path, monkeypatch):
+    """Historial de ejemplo con imágenes y videos en dos meses"""
+    monkeypatch.setattr(utils, "GENERATION_STATS_FILE", tmp_path / "generation_stats.json")
+    items = [
+        {'tipo': 'imagen', 'modelo': 'flux_pro', 'fecha': '2025-06-30T10:00:00', 'prompt': 'a'},
+        {'tipo': 'imagen', 'modelo': 'flux_pro', 'fecha': '2025-07-01T10:00:00', 'prompt': 'b'},
+        {'tipo': 'video', 'modelo': 'veo3', 'fecha': '2025-07-02T10:00:00', 'prompt': 'c',
+         'parametros': {'duration': 4}},
+        {'tipo': 'imagen', 'modelo': 'flux_pro', 'fecha': '', 'prompt': 'sin fecha'},
+    ]
+    for item in items:
+        save_to_history(item)
+    return items
+
+
+def _stored_files(directory):
+    """Archivos bajo un directorio, como rutas relativas"""
+    return sorted(p.relative_to(directory).as_posix() for p in directory.rglob('*') if p.is_file())
+
+
+class FakeFileServer:
+    """Servidor simulado para requests.get(stream=True) con soporte de Range"""
+
+    def __init__(self, content, drop_after=None, support_range=True, status=200, announced_size=None):
+        self.content = content
+        self.drop_after = list(drop_after or [])
+        self.support_range = support_range
+        self.status = status
+        self.announced_size = announced_size
+        self.requests = []
+
+    def get(self, url, stream=False, timeout=None, headers=None):
+        assert stream
+        headers = headers or {}
+        self.requests.append(headers)
+        offset = 0
+        if self.support_range and 'Range' in headers:
+            offset = int(headers['Range'][len('bytes='):-1])
+        return FakeResponse(self, offset, self.drop_after.pop(0) if self.drop_after else None)
+
+
+class FakeResponse:
+    def __init__(self, server, offset, drop_after):
+        body = server.content[offset:]
+        self._body = body[:drop_after] if drop_after is not None else body
+        self._dropped = drop_after is not None
+        self.status_code = server.status if server.status != 200 else (206 if offset else 200)
+        size = server.announced_size or len(server.content)
+        self.headers = {'Content-Length': str(size - offset)}
+        if offset:
+            self.headers['Content-Range'] = f"bytes {offset}-{size - 1}/{size}"
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def iter_content(self, chunk_size):
+        for start in range(0, len(self._body), chunk_size):
+            yield self._body[start:start + chunk_size]
+        if self._dropped:
+            raise requests.exceptions.ChunkedEncodingError("conexión cortada")
+
+
+class TestStreamingDownload:
+    """Pruebas para la descarga por bloques con reanudación"""
+
+    @pytest.fixture(autouse=True)
+    def no_retry_delay(self, monkeypatch):
+        monkeypatch.setattr(utils, "DOWNLOAD_RETRY_DELAY", 0)
+
+    def test_download_in_chunks(self, temp_history_dir, monkeypatch):
+        """El archivo se escribe por bloques y solo aparece completo"""
+        server = FakeFileServer(b"x" * 2500)
+        monkeypatch.setattr(utils, "get_http_session", lambda: server)
+        monkeypatch.setattr(utils, "DOWNLOAD_CHUNK_SIZE", 1000)
+
+        path = download_and_save_file("https://example.com/v.mp4", "v.mp4", "video")
+
+        media_hash = hashlib.sha256(b"x" * 2500).hexdigest()
+        assert path == str(utils.media_path(media_hash, ".mp4"))
+        assert utils.get_media_hash(path) == media_hash
+        assert _stored_files(temp_history_dir) == [f"media/{media_hash[:2]}/{media_hash[2:4]}/{media_hash}.mp4"]
+
+    def test_dropped_connection_resumes_with_range(self, temp_history_dir, monkeypatch):
+        """Tras un corte se pide solo lo que falta"""
+        content = bytes(range(256)) * 20
+        server = FakeFileServer(content, drop_after=[1000, 1500])
+        monkeypatch.setattr(utils, "get_http_session", lambda: server)
+
+        path = download_and_save_file("https://example.com/v.mp4", "v.mp4", "video")
+
+        assert open(path, 'rb').read() == content
+        assert utils.get_media_hash(path) == hashlib.sha256(content).hexdigest()
+        assert server.requests == [{}, {'Range': 'bytes=1000-'}, {'Range': 'bytes=2500-'}]
+
+    def test_server_without_range_restarts(self, temp_history_dir, monkeypatch):
+        """Si el servidor ignora Range se reescribe el archivo desde el principio"""
+        content = b"abcdefghij" * 100
+        server = FakeFileServer(content, drop_after=[300], support_range=False)
+        monkeypatch.setattr(utils, "get_http_session", lambda: server)
+
+        path = download_and_save_file("https://example.com/i.png", "i.png", "imagen")
+
+        assert open(path, 'rb').read() == content
+        assert utils.get_media_hash(path) == hashlib.sha256(content).hexdigest()
+
+    def test_incomplete_download_is_discarded(self, temp_history_dir, monkeypatch):
+        """Si nunca se reciben los bytes anunciados no queda ningún archivo"""
+        server = FakeFileServer(b"x" * 100, announced_size=200)
+        monkeypatch.setattr(utils, "get_http_session", lambda: server)
+
+        assert download_and_save_file("https://example.com/v.mp4", "v.mp4", "video") is None
+        assert len(server.requests) == utils.DOWNLOAD_RETRIES + 1
+        assert _stored_files(temp_history_dir) == []
+
+    def test_http_error_returns_none(self, temp_history_dir, monkeypatch):
+        """Un error HTTP no se reintenta"""
+        server = FakeFileServer(b"", status=404)
+        monkeypatch.setattr(utils, "get_http_session", lambda: server)
+
+        assert download_and_save_file("https://example.com/v.mp4", "v.mp4", "video") is None
+        assert len(server.requests) == 1
+
+
+class TestMediaStore:
+    """Pruebas para el almacén de medios direccionado por contenido"""
+
+    def _download(self, monkeypatch, content, filename):
+        monkeypatch.setattr(utils, "get_http_session", lambda: FakeFileServer(content))
+        return download_and_save_file(f"https://example.com/{filename}", filename, "imagen")
+
+    def test_same_name_does_not_collide(self, temp_history_dir, monkeypatch):
+        """Dos generaciones con el mismo nombre y distinto contenido se guardan ambas"""
+        first = self._download(monkeypatch, b"primera", "imagen_20250701_100000.webp")
+        second = self._download(monkeypatch, b"segunda", "imagen_20250701_100000.webp")
+
+        assert first != second
+        assert open(first, 'rb').read() == b"primera"
+        assert open(second, 'rb').read() == b"segunda"
+
+    def test_identical_content_is_stored_once(self, temp_history_dir, monkeypatch):
+        """El mismo contenido descargado dos veces ocupa un solo archivo"""
+        first = self._download(monkeypatch, b"igual", "a.png")
+        second = self._download(monkeypatch, b"igual", "b.png")
+
+        assert first == second
+        assert len(_stored_files(temp_history_dir / "media")) == 1
+
+    def test_resolve_refcount_and_gc(self, temp_history_dir, monkeypatch):
+        """Los items apuntan al hash y el GC solo borra archivos sin referencias"""
+        kept = self._download(monkeypatch, b"usado", "a.png")
+        orphan = self._download(monkeypatch, b"huerfano", "b.png")
+        item = {'tipo': 'imagen', 'prompt': 'p', 'archivo_local': 'a.png', 'media_hash': utils.get_media_hash(kept)}
+        save_to_history(item)
+        save_to_history(dict(item, prompt='q'))
+        old = time.time() - utils.MEDIA_GC_GRACE_SECONDS - 10
+        for path in (kept, orphan):
+            os.utime(path, (old, old))
+
+        assert str(utils.resolve_media_path(utils.load_history()[0])) == kept
+        assert utils.get_media_refcounts() == {utils.get_media_hash(kept): 2}
+        assert utils.gc_media_store(dry_run=True) == (1, len(b"huerfano"))
+        assert utils.gc_media_store() == (1, len(b"huerfano"))
+        assert os.path.exists(kept) and not os.path.exists(orphan)
+
+    def test_recent_unreferenced_files_are_kept(self, temp_history_dir, monkeypatch):
+        """Un archivo recién descargado aún sin item no se borra"""
+        self._download(monkeypatch, b"en curso", "a.png")
+
+        assert utils.gc_media_store() == (0, 0)
+
+    def test_migrate_legacy_files(self, temp_history_dir):
+        """Los archivos antiguos pasan al almacén y los items guardan su hash"""
+        (temp_history_dir / "imagen_1.webp").write_bytes(b"antigua")
+        save_to_history({'tipo': 'imagen', 'prompt': 'a', 'archivo_local': 'imagen_1.webp'})
+        save_to_history({'tipo': 'imagen', 'prompt': 'b', 'archivo_local': 'imagen_1.webp'})
+        save_to_history({'tipo': 'imagen', 'prompt': 'c', 'archivo_local': 'perdida.webp'})
+        assert utils.resolve_media_path(utils.load_history()[1]) == temp_history_dir / "imagen_1.webp"
+
+        assert utils.migrate_media_to_store() == 2
+
+        history = utils.load_history()
+        media_hash = hashlib.sha256(b"antigua").hexdigest()
+        assert [item.get('media_hash') for item in history] == [None, media_hash, media_hash]
+        assert utils.resolve_media_path(history[1]).read_bytes() == b"antigua"
+        assert not (temp_history_dir / "imagen_1.webp").exists()
+        assert utils.migrate_media_to_store() == 0
+
+
+class TestAnalyticsSnapshot:
+    """Pruebas para el snapshot de analíticas del Dashboard"""
+
+    def test_totals_by_type_and_model(self, dashboard_history):
+        """Totales globales, por tipo y por modelo"""
+        stats = get_analytics_snapshot()['stats']
+
+        assert stats['total_generations'] == 4
+        assert stats['total_cost_usd'] == pytest.approx(0.055 * 3 + 0.25 * 4)
+        assert stats['stats_by_type']['imagen']['count'] == 3
+        assert stats['stats_by_type']['video']['total_cost'] == pytest.approx(1.0)
+        assert stats['stats_by_model']['flux_pro']['avg_cost'] == pytest.approx(0.055)
+        assert list(stats['stats_by_month']) == ['2025-07', '2025-06']
+
+    def test_period_breakdowns(self, dashboard_history):
+        """Desglose por día, semana y mes; los items sin fecha se omiten"""
+        by_period = get_analytics_snapshot()['by_period']
+
+        assert list(by_period['month']) == ['2025-07', '2025-06']
+        assert by_period['month']['2025-07']['count'] == 2
+        assert len(by_period['day']) == 3
+        # 2025-06-30 (lunes) y 2025-07-02 caen en la misma semana
+        assert sum(week['count'] for week in by_period['week'].values()) == 3
+        assert len(by_period['week']) == 1
+
+    def test_public_functions_match_snapshot(self, dashboard_history):
+        """Las funciones existentes devuelven los datos del snapshot"""
+        snapshot = get_analytics_snapshot()
+
+        assert utils.get_comprehensive_stats() == snapshot['stats']
+        assert utils.get_cost_breakdown_by_period('week') == snapshot['by_period']['week']
+        assert utils.get_model_efficiency_ranking() == snapshot['ranking']
+        assert utils.get_spending_alerts() == snapshot['alerts']
+
+    def test_single_pass_and_memoization(self, dashboard_history, monkeypatch):
+        """Cada item se costea una sola vez y el snapshot se reutiliza"""
+        calls = []
+        original = utils.calculate_item_cost
+        monkeypatch.setattr(utils, "calculate_item_cost", lambda item: calls.append(1) or original(item))
+
+        first = get_analytics_snapshot()
+        utils.get_spending_alerts()
+        utils.get_model_efficiency_ranking()
+        assert len(calls) == 4
+        assert get_analytics_snapshot() is first
+
+        save_to_history({'tipo': 'imagen', 'fecha': '2025-07-03T10:00:00', 'prompt': 'd'})
+        assert get_analytics_snapshot()['stats']['total_generations'] == 5
+
+    def test_success_rate_from_generation_stats(self, dashboard_history):
+        """La tasa de éxito se toma de generation_stats.json y refresca el snapshot"""
+        get_analytics_snapshot()
+        utils.GENERATION_STATS_FILE.write_text(
+            '{"veo3": {"total": 4, "exitosas": 3, "tiempo_promedio": 50}}', encoding='utf-8'
+        )
+
+        stats = get_analytics_snapshot()['stats']
+        assert stats['stats_by_model']['veo3']['success_rate'] == pytest.approx(75.0)
+
+
+def _update_stats_many(n):
+    for _ in range(n):
+        utils.update_generation_stats("⚡ Imagen (SSD-1B)", 1.0, True)
+
+
+class TestGenerationStatsStore:
+    """Pruebas para las escrituras concurrentes de generation_stats.json"""
+
+    @pytest.fixture(autouse=True)
+    def stats_file(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(utils, "GENERATION_STATS_FILE", tmp_path / "generation_stats.json")
+        return utils.GENERATION_STATS_FILE
+
+    def test_threads_do_not_lose_updates(self, stats_file):
+        """Muchos hilos a la vez: no se pierde ningún incremento ni quedan temporales"""
+        threads = [threading.Thread(target=_update_stats_many, args=(10,)) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        entry = utils.get_generation_stats()["⚡ Imagen (SSD-1B)"]
+        assert (entry["total"], entry["exitosas"]) == (80, 80)
+        assert entry["latencia"]["total"]["n"] == 80
+        assert not list(stats_file.parent.glob(".generation_stats_*"))
+
+    @pytest.mark.skipif("fork" not in multiprocessing.get_all_start_methods(), reason="Requiere fork")
+    def test_processes_do_not_lose_updates(self, stats_file):
+        """Varios procesos (workers) a la vez se serializan con el bloqueo del archivo"""
+        context = multiprocessing.get_context("fork")
+        processes = [context.Process(target=_update_stats_many, args=(10,)) for _ in range(4)]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+
+        assert utils.get_generation_stats()["⚡ Imagen (SSD-1B)"]["total"] == 40
+
+    def test_concurrent_updates_are_coalesced(self, monkeypatch):
+        """Las generaciones que terminan mientras se escribe se agrupan en una escritura"""
+        writes = []
+        original = utils._save_generation_stats
+
+        def slow_save(stats):
+            writes.append(stats["⚡ Imagen (SSD-1B)"]["total"])
+            time.sleep(0.05)
+            original(stats)
+
+        monkeypatch.setattr(utils, "_save_generation_stats", slow_save)
+        threads = [threading.Thread(target=_update_stats_many, args=(1,)) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert writes[-1] == 8
+        assert len(writes) < 8
+
+    def test_failed_write_keeps_file_and_update(self, stats_file, monkeypatch):
+        """Si la escritura falla el archivo anterior sigue intacto y la actualización no se pierde"""
+        _update_stats_many(1)
+        monkeypatch.setattr(utils.json, "dump", lambda *args, **kwargs: 1 / 0)
+
+        with pytest.raises(ZeroDivisionError):
+            _update_stats_many(1)
+
+        assert utils.get_generation_stats()["⚡ Imagen (SSD-1B)"]["total"] == 1
+        monkeypatch.undo()
+        monkeypatch.setattr(utils, "GENERATION_STATS_FILE", stats_file)
+        _update_stats_many(1)
+        assert utils.get_generation_stats()["⚡ Imagen (SSD-1B)"]["total"] == 3
+
+    def test_unreadable_file_is_not_replaced(self, stats_file):
+        """Un archivo existente que no se puede leer no se sobrescribe con una sola entrada"""
+        _update_stats_many(1)
+        content = stats_file.read_text(encoding='utf-8')
+        stats_file.write_text(content[:len(content) // 2], encoding='utf-8')  # Lectura a medias
+
+        with pytest.raises(ValueError):
+            _update_stats_many(1)
+        assert stats_file.read_text(encoding='utf-8') == content[:len(content) // 2]
+
+        stats_file.write_text(content, encoding='utf-8')
+        _update_stats_many(1)
+        assert utils.get_generation_stats()["⚡ Imagen (SSD-1B)"]["total"] == 3
+
+    def test_pending_updates_are_capped(self, stats_file, monkeypatch):
+        """Con el archivo ilegible las actualizaciones pendientes no crecen sin límite"""
+        monkeypatch.setattr(utils, "STATS_PENDING_MAX", 3)
+        monkeypatch.setattr(utils, "_stats_pending", [])
+        stats_file.write_text('{"roto', encoding='utf-8')
+
+        for _ in range(5):
+            with pytest.raises(ValueError):
+                _update_stats_many(1)
+        assert len(utils._stats_pending) == 3
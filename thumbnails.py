@@ -0,0 +1,215 @@
+"""
+Miniaturas y fotogramas de portada para la Biblioteca
+
+La cuadrícula de la Biblioteca muestra miniaturas WebP pequeñas en lugar de
+las imágenes originales y un fotograma de portada en lugar de un reproductor
+por cada video. Se generan una sola vez y se guardan en
+``historial/thumbs/`` con el hash del archivo original en el nombre, así
+sobreviven a los reruns y se invalidan solas si cambia el contenido.
+
+Las portadas de video necesitan ffmpeg en el PATH; sin él los videos se
+muestran con una tarjeta sin portada.
+"""
+
+import hashlib
+import os
+import shutil
+import subprocess
+import tempfile
+from pathlib import Path
+from typing import Any, Mapping, Optional
+
+from PIL import Image, ImageOps
+
+import utils
+
+
+# ===============================
+# CONFIGURACIÓN
+# ===============================
+
+THUMBS_DIR_NAME = "thumbs"
+
+# Lado mayor de la miniatura según el "Tamaño de vista previa" de la Biblioteca
+THUMBNAIL_SIZES = {
+    "Pequeño": 192,
+    "Mediano": 320,
+    "Grande": 480,
+    "Extra Grande": 640,
+}
+DEFAULT_THUMBNAIL_SIZE = THUMBNAIL_SIZES["Mediano"]
+
+THUMBNAIL_QUALITY = 80
+
+# Segundo del video usado como portada (se usa el primero si el video es más corto)
+POSTER_FRAME_SECOND = 1.0
+FFMPEG_TIMEOUT = 30
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp', '.gif', '.bmp')
+VIDEO_EXTENSIONS = ('.mp4', '.mov', '.webm', '.avi', '.mkv')
+
+
+# ===============================
+# CACHÉ
+# ===============================
+
+def _thumbs_dir() -> Path:
+    """Directorio de miniaturas (sigue a utils.HISTORY_DIR)"""
+    return utils.HISTORY_DIR / THUMBS_DIR_NAME
+
+
+def _source_key(item: Mapping[str, Any], source: Path) -> str:
+    """
+    Clave de caché del archivo original
+
+    Es el media_hash para los archivos del almacén de medios; para los
+    archivos antiguos (sin hash) se usa ruta, tamaño y fecha de modificación
+    para no tener que leer el archivo completo en cada rerun.
+    """
+    if item.get('media_hash'):
+        return item['media_hash']
+    stat = source.stat()
+    return hashlib.sha256(f"{source.name}:{stat.st_size}:{stat.st_mtime_ns}".encode('utf-8')).hexdigest()
+
+
+def thumbnail_path(source_key: str, size: int) -> Path:
+    """Ruta de la miniatura de un archivo para un tamaño"""
+    return _thumbs_dir() / source_key[:2] / f"{source_key}_{size}.webp"
+
+
+def _save_thumbnail(image: Image.Image, dest: Path, size: int) -> None:
+    """Reducir una imagen y guardarla como WebP de forma atómica"""
+    image = ImageOps.exif_transpose(image)
+    if image.mode not in ("RGB", "RGBA"):
+        image = image.convert("RGBA" if "transparency" in image.info else "RGB")
+    image.thumbnail((size, size), Image.LANCZOS)
+
+    dest.parent.mkdir(parents=True, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=dest.parent, prefix=".thumb_", suffix=".webp")
+    os.close(fd)
+    try:
+        image.save(temp_path, "WEBP", quality=THUMBNAIL_QUALITY, method=4)
+        os.replace(temp_path, dest)
+    except Exception:
+        if os.path.exists(temp_path):
+            os.unlink(temp_path)
+        raise
+
+
+# ===============================
+# GENERACIÓN
+# ===============================
+
+def _extract_poster_frame(video_path: Path, frame_path: Path) -> bool:
+    """
+    Extraer un fotograma de un video con ffmpeg
+
+    Returns:
+        bool: True si se extrajo (False si ffmpeg no está disponible o falló)
+    """
+    ffmpeg = shutil.which("ffmpeg")
+    if not ffmpeg:
+        return False
+
+    for seek in (POSTER_FRAME_SECOND, 0):
+        try:
+            subprocess.run(
+                [ffmpeg, "-y", "-loglevel", "error", "-ss", str(seek), "-i", str(video_path),
+                 "-frames:v", "1", str(frame_path)],
+                check=True, timeout=FFMPEG_TIMEOUT, stdin=subprocess.DEVNULL,
+                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+            )
+        except (subprocess.SubprocessError, OSError):
+            continue
+        if frame_path.exists() and frame_path.stat().st_size > 0:
+            return True
+    return False
+
+
+def create_thumbnail(source: Path, dest: Path, size: int) -> bool:
+    """
+    Generar la miniatura de una imagen o la portada de un video
+
+    Args:
+        source: Archivo original
+        dest: Ruta de la miniatura (.webp)
+        size: Lado mayor en píxeles
+
+    Returns:
+        bool: True si se generó
+    """
+    suffix = source.suffix.lower()
+    try:
+        if suffix in IMAGE_EXTENSIONS:
+            with Image.open(source) as image:
+                _save_thumbnail(image, dest, size)
+            return True
+
+        if suffix in VIDEO_EXTENSIONS:
+            with tempfile.TemporaryDirectory() as temp_dir:
+                frame_path = Path(temp_dir) / "frame.png"
+                if not _extract_poster_frame(source, frame_path):
+                    return False
+                with Image.open(frame_path) as frame:
+                    _save_thumbnail(frame, dest, size)
+            return True
+    except (OSError, ValueError, Image.DecompressionBombError):
+        return False
+    return False
+
+
+def get_thumbnail(item: Mapping[str, Any], size: int = DEFAULT_THUMBNAIL_SIZE) -> Optional[Path]:
+    """
+    Miniatura de un item del historial, generándola si no está en caché
+
+    Args:
+        item: Item del historial
+        size: Lado mayor en píxeles (ver THUMBNAIL_SIZES)
+
+    Returns:
+        Optional[Path]: Ruta de la miniatura, o None si el item no tiene
+        archivo local o no se pudo generar (p. ej. video sin ffmpeg)
+    """
+    source = utils.resolve_media_path(item)
+    if source is None or not source.is_file():
+        return None
+
+    dest = thumbnail_path(_source_key(item, source), size)
+    if dest.exists() or create_thumbnail(source, dest, size):
+        return dest
+    return None
+
+
+def generate_missing_thumbnails(size: int = DEFAULT_THUMBNAIL_SIZE) -> int:
+    """
+    Generar las miniaturas que falten para todo el historial
+
+    Returns:
+        int: Número de items con miniatura disponible
+    """
+    return sum(1 for item in utils.load_history() if get_thumbnail(item, size))
+
+
+def prune_thumbnails() -> int:
+    """
+    Borrar las miniaturas de archivos que ya no están en el historial
+
+    Returns:
+        int: Número de miniaturas borradas
+    """
+    thumbs_dir = _thumbs_dir()
+    if not thumbs_dir.exists():
+        return 0
+
+    keys = set()
+    for item in utils.load_history():
+        source = utils.resolve_media_path(item)
+        if source is not None and source.is_file():
+            keys.add(_source_key(item, source))
+
+    removed = 0
+    for thumb in thumbs_dir.rglob("*.webp"):
+        if thumb.name.rsplit("_", 1)[0] not in keys:
+            thumb.unlink()
+            removed += 1
+    return removed
@@ -0,0 +1,308 @@
+"""
+Trazas de las generaciones (spans anidados en JSON Lines)
+
+Cada generación es una traza con un span raíz ("generacion") y spans hijos
+para cada etapa: envío o ejecución en Replicate ("submit"/"run"), sondeo
+("poll"), descargas ("download"), escritura del historial ("persist"), de
+las estadísticas ("stats") y la interfaz ("render"). Cada span lleva su
+duración y atributos (modelo, id de predicción, bytes descargados, tamaño
+del historial...), de modo que se ve si el tiempo se va en el modelo, en la
+red o en el disco local.
+
+Los spans se añaden a ``historial/traces.jsonl`` al terminar, uno por línea,
+con los nombres de campo de OTLP (trace_id, span_id, parent_span_id,
+start_time_unix_nano, end_time_unix_nano, attributes) para poder
+convertirlos a un colector de OpenTelemetry. El archivo se rota al superar
+TRACE_MAX_BYTES (se conserva una sola rotación, traces.1.jsonl).
+
+El span actual se guarda en un ContextVar: se anidan solos dentro de un
+hilo y los pools que quieran continuar la traza deben ejecutar la tarea con
+contextvars.copy_context() (ver downloads.DownloadManager.submit).
+"""
+
+import contextvars
+import functools
+import json
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+from latency import LatencyHistogram
+
+
+# ===============================
+# CONFIGURACIÓN
+# ===============================
+
+TRACING_ENABLED = True
+
+TRACES_FILE_NAME = "traces.jsonl"
+TRACES_ROTATED_NAME = "traces.1.jsonl"
+TRACE_MAX_BYTES = 5 * 1024 * 1024
+
+# A qué se atribuye el tiempo de cada span en el visor del Dashboard
+SPAN_CATEGORIES = {
+    "submit": "modelo",
+    "run": "modelo",
+    "poll": "modelo",
+    "download": "red",
+    "persist": "disco",
+    "stats": "disco",
+    "render": "interfaz",
+}
+CATEGORY_LABELS = {
+    "modelo": "🤖 Modelo",
+    "red": "🌐 Red",
+    "disco": "💾 Disco",
+    "interfaz": "🖥️ Interfaz",
+    "otros": "⚙️ Resto",
+}
+
+_current_span: contextvars.ContextVar[Optional["Span"]] = contextvars.ContextVar("current_span", default=None)
+_write_lock = threading.Lock()
+
+
+def _traces_file() -> Path:
+    """Archivo de trazas (sigue a utils.HISTORY_DIR)"""
+    import utils
+    return utils.HISTORY_DIR / TRACES_FILE_NAME
+
+
+# ===============================
+# SPANS
+# ===============================
+
+class Span:
+    """Un tramo de una traza; usar span() en lugar de crearlo directamente"""
+
+    def __init__(self, name: str, parent: Optional["Span"], attributes: Dict[str, Any]) -> None:
+        self.name = name
+        self.trace_id = parent.trace_id if parent else uuid.uuid4().hex
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_span_id = parent.span_id if parent else None
+        self.attributes = dict(attributes)
+        self.status = "ok"
+        self.start_ns = time.time_ns()
+        self.end_ns: Optional[int] = None
+
+    def set(self, **attributes: Any) -> None:
+        """Añadir o actualizar atributos"""
+        self.attributes.update(attributes)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_span_id": self.parent_span_id,
+            "name": self.name,
+            "start_time_unix_nano": self.start_ns,
+            "end_time_unix_nano": self.end_ns,
+            "duration_ms": round((self.end_ns - self.start_ns) / 1e6, 3),
+            "status": self.status,
+            "attributes": self.attributes,
+        }
+
+
+def _write_span(data: Dict[str, Any]) -> None:
+    """Añadir un span terminado al archivo (las trazas nunca rompen la generación)"""
+    line = json.dumps(data, ensure_ascii=False, default=str) + "\n"
+    traces_file = _traces_file()
+    try:
+        with _write_lock:
+            traces_file.parent.mkdir(parents=True, exist_ok=True)
+            if traces_file.exists() and traces_file.stat().st_size > TRACE_MAX_BYTES:
+                traces_file.replace(traces_file.with_name(TRACES_ROTATED_NAME))
+            with open(traces_file, 'a', encoding='utf-8') as f:
+                f.write(line)
+    except OSError:
+        pass
+
+
+@contextmanager
+def span(name: str, **attributes: Any) -> Iterator[Optional[Span]]:
+    """
+    Medir un bloque como span hijo del span actual (o raíz de una traza nueva)
+
+    Args:
+        name: Nombre de la etapa (ver SPAN_CATEGORIES)
+        **attributes: Atributos iniciales; se pueden añadir más con .set()
+
+    Yields:
+        Optional[Span]: El span (None si las trazas están desactivadas)
+    """
+    if not TRACING_ENABLED:
+        yield None
+        return
+
+    current = Span(name, _current_span.get(), attributes)
+    token = _current_span.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.status = "error"
+        current.set(error=f"{type(e).__name__}: {e}"[:200])
+        raise
+    finally:
+        _current_span.reset(token)
+        current.end_ns = time.time_ns()
+        _write_span(current.to_dict())
+
+
+def traced(name: str, **attributes: Any) -> Callable:
+    """
+    Decorador: ejecutar la función dentro de span(name, **attributes)
+
+    Solo se registra dentro de una traza abierta (p. ej. el span
+    "generacion"); fuera de ella la función se llama sin más, así las
+    funciones de biblioteca no crean trazas sueltas.
+    """
+    def decorator(func: Callable) -> Callable:
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if _current_span.get() is None:
+                return func(*args, **kwargs)
+            with span(name, **attributes):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def current_span() -> Optional[Span]:
+    """Span activo en este contexto (None fuera de una traza)"""
+    return _current_span.get()
+
+
+def annotate(**attributes: Any) -> None:
+    """Añadir atributos al span activo (no hace nada fuera de una traza)"""
+    active = _current_span.get()
+    if active is not None:
+        active.set(**attributes)
+
+
+# ===============================
+# LECTURA (VISOR DEL DASHBOARD)
+# ===============================
+
+def _read_spans(path: Path) -> List[Dict[str, Any]]:
+    spans = []
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    spans.append(json.loads(line))
+                except ValueError:
+                    continue  # Línea cortada por una escritura interrumpida
+    except OSError:
+        pass
+    return spans
+
+
+def load_traces(limit: int = 50) -> List[Dict[str, Any]]:
+    """
+    Trazas más recientes con sus spans
+
+    Args:
+        limit: Máximo de trazas
+
+    Returns:
+        List[Dict]: Más reciente primero; cada traza tiene trace_id, root
+        (span raíz, o el más antiguo si la raíz no terminó), spans (por
+        inicio), duration_ms y breakdown (ms por categoría, ver breakdown)
+    """
+    traces_file = _traces_file()
+    spans = _read_spans(traces_file.with_name(TRACES_ROTATED_NAME)) + _read_spans(traces_file)
+
+    by_trace: Dict[str, List[Dict[str, Any]]] = {}
+    for data in spans:
+        by_trace.setdefault(data.get("trace_id"), []).append(data)
+
+    traces = []
+    for trace_id, trace_spans in by_trace.items():
+        trace_spans.sort(key=lambda s: s.get("start_time_unix_nano", 0))
+        root = next((s for s in trace_spans if not s.get("parent_span_id")), trace_spans[0])
+        traces.append({
+            "trace_id": trace_id,
+            "root": root,
+            "spans": trace_spans,
+            "duration_ms": root.get("duration_ms", 0),
+            "breakdown": breakdown(trace_spans, root),
+        })
+    traces.sort(key=lambda t: t["root"].get("start_time_unix_nano", 0), reverse=True)
+    return traces[:limit]
+
+
+def breakdown(trace_spans: List[Dict[str, Any]], root: Dict[str, Any]) -> Dict[str, float]:
+    """
+    Milisegundos de una traza por categoría (modelo, red, disco, interfaz, resto)
+
+    Cada categoría suma los spans de más arriba de esa categoría (las
+    descargas paralelas de una misma generación cuentan por su intervalo
+    conjunto, no por la suma). "otros" es el tiempo de la raíz no cubierto.
+    """
+    by_id = {s.get("span_id"): s for s in trace_spans}
+
+    def category(data: Dict[str, Any]) -> Optional[str]:
+        return SPAN_CATEGORIES.get(data.get("name"))
+
+    def has_categorized_ancestor(data: Dict[str, Any]) -> bool:
+        parent = by_id.get(data.get("parent_span_id"))
+        while parent is not None:
+            if category(parent):
+                return True
+            parent = by_id.get(parent.get("parent_span_id"))
+        return False
+
+    intervals: Dict[str, List[List[int]]] = {}
+    for data in trace_spans:
+        name = category(data)
+        if name and data is not root and not has_categorized_ancestor(data):
+            intervals.setdefault(name, []).append([data["start_time_unix_nano"], data["end_time_unix_nano"]])
+
+    result: Dict[str, float] = {}
+    covered = 0.0
+    for name, spans in intervals.items():
+        total = 0
+        spans.sort()
+        start, end = spans[0]
+        for next_start, next_end in spans[1:]:
+            if next_start > end:
+                total += end - start
+                start, end = next_start, next_end
+            else:
+                end = max(end, next_end)
+        total += end - start
+        result[name] = round(total / 1e6, 3)
+        covered += result[name]
+    result["otros"] = round(max(root.get("duration_ms", 0) - covered, 0.0), 3)
+    return result
+
+
+def summarize_spans(traces: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Duración de cada tipo de span en un conjunto de trazas
+
+    Returns:
+        List[Dict]: name, category, count, total_ms, mean_ms, p50_ms y
+        p95_ms, de mayor a menor tiempo total
+    """
+    histograms: Dict[str, LatencyHistogram] = {}
+    for trace in traces:
+        for data in trace["spans"]:
+            histograms.setdefault(data.get("name"), LatencyHistogram()).record(data.get("duration_ms", 0) / 1000)
+
+    rows = []
+    for name, histogram in histograms.items():
+        rows.append({
+            "name": name,
+            "category": SPAN_CATEGORIES.get(name, "otros"),
+            "count": histogram.count,
+            "total_ms": histogram.total * 1000,
+            "mean_ms": histogram.mean * 1000,
+            "p50_ms": histogram.percentile(50) * 1000,
+            "p95_ms": histogram.percentile(95) * 1000,
+        })
+    rows.sort(key=lambda row: row["total_ms"], reverse=True)
+    return rows
@@ -4,15 +4,31 @@ Contiene funciones compartidas para historial, cálculos de costo, configuració
 """
 
 import os
+import re
 import json
 import base64
+import copy
+import hashlib
+import shutil
 import requests
+from requests.adapters import HTTPAdapter
 import tempfile
-from pathlib import Path
+import threading
+import time
+import unicodedata
+import uuid
+import numpy as np
+from contextlib import contextmanager
+from pathlib import Path, PurePosixPath
 from datetime import datetime, timedelta
-from typing import Dict, List, Any, Optional, Tuple
+from types import MappingProxyType
+from typing import Callable, Dict, Iterator, List, Any, Mapping, Optional, Tuple
+from urllib.parse import urlsplit
 import streamlit as st
 
+import latency
+from tracing import annotate, traced
+
 
 # ===============================
 # FUNCIONES AUXILIARES
@@ -44,19 +60,100 @@ def get_model_from_filename(filename: str) -> str:
         return 'Desconocido'
 
 
+@contextmanager
+def _interprocess_lock(lock_file: Path) -> Iterator[None]:
+    """
+    Bloqueo exclusivo entre procesos sobre un archivo .lock
+
+    Usa flock en POSIX y msvcrt.locking en Windows. Solo excluye a otros
+    procesos (y a otros manejadores del mismo proceso): combinarlo con un
+    threading.Lock para los hilos.
+    """
+    lock_file.parent.mkdir(parents=True, exist_ok=True)
+    with open(lock_file, 'a+b') as handle:
+        if os.name == 'nt':
+            import msvcrt
+            handle.seek(0)
+            while True:
+                try:
+                    # LK_LOCK reintenta durante ~10 s antes de fallar
+                    msvcrt.locking(handle.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    continue
+            try:
+                yield
+            finally:
+                handle.seek(0)
+                msvcrt.locking(handle.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(handle.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(handle.fileno(), fcntl.LOCK_UN)
+
+
 # ===============================
 # CONFIGURACIÓN Y CONSTANTES
 # ===============================
 
 # Configuración de directorios
 HISTORY_DIR = Path("historial")
-HISTORY_FILE = HISTORY_DIR / "history.json"
+# Log append-only (JSON Lines, una generación por línea en orden cronológico)
+HISTORY_FILE = HISTORY_DIR / "history.jsonl"
+# Formato anterior (array JSON reescrito completo); solo se lee para migrar
+LEGACY_HISTORY_FILE = HISTORY_DIR / "history.json"
+# Bytes iniciales del log usados para detectar que fue reemplazado
+_LOG_HEAD_BYTES = 256
+# Almacén de medios direccionado por contenido, dentro de HISTORY_DIR:
+# media/ab/cd/<sha256>.<ext>
+MEDIA_DIR_NAME = "media"
+# Los archivos sin referencias más recientes que esto no se borran (descargas en curso)
+MEDIA_GC_GRACE_SECONDS = 3600
 BACKUPS_DIR = Path("backups")
+GENERATION_STATS_FILE = Path("generation_stats.json")
+
+# Descargas: bloques de escritura, timeouts (conexión, entre bloques) y reintentos
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+DOWNLOAD_TIMEOUT = (10, 60)
+DOWNLOAD_RETRIES = 3
+DOWNLOAD_RETRY_DELAY = 1.0
+
+# Pool de conexiones de la sesión HTTP compartida (hosts distintos, conexiones por host)
+HTTP_POOL_CONNECTIONS = 8
+HTTP_POOL_MAXSIZE = 16
 
 # Asegurar que los directorios existen
 HISTORY_DIR.mkdir(exist_ok=True)
 BACKUPS_DIR.mkdir(exist_ok=True)
 
+# Serializa las escrituras al historial dentro del proceso
+_history_lock = threading.RLock()
+# Anidamiento del bloqueo entre procesos del log (protegido por _history_lock)
+_history_write_state: Dict[str, int] = {'depth': 0}
+
+# Caché del historial parseado, válida mientras no cambie el archivo. Los
+# items se guardan en orden cronológico para añadir al final sin copiar;
+# 'version' cambia con cada modificación de la lista
+_history_cache: Dict[str, Any] = {'key': None, 'items': [], 'version': 0}
+
+# Índice id -> item sobre la lista cacheada (se rehace cuando cambia su versión)
+_history_id_index: Dict[str, Any] = {'version': None, 'by_id': {}}
+
+# Serializa las escrituras de generation_stats.json dentro del proceso; entre
+# procesos se usa además un bloqueo sobre generation_stats.json.lock
+_stats_lock = threading.Lock()
+
+# Actualizaciones de estadísticas pendientes de escribir (se agrupan en una
+# sola escritura cuando terminan varias generaciones a la vez)
+_stats_pending: List[Tuple[str, float, bool, Dict[str, float], datetime]] = []
+_stats_pending_lock = threading.Lock()
+# Máximo de actualizaciones que se conservan mientras el archivo no se puede
+# escribir (se descartan las más antiguas)
+STATS_PENDING_MAX = 1000
+
 # Tarifas de modelos actualizadas (USD por segundo/imagen)
 COST_RATES = {
     'imagen': {
@@ -71,6 +168,10 @@ COST_RATES = {
     }
 }
 
+# Versión de las tarifas/reglas de costo. Incrementar al cambiar COST_RATES o
+# el cálculo: los costos guardados en el historial con otra versión se recalculan
+COST_RATES_VERSION = 1
+
 
 # ===============================
 # GESTIÓN DE CONFIGURACIÓN
@@ -159,40 +260,275 @@ MAX_HISTORY_ITEMS = 100
 # GESTIÓN DE HISTORIAL
 # ===============================
 
-def load_history() -> List[Dict[str, Any]]:
+def new_history_id() -> str:
+    """Id único para un item nuevo del historial"""
+    return uuid.uuid4().hex
+
+
+def _legacy_history_id(item: Mapping[str, Any], occurrence: int = 0) -> str:
     """
-    Cargar historial desde archivo JSON y normalizar datos
-    
-    Returns:
-        List[Dict]: Lista de elementos del historial
+    Id derivado del contenido para items guardados antes de existir 'id'
+
+    Solo usa campos que no cambian al sellar costos o migrar medios, así el
+    id es el mismo en cada carga y al persistirlo con assign_history_ids().
+    occurrence distingue líneas antiguas idénticas (ver _ensure_history_ids).
     """
-    if not HISTORY_FILE.exists():
-        return []
-    
+    fields = [item.get('fecha'), item.get('prompt'), item.get('url'),
+              item.get('archivo_local'), item.get('id_prediccion')]
+    if occurrence:
+        fields.append(occurrence)
+    key = json.dumps(fields, ensure_ascii=False)
+    return hashlib.sha256(key.encode('utf-8')).hexdigest()[:32]
+
+
+def _ensure_history_ids(items: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Asignar el id derivado a los items sin 'id' de una lista cronológica
+
+    Dos líneas antiguas idénticas tendrían el mismo hash: la primera conserva
+    el id de siempre y las repeticiones incluyen su número de aparición.
+    """
+    seen: Dict[str, int] = {}
+    for item in items:
+        if item.get('id'):
+            continue
+        legacy_id = _legacy_history_id(item)
+        occurrence = seen.get(legacy_id, 0)
+        seen[legacy_id] = occurrence + 1
+        item['id'] = _legacy_history_id(item, occurrence) if occurrence else legacy_id
+    return items
+
+
+def _normalize_history_item(item: Dict[str, Any]) -> Dict[str, Any]:
+    """Normalizar tipos de video incorrectos de versiones anteriores y asegurar el id"""
+    if item.get('tipo') in ['video_seedance', 'video_anime']:
+        item['tipo'] = 'video'
+    if not item.get('id'):
+        item['id'] = _legacy_history_id(item)
+    return item
+
+
+def _clean_history_item(item: Dict[str, Any]) -> Dict[str, Any]:
+    """Limpiar cualquier objeto no serializable del item"""
+    clean_item = {}
+    for key, value in item.items():
+        try:
+            # Intentar serializar cada valor individualmente
+            json.dumps(value)
+            clean_item[key] = value
+        except (TypeError, ValueError):
+            # Si no se puede serializar, convertir a string
+            clean_item[key] = str(value)
+    return clean_item
+
+
+def _read_history_log(log_file: Path) -> List[Dict[str, Any]]:
+    """
+    Leer el log JSON Lines en orden cronológico (más antiguo primero)
+
+    Las líneas corruptas o incompletas (p. ej. una escritura interrumpida
+    al final del archivo) se ignoran en lugar de invalidar todo el historial.
+    """
+    items = []
+    with open(log_file, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                item = json.loads(line)
+            except ValueError:
+                continue
+            if isinstance(item, dict):
+                items.append(item)
+    return items
+
+
+def _history_lock_file() -> Path:
+    """Archivo de bloqueo entre procesos del log del historial"""
+    return HISTORY_FILE.with_name(HISTORY_FILE.name + ".lock")
+
+
+@contextmanager
+def _history_write_lock() -> Iterator[None]:
+    """
+    Excluir a otros hilos y a otros procesos mientras se escribe el log
+
+    Toda reescritura (leer, modificar y reemplazar) y cada append debe
+    hacerse dentro de este bloqueo; si no, un proceso puede reemplazar el
+    log con una copia que no incluye la línea que otro acaba de añadir.
+    Es reentrante dentro del mismo hilo.
+    """
+    with _history_lock:
+        if _history_write_state['depth']:
+            _history_write_state['depth'] += 1
+            try:
+                yield
+            finally:
+                _history_write_state['depth'] -= 1
+            return
+        with _interprocess_lock(_history_lock_file()):
+            _history_write_state['depth'] = 1
+            try:
+                yield
+            finally:
+                _history_write_state['depth'] = 0
+
+
+def _write_history_log(items: List[Dict[str, Any]], log_file: Path) -> None:
+    """
+    Reescribir el log completo de forma atómica (archivo temporal + rename)
+
+    Args:
+        items: Elementos en orden cronológico (más antiguo primero)
+        log_file: Ruta destino del log
+    """
+    log_file.parent.mkdir(parents=True, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=log_file.parent, prefix=".history_", suffix=".tmp")
     try:
-        with open(HISTORY_FILE, 'r', encoding='utf-8') as f:
-            history = json.load(f)
-            
-            # Normalizar tipos de video incorrectos
-            for item in history:
-                if item.get('tipo') in ['video_seedance', 'video_anime']:
-                    item['tipo'] = 'video'
-                    # Asegurar que el modelo está correctamente asignado
-                    if 'video_seedance' in str(item.get('tipo', '')):
-                        if not item.get('modelo'):
-                            item['modelo'] = 'Seedance'
-                    elif 'video_anime' in str(item.get('tipo', '')):
-                        if not item.get('modelo'):
-                            item['modelo'] = 'Pixverse'
-            
-            return history
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            for item in items:
+                f.write(json.dumps(item, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, log_file)
     except Exception:
-        return []
+        if os.path.exists(temp_path):
+            os.unlink(temp_path)
+        raise
+
+
+def migrate_legacy_history(legacy_file: Optional[Path] = None, overwrite: bool = False) -> bool:
+    """
+    Migrar un history.json (array, más reciente primero) al log JSON Lines
+
+    Tras migrar, el archivo original se renombra a ``history.json.migrated``
+    para que no se vuelva a importar.
+
+    Args:
+        legacy_file: Archivo JSON a migrar (por defecto LEGACY_HISTORY_FILE)
+        overwrite: Reemplazar el log actual si ya existe
+
+    Returns:
+        bool: True si se migró algún archivo
+    """
+    legacy_file = legacy_file or LEGACY_HISTORY_FILE
+    if not legacy_file.exists():
+        return False
+    if HISTORY_FILE.exists() and not overwrite:
+        return False
+
+    with _history_write_lock():
+        with open(legacy_file, 'r', encoding='utf-8') as f:
+            legacy_history = json.load(f)
+        if not isinstance(legacy_history, list):
+            return False
+
+        # El formato anterior guardaba el más reciente primero; el log es cronológico
+        items = _ensure_history_ids([
+            _clean_history_item(item) for item in reversed(legacy_history) if isinstance(item, dict)
+        ])
+        items = [_stamp_item_cost(_normalize_history_item(item)) for item in items]
+        _write_history_log(items, HISTORY_FILE)
+        legacy_file.replace(legacy_file.with_name(legacy_file.name + ".migrated"))
+        invalidate_history_cache()
+
+    return True
+
+
+def _ensure_history_migrated() -> None:
+    """Importar history.json antiguo la primera vez que se accede al log"""
+    if not HISTORY_FILE.exists() and LEGACY_HISTORY_FILE.exists():
+        try:
+            migrate_legacy_history()
+        except Exception:
+            pass
+
+
+def _freeze(value: Any) -> Any:
+    """Convertir los dicts (también anidados) en vistas de solo lectura"""
+    if isinstance(value, dict):
+        return MappingProxyType({key: _freeze(val) for key, val in value.items()})
+    if isinstance(value, list):
+        return [_freeze(val) for val in value]
+    return value
+
+
+def thaw_history_item(item: Mapping[str, Any]) -> Dict[str, Any]:
+    """
+    Obtener una copia mutable (y serializable) de un item de load_history()
+
+    Args:
+        item: Elemento de solo lectura del historial
+
+    Returns:
+        Dict: Copia con dicts y listas normales
+    """
+    if isinstance(item, Mapping):
+        return {key: thaw_history_item(val) for key, val in item.items()}
+    if isinstance(item, list):
+        return [thaw_history_item(val) for val in item]
+    return item
+
+
+def _history_file_key() -> Optional[Tuple[int, int, int]]:
+    """Identidad del log en disco: (inode, tamaño, mtime en ns)"""
+    try:
+        stat = HISTORY_FILE.stat()
+    except OSError:
+        return None
+    return stat.st_ino, stat.st_size, stat.st_mtime_ns
+
+
+def invalidate_history_cache() -> None:
+    """Descartar el historial cacheado (tras reemplazar el log fuera de save_to_history)"""
+    with _history_lock:
+        _history_cache['key'] = None
+        _history_cache['items'] = []
+        _history_cache['version'] += 1
+
+
+def load_history() -> List[Mapping[str, Any]]:
+    """
+    Cargar historial desde el log JSON Lines y normalizar datos
 
+    El resultado se cachea en el proceso y solo se vuelve a parsear cuando
+    cambia el archivo (inode, tamaño o mtime). Los elementos son vistas de
+    solo lectura compartidas entre llamadas; usar thaw_history_item() para
+    obtener una copia modificable.
+    
+    Returns:
+        List[Mapping]: Lista de elementos del historial (más reciente primero)
+    """
+    _ensure_history_migrated()
+
+    with _history_lock:
+        key = _history_file_key()
+        if key is None:
+            return []
+        if _history_cache['key'] == key:
+            return _history_cache['items'][::-1]
+
+        try:
+            history = _read_history_log(HISTORY_FILE)
+        except Exception:
+            return []
+        items = [_freeze(_normalize_history_item(item)) for item in _ensure_history_ids(history)]
+
+        _history_cache['key'] = key
+        _history_cache['items'] = items
+        _history_cache['version'] += 1
+        return items[::-1]
 
+
+@traced("persist")
 def save_to_history(item: Dict[str, Any]) -> bool:
     """
     Guardar item al historial
+
+    Añade una sola línea al final del log (O(1)), sin releer ni reescribir
+    el historial existente y sin límite de elementos. Si el item no trae
+    'id' se le asigna uno nuevo (ver get_history_item).
     
     Args:
         item: Elemento a guardar en el historial
@@ -201,25 +537,48 @@ def save_to_history(item: Dict[str, Any]) -> bool:
         bool: True si se guardó exitosamente
     """
     try:
-        # Limpiar cualquier objeto no serializable del item
-        clean_item = {}
-        for key, value in item.items():
+        _ensure_history_migrated()
+
+        clean_item = _stamp_item_cost(_clean_history_item(item))
+        if not clean_item.get('id'):
+            clean_item['id'] = new_history_id()
+        # Una única escritura por línea en modo append: un corte a mitad deja
+        # como mucho una línea incompleta que load_history() descarta
+        line = (json.dumps(clean_item, ensure_ascii=False) + "\n").encode('utf-8')
+        
+        with _history_write_lock():
+            HISTORY_FILE.parent.mkdir(parents=True, exist_ok=True)
+            key_before = _history_file_key()
+            fd = os.open(HISTORY_FILE, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
             try:
-                # Intentar serializar cada valor individualmente
-                json.dumps(value)
-                clean_item[key] = value
-            except (TypeError, ValueError):
-                # Si no se puede serializar, convertir a string
-                clean_item[key] = str(value)
-        
-        history = load_history()
-        history.insert(0, clean_item)  # Añadir al principio
-        
-        # Mantener solo los últimos 100 elementos
-        history = history[:100]
-        
-        with open(HISTORY_FILE, 'w', encoding='utf-8') as f:
-            json.dump(history, f, ensure_ascii=False, indent=2)
+                os.write(fd, line)
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+
+            # Si la caché estaba al día y el log creció exactamente esta línea
+            # (nadie más escribió entre medias), añadir el item sin volver a parsear
+            key_after = _history_file_key()
+            if (key_before is not None and key_after is not None and _history_cache['key'] == key_before
+                    and key_after[0] == key_before[0] and key_after[1] == key_before[1] + len(line)):
+                new_item = _freeze(_normalize_history_item(json.loads(line)))
+                index_current = _history_id_index['version'] == _history_cache['version']
+                _history_cache['items'].append(new_item)
+                _history_cache['key'] = key_after
+                _history_cache['version'] += 1
+                if index_current:
+                    _history_id_index['by_id'][new_item['id']] = new_item
+                    _history_id_index['version'] = _history_cache['version']
+            else:
+                invalidate_history_cache()
+            annotate(line_bytes=len(line), history_bytes=key_after[1] if key_after else None,
+                     history_items=len(_history_cache['items']) if _history_cache['key'] else None)
+
+            # Sumar el costo del nuevo item a los rollups (solo lee la línea añadida)
+            try:
+                _sync_cost_rollups()
+            except Exception:
+                pass
         
         return True
         
@@ -229,6 +588,167 @@ def save_to_history(item: Dict[str, Any]) -> bool:
         return False
 
 
+def _read_history_log_tail(state: Mapping[str, Any]) -> Tuple[bool, List[Dict[str, Any]], Dict[str, Any]]:
+    """
+    Leer las líneas completas añadidas al log desde una posición conocida
+
+    Lo usan las estructuras derivadas del log (índice, rollups de costo)
+    para ponerse al día leyendo solo los bytes nuevos.
+
+    Args:
+        state: Posición ya consumida ({'offset', 'inode', 'head'}); vacío para leer todo
+
+    Returns:
+        Tuple: (reiniciado, items nuevos normalizados, nuevo estado). Si el log
+        fue reemplazado (compactación, restauración) se lee desde el principio
+        y reiniciado es True.
+    """
+    _ensure_history_migrated()
+
+    offset = int(state.get('offset', 0) or 0)
+    if not HISTORY_FILE.exists():
+        return bool(offset), [], {'offset': 0, 'inode': '', 'head': ''}
+
+    stat = HISTORY_FILE.stat()
+    reset = False
+    with open(HISTORY_FILE, 'rb') as f:
+        head = f.read(_LOG_HEAD_BYTES).hex()
+        if offset and (state.get('inode') != str(stat.st_ino) or offset > stat.st_size
+                       or not head.startswith(str(state.get('head', ''))[:len(head)])):
+            reset = True
+            offset = 0
+
+        data = b""
+        if offset < stat.st_size:
+            f.seek(offset)
+            data = f.read()
+
+    # Consumir solo líneas completas; una escritura en curso se leerá después
+    end = data.rfind(b"\n") + 1
+    items = []
+    for raw_line in data[:end].splitlines():
+        try:
+            item = json.loads(raw_line.decode('utf-8'))
+        except ValueError:
+            continue
+        if isinstance(item, dict):
+            items.append(item)
+    # Las líneas sin id solo las escribían versiones anteriores, así que en
+    # la práctica están al principio del log y se leen aquí desde el offset 0
+    items = [_normalize_history_item(item) for item in _ensure_history_ids(items)]
+
+    return reset, items, {'offset': offset + end, 'inode': str(stat.st_ino), 'head': head}
+
+
+def get_history_item(item_id: Optional[str]) -> Optional[Mapping[str, Any]]:
+    """
+    Buscar un item del historial por su id
+
+    Usa un índice id -> item construido una vez sobre el historial cacheado
+    (O(1) por consulta en lugar de recorrer la lista).
+
+    Args:
+        item_id: Campo 'id' del item
+
+    Returns:
+        Optional[Mapping]: Item de solo lectura, o None si no existe
+    """
+    if not item_id:
+        return None
+    load_history()
+
+    with _history_lock:
+        if _history_id_index['version'] != _history_cache['version']:
+            # Del más antiguo al más reciente: con ids repetidos gana el más reciente
+            _history_id_index['by_id'] = {item['id']: item for item in _history_cache['items']}
+            _history_id_index['version'] = _history_cache['version']
+        return _history_id_index['by_id'].get(item_id)
+
+
+def delete_history_item(item_id: str) -> bool:
+    """
+    Eliminar un item del historial por su id
+
+    Reescribe el log de forma atómica; los rollups y el índice se recalculan
+    solos al detectar el log reemplazado. Los items antiguos se guardan con
+    su id derivado, así no cambia al desaparecer una línea idéntica anterior.
+    El archivo en el almacén de medios se conserva hasta el siguiente
+    gc_media_store().
+
+    Args:
+        item_id: Campo 'id' del item
+
+    Returns:
+        bool: True si se encontró y eliminó el item
+    """
+    if not item_id or not HISTORY_FILE.exists():
+        return False
+
+    try:
+        with _history_write_lock():
+            items = _ensure_history_ids(_read_history_log(HISTORY_FILE))
+            kept = [item for item in items if item['id'] != item_id]
+            if len(kept) == len(items):
+                return False
+            _write_history_log(kept, HISTORY_FILE)
+            invalidate_history_cache()
+        return True
+    except Exception:
+        return False
+
+
+def assign_history_ids() -> int:
+    """
+    Guardar en el log el id de los items antiguos que no lo tienen
+
+    No es necesario para el funcionamiento normal (el id derivado se calcula
+    al cargar), pero evita recalcularlo y fija el id aunque luego se edite
+    el item.
+
+    Returns:
+        int: Número de items actualizados (-1 si hubo un error)
+    """
+    try:
+        with _history_write_lock():
+            _ensure_history_migrated()
+            if not HISTORY_FILE.exists():
+                return 0
+
+            items = _read_history_log(HISTORY_FILE)
+            missing = [item for item in items if not item.get('id')]
+            _ensure_history_ids(items)
+
+            if missing:
+                _write_history_log(items, HISTORY_FILE)
+                invalidate_history_cache()
+        return len(missing)
+    except Exception:
+        return -1
+
+
+def compact_history() -> bool:
+    """
+    Compactar el log del historial
+
+    Reescribe el log de forma atómica descartando líneas corruptas o
+    incompletas. No es necesario para el funcionamiento normal.
+
+    Returns:
+        bool: True si se compactó exitosamente
+    """
+    if not HISTORY_FILE.exists():
+        return False
+
+    try:
+        with _history_write_lock():
+            items = _read_history_log(HISTORY_FILE)
+            _write_history_log(items, HISTORY_FILE)
+            invalidate_history_cache()
+        return True
+    except Exception:
+        return False
+
+
 def filter_history_by_type(history: List[Dict[str, Any]], tipo: str) -> List[Dict[str, Any]]:
     """
     Filtrar historial por tipo de contenido
@@ -271,7 +791,7 @@ def backup_history_file() -> bool:
         return False
     
     try:
-        backup_file = HISTORY_DIR / f"history_backup_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+        backup_file = HISTORY_DIR / f"history_backup_{datetime.now().strftime('%Y%m%d_%H%M%S')}{HISTORY_FILE.suffix}"
         
         with open(HISTORY_FILE, 'r', encoding='utf-8') as source:
             with open(backup_file, 'w', encoding='utf-8') as backup:
@@ -309,85 +829,583 @@ def validate_history_structure(history: List[Dict[str, Any]]) -> bool:
 
 
 # ===============================
-# CÁLCULOS DE COSTO
+# ÍNDICE SQLITE DEL HISTORIAL
 # ===============================
 
-def calculate_item_cost(item: Dict[str, Any]) -> Tuple[float, str, str]:
+# Índice derivado del log (se puede borrar; se reconstruye solo)
+HISTORY_INDEX_FILE = HISTORY_DIR / "history_index.db"
+
+# Desactivar para filtrar siempre en memoria sobre load_history()
+USE_HISTORY_INDEX = True
+
+_HISTORY_ORDERS = {
+    'desc': 'h.fecha DESC, h.seq DESC',
+    'asc': 'h.fecha ASC, h.seq ASC',
+    'tipo': 'h.tipo ASC, h.fecha DESC, h.seq DESC',
+}
+
+
+def _fts5_available(conn) -> bool:
+    """Comprobar si el SQLite enlazado soporta FTS5"""
+    try:
+        conn.execute("CREATE VIRTUAL TABLE IF NOT EXISTS temp.fts5_probe USING fts5(x)")
+        conn.execute("DROP TABLE temp.fts5_probe")
+        return True
+    except Exception:
+        return False
+
+
+def _open_history_index():
     """
-    Calcular el costo de un item individual basado en sus características reales
-    
-    Args:
-        item: Elemento del historial con información del contenido generado
-        
+    Abrir (y crear si hace falta) la base de datos del índice
+
     Returns:
-        Tuple[float, str, str]: (costo, información_del_modelo, detalles_del_cálculo)
-    """
-    item_type = item.get('tipo', 'imagen')
-    archivo_local = item.get('archivo_local', '')
-    modelo = item.get('modelo', '').lower()
-    parametros = item.get('parametros', {})
-    
-    # Normalizar tipos de video incorrectos
-    if item_type in ['video_seedance', 'video_anime']:
-        item_type = 'video'
-    
-    # Variables para el cálculo
-    cost = 0
-    model_info = ""
-    calculation_details = ""
-    
-    if item_type == 'imagen':
-        cost, model_info, calculation_details = _calculate_image_cost(
-            archivo_local, modelo, parametros, item
-        )
-    elif item_type == 'video':
-        cost, model_info, calculation_details = _calculate_video_cost(
-            archivo_local, modelo, parametros, item
+        Tuple[sqlite3.Connection, bool]: (conexión, FTS5 disponible)
+    """
+    import sqlite3
+
+    conn = sqlite3.connect(str(HISTORY_INDEX_FILE), timeout=10)
+    # Búsqueda sin FTS5 con la misma semántica que el fallback en memoria
+    conn.create_function("prompt_matches", 2,
+                         lambda prompt, text: _prompt_matches(prompt or '', _search_terms(text)),
+                         deterministic=True)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.executescript("""
+        CREATE TABLE IF NOT EXISTS history (
+            seq INTEGER PRIMARY KEY,
+            fecha TEXT,
+            tipo TEXT,
+            modelo TEXT,
+            prompt TEXT,
+            data TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_history_fecha ON history(fecha);
+        CREATE INDEX IF NOT EXISTS idx_history_tipo ON history(tipo, fecha);
+        CREATE INDEX IF NOT EXISTS idx_history_modelo ON history(modelo COLLATE NOCASE, fecha);
+        CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+    """)
+
+    has_fts = _fts5_available(conn)
+    if has_fts:
+        conn.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS history_fts "
+            "USING fts5(prompt, content='history', content_rowid='seq')"
         )
-    
-    return round(cost, 3), model_info, calculation_details
+    return conn, has_fts
 
 
-def _calculate_image_cost(archivo_local: str, modelo: str, parametros: Dict, item: Dict) -> Tuple[float, str, str]:
-    """Calcular costo para imágenes"""
-    # Detectar modelo de imagen
-    if 'kandinsky' in archivo_local.lower() or 'kandinsky' in modelo:
-        model_key = 'kandinsky'
-        # Usar tiempo guardado o estimar basado en parámetros
-        seconds = item.get('processing_time', 12)  # Tiempo real si está guardado
-        if 'num_inference_steps' in parametros:
-            # Estimar basado en steps (más steps = más tiempo)
-            steps = parametros['num_inference_steps']
-            seconds = max(8, min(15, steps * 0.4))  # Entre 8-15 segundos según steps
-        cost = COST_RATES['imagen'][model_key]['rate'] * seconds
-        model_info = f"Kandinsky ({seconds:.1f}s)"
-        calculation_details = f"${COST_RATES['imagen'][model_key]['rate']} × {seconds:.1f}s"
-        
-    elif 'ssd' in archivo_local.lower() or 'ssd' in modelo:
-        model_key = 'ssd_1b'
-        # Usar tiempo guardado o estimar basado en parámetros
-        seconds = item.get('processing_time', 6)  # Tiempo real si está guardado
-        if 'num_inference_steps' in parametros:
-            # Estimar basado en steps (más steps = más tiempo)
-            steps = parametros['num_inference_steps']
-            seconds = max(4, min(10, steps * 0.2))  # Entre 4-10 segundos según steps
-        cost = COST_RATES['imagen'][model_key]['rate'] * seconds
-        model_info = f"SSD-1B ({seconds:.1f}s)"
-        calculation_details = f"${COST_RATES['imagen'][model_key]['rate']} × {seconds:.1f}s"
-        
-    else:  # Flux Pro por defecto
-        model_key = 'flux_pro'
-        cost = COST_RATES['imagen'][model_key]['rate']
-        model_info = "Flux Pro"
-        calculation_details = f"${COST_RATES['imagen'][model_key]['rate']} por imagen"
-    
-    return cost, model_info, calculation_details
+def _reset_history_index(conn, has_fts: bool) -> None:
+    """Vaciar el índice para reconstruirlo desde el principio del log"""
+    conn.execute("DELETE FROM history")
+    conn.execute("DELETE FROM meta")
+    if has_fts:
+        conn.execute("INSERT INTO history_fts(history_fts) VALUES('delete-all')")
 
 
-def _calculate_video_cost(archivo_local: str, modelo: str, parametros: Dict, item: Dict) -> Tuple[float, str, str]:
-    """Calcular costo para videos"""
-    # Detectar modelo de video
-    if 'seedance' in archivo_local.lower() or 'seedance' in modelo or item.get('modelo') == 'Seedance':
+def _sync_history_index(conn, has_fts: bool) -> None:
+    """
+    Incorporar al índice las líneas añadidas al log desde la última sincronización
+
+    Solo se leen los bytes nuevos del log. Si el log fue reemplazado
+    (compactación, restauración) el índice se reconstruye completo.
+    """
+    meta = dict(conn.execute("SELECT key, value FROM meta").fetchall())
+    reset, items, state = _read_history_log_tail(meta)
+    if not reset and state['offset'] == int(meta.get('offset', 0)):
+        return
+
+    with conn:
+        if reset:
+            _reset_history_index(conn, has_fts)
+        for item in items:
+            row = (
+                str(item.get('fecha', '') or ''),
+                str(item.get('tipo', '') or ''),
+                str(item.get('modelo', '') or ''),
+                str(item.get('prompt', '') or ''),
+                json.dumps(item, ensure_ascii=False)
+            )
+            cursor = conn.execute(
+                "INSERT INTO history (fecha, tipo, modelo, prompt, data) VALUES (?, ?, ?, ?, ?)", row
+            )
+            if has_fts:
+                conn.execute(
+                    "INSERT INTO history_fts(rowid, prompt) VALUES (?, ?)", (cursor.lastrowid, row[3])
+                )
+        conn.executemany("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", [
+            (key, str(value)) for key, value in state.items()
+        ])
+
+
+def _search_tokens(text: str) -> List[str]:
+    """
+    Tokens de un texto como los genera FTS5 (tokenizer unicode61)
+
+    En minúsculas, sin acentos y separados por todo lo que no sea letra o
+    número; así el índice y el fallback en memoria coinciden igual.
+    """
+    decomposed = unicodedata.normalize('NFKD', text.lower())
+    return re.findall(r'[^\W_]+', ''.join(char for char in decomposed if not unicodedata.combining(char)))
+
+
+def _search_terms(text: str) -> List[List[str]]:
+    """Términos de búsqueda (separados por espacios), cada uno como lista de tokens"""
+    return [tokens for tokens in (_search_tokens(term) for term in text.split()) if tokens]
+
+
+def _prompt_matches(prompt: str, terms: List[List[str]]) -> bool:
+    """
+    Si algún término aparece en el prompt por prefijo de token (semántica de _fts_query)
+
+    Un término con varios tokens ("corona-den") es una frase: tokens
+    consecutivos, el último por prefijo.
+    """
+    tokens = _search_tokens(prompt)
+    for term in terms:
+        *exact, last = term
+        for start in range(len(tokens) - len(term) + 1):
+            if tokens[start:start + len(exact)] == exact and tokens[start + len(exact)].startswith(last):
+                return True
+    return False
+
+
+def _fts_query(text: str) -> str:
+    """Convertir términos de búsqueda en una consulta FTS5 (cualquier término, por prefijo)"""
+    return " OR ".join('"' + " ".join(term) + '"*' for term in _search_terms(text))
+
+
+def _as_iso(value: Any) -> Optional[str]:
+    """Aceptar datetime o string ISO para los filtros de fecha"""
+    if value is None:
+        return None
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+
+def _query_history_in_memory(tipo=None, modelo=None, text=None, since=None, until=None,
+                             order='desc', limit=None, offset=0, max_seq=None) -> List[Dict[str, Any]]:
+    """Implementación de query_history sin SQLite (filtrado sobre load_history())"""
+    items = load_history()
+    if max_seq is not None:
+        # load_history() va del más reciente al más antiguo: la posición en el log es len - índice
+        items = items[max(len(items) - max_seq, 0):]
+
+    if tipo:
+        items = filter_history_by_type(items, tipo)
+    if modelo:
+        items = [item for item in items if str(item.get('modelo', '') or '').lower() == modelo.lower()]
+    if text:
+        terms = _search_terms(text)
+        items = [item for item in items if _prompt_matches(str(item.get('prompt', '') or ''), terms)]
+    if since:
+        items = [item for item in items if item.get('fecha', '') >= since]
+    if until:
+        items = [item for item in items if item.get('fecha', '') <= until]
+
+    # load_history() devuelve el más reciente primero; sort es estable
+    if order == 'asc':
+        items.reverse()
+        items.sort(key=lambda x: x.get('fecha', ''))
+    elif order == 'tipo':
+        items.sort(key=lambda x: x.get('fecha', ''), reverse=True)
+        items.sort(key=lambda x: x.get('tipo', ''))
+    else:
+        items.sort(key=lambda x: x.get('fecha', ''), reverse=True)
+
+    end = offset + limit if limit is not None else None
+    return items[offset:end]
+
+
+def _history_filters_sql(has_fts: bool, tipo=None, modelo=None, text=None, since=None, until=None,
+                         max_seq=None) -> Tuple[str, List[Any]]:
+    """Cláusula WHERE (o cadena vacía) y parámetros de los filtros de query_history"""
+    where, params = [], []
+    if tipo:
+        where.append("h.tipo = ?")
+        params.append(tipo)
+    if modelo:
+        where.append("h.modelo = ? COLLATE NOCASE")
+        params.append(modelo)
+    if text:
+        if not _search_terms(text):
+            # Solo signos de puntuación: ningún prompt puede coincidir
+            where.append("0")
+        elif has_fts:
+            where.append("h.seq IN (SELECT rowid FROM history_fts WHERE history_fts MATCH ?)")
+            params.append(_fts_query(text))
+        else:
+            where.append("prompt_matches(h.prompt, ?)")
+            params.append(text)
+    if since:
+        where.append("h.fecha >= ?")
+        params.append(since)
+    if until:
+        where.append("h.fecha <= ?")
+        params.append(until)
+    if max_seq is not None:
+        where.append("h.seq <= ?")
+        params.append(max_seq)
+    return (" WHERE " + " AND ".join(where)) if where else "", params
+
+
+def query_history(tipo: Optional[str] = None, modelo: Optional[str] = None,
+                  text: Optional[str] = None, since: Any = None, until: Any = None,
+                  order: str = 'desc', limit: Optional[int] = None,
+                  offset: int = 0, max_seq: Optional[int] = None) -> List[Dict[str, Any]]:
+    """
+    Consultar el historial con filtros, búsqueda y paginación
+
+    Usa el índice SQLite (con FTS5 sobre el prompt si está disponible) y
+    recurre al filtrado en memoria si SQLite no se puede usar.
+
+    Args:
+        tipo: Filtrar por tipo ('imagen', 'video', ...)
+        modelo: Filtrar por modelo (sin distinguir mayúsculas)
+        text: Términos a buscar en el prompt (basta con que coincida uno; por
+            prefijo de palabra, sin distinguir mayúsculas ni acentos)
+        since: Fecha mínima (datetime o string ISO, inclusive)
+        until: Fecha máxima (datetime o string ISO, inclusive)
+        order: 'desc' (más reciente primero), 'asc' o 'tipo'
+        limit: Número máximo de elementos (None = todos)
+        offset: Elementos a saltar (paginación)
+        max_seq: Ignorar los elementos añadidos al log después de esta
+            posición (ver query_history_page)
+
+    Returns:
+        List[Dict]: Elementos que cumplen los filtros
+    """
+    since, until = _as_iso(since), _as_iso(until)
+    text = text.strip() if text else None
+
+    if USE_HISTORY_INDEX:
+        try:
+            conn, has_fts = _open_history_index()
+            try:
+                _sync_history_index(conn, has_fts)
+
+                where, params = _history_filters_sql(has_fts, tipo, modelo, text, since, until, max_seq)
+                sql = "SELECT h.data FROM history h" + where
+                sql += " ORDER BY " + _HISTORY_ORDERS.get(order, _HISTORY_ORDERS['desc'])
+                sql += " LIMIT ? OFFSET ?"
+                params.extend([limit if limit is not None else -1, offset])
+
+                return [json.loads(row[0]) for row in conn.execute(sql, params)]
+            finally:
+                conn.close()
+        except Exception:
+            pass
+
+    return _query_history_in_memory(tipo, modelo, text, since, until, order, limit, offset, max_seq)
+
+
+def query_history_page(tipo: Optional[str] = None, modelo: Optional[str] = None,
+                       text: Optional[str] = None, since: Any = None, until: Any = None,
+                       order: str = 'desc', page: int = 1, page_size: int = 24,
+                       cursor: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Una página del historial con un cursor estable
+
+    El cursor es la posición en el log del último elemento que existía al
+    abrir el listado: las generaciones nuevas no desplazan las páginas
+    mientras se navega (se informan en 'new_items'). Solo se cargan los
+    elementos de la página pedida.
+
+    Args:
+        tipo, modelo, text, since, until, order: Como en query_history
+        page: Página (desde 1; se ajusta al rango disponible)
+        page_size: Elementos por página
+        cursor: Cursor de una página anterior (None = estado actual del log)
+
+    Returns:
+        Dict: items, page, pages, total, cursor y new_items (elementos que
+        cumplen los filtros añadidos después del cursor)
+    """
+    since, until = _as_iso(since), _as_iso(until)
+    text = text.strip() if text else None
+    page_size = max(1, int(page_size))
+
+    def build_page(items_for_page, total, matching_now, cursor):
+        pages = max(1, -(-total // page_size))
+        current = min(max(1, int(page)), pages)
+        return {
+            'items': items_for_page(current),
+            'page': current,
+            'pages': pages,
+            'total': total,
+            'cursor': cursor,
+            'new_items': max(matching_now - total, 0),
+        }
+
+    if USE_HISTORY_INDEX:
+        try:
+            conn, has_fts = _open_history_index()
+            try:
+                _sync_history_index(conn, has_fts)
+                if cursor is None:
+                    cursor = conn.execute("SELECT COALESCE(MAX(seq), 0) FROM history").fetchone()[0]
+
+                def count(max_seq):
+                    where, params = _history_filters_sql(has_fts, tipo, modelo, text, since, until, max_seq)
+                    return conn.execute("SELECT COUNT(*) FROM history h" + where, params).fetchone()[0]
+
+                def items_for_page(current):
+                    where, params = _history_filters_sql(has_fts, tipo, modelo, text, since, until, cursor)
+                    sql = ("SELECT h.data FROM history h" + where + " ORDER BY "
+                           + _HISTORY_ORDERS.get(order, _HISTORY_ORDERS['desc']) + " LIMIT ? OFFSET ?")
+                    params.extend([page_size, (current - 1) * page_size])
+                    return [json.loads(row[0]) for row in conn.execute(sql, params)]
+
+                return build_page(items_for_page, count(cursor), count(None), cursor)
+            finally:
+                conn.close()
+        except Exception:
+            pass
+
+    if cursor is None:
+        cursor = len(load_history())
+    visible = _query_history_in_memory(tipo, modelo, text, since, until, order, max_seq=cursor)
+    matching_now = len(_query_history_in_memory(tipo, modelo, text, since, until, order))
+    return build_page(lambda current: visible[(current - 1) * page_size:current * page_size],
+                      len(visible), matching_now, cursor)
+
+
+def rebuild_history_index() -> bool:
+    """
+    Reconstruir el índice SQLite completo desde el log del historial
+
+    Returns:
+        bool: True si se reconstruyó exitosamente
+    """
+    try:
+        conn, has_fts = _open_history_index()
+        try:
+            with conn:
+                _reset_history_index(conn, has_fts)
+            _sync_history_index(conn, has_fts)
+        finally:
+            conn.close()
+        return True
+    except Exception:
+        return False
+
+
+# ===============================
+# CÁLCULOS DE COSTO
+# ===============================
+
+def calculate_item_cost(item: Dict[str, Any]) -> Tuple[float, str, str]:
+    """
+    Calcular el costo de un item individual basado en sus características reales
+
+    Si el item tiene el costo guardado con la versión actual de tarifas
+    (campo 'cost', ver save_to_history) se usa directamente.
+    
+    Args:
+        item: Elemento del historial con información del contenido generado
+        
+    Returns:
+        Tuple[float, str, str]: (costo, información_del_modelo, detalles_del_cálculo)
+    """
+    stored = _stored_item_cost(item)
+    if stored is not None:
+        return stored['usd'], stored['model_info'], stored['details']
+    return _compute_item_cost(item)
+
+
+def _stored_item_cost(item: Mapping[str, Any]) -> Optional[Mapping[str, Any]]:
+    """Costo guardado en el item, si existe y es de la versión actual de tarifas"""
+    stored = item.get('cost')
+    if type(stored) in _MAPPING_TYPES and stored.get('rates_version') == COST_RATES_VERSION:
+        return stored
+    return None
+
+
+def _compute_item_cost(item: Mapping[str, Any]) -> Tuple[float, str, str]:
+    """Calcular el costo de un item desde sus datos (archivo, modelo y parámetros)"""
+    item_type = item.get('tipo', 'imagen')
+    archivo_local = item.get('archivo_local', '')
+    modelo = item.get('modelo', '').lower()
+    parametros = item.get('parametros', {})
+    
+    # Normalizar tipos de video incorrectos
+    if item_type in ['video_seedance', 'video_anime']:
+        item_type = 'video'
+    
+    # Variables para el cálculo
+    cost = 0
+    model_info = ""
+    calculation_details = ""
+    
+    if item_type == 'imagen':
+        cost, model_info, calculation_details = _calculate_image_cost(
+            archivo_local, modelo, parametros, item
+        )
+    elif item_type == 'video':
+        cost, model_info, calculation_details = _calculate_video_cost(
+            archivo_local, modelo, parametros, item
+        )
+    
+    return round(cost, 3), model_info, calculation_details
+
+
+def _detect_cost_model(item_type: str, archivo_local: str, modelo: str) -> Optional[str]:
+    """
+    Detectar el modelo a efectos de costo a partir del archivo y el modelo guardado
+
+    Args:
+        item_type: Tipo ya normalizado ('imagen' o 'video')
+        archivo_local: Nombre del archivo local
+        modelo: Modelo guardado, en minúsculas
+
+    Returns:
+        Optional[str]: flux_pro, kandinsky, ssd_1b, seedance, pixverse, veo3,
+        video_generico o None si el tipo no tiene costo
+    """
+    archivo_local = archivo_local.lower()
+    if item_type == 'imagen':
+        if 'kandinsky' in archivo_local or 'kandinsky' in modelo:
+            return 'kandinsky'
+        if 'ssd' in archivo_local or 'ssd' in modelo:
+            return 'ssd_1b'
+        return 'flux_pro'
+    if item_type == 'video':
+        if 'seedance' in archivo_local or 'seedance' in modelo:
+            return 'seedance'
+        if 'pixverse' in archivo_local or 'pixverse' in modelo:
+            return 'pixverse'
+        if 'veo3' in archivo_local or 'veo' in modelo:
+            return 'veo3'
+        return 'video_generico'
+    return None
+
+
+def get_item_model_id(item: Mapping[str, Any]) -> Optional[str]:
+    """
+    Obtener el modelo normalizado de un item del historial
+
+    Usa el valor guardado al crear el item; para items antiguos lo detecta
+    a partir del archivo y el modelo.
+
+    Returns:
+        Optional[str]: flux_pro, kandinsky, ssd_1b, seedance, pixverse, veo3,
+        video_generico o None
+    """
+    stored = item.get('cost')
+    if type(stored) in _MAPPING_TYPES and 'model_id' in stored:
+        return stored['model_id']
+
+    item_type = item.get('tipo', 'imagen')
+    if item_type in ['video_seedance', 'video_anime']:
+        item_type = 'video'
+    return _detect_cost_model(item_type, str(item.get('archivo_local', '') or ''),
+                              str(item.get('modelo', '') or '').lower())
+
+
+def _stamp_item_cost(item: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Guardar en el item su modelo normalizado y su costo (campo 'cost')
+
+    Si el costo no se puede calcular el item se deja sin sellar y se
+    calculará al leerlo.
+    """
+    item.pop('cost', None)
+    try:
+        cost, model_info, details = _compute_item_cost(item)
+        model_id = get_item_model_id(item)
+    except Exception:
+        return item
+
+    item['cost'] = {
+        'model_id': model_id,
+        'usd': cost,
+        'model_info': model_info,
+        'details': details,
+        'rates_version': COST_RATES_VERSION,
+    }
+    return item
+
+
+def _calculate_image_cost(archivo_local: str, modelo: str, parametros: Dict, item: Dict) -> Tuple[float, str, str]:
+    """Calcular costo para imágenes"""
+    # Detectar modelo de imagen
+    detected = _detect_cost_model('imagen', archivo_local, modelo)
+    if detected == 'kandinsky':
+        model_key = 'kandinsky'
+        # Usar tiempo guardado o estimar basado en parámetros
+        seconds = item.get('processing_time', 12)  # Tiempo real si está guardado
+        if 'num_inference_steps' in parametros:
+            # Estimar basado en steps (más steps = más tiempo)
+            steps = parametros['num_inference_steps']
+            seconds = max(8, min(15, steps * 0.4))  # Entre 8-15 segundos según steps
+        cost = COST_RATES['imagen'][model_key]['rate'] * seconds
+        model_info = f"Kandinsky ({seconds:.1f}s)"
+        calculation_details = f"${COST_RATES['imagen'][model_key]['rate']} × {seconds:.1f}s"
+        
+    elif detected == 'ssd_1b':
+        model_key = 'ssd_1b'
+        # Usar tiempo guardado o estimar basado en parámetros
+        seconds = item.get('processing_time', 6)  # Tiempo real si está guardado
+        if 'num_inference_steps' in parametros:
+            # Estimar basado en steps (más steps = más tiempo)
+            steps = parametros['num_inference_steps']
+            seconds = max(4, min(10, steps * 0.2))  # Entre 4-10 segundos según steps
+        cost = COST_RATES['imagen'][model_key]['rate'] * seconds
+        model_info = f"SSD-1B ({seconds:.1f}s)"
+        calculation_details = f"${COST_RATES['imagen'][model_key]['rate']} × {seconds:.1f}s"
+        
+    else:  # Flux Pro por defecto
+        model_key = 'flux_pro'
+        cost = COST_RATES['imagen'][model_key]['rate']
+        model_info = "Flux Pro"
+        calculation_details = f"${COST_RATES['imagen'][model_key]['rate']} por imagen"
+    
+    return cost, model_info, calculation_details
+
+
+def _pixverse_duration_seconds(duration: Any) -> float:
+    """Convertir la duración de Pixverse ('5s' o número) a segundos; 5 por defecto"""
+    if isinstance(duration, str) and duration.endswith('s'):
+        try:
+            return int(duration[:-1])
+        except ValueError:
+            return 5
+    if isinstance(duration, (int, float)):
+        return duration
+    return 5
+
+
+def _pixverse_resolution_factor(resolution: Any) -> float:
+    """Factor de units según resolución (720p base, 1080p +50%, 540p -30%)"""
+    if '1080p' in str(resolution):
+        return 1.5
+    if '540p' in str(resolution):
+        return 0.7
+    return 1.0
+
+
+def estimate_pixverse_units(duration: Any, resolution: Any) -> float:
+    """
+    Estimar las units de Pixverse a partir de duración y resolución
+
+    Args:
+        duration: Duración ('5s' o segundos)
+        resolution: Resolución/calidad ('540p', '720p', '1080p')
+
+    Returns:
+        float: Units estimadas (6 por segundo, ajustadas por resolución)
+    """
+    base_units = _pixverse_duration_seconds(duration) * 6  # Base: 6 units por segundo
+    factor = _pixverse_resolution_factor(resolution)
+    return round(base_units * factor if factor != 1.0 else base_units, 1)
+
+
+def _calculate_video_cost(archivo_local: str, modelo: str, parametros: Dict, item: Dict) -> Tuple[float, str, str]:
+    """Calcular costo para videos"""
+    # Detectar modelo de video
+    detected = _detect_cost_model('video', archivo_local, modelo)
+    if detected == 'seedance':
         model_key = 'seedance'
         # Usar duración guardada o estimar basado en parámetros
         duration = item.get('video_duration', 6)  # Duración real si está guardada
@@ -399,7 +1417,7 @@ def _calculate_video_cost(archivo_local: str, modelo: str, parametros: Dict, ite
         model_info = f"Seedance ({duration}s)"
         calculation_details = f"${COST_RATES['video'][model_key]['rate']} × {duration}s"
         
-    elif 'pixverse' in archivo_local.lower() or 'pixverse' in modelo or item.get('modelo') == 'Pixverse':
+    elif detected == 'pixverse':
         model_key = 'pixverse'
         # Para Pixverse usar units calculadas por duración y resolución
         units = item.get('pixverse_units', 1)  # Units reales si están guardadas
@@ -410,32 +1428,13 @@ def _calculate_video_cost(archivo_local: str, modelo: str, parametros: Dict, ite
             duration = parametros.get('duration', '5s')
             resolution = parametros.get('resolution', '720p')
             
-            # Convertir duración a número
-            duration_num = 5  # Por defecto
-            if isinstance(duration, str) and duration.endswith('s'):
-                try:
-                    duration_num = int(duration[:-1])
-                except ValueError:
-                    duration_num = 5
-            elif isinstance(duration, (int, float)):
-                duration_num = duration
-            
-            # Calcular units basado en duración y resolución
-            base_units = duration_num * 6  # Base: 6 units por segundo
-            if '1080p' in str(resolution):
-                units = base_units * 1.5  # 50% más para 1080p
-            elif '540p' in str(resolution):
-                units = base_units * 0.7  # 30% menos para 540p
-            else:  # 720p
-                units = base_units
-            
-            units = round(units, 1)
+            units = estimate_pixverse_units(duration, resolution)
         
         cost = COST_RATES['video'][model_key]['rate'] * units
         model_info = f"Pixverse ({units} units)"
         calculation_details = f"${COST_RATES['video'][model_key]['rate']} × {units} units"
         
-    elif 'veo3' in archivo_local.lower() or 'veo' in modelo:
+    elif detected == 'veo3':
         model_key = 'veo3'
         # Usar duración guardada o estimar (generalmente 5 segundos)
         duration = item.get('video_duration', 5)
@@ -460,40 +1459,45 @@ def _calculate_video_cost(archivo_local: str, modelo: str, parametros: Dict, ite
     return cost, model_info, calculation_details
 
 
-def calculate_total_cost(history: List[Dict[str, Any]]) -> float:
+def calculate_total_cost(history: Optional[List[Dict[str, Any]]] = None) -> float:
     """
     Calcular el costo total de todo el historial
     
     Args:
-        history: Lista del historial
+        history: Lista del historial; si se omite se usan los rollups
+            persistidos del historial completo (sin recorrerlo)
         
     Returns:
         float: Costo total en USD
     """
-    total = 0
-    for item in history:
-        cost, _, _ = calculate_item_cost(item)
-        total += cost
-    return round(total, 3)
+    if history is None:
+        return get_cost_rollups()['total_cost']
 
+    # Suma secuencial (como el bucle original) sobre los costos vectorizados
+    return round(sum(calculate_costs(history).tolist()), 3)
 
-def calculate_cost_breakdown(history: List[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+
+def calculate_cost_breakdown(history: Optional[List[Dict[str, Any]]] = None) -> Dict[str, Dict[str, Any]]:
     """
     Calcular desglose de costos por modelo y tipo
     
     Args:
-        history: Lista del historial
+        history: Lista del historial; si se omite se usan los rollups
+            persistidos del historial completo (sin recorrerlo)
         
     Returns:
         Dict: Desglose detallado de costos
     """
+    if history is None:
+        return get_cost_rollups()['by_model']
+
     breakdown = {}
     
     for item in history:
         cost, model_info, _ = calculate_item_cost(item)
         item_type = item.get('tipo', 'imagen')
         
-        key = f"{item_type}_{model_info.split()[0].lower()}"
+        key = _cost_breakdown_key(item_type, model_info)
         
         if key not in breakdown:
             breakdown[key] = {
@@ -513,6 +1517,192 @@ def calculate_cost_breakdown(history: List[Dict[str, Any]]) -> Dict[str, Dict[st
     return breakdown
 
 
+# Códigos de modelo del cálculo vectorizado (índice en _cost_rate_table())
+_COST_MODEL_CODES = {
+    None: 0,
+    'flux_pro': 1,
+    'kandinsky': 2,
+    'ssd_1b': 3,
+    'seedance': 4,
+    'pixverse': 5,
+    'veo3': 6,
+    'video_generico': 7,
+}
+
+_NUMERIC_TYPES = (int, float, bool)
+_MAPPING_TYPES = (dict, MappingProxyType)
+
+# Duración por defecto de los videos cobrados por segundo (sin video_duration)
+_DEFAULT_VIDEO_DURATION = {'seedance': 6, 'veo3': 5, 'video_generico': 4}
+
+
+def _cost_rate_table() -> np.ndarray:
+    """Tarifas de COST_RATES indexadas por código de modelo"""
+    return np.array([
+        0.0,
+        COST_RATES['imagen']['flux_pro']['rate'],
+        COST_RATES['imagen']['kandinsky']['rate'],
+        COST_RATES['imagen']['ssd_1b']['rate'],
+        COST_RATES['video']['seedance']['rate'],
+        COST_RATES['video']['pixverse']['rate'],
+        COST_RATES['video']['veo3']['rate'],
+        COST_RATES['video']['seedance']['rate'],
+    ], dtype=np.float64)
+
+
+def _round_half_like_python(values: np.ndarray, decimals: int) -> np.ndarray:
+    """
+    Redondear como round() de Python
+
+    np.round escala y redondea en binario, por lo que en los empates (p. ej.
+    0.0925 a 3 decimales) puede diferir de round(); esos pocos casos se
+    redondean uno a uno.
+    """
+    result = np.round(values, decimals)
+    scaled = values * 10 ** decimals
+    ties = np.flatnonzero(np.abs(scaled - np.floor(scaled) - 0.5) < 1e-6)
+    for i in ties:
+        result[i] = round(float(values[i]), decimals)
+    return result
+
+
+def calculate_costs(history: List[Mapping[str, Any]]) -> np.ndarray:
+    """
+    Calcular el costo de todos los items del historial de una vez
+
+    Una sola pasada extrae columnas (código de modelo, cantidad base, si hay
+    que estimarla y factor de resolución); segundos, duraciones y units se
+    derivan y se multiplican por la tarifa de cada modelo con operaciones
+    vectorizadas. Los items con el costo ya guardado para la versión actual
+    de tarifas no se recalculan. El resultado es idéntico a aplicar
+    calculate_item_cost() a cada item; los pocos items con valores no
+    numéricos se delegan en ella.
+
+    Args:
+        history: Lista del historial
+
+    Returns:
+        np.ndarray: Costo en USD de cada item (float64, mismo orden)
+    """
+    codes = []
+    # Cantidad base: processing_time o steps (Kandinsky/SSD-1B), duración
+    # (videos por segundo), units o duración a estimar (Pixverse)
+    values = []
+    # Kandinsky/SSD-1B: el valor son steps; Pixverse: hay que estimar units
+    estimate = []
+    resolution_factor = []
+    scalar_items = []
+
+    # Costos ya guardados en el item con la versión actual de tarifas
+    stored_items = []
+    stored_costs = []
+
+    for i, item in enumerate(history):
+        stored = item.get('cost')
+        if type(stored) in _MAPPING_TYPES and stored.get('rates_version') == COST_RATES_VERSION:
+            stored_items.append(i)
+            stored_costs.append(stored['usd'])
+            codes.append(0)
+            values.append(0)
+            estimate.append(False)
+            resolution_factor.append(1.0)
+            continue
+
+        item_type = item.get('tipo', 'imagen')
+        if item_type in ['video_seedance', 'video_anime']:
+            item_type = 'video'
+        parametros = item.get('parametros', {})
+        model = _detect_cost_model(item_type, item.get('archivo_local', ''), item.get('modelo', '').lower())
+        value = 1
+        item_estimate = False
+        factor = 1.0
+
+        if type(parametros) not in _MAPPING_TYPES:
+            scalar_items.append(i)
+        elif model == 'kandinsky' or model == 'ssd_1b':
+            if 'num_inference_steps' in parametros:
+                value = parametros['num_inference_steps']
+                item_estimate = True
+            else:
+                value = item.get('processing_time', 12 if model == 'kandinsky' else 6)
+        elif model == 'pixverse':
+            value = item.get('pixverse_units', 1)
+            if value == 1 and parametros and type(value) in _NUMERIC_TYPES:
+                value = _pixverse_duration_seconds(parametros.get('duration', '5s'))
+                item_estimate = True
+                factor = _pixverse_resolution_factor(parametros.get('resolution', '720p'))
+        elif model is not None and model != 'flux_pro':
+            value = item.get('video_duration', _DEFAULT_VIDEO_DURATION[model])
+            if model != 'veo3' and 'video_length' in parametros:
+                value = parametros['video_length']
+            elif 'duration' in parametros:
+                value = parametros['duration']
+
+        if type(value) not in _NUMERIC_TYPES:
+            scalar_items.append(i)
+            value = 0
+        codes.append(_COST_MODEL_CODES[model])
+        values.append(value)
+        estimate.append(item_estimate)
+        resolution_factor.append(factor)
+
+    codes = np.array(codes, dtype=np.int8)
+    values = np.array(values, dtype=np.float64)
+    estimate = np.array(estimate, dtype=bool)
+    resolution_factor = np.array(resolution_factor, dtype=np.float64)
+
+    # Cantidad facturable: 1 imagen (Flux), segundos, duración o units
+    quantity = values.copy()
+    kandinsky = estimate & (codes == _COST_MODEL_CODES['kandinsky'])
+    quantity[kandinsky] = np.clip(values[kandinsky] * 0.4, 8, 15)
+    ssd = estimate & (codes == _COST_MODEL_CODES['ssd_1b'])
+    quantity[ssd] = np.clip(values[ssd] * 0.2, 4, 10)
+    pixverse = estimate & (codes == _COST_MODEL_CODES['pixverse'])
+    quantity[pixverse] = _round_half_like_python(values[pixverse] * 6 * resolution_factor[pixverse], 1)
+
+    costs = _round_half_like_python(_cost_rate_table()[codes] * quantity, 3)
+    costs[stored_items] = stored_costs
+
+    for i in scalar_items:
+        costs[i] = calculate_item_cost(history[i])[0]
+
+    return costs
+
+
+def stamp_history_costs(force: bool = False) -> int:
+    """
+    Guardar en el log el costo y el modelo de los items que no lo tienen
+
+    Sella los items antiguos y los calculados con otra versión de tarifas
+    (o todos con force=True) y reescribe el log de forma atómica.
+
+    Args:
+        force: Recalcular también los items ya sellados con la versión actual
+
+    Returns:
+        int: Número de items actualizados (-1 si hubo un error)
+    """
+    try:
+        with _history_write_lock():
+            _ensure_history_migrated()
+            if not HISTORY_FILE.exists():
+                return 0
+
+            items = _read_history_log(HISTORY_FILE)
+            updated = 0
+            for item in items:
+                if force or _stored_item_cost(item) is None:
+                    _stamp_item_cost(item)
+                    updated += 1
+
+            if updated:
+                _write_history_log(items, HISTORY_FILE)
+                invalidate_history_cache()
+        return updated
+    except Exception:
+        return -1
+
+
 def convert_usd_to_eur(usd_amount: float, exchange_rate: float = 0.85) -> float:
     """
     Convertir USD a EUR
@@ -564,47 +1754,337 @@ def validate_cost_range(cost: float, item_type: str) -> bool:
 
 
 # ===============================
-# UTILIDADES DE ARCHIVOS
+# ROLLUPS DE COSTO
 # ===============================
 
-def download_and_save_file(url: str, filename: str, file_type: str) -> Optional[str]:
-    """
-    Descargar archivo y guardarlo localmente
-    
-    Args:
-        url: URL del archivo a descargar
-        filename: Nombre del archivo local
-        file_type: Tipo de archivo para mensajes de error
-        
-    Returns:
-        str: Ruta del archivo local o None si falló
-    """
-    try:
-        local_path = HISTORY_DIR / filename
-        
-        # Si ya existe, no descargar de nuevo
-        if local_path.exists():
-            return str(local_path)
-        
-        response = requests.get(url, timeout=60)
-        if response.status_code == 200:
-            with open(local_path, 'wb') as f:
-                f.write(response.content)
-            return str(local_path)
-        else:
-            return None
-    except Exception as e:
-        if 'st' in globals():
-            st.error(f"Error al descargar {file_type}: {str(e)}")
-        return None
+# Totales de costo derivados del log, actualizados en cada save_to_history
+COST_ROLLUPS_FILE = HISTORY_DIR / "cost_rollups.json"
 
+_COST_ROLLUPS_VERSION = 1
 
-def ensure_directory_exists(directory: Path) -> bool:
-    """
-    Asegurar que un directorio existe
-    
-    Args:
-        directory: Ruta del directorio
+
+def _empty_cost_rollups() -> Dict[str, Any]:
+    """Estructura vacía de rollups de costo"""
+    return {
+        'version': _COST_ROLLUPS_VERSION,
+        'rates_version': COST_RATES_VERSION,
+        'log': {'offset': 0, 'inode': '', 'head': ''},
+        'count': 0,
+        'total_cost': 0.0,
+        'by_type': {},
+        'by_model': {},
+        'by_month': {},
+    }
+
+
+def _cost_breakdown_key(item_type: str, model_info: str) -> str:
+    """Clave del desglose por modelo (misma que calculate_cost_breakdown)"""
+    model_word = model_info.split()[0].lower() if model_info.split() else 'desconocido'
+    return f"{item_type}_{model_word}"
+
+
+def _fold_cost_rollups(rollups: Dict[str, Any], item: Mapping[str, Any]) -> None:
+    """Sumar el costo de un item a los rollups"""
+    cost, model_info, _ = calculate_item_cost(item)
+    item_type = item.get('tipo', 'imagen')
+
+    rollups['count'] += 1
+    rollups['total_cost'] += cost
+
+    by_type = rollups['by_type'].setdefault(item_type, {'count': 0, 'total_cost': 0.0})
+    by_type['count'] += 1
+    by_type['total_cost'] += cost
+
+    by_model = rollups['by_model'].setdefault(_cost_breakdown_key(item_type, model_info), {
+        'type': item_type,
+        'model': model_info,
+        'count': 0,
+        'total_cost': 0.0
+    })
+    by_model['count'] += 1
+    by_model['total_cost'] += cost
+
+    fecha = str(item.get('fecha', '') or '')
+    if len(fecha) >= 7:
+        by_month = rollups['by_month'].setdefault(fecha[:7], {'count': 0, 'total_cost': 0.0})
+        by_month['count'] += 1
+        by_month['total_cost'] += cost
+
+
+def _load_cost_rollups() -> Dict[str, Any]:
+    """Leer los rollups persistidos; vacíos si no existen o son de otra versión (o tarifas)"""
+    try:
+        with open(COST_ROLLUPS_FILE, 'r', encoding='utf-8') as f:
+            rollups = json.load(f)
+        if (isinstance(rollups, dict) and rollups.get('version') == _COST_ROLLUPS_VERSION
+                and rollups.get('rates_version') == COST_RATES_VERSION):
+            return rollups
+    except (OSError, ValueError):
+        pass
+    return _empty_cost_rollups()
+
+
+def _save_cost_rollups(rollups: Dict[str, Any]) -> None:
+    """Persistir los rollups de forma atómica (archivo temporal + rename)"""
+    COST_ROLLUPS_FILE.parent.mkdir(parents=True, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=COST_ROLLUPS_FILE.parent, prefix=".rollups_", suffix=".tmp")
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(rollups, f, ensure_ascii=False, indent=2)
+        os.replace(temp_path, COST_ROLLUPS_FILE)
+    except Exception:
+        if os.path.exists(temp_path):
+            os.unlink(temp_path)
+        raise
+
+
+def _sync_cost_rollups() -> Dict[str, Any]:
+    """
+    Poner los rollups al día con el log y persistirlos si cambiaron
+
+    Solo se costean las líneas añadidas desde la última actualización
+    (normalmente la que acaba de escribir save_to_history). Si el log fue
+    reemplazado los totales se recalculan desde el principio.
+    """
+    with _history_lock:
+        rollups = _load_cost_rollups()
+        reset, items, state = _read_history_log_tail(rollups['log'])
+        if not reset and state['offset'] == rollups['log'].get('offset', 0):
+            return rollups
+
+        if reset:
+            rollups = _empty_cost_rollups()
+        for item in items:
+            _fold_cost_rollups(rollups, item)
+        rollups['log'] = state
+        _save_cost_rollups(rollups)
+        return rollups
+
+
+def get_cost_rollups() -> Dict[str, Any]:
+    """
+    Obtener los totales de costo del historial sin recorrerlo
+
+    Returns:
+        Dict: count, total_cost (USD), by_type, by_model (mismo formato que
+        calculate_cost_breakdown) y by_month ('YYYY-MM'), con costos redondeados
+    """
+    try:
+        rollups = _sync_cost_rollups()
+    except Exception:
+        # Sin acceso de escritura: calcular en memoria sin persistir
+        rollups = _empty_cost_rollups()
+        for item in load_history():
+            _fold_cost_rollups(rollups, item)
+
+    def rounded(groups):
+        return {key: {**group, 'total_cost': round(group['total_cost'], 3)} for key, group in groups.items()}
+
+    return {
+        'count': rollups['count'],
+        'total_cost': round(rollups['total_cost'], 3),
+        'by_type': rounded(rollups['by_type']),
+        'by_model': rounded(rollups['by_model']),
+        'by_month': rounded(rollups['by_month']),
+    }
+
+
+def rebuild_cost_rollups() -> bool:
+    """
+    Recalcular los rollups de costo desde el log completo
+
+    Al cambiar COST_RATES_VERSION se recalculan solos; esto fuerza el
+    recálculo (p. ej. si se editaron las tarifas sin cambiar la versión).
+
+    Returns:
+        bool: True si se reconstruyeron exitosamente
+    """
+    try:
+        with _history_lock:
+            if COST_ROLLUPS_FILE.exists():
+                COST_ROLLUPS_FILE.unlink()
+            _sync_cost_rollups()
+        return True
+    except Exception:
+        return False
+
+
+# ===============================
+# SESIÓN HTTP
+# ===============================
+
+_http_session: Optional[requests.Session] = None
+_http_session_lock = threading.Lock()
+
+
+def get_http_session() -> requests.Session:
+    """
+    Sesión HTTP compartida del proceso
+
+    Reutiliza las conexiones (keep-alive) entre descargas en lugar de abrir
+    una nueva en cada requests.get. El pool admite HTTP_POOL_MAXSIZE
+    conexiones por host, suficiente para las descargas en paralelo de
+    downloads.py; las peticiones GET concurrentes sobre una misma sesión son
+    seguras entre hilos.
+    """
+    global _http_session
+    with _http_session_lock:
+        if _http_session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=HTTP_POOL_CONNECTIONS, pool_maxsize=HTTP_POOL_MAXSIZE)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _http_session = session
+        return _http_session
+
+
+# ===============================
+# UTILIDADES DE ARCHIVOS
+# ===============================
+
+class IncompleteDownloadError(IOError):
+    """La descarga terminó con menos bytes de los anunciados por el servidor"""
+
+
+def _expected_download_size(response, offset: int) -> Optional[int]:
+    """
+    Tamaño final esperado del archivo según las cabeceras de la respuesta
+
+    Con 206 se usa el total de Content-Range; con 200, Content-Length. Si la
+    respuesta viene comprimida (Content-Encoding) los bytes escritos no
+    coinciden con Content-Length y no se comprueba.
+    """
+    if response.headers.get('Content-Encoding', 'identity') != 'identity':
+        return None
+
+    content_range = response.headers.get('Content-Range', '')
+    if response.status_code == 206 and '/' in content_range:
+        total = content_range.rsplit('/', 1)[1]
+        if total.isdigit():
+            return int(total)
+
+    content_length = response.headers.get('Content-Length')
+    if content_length and content_length.isdigit():
+        return offset + int(content_length)
+    return None
+
+
+def _stream_download(url: str, dest: Path, chunk_size: int = DOWNLOAD_CHUNK_SIZE,
+                     retries: int = DOWNLOAD_RETRIES) -> Optional[str]:
+    """
+    Descargar por bloques a un archivo temporal y renombrarlo al terminar
+
+    La memoria usada no depende del tamaño del archivo. Si la conexión se
+    corta, el reintento pide solo lo que falta (cabecera Range) y continúa
+    el archivo parcial; si el servidor no admite Range, vuelve a empezar.
+    El archivo final solo aparece (os.replace) cuando su tamaño coincide con
+    el anunciado. El SHA-256 se calcula mientras se escribe (al reanudar se
+    incluye primero lo ya descargado), sin releer el archivo al final.
+
+    Args:
+        url: URL del archivo
+        dest: Ruta final
+        chunk_size: Bytes por bloque
+        retries: Reintentos tras errores de red o descargas incompletas
+
+    Returns:
+        Optional[str]: SHA-256 del archivo, o None si el servidor respondió con error
+
+    Raises:
+        requests.RequestException, IncompleteDownloadError: Si fallan todos los reintentos
+    """
+    part_path = dest.with_name(f".{dest.name}.part")
+    attempt = 0
+
+    try:
+        while True:
+            offset = part_path.stat().st_size if part_path.exists() else 0
+            headers = {'Range': f'bytes={offset}-'} if offset else {}
+            try:
+                with get_http_session().get(url, stream=True, timeout=DOWNLOAD_TIMEOUT,
+                                            headers=headers) as response:
+                    if response.status_code == 416:
+                        # El parcial no encaja con el archivo remoto: empezar de cero
+                        part_path.unlink()
+                        raise IncompleteDownloadError("Rango no válido para el archivo parcial")
+                    if response.status_code not in (200, 206):
+                        return None
+                    if response.status_code == 200:
+                        # Sin soporte de Range (o primera petición): se reescribe entero
+                        offset = 0
+
+                    expected = _expected_download_size(response, offset)
+                    hasher = hashlib.sha256()
+                    if offset:
+                        _hash_file(part_path, hasher, chunk_size)
+                    with open(part_path, 'ab' if offset else 'wb') as f:
+                        for chunk in response.iter_content(chunk_size=chunk_size):
+                            if chunk:
+                                f.write(chunk)
+                                hasher.update(chunk)
+
+                size = part_path.stat().st_size
+                if expected is not None and size != expected:
+                    if size > expected:
+                        part_path.unlink()
+                    raise IncompleteDownloadError(f"Recibidos {size} de {expected} bytes")
+
+                os.replace(part_path, dest)
+                return hasher.hexdigest()
+            except (requests.ConnectionError, requests.Timeout,
+                    requests.exceptions.ChunkedEncodingError, IncompleteDownloadError):
+                attempt += 1
+                if attempt > retries:
+                    raise
+                time.sleep(DOWNLOAD_RETRY_DELAY * attempt)
+    finally:
+        # Tras un fallo definitivo no se deja el parcial en el historial
+        if part_path.exists():
+            part_path.unlink()
+
+
+@traced("download")
+def download_and_save_file(url: str, filename: str, file_type: str) -> Optional[str]:
+    """
+    Descargar archivo y guardarlo en el almacén de medios
+    
+    La descarga es por bloques (memoria constante), se reanuda con Range si
+    la conexión se corta (ver _stream_download) y el archivo se guarda por
+    su SHA-256 (ver add_to_media_store): dos generaciones con el mismo
+    nombre no se pisan y un contenido repetido se guarda una sola vez.
+    Guardar get_media_hash(ruta) en el item del historial como media_hash.
+    
+    Args:
+        url: URL del archivo a descargar
+        filename: Nombre del archivo local (se usa su extensión)
+        file_type: Tipo de archivo para mensajes de error
+        
+    Returns:
+        str: Ruta del archivo en el almacén o None si falló
+    """
+    try:
+        incoming = _media_dir() / ".incoming" / f"{uuid.uuid4().hex}{Path(filename).suffix.lower()}"
+        incoming.parent.mkdir(parents=True, exist_ok=True)
+        
+        annotate(host=urlsplit(url).netloc, archivo=filename)
+        media_hash = _stream_download(url, incoming)
+        if media_hash:
+            annotate(bytes=incoming.stat().st_size)
+            return str(add_to_media_store(incoming, media_hash))
+        else:
+            return None
+    except Exception as e:
+        if 'st' in globals():
+            st.error(f"Error al descargar {file_type}: {str(e)}")
+        return None
+
+
+def ensure_directory_exists(directory: Path) -> bool:
+    """
+    Asegurar que un directorio existe
+    
+    Args:
+        directory: Ruta del directorio
         
     Returns:
         bool: True si el directorio existe o se creó exitosamente
@@ -665,101 +2145,549 @@ def get_file_info(file_path: Path) -> Dict[str, Any]:
         return {'exists': False}
 
 
+# ===============================
+# ALMACÉN DE MEDIOS
+# ===============================
+
+def _media_dir() -> Path:
+    """Directorio del almacén de medios (sigue a HISTORY_DIR)"""
+    return HISTORY_DIR / MEDIA_DIR_NAME
+
+
+def _hash_file(file_path: Path, hasher=None, chunk_size: int = DOWNLOAD_CHUNK_SIZE):
+    """
+    Añadir el contenido de un archivo a un hash, por bloques
+
+    Returns:
+        El hasher (sha256 nuevo si no se pasa uno)
+    """
+    hasher = hasher or hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(chunk_size), b''):
+            hasher.update(block)
+    return hasher
+
+
+def media_path(media_hash: str, suffix: str = "") -> Path:
+    """
+    Ruta de un archivo del almacén: media/<2 hex>/<2 hex>/<sha256><ext>
+
+    Los dos niveles de subdirectorios mantienen cada directorio pequeño
+    aunque el historial tenga decenas de miles de archivos.
+    """
+    return _media_dir() / media_hash[:2] / media_hash[2:4] / f"{media_hash}{suffix.lower()}"
+
+
+def add_to_media_store(file_path: Path, media_hash: Optional[str] = None) -> Path:
+    """
+    Mover un archivo al almacén de medios
+
+    Si ya hay un archivo con el mismo contenido el original se descarta
+    (deduplicación).
+
+    Args:
+        file_path: Archivo a mover (se conserva su extensión)
+        media_hash: SHA-256 ya calculado (si no, se calcula)
+
+    Returns:
+        Path: Ruta del archivo en el almacén
+    """
+    file_path = Path(file_path)
+    media_hash = media_hash or _hash_file(file_path).hexdigest()
+    dest = media_path(media_hash, file_path.suffix)
+    if dest.exists():
+        file_path.unlink()
+    else:
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        os.replace(file_path, dest)
+    return dest
+
+
+def get_media_hash(local_path: Optional[str]) -> Optional[str]:
+    """SHA-256 de una ruta devuelta por download_and_save_file (None si no hay ruta)"""
+    return Path(local_path).stem if local_path else None
+
+
+def resolve_media_path(item: Mapping[str, Any]) -> Optional[Path]:
+    """
+    Ruta local del archivo de un item del historial
+
+    Los items con media_hash apuntan al almacén; los anteriores al almacén,
+    a HISTORY_DIR/archivo_local.
+
+    Returns:
+        Optional[Path]: Ruta (puede no existir) o None si el item no tiene archivo local
+    """
+    archivo_local = item.get('archivo_local')
+    if not archivo_local:
+        return None
+    media_hash = item.get('media_hash')
+    if media_hash:
+        return media_path(media_hash, Path(archivo_local).suffix)
+    return HISTORY_DIR / archivo_local
+
+
+def _item_media_hashes(item: Mapping[str, Any]) -> List[str]:
+    """Hashes de medios que referencia un item (principal y archivos_extra)"""
+    hashes = [item['media_hash']] if item.get('media_hash') else []
+    for extra in item.get('archivos_extra') or []:
+        if isinstance(extra, Mapping) and extra.get('media_hash'):
+            hashes.append(extra['media_hash'])
+    return hashes
+
+
+def get_media_refcounts(history: Optional[List[Mapping[str, Any]]] = None) -> Dict[str, int]:
+    """
+    Número de items del historial que referencian cada hash del almacén
+
+    Args:
+        history: Historial (por defecto, load_history())
+    """
+    refcounts: Dict[str, int] = {}
+    for item in load_history() if history is None else history:
+        for media_hash in _item_media_hashes(item):
+            refcounts[media_hash] = refcounts.get(media_hash, 0) + 1
+    return refcounts
+
+
+def gc_media_store(dry_run: bool = False) -> Tuple[int, int]:
+    """
+    Borrar del almacén los archivos sin referencias en el historial
+
+    Se respetan los archivos modificados hace menos de MEDIA_GC_GRACE_SECONDS
+    (descargados pero aún no guardados en el historial), incluidos los
+    parciales de .incoming.
+
+    Args:
+        dry_run: Solo contar, sin borrar
+
+    Returns:
+        Tuple[int, int]: (archivos, bytes) liberados
+    """
+    media_dir = _media_dir()
+    if not media_dir.exists():
+        return 0, 0
+
+    refcounts = get_media_refcounts()
+    cutoff = time.time() - MEDIA_GC_GRACE_SECONDS
+    removed = freed = 0
+    for file_path in media_dir.rglob('*'):
+        if not file_path.is_file():
+            continue
+        stat = file_path.stat()
+        incoming = file_path.parent.name == ".incoming"
+        if stat.st_mtime > cutoff or (not incoming and refcounts.get(file_path.name.split('.')[0])):
+            continue
+        if not dry_run:
+            file_path.unlink()
+        removed += 1
+        freed += stat.st_size
+    return removed, freed
+
+
+def migrate_media_to_store() -> int:
+    """
+    Mover al almacén los archivos de items antiguos (HISTORY_DIR/archivo_local)
+
+    Añade media_hash a cada item cuyo archivo existe y reescribe el log de
+    forma atómica. Varios items con el mismo archivo comparten el hash. Los
+    archivos se copian y los originales solo se borran después de guardar
+    el log, así un fallo a mitad no deja items sin archivo.
+
+    Returns:
+        int: Número de items actualizados (-1 si hubo un error)
+    """
+    try:
+        with _history_write_lock():
+            _ensure_history_migrated()
+            if not HISTORY_FILE.exists():
+                return 0
+
+            items = _read_history_log(HISTORY_FILE)
+            copied: Dict[str, str] = {}
+            updated = 0
+            for item in items:
+                archivo_local = item.get('archivo_local')
+                if not archivo_local or item.get('media_hash'):
+                    continue
+                if archivo_local not in copied:
+                    legacy_path = HISTORY_DIR / archivo_local
+                    if not legacy_path.is_file():
+                        continue
+                    media_hash = _hash_file(legacy_path).hexdigest()
+                    dest = media_path(media_hash, legacy_path.suffix)
+                    if not dest.exists():
+                        dest.parent.mkdir(parents=True, exist_ok=True)
+                        temp_path = dest.with_name(f".{dest.name}.tmp")
+                        shutil.copy2(legacy_path, temp_path)
+                        os.replace(temp_path, dest)
+                    copied[archivo_local] = media_hash
+                item['media_hash'] = copied[archivo_local]
+                updated += 1
+
+            if updated:
+                _write_history_log(items, HISTORY_FILE)
+                invalidate_history_cache()
+                for archivo_local in copied:
+                    (HISTORY_DIR / archivo_local).unlink(missing_ok=True)
+        return updated
+    except Exception:
+        return -1
+
+
 # ===============================
 # DASHBOARD DE ESTADÍSTICAS Y COSTOS
 # ===============================
 
-def get_comprehensive_stats():
+# Snapshot de analíticas cacheado por versión del historial y de las estadísticas
+_analytics_cache: Dict[str, Any] = {'key': None, 'snapshot': None}
+
+
+def _normalize_stats_type(item_type: str) -> str:
+    """Agrupar el tipo de un item en imagen/video/texto para las estadísticas"""
+    if item_type in ['imagen']:
+        return 'imagen'
+    elif item_type in ['video', 'video_seedance']:
+        return 'video'
+    return 'texto'  # Para futuros modelos
+
+
+def _load_generation_stats(strict: bool = False) -> Dict[str, Any]:
     """
-    Obtener estadísticas completas del sistema
-    
+    Cargar generation_stats.json (vacío si no existe o no es legible)
+
+    Con strict (al escribir) un archivo que existe pero no se puede leer o
+    no es un objeto JSON lanza la excepción en lugar de devolver {}: si no,
+    la escritura siguiente lo reemplazaría y se perdería todo el historial.
+    """
+    try:
+        with open(GENERATION_STATS_FILE, "r", encoding="utf-8") as f:
+            stats = json.load(f)
+    except FileNotFoundError:
+        return {}
+    except Exception:
+        if strict:
+            raise
+        return {}
+    if not isinstance(stats, dict):
+        if strict:
+            raise ValueError(f"{GENERATION_STATS_FILE} no contiene un objeto JSON")
+        return {}
+    return stats
+
+
+def get_generation_stats() -> Dict[str, Any]:
+    """
+    Estadísticas de generación por modelo (contenido de generation_stats.json)
+
+    El archivo se reemplaza de forma atómica, así que nunca se lee a medias.
+    No modificar el resultado para guardarlo: usar update_generation_stats.
+    """
+    return _load_generation_stats()
+
+
+def _stats_lock_file() -> Path:
+    """Archivo de bloqueo entre procesos de generation_stats.json"""
+    return GENERATION_STATS_FILE.with_name(GENERATION_STATS_FILE.name + ".lock")
+
+
+def _save_generation_stats(stats: Dict[str, Any]) -> None:
+    """Persistir las estadísticas de forma atómica (archivo temporal + rename)"""
+    stats_dir = GENERATION_STATS_FILE.parent
+    fd, temp_path = tempfile.mkstemp(dir=stats_dir, prefix=".generation_stats_", suffix=".tmp")
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(stats, f, indent=2, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, GENERATION_STATS_FILE)
+    except Exception:
+        if os.path.exists(temp_path):
+            os.unlink(temp_path)
+        raise
+
+
+def _apply_stats_update(stats: Dict[str, Any], model: str, time_taken: float, success: bool,
+                        phases: Dict[str, float], moment: datetime, downloads: int = 0,
+                        download_bytes: int = 0) -> None:
+    """Sumar una generación a las estadísticas cargadas"""
+    # Inicializar modelo si no existe
+    if model not in stats:
+        stats[model] = {
+            "total": 0,
+            "exitosas": 0,
+            "tiempo_promedio": 0
+        }
+
+    # Entradas anteriores a los histogramas: conservar su media como muestras previas
+    entry = stats[model]
+    if entry.get("tiempo_promedio") and "tiempo_previo" not in entry and not latency.total_histogram(entry).count:
+        entry["tiempo_previo"] = {"n": max(entry.get("exitosas", 0), 1), "media": entry["tiempo_promedio"]}
+
+    # Actualizar estadísticas
+    stats[model]["total"] += 1
+    if success:
+        stats[model]["exitosas"] += 1
+    if downloads or download_bytes:
+        stats[model]["descargas"] = stats[model].get("descargas", 0) + downloads
+        stats[model]["bytes_descargados"] = stats[model].get("bytes_descargados", 0) + download_bytes
+
+    latency.record_generation(stats[model], {**phases, "total": time_taken}, success, now=moment)
+    histogram = latency.total_histogram(entry)
+    previous = entry.get("tiempo_previo") or {}
+    count = histogram.count + previous.get("n", 0)
+    if count:
+        entry["tiempo_promedio"] = (histogram.total + previous.get("n", 0) * previous.get("media", 0)) / count
+
+
+def _flush_generation_stats() -> int:
+    """
+    Escribir todas las actualizaciones pendientes en una sola lectura-escritura
+
+    Un único hilo escribe a la vez; los que esperaban encuentran sus
+    actualizaciones ya escritas por él y no vuelven a escribir. La
+    lectura-modificación-escritura se hace con el bloqueo entre procesos,
+    así que no se pierden incrementos con varios workers de Streamlit.
+
     Returns:
-        Dict: Estadísticas completas organizadas
+        int: Actualizaciones escritas
     """
-    history = load_history()
-    generation_stats = {}
+    with _stats_lock:
+        with _stats_pending_lock:
+            pending = list(_stats_pending)
+            _stats_pending.clear()
+        if not pending:
+            return 0
+
+        try:
+            with _interprocess_lock(_stats_lock_file()):
+                stats = _load_generation_stats(strict=True)
+                for update in pending:
+                    _apply_stats_update(stats, *update)
+                _save_generation_stats(stats)
+        except Exception:
+            # Devolver las actualizaciones a la cola para el siguiente intento,
+            # sin que crezca sin límite si el archivo sigue sin poder leerse
+            with _stats_pending_lock:
+                _stats_pending[:0] = pending
+                del _stats_pending[:-STATS_PENDING_MAX]
+            raise
+        return len(pending)
+
+
+@traced("stats")
+def update_generation_stats(model: str, time_taken: float, success: bool,
+                            phases: Optional[Mapping[str, float]] = None,
+                            downloads: int = 0, download_bytes: int = 0) -> None:
+    """
+    Actualiza las estadísticas de generación
+
+    Además de los contadores guarda histogramas de latencia por fase y por
+    franja horaria (ver latency.py); tiempo_promedio es la media exacta de
+    las generaciones correctas (incluida la media guardada antes de existir
+    los histogramas, en 'tiempo_previo'). Al volver, la actualización ya está escrita
+    (por este hilo o agrupada con las de otros, ver _flush_generation_stats).
+
+    Args:
+        model: Tipo de contenido (p. ej. "🖼️ Imagen (Flux Pro)")
+        time_taken: Duración de la generación en segundos
+        success: Si la generación terminó correctamente
+        phases: Segundos por fase medidos ("cola", "ejecucion", "descarga")
+        downloads: Archivos descargados de la generación
+        download_bytes: Bytes descargados de la generación
+    """
+    with _stats_pending_lock:
+        _stats_pending.append((model, time_taken, success, dict(phases or {}), datetime.now(),
+                               downloads, download_bytes))
+    annotate(written=_flush_generation_stats())
+
+
+def get_latency_stats(window: str = "24h") -> Dict[str, Dict[str, Any]]:
+    """
+    Percentiles de latencia y rendimiento por modelo
+
+    Args:
+        window: Ventana de tiempo (clave de latency.WINDOWS)
+
+    Returns:
+        Dict: modelo -> resumen de latency.summarize (solo modelos con
+        generaciones en la ventana)
+    """
+    summaries = {}
+    for model, entry in _load_generation_stats().items():
+        if not isinstance(entry, dict):
+            continue
+        summary = latency.summarize(entry, window)
+        if summary['n']:
+            summaries[model] = summary
+    return summaries
+
+
+def _period_keys(fecha: str) -> Optional[Dict[str, str]]:
+    """Claves de día, semana y mes de una fecha ISO (None si no se puede parsear)"""
+    try:
+        fecha_obj = datetime.fromisoformat(fecha.replace('Z', '+00:00'))
+    except Exception:
+        return None
+    # La semana se identifica por su lunes
+    monday = fecha_obj - timedelta(days=fecha_obj.weekday())
+    return {
+        'day': fecha_obj.strftime('%Y-%m-%d'),
+        'week': monday.strftime('%Y-W%W'),
+        'month': fecha_obj.strftime('%Y-%m'),
+    }
+
+
+def _build_model_ranking(stats_by_model: Dict[str, Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Calcular el ranking de eficiencia a partir de las estadísticas por modelo"""
+    models = []
+    
+    for model_name, model_data in stats_by_model.items():
+        efficiency_score = 0
+        
+        # Factores para el score de eficiencia
+        success_rate = model_data.get('success_rate', 0)
+        avg_cost = model_data.get('avg_cost', 0)
+        total_uses = model_data.get('count', 0)
+        
+        # Calcular score: mayor éxito, menor costo, más uso = mejor score
+        if avg_cost > 0:
+            cost_factor = 1 / avg_cost  # Inverso del costo
+            usage_factor = min(total_uses / 10, 1)  # Normalizar uso (máximo factor 1)
+            success_factor = success_rate / 100
+            
+            efficiency_score = (success_factor * 0.4 + cost_factor * 0.4 + usage_factor * 0.2) * 100
+        
+        models.append({
+            'name': model_name,
+            'type': model_data.get('type', 'unknown'),
+            'efficiency_score': efficiency_score,
+            'success_rate': success_rate,
+            'avg_cost': avg_cost,
+            'total_uses': total_uses,
+            'total_cost': model_data.get('total_cost', 0)
+        })
+    
+    # Ordenar por score de eficiencia
+    return sorted(models, key=lambda x: x['efficiency_score'], reverse=True)
+
+
+def _build_spending_alerts(stats: Dict[str, Any], monthly_costs: Dict[str, Any],
+                           ranking: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Generar las alertas de gasto a partir de los agregados ya calculados"""
+    alerts = []
+    
+    # Alerta por gasto total alto
+    if stats['total_cost_usd'] > 50:
+        alerts.append({
+            'type': 'warning',
+            'title': 'Gasto Total Elevado',
+            'message': f"El gasto total acumulado es ${stats['total_cost_usd']:.2f} USD",
+            'icon': '💰'
+        })
     
-    # Cargar estadísticas de generación si existen
-    if os.path.exists("generation_stats.json"):
-        with open("generation_stats.json", "r", encoding="utf-8") as f:
-            generation_stats = json.load(f)
+    # Alerta por gasto mensual alto
+    if monthly_costs:
+        current_month_cost = list(monthly_costs.values())[0]['total_cost']
+        if current_month_cost > 20:
+            alerts.append({
+                'type': 'warning',
+                'title': 'Gasto Mensual Alto',
+                'message': f"El gasto del mes actual es ${current_month_cost:.2f} USD",
+                'icon': '📅'
+            })
+    
+    # Alerta por modelos ineficientes
+    for model in ranking[-3:]:  # Los 3 menos eficientes
+        if model['total_uses'] > 5 and model['success_rate'] < 70:
+            alerts.append({
+                'type': 'info',
+                'title': 'Modelo Poco Eficiente',
+                'message': f"{model['name']}: {model['success_rate']:.1f}% éxito, ${model['avg_cost']:.3f} promedio",
+                'icon': '⚠️'
+            })
     
+    return alerts
+
+
+def _build_analytics(history: List[Mapping[str, Any]], generation_stats: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Calcular todos los agregados del Dashboard en un único recorrido del historial
+
+    Args:
+        history: Elementos del historial
+        generation_stats: Contenido de generation_stats.json
+
+    Returns:
+        Dict: Snapshot con 'stats', 'by_period', 'ranking' y 'alerts'
+    """
     # Estadísticas por tipo de contenido
     stats_by_type = {
         'imagen': {'count': 0, 'total_cost': 0, 'models': {}},
         'video': {'count': 0, 'total_cost': 0, 'models': {}},
         'texto': {'count': 0, 'total_cost': 0, 'models': {}},  # Para futuros modelos de texto
     }
-    
-    # Estadísticas por modelo
     stats_by_model = {}
-    
-    # Estadísticas temporales (por mes)
     stats_by_month = {}
-    
-    # Procesar historial
+    by_period = {'day': {}, 'week': {}, 'month': {}}
     total_cost = 0
+
     for item in history:
-        item_cost, model_info, _ = calculate_item_cost(item)
-        item_type = item.get('tipo', 'unknown')
+        item_cost, _, _ = calculate_item_cost(item)
+        normalized_type = _normalize_stats_type(item.get('tipo', 'unknown'))
         modelo = item.get('modelo', 'unknown')
         fecha = item.get('fecha', '')
         
-        # Normalizar tipo
-        if item_type in ['imagen']:
-            normalized_type = 'imagen'
-        elif item_type in ['video', 'video_seedance']:
-            normalized_type = 'video'
-        else:
-            normalized_type = 'texto'  # Para futuros modelos
-        
-        # Estadísticas por tipo
-        if normalized_type in stats_by_type:
-            stats_by_type[normalized_type]['count'] += 1
-            stats_by_type[normalized_type]['total_cost'] += item_cost
-            
-            # Estadísticas por modelo dentro del tipo
-            if modelo not in stats_by_type[normalized_type]['models']:
-                stats_by_type[normalized_type]['models'][modelo] = {
-                    'count': 0, 'cost': 0, 'avg_cost': 0
-                }
-            stats_by_type[normalized_type]['models'][modelo]['count'] += 1
-            stats_by_type[normalized_type]['models'][modelo]['cost'] += item_cost
+        # Estadísticas por tipo y por modelo dentro del tipo
+        type_data = stats_by_type[normalized_type]
+        type_data['count'] += 1
+        type_data['total_cost'] += item_cost
+        type_model = type_data['models'].setdefault(modelo, {'count': 0, 'cost': 0, 'avg_cost': 0})
+        type_model['count'] += 1
+        type_model['cost'] += item_cost
         
         # Estadísticas por modelo
-        if modelo not in stats_by_model:
-            stats_by_model[modelo] = {
-                'count': 0, 'total_cost': 0, 'type': normalized_type,
-                'avg_cost': 0, 'success_rate': 0
-            }
-        stats_by_model[modelo]['count'] += 1
-        stats_by_model[modelo]['total_cost'] += item_cost
+        model_data = stats_by_model.setdefault(modelo, {
+            'count': 0, 'total_cost': 0, 'type': normalized_type,
+            'avg_cost': 0, 'success_rate': 0
+        })
+        model_data['count'] += 1
+        model_data['total_cost'] += item_cost
         
-        # Estadísticas por mes
         if fecha:
-            try:
-                month_key = fecha[:7]  # YYYY-MM
-                if month_key not in stats_by_month:
-                    stats_by_month[month_key] = {
-                        'count': 0, 'cost': 0, 'types': {'imagen': 0, 'video': 0, 'texto': 0}
-                    }
-                stats_by_month[month_key]['count'] += 1
-                stats_by_month[month_key]['cost'] += item_cost
-                stats_by_month[month_key]['types'][normalized_type] += 1
-            except:
-                pass
+            # Estadísticas por mes (prefijo YYYY-MM del texto)
+            month_data = stats_by_month.setdefault(fecha[:7], {
+                'count': 0, 'cost': 0, 'types': {'imagen': 0, 'video': 0, 'texto': 0}
+            })
+            month_data['count'] += 1
+            month_data['cost'] += item_cost
+            month_data['types'][normalized_type] += 1
+            
+            # Desglose por día, semana y mes (solo fechas ISO válidas)
+            keys = _period_keys(fecha)
+            if keys:
+                for period, key in keys.items():
+                    period_data = by_period[period].setdefault(key, {
+                        'total_cost': 0,
+                        'count': 0,
+                        'types': {'imagen': {'count': 0, 'cost': 0},
+                                  'video': {'count': 0, 'cost': 0},
+                                  'texto': {'count': 0, 'cost': 0}}
+                    })
+                    period_data['total_cost'] += item_cost
+                    period_data['count'] += 1
+                    period_data['types'][normalized_type]['count'] += 1
+                    period_data['types'][normalized_type]['cost'] += item_cost
         
         total_cost += item_cost
     
     # Calcular promedios y completar datos
-    for tipo in stats_by_type:
-        for modelo in stats_by_type[tipo]['models']:
-            model_data = stats_by_type[tipo]['models'][modelo]
+    for type_data in stats_by_type.values():
+        for model_data in type_data['models'].values():
             if model_data['count'] > 0:
                 model_data['avg_cost'] = model_data['cost'] / model_data['count']
     
-    for modelo in stats_by_model:
-        model_data = stats_by_model[modelo]
+    for modelo, model_data in stats_by_model.items():
         if model_data['count'] > 0:
             model_data['avg_cost'] = model_data['total_cost'] / model_data['count']
         
@@ -769,7 +2697,7 @@ def get_comprehensive_stats():
             if gen_data.get('total', 0) > 0:
                 model_data['success_rate'] = (gen_data.get('exitosas', 0) / gen_data['total']) * 100
     
-    return {
+    stats = {
         'total_generations': len(history),
         'total_cost_usd': total_cost,
         'total_cost_eur': total_cost * 0.92,
@@ -778,6 +2706,58 @@ def get_comprehensive_stats():
         'stats_by_month': dict(sorted(stats_by_month.items(), reverse=True)),
         'generation_performance': generation_stats
     }
+    # Ordenar por fecha (más reciente primero)
+    by_period = {period: dict(sorted(data.items(), reverse=True)) for period, data in by_period.items()}
+    ranking = _build_model_ranking(stats_by_model)
+    
+    return {
+        'stats': stats,
+        'by_period': by_period,
+        'ranking': ranking,
+        'alerts': _build_spending_alerts(stats, by_period['month'], ranking),
+    }
+
+
+def get_analytics_snapshot() -> Dict[str, Any]:
+    """
+    Obtener todos los agregados del Dashboard calculados en una sola pasada
+
+    El resultado se memoiza mientras no cambien el historial ni
+    generation_stats.json, de modo que el Dashboard completo se renderiza
+    desde un único snapshot. No modificar el resultado.
+
+    Returns:
+        Dict: 'stats' (como get_comprehensive_stats), 'by_period' con las
+        claves 'day'/'week'/'month', 'ranking' y 'alerts'
+    """
+    history = load_history()
+    try:
+        stats_stat = GENERATION_STATS_FILE.stat()
+        stats_key = (stats_stat.st_ino, stats_stat.st_size, stats_stat.st_mtime_ns)
+    except OSError:
+        stats_key = None
+    key = (_history_file_key(), stats_key)
+
+    with _history_lock:
+        if _analytics_cache['key'] == key and _analytics_cache['snapshot'] is not None:
+            return _analytics_cache['snapshot']
+
+    snapshot = _build_analytics(history, _load_generation_stats())
+
+    with _history_lock:
+        _analytics_cache['key'] = key
+        _analytics_cache['snapshot'] = snapshot
+    return snapshot
+
+
+def get_comprehensive_stats():
+    """
+    Obtener estadísticas completas del sistema
+    
+    Returns:
+        Dict: Estadísticas completas organizadas
+    """
+    return copy.deepcopy(get_analytics_snapshot()['stats'])
 
 
 def get_cost_breakdown_by_period(period='month'):
@@ -790,96 +2770,18 @@ def get_cost_breakdown_by_period(period='month'):
     Returns:
         Dict: Costos organizados por período
     """
-    history = load_history()
-    breakdown = {}
-    
-    for item in history:
-        fecha = item.get('fecha', '')
-        if not fecha:
-            continue
-            
-        try:
-            fecha_obj = datetime.fromisoformat(fecha.replace('Z', '+00:00'))
-            
-            if period == 'day':
-                key = fecha_obj.strftime('%Y-%m-%d')
-            elif period == 'week':
-                # Obtener el lunes de esa semana
-                monday = fecha_obj - timedelta(days=fecha_obj.weekday())
-                key = monday.strftime('%Y-W%W')
-            else:  # month
-                key = fecha_obj.strftime('%Y-%m')
-            
-            if key not in breakdown:
-                breakdown[key] = {
-                    'total_cost': 0,
-                    'count': 0,
-                    'types': {'imagen': {'count': 0, 'cost': 0}, 
-                             'video': {'count': 0, 'cost': 0}, 
-                             'texto': {'count': 0, 'cost': 0}}
-                }
-            
-            item_cost, _, _ = calculate_item_cost(item)
-            item_type = item.get('tipo', 'unknown')
-            
-            # Normalizar tipo
-            if item_type in ['imagen']:
-                normalized_type = 'imagen'
-            elif item_type in ['video', 'video_seedance']:
-                normalized_type = 'video'
-            else:
-                normalized_type = 'texto'
-            
-            breakdown[key]['total_cost'] += item_cost
-            breakdown[key]['count'] += 1
-            breakdown[key]['types'][normalized_type]['count'] += 1
-            breakdown[key]['types'][normalized_type]['cost'] += item_cost
-            
-        except Exception:
-            continue
-    
-    # Ordenar por fecha (más reciente primero)
-    return dict(sorted(breakdown.items(), reverse=True))
+    by_period = get_analytics_snapshot()['by_period']
+    return copy.deepcopy(by_period.get(period, by_period['month']))
 
 
 def get_model_efficiency_ranking():
-    """
-    Obtener ranking de eficiencia de modelos
-    
-    Returns:
-        List: Modelos ordenados por eficiencia
-    """
-    stats = get_comprehensive_stats()
-    models = []
-    
-    for model_name, model_data in stats['stats_by_model'].items():
-        efficiency_score = 0
-        
-        # Factores para el score de eficiencia
-        success_rate = model_data.get('success_rate', 0)
-        avg_cost = model_data.get('avg_cost', 0)
-        total_uses = model_data.get('count', 0)
-        
-        # Calcular score: mayor éxito, menor costo, más uso = mejor score
-        if avg_cost > 0:
-            cost_factor = 1 / avg_cost  # Inverso del costo
-            usage_factor = min(total_uses / 10, 1)  # Normalizar uso (máximo factor 1)
-            success_factor = success_rate / 100
-            
-            efficiency_score = (success_factor * 0.4 + cost_factor * 0.4 + usage_factor * 0.2) * 100
-        
-        models.append({
-            'name': model_name,
-            'type': model_data.get('type', 'unknown'),
-            'efficiency_score': efficiency_score,
-            'success_rate': success_rate,
-            'avg_cost': avg_cost,
-            'total_uses': total_uses,
-            'total_cost': model_data.get('total_cost', 0)
-        })
+    """
+    Obtener ranking de eficiencia de modelos
     
-    # Ordenar por score de eficiencia
-    return sorted(models, key=lambda x: x['efficiency_score'], reverse=True)
+    Returns:
+        List: Modelos ordenados por eficiencia
+    """
+    return copy.deepcopy(get_analytics_snapshot()['ranking'])
 
 
 def get_spending_alerts():
@@ -889,42 +2791,7 @@ def get_spending_alerts():
     Returns:
         List: Lista de alertas
     """
-    stats = get_comprehensive_stats()
-    alerts = []
-    
-    # Alerta por gasto total alto
-    if stats['total_cost_usd'] > 50:
-        alerts.append({
-            'type': 'warning',
-            'title': 'Gasto Total Elevado',
-            'message': f"El gasto total acumulado es ${stats['total_cost_usd']:.2f} USD",
-            'icon': '💰'
-        })
-    
-    # Alerta por gasto mensual alto
-    monthly_costs = get_cost_breakdown_by_period('month')
-    if monthly_costs:
-        current_month_cost = list(monthly_costs.values())[0]['total_cost']
-        if current_month_cost > 20:
-            alerts.append({
-                'type': 'warning',
-                'title': 'Gasto Mensual Alto',
-                'message': f"El gasto del mes actual es ${current_month_cost:.2f} USD",
-                'icon': '📅'
-            })
-    
-    # Alerta por modelos ineficientes
-    ranking = get_model_efficiency_ranking()
-    for model in ranking[-3:]:  # Los 3 menos eficientes
-        if model['total_uses'] > 5 and model['success_rate'] < 70:
-            alerts.append({
-                'type': 'info',
-                'title': 'Modelo Poco Eficiente',
-                'message': f"{model['name']}: {model['success_rate']:.1f}% éxito, ${model['avg_cost']:.3f} promedio",
-                'icon': '⚠️'
-            })
-    
-    return alerts
+    return copy.deepcopy(get_analytics_snapshot()['alerts'])
 
 
 # ===============================
@@ -1116,80 +2983,796 @@ def round_cost(cost: float, decimals: int = 3) -> float:
 # FUNCIONES DE BACKUP Y RESTAURACIÓN
 # ===============================
 
-def create_backup() -> Tuple[bool, str, Optional[str]]:
+# Formatos ya comprimidos: se guardan en el ZIP sin recomprimir (ZIP_STORED)
+BACKUP_STORED_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp', '.gif', '.mp4', '.mov', '.avi', '.webm', '.mkv', '.zip')
+
+# Archivos multimedia sueltos en historial/ (anteriores al almacén de medios)
+BACKUP_MEDIA_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp', '.mp4', '.mov', '.avi')
+
+# Hilos para hashear medios al crear backups y para verificarlos
+BACKUP_WORKERS = min(4, os.cpu_count() or 1)
+
+# Backups incrementales seguidos sobre un completo antes de forzar otro completo
+BACKUP_MAX_CHAIN = 10
+
+BACKUP_PREFIX = "ai_models_backup_"
+BACKUP_METADATA_NAME = "backup_metadata.json"
+BACKUP_MANIFEST_NAME = "backup_manifest.json"
+BACKUP_FORMAT_VERSION = "2.0"
+
+# Catálogo de backups en BACKUPS_DIR: permite listarlos sin abrir cada ZIP
+BACKUP_CATALOG_NAME = "backup_catalog.json"
+_BACKUP_CATALOG_VERSION = 1
+_backup_catalog_lock = threading.RLock()
+
+# Copias rápidas de los datos actuales que crea restore_backup (se conservan las últimas)
+SAFETY_SNAPSHOT_PREFIX = "safety_snapshot_"
+SAFETY_SNAPSHOTS_KEEP = 3
+
+
+def _backup_compression(file_path: Path) -> int:
+    """ZIP_STORED para imágenes y videos (ya comprimidos), ZIP_DEFLATED para el resto"""
+    import zipfile
+    return zipfile.ZIP_STORED if file_path.suffix.lower() in BACKUP_STORED_EXTENSIONS else zipfile.ZIP_DEFLATED
+
+
+def _iter_backup_media():
     """
-    Crear backup completo de todos los datos de la aplicación
-    
+    Archivos multimedia a respaldar, en un único recorrido de HISTORY_DIR
+
+    Yields:
+        Tuple[Path, str]: (ruta, nombre dentro del ZIP)
+    """
+    if not HISTORY_DIR.exists():
+        return
+    for file_path in HISTORY_DIR.iterdir():
+        if file_path.is_file() and file_path.suffix.lower() in BACKUP_MEDIA_EXTENSIONS:
+            yield file_path, f"historial/{file_path.name}"
+
+    # Almacén de medios (sin temporales ni descargas en curso)
+    media_dir = _media_dir()
+    if media_dir.exists():
+        for file_path in media_dir.rglob('*'):
+            relative = file_path.relative_to(HISTORY_DIR)
+            if file_path.is_file() and not any(part.startswith('.') for part in relative.parts):
+                yield file_path, f"historial/{relative.as_posix()}"
+
+
+def _store_file_hash(file_path: Path) -> Optional[str]:
+    """SHA-256 de un archivo del almacén de medios (su nombre), None si no es del almacén"""
+    if _media_dir() in file_path.parents and len(file_path.stem) == 64:
+        return file_path.stem
+    return None
+
+
+def _read_backup_json(backup_path: Path, name: str) -> Optional[Dict[str, Any]]:
+    """Leer un JSON interno de un backup (metadatos o manifiesto) sin extraer nada más"""
+    import zipfile
+    try:
+        with zipfile.ZipFile(backup_path, 'r') as zipf:
+            return json.loads(zipf.read(name).decode('utf-8'))
+    except (OSError, KeyError, ValueError, zipfile.BadZipFile):
+        return None
+
+
+def _backup_catalog_file() -> Path:
+    """Ruta del catálogo (sigue a BACKUPS_DIR)"""
+    return BACKUPS_DIR / BACKUP_CATALOG_NAME
+
+
+def _load_backup_catalog() -> Dict[str, Any]:
+    """Leer el catálogo persistido; vacío si no existe, está dañado o es de otra versión"""
+    try:
+        with open(_backup_catalog_file(), 'r', encoding='utf-8') as f:
+            catalog = json.load(f)
+        if isinstance(catalog, dict) and catalog.get('version') == _BACKUP_CATALOG_VERSION:
+            return catalog
+    except (OSError, ValueError):
+        pass
+    return {'version': _BACKUP_CATALOG_VERSION, 'backups': {}}
+
+
+def _save_backup_catalog(catalog: Dict[str, Any]) -> None:
+    """Persistir el catálogo de forma atómica (archivo temporal + rename)"""
+    catalog_file = _backup_catalog_file()
+    catalog_file.parent.mkdir(parents=True, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=catalog_file.parent, prefix=".catalog_", suffix=".tmp")
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(catalog, f, ensure_ascii=False, indent=2)
+        os.replace(temp_path, catalog_file)
+    except Exception:
+        if os.path.exists(temp_path):
+            os.unlink(temp_path)
+        raise
+
+
+def _backup_catalog_entry(backup_path: Path, metadata: Optional[Dict[str, Any]] = None,
+                          manifest_bytes: Optional[bytes] = None) -> Dict[str, Any]:
+    """
+    Entrada del catálogo de un backup
+
+    Sin metadatos/manifiesto se leen del ZIP (backups copiados a mano o
+    creados antes del catálogo).
+    """
+    import zipfile
+    if metadata is None:
+        try:
+            with zipfile.ZipFile(backup_path, 'r') as zipf:
+                names = set(zipf.namelist())
+                if BACKUP_METADATA_NAME in names:
+                    metadata = json.loads(zipf.read(BACKUP_METADATA_NAME).decode('utf-8'))
+                if BACKUP_MANIFEST_NAME in names:
+                    manifest_bytes = zipf.read(BACKUP_MANIFEST_NAME)
+        except (OSError, ValueError, zipfile.BadZipFile):
+            pass
+
+    stat = backup_path.stat()
+    return {
+        'filename': backup_path.name,
+        'size_bytes': stat.st_size,
+        'mtime_ns': stat.st_mtime_ns,
+        'created': datetime.fromtimestamp(stat.st_mtime).strftime("%Y-%m-%d %H:%M:%S"),
+        'metadata': metadata,
+        'manifest_sha256': hashlib.sha256(manifest_bytes).hexdigest() if manifest_bytes is not None else None,
+        'verification': None,
+    }
+
+
+def _sync_backup_catalog() -> Dict[str, Any]:
+    """
+    Poner el catálogo al día con BACKUPS_DIR y persistirlo si cambió
+
+    Solo se listan y se hace stat de los archivos: los ZIP se abren
+    únicamente si no están en el catálogo o cambiaron de tamaño o fecha
+    (p. ej. copiados a mano), y se quitan las entradas de los borrados.
+    """
+    with _backup_catalog_lock:
+        catalog = _load_backup_catalog()
+        entries = catalog['backups']
+        changed = False
+        on_disk = set()
+
+        if BACKUPS_DIR.exists():
+            with os.scandir(BACKUPS_DIR) as scan:
+                for entry in scan:
+                    if not (entry.name.startswith(BACKUP_PREFIX) and entry.name.endswith('.zip') and entry.is_file()):
+                        continue
+                    on_disk.add(entry.name)
+                    stat = entry.stat()
+                    known = entries.get(entry.name)
+                    if known and known.get('size_bytes') == stat.st_size and known.get('mtime_ns') == stat.st_mtime_ns:
+                        continue
+                    entries[entry.name] = _backup_catalog_entry(Path(entry.path))
+                    changed = True
+
+        for name in [name for name in entries if name not in on_disk]:
+            del entries[name]
+            changed = True
+
+        if changed:
+            try:
+                _save_backup_catalog(catalog)
+            except OSError:
+                pass  # Sin poder persistirlo, el catálogo en memoria sigue siendo válido
+        return catalog
+
+
+def rebuild_backup_catalog() -> bool:
+    """
+    Reconstruir el catálogo leyendo todos los backups de BACKUPS_DIR
+
+    Returns:
+        bool: True si se reconstruyó exitosamente
+    """
+    try:
+        with _backup_catalog_lock:
+            _save_backup_catalog({'version': _BACKUP_CATALOG_VERSION, 'backups': {}})
+            _sync_backup_catalog()
+        return True
+    except Exception:
+        return False
+
+
+def _find_backup_parent() -> Optional[Tuple[Path, Dict[str, Any], Dict[str, Any]]]:
+    """
+    Backup sobre el que crear un incremental: el último con manifiesto
+
+    Returns:
+        Optional[Tuple]: (ruta, metadatos, manifiesto), o None si no hay un
+        padre utilizable (sin backups con manifiesto, cadena incompleta o
+        demasiado larga)
+    """
+    latest = None
+    for entry in _sync_backup_catalog()['backups'].values():
+        metadata = entry.get('metadata')
+        if not metadata or not metadata.get('chain'):
+            continue
+        if latest is None or metadata.get('created_at', '') > latest[1].get('created_at', ''):
+            latest = (BACKUPS_DIR / entry['filename'], metadata)
+
+    if latest is None:
+        return None
+    chain = latest[1]['chain']
+    if len(chain) > BACKUP_MAX_CHAIN or not all((BACKUPS_DIR / name).exists() for name in chain):
+        return None
+    manifest = _read_backup_json(latest[0], BACKUP_MANIFEST_NAME)
+    if manifest is None:
+        return None
+    return latest[0], latest[1], manifest
+
+
+def create_backup(incremental: bool = False, parallel_hashing: bool = True) -> Tuple[bool, str, Optional[str]]:
+    """
+    Crear backup de todos los datos de la aplicación
+
+    Un backup completo guarda todos los archivos. Uno incremental guarda las
+    estadísticas, el log del historial y solo los medios nuevos o
+    modificados desde el último backup; su manifiesto (tamaño, fecha y hash
+    de cada archivo) indica en qué backup de la cadena está cada uno. Si no
+    hay un padre válido o la cadena llega a BACKUP_MAX_CHAIN incrementales,
+    se crea un backup completo.
+
+    zipfile solo admite un escritor por archivo, así que la compresión es
+    secuencial; con parallel_hashing los SHA-256 de los medios nuevos se
+    calculan en BACKUP_WORKERS hilos mientras el hilo principal comprime
+    los JSON y copia los medios.
+
+    Args:
+        incremental: Crear un backup incremental sobre el último
+        parallel_hashing: Calcular los hashes de los medios en hilos
+
     Returns:
         Tuple[bool, str, Optional[str]]: (éxito, mensaje, ruta_del_backup)
     """
     import zipfile
-    import shutil
-    from datetime import datetime
-    
+    from concurrent.futures import ThreadPoolExecutor
+
+    temp_path = None
+    executor = None
     try:
+        started = time.monotonic()
+        parent = _find_backup_parent() if incremental else None
+        previous_files = parent[2].get('files', {}) if parent else {}
+
         # Crear nombre único para el backup
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        backup_filename = f"ai_models_backup_{timestamp}.zip"
+        now = datetime.now()
+        timestamp = now.strftime("%Y%m%d_%H%M%S")
+        suffix = "_inc" if parent else ""
+        backup_filename = f"{BACKUP_PREFIX}{timestamp}{suffix}.zip"
+        counter = 2
+        while (BACKUPS_DIR / backup_filename).exists():
+            backup_filename = f"{BACKUP_PREFIX}{timestamp}_{counter}{suffix}.zip"
+            counter += 1
         backup_path = BACKUPS_DIR / backup_filename
-        
-        # Crear archivo ZIP
-        with zipfile.ZipFile(backup_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
-            
-            # 1. Respaldar generation_stats.json
-            stats_file = Path("generation_stats.json")
-            if stats_file.exists():
-                zipf.write(stats_file, "generation_stats.json")
-            
-            # 2. Respaldar history.json
-            if HISTORY_FILE.exists():
-                zipf.write(HISTORY_FILE, "historial/history.json")
-            
-            # 3. Respaldar todos los archivos multimedia del historial
-            if HISTORY_DIR.exists():
-                for file_path in HISTORY_DIR.iterdir():
-                    if file_path.is_file() and file_path.name != "history.json":
-                        # Incluir solo archivos multimedia comunes
-                        if file_path.suffix.lower() in ['.jpg', '.jpeg', '.png', '.webp', '.mp4', '.mov', '.avi']:
-                            zipf.write(file_path, f"historial/{file_path.name}")
-            
-            # 4. Crear archivo de metadatos del backup
+        temp_path = BACKUPS_DIR / f".{backup_filename}.part"
+
+        # Medios: los que no cambiaron desde el padre solo se anotan en el manifiesto
+        manifest_files = {}
+        new_media = []
+        for file_path, arcname in _iter_backup_media():
+            stat = file_path.stat()
+            known_hash = _store_file_hash(file_path)
+            previous = previous_files.get(arcname)
+            if previous and previous.get('size') == stat.st_size and (
+                    previous.get('sha256') == known_hash if known_hash
+                    else previous.get('mtime_ns') == stat.st_mtime_ns):
+                manifest_files[arcname] = previous
+            else:
+                new_media.append((file_path, arcname, stat, known_hash))
+
+        # Los hashes que faltan (medios fuera del almacén) se calculan en hilos mientras se escribe
+        if parallel_hashing and BACKUP_WORKERS > 1:
+            executor = ThreadPoolExecutor(max_workers=BACKUP_WORKERS, thread_name_prefix="backup-hash")
+        hashes = {
+            arcname: executor.submit(_hash_file, file_path)
+            for file_path, arcname, _, known_hash in new_media if not known_hash and executor
+        }
+
+        added_bytes = 0
+        with zipfile.ZipFile(temp_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
+
+            # 1. Estadísticas y log del historial (cambian en cada generación: siempre se
+            #    incluyen). Se leen una vez para que el hash del manifiesto sea el de lo escrito
+            text_files = [(GENERATION_STATS_FILE, "generation_stats.json"),
+                          (HISTORY_FILE, f"historial/{HISTORY_FILE.name}")]
+            for file_path, arcname in text_files:
+                if not file_path.exists():
+                    continue
+                data = file_path.read_bytes()
+                zinfo = zipfile.ZipInfo.from_file(file_path, arcname)
+                zinfo.compress_type = zipfile.ZIP_DEFLATED
+                zipf.writestr(zinfo, data)
+                manifest_files[arcname] = {
+                    'size': len(data),
+                    'mtime_ns': file_path.stat().st_mtime_ns,
+                    'sha256': hashlib.sha256(data).hexdigest(),
+                    'archive': backup_filename,
+                }
+                added_bytes += len(data)
+            has_stats = "generation_stats.json" in manifest_files
+            has_history = f"historial/{HISTORY_FILE.name}" in manifest_files
+
+            # 2. Medios nuevos o modificados, sin recomprimir imágenes y videos
+            for file_path, arcname, stat, known_hash in new_media:
+                zipf.write(file_path, arcname, compress_type=_backup_compression(file_path))
+                manifest_files[arcname] = {
+                    'size': stat.st_size,
+                    'mtime_ns': stat.st_mtime_ns,
+                    'sha256': known_hash or (hashes[arcname].result() if arcname in hashes
+                                             else _hash_file(file_path)).hexdigest(),
+                    'archive': backup_filename,
+                }
+                added_bytes += stat.st_size
+            added_files = len(new_media)
+            media_files = len(manifest_files) - has_stats - has_history
+            seconds = max(time.monotonic() - started, 1e-6)
+
+            # 3. Metadatos y manifiesto
             metadata = {
                 "backup_date": timestamp,
+                "created_at": now.isoformat(),
                 "app_name": "AI Models Pro Generator",
-                "backup_version": "1.0",
+                "backup_version": BACKUP_FORMAT_VERSION,
+                "backup_type": "incremental" if parent else "full",
+                "parent": parent[0].name if parent else None,
+                "chain": (parent[1]['chain'] if parent else []) + [backup_filename],
                 "files_included": {
-                    "generation_stats": stats_file.exists(),
-                    "history_json": HISTORY_FILE.exists(),
-                    "media_files": len([f for f in HISTORY_DIR.iterdir() 
-                                      if f.is_file() and f.suffix.lower() in ['.jpg', '.jpeg', '.png', '.webp', '.mp4', '.mov', '.avi']]) if HISTORY_DIR.exists() else 0
+                    "generation_stats": has_stats,
+                    "history_json": has_history,
+                    "media_files": media_files,
+                    "media_files_added": added_files,
+                    "media_bytes_added": added_bytes
+                },
+                "stats": {
+                    "seconds": round(seconds, 3),
+                    "bytes": added_bytes,
+                    "throughput_mb_s": round(added_bytes / (1024 * 1024) / seconds, 1),
+                    "parallel_hashing": executor is not None
                 }
             }
-            
-            # Añadir metadatos al ZIP
-            zipf.writestr("backup_metadata.json", json.dumps(metadata, indent=2))
-        
+            manifest_bytes = json.dumps({"files": manifest_files}).encode('utf-8')
+            zipf.writestr(BACKUP_METADATA_NAME, json.dumps(metadata, indent=2))
+            zipf.writestr(BACKUP_MANIFEST_NAME, manifest_bytes)
+
+        os.replace(temp_path, backup_path)
+        try:
+            with _backup_catalog_lock:
+                catalog = _load_backup_catalog()
+                catalog['backups'][backup_filename] = _backup_catalog_entry(backup_path, metadata, manifest_bytes)
+                _save_backup_catalog(catalog)
+        except OSError:
+            pass  # El backup ya existe; _sync_backup_catalog() lo catalogará al listar
+
         # Calcular tamaño del backup
         backup_size = backup_path.stat().st_size / (1024 * 1024)  # MB
-        
-        return True, f"Backup creado exitosamente: {backup_filename} ({backup_size:.1f} MB)", str(backup_path)
-        
+        kind = "incremental" if parent else "completo"
+
+        return True, (f"Backup {kind} creado exitosamente: {backup_filename} ({backup_size:.1f} MB, "
+                      f"{added_files} de {media_files} archivos multimedia, "
+                      f"{metadata['stats']['throughput_mb_s']} MB/s)"), str(backup_path)
+
     except Exception as e:
+        if temp_path is not None and temp_path.exists():
+            temp_path.unlink()
         return False, f"Error al crear backup: {str(e)}", None
+    finally:
+        if executor is not None:
+            executor.shutdown(wait=True)
 
 
-def restore_backup(backup_file_path: str) -> Tuple[bool, str]:
+def _resolve_backup_chain(backup_path: Path, metadata: Mapping[str, Any]) -> Tuple[Dict[str, Path], List[str]]:
     """
-    Restaurar backup desde archivo ZIP
-    
+    Localizar los backups anteriores de la cadena de un incremental
+
+    Se buscan junto al backup y en BACKUPS_DIR. El propio backup es el
+    último eslabón aunque se haya renombrado (p. ej. al subirlo).
+
+    Returns:
+        Tuple[Dict[str, Path], List[str]]: (nombre -> ruta, nombres no encontrados)
+    """
+    chain = metadata.get('chain') or [backup_path.name]
+    paths = {chain[-1]: backup_path}
+    missing = []
+    for name in chain[:-1]:
+        for candidate in (backup_path.parent / name, BACKUPS_DIR / name):
+            if candidate.exists():
+                paths[name] = candidate
+                break
+        else:
+            missing.append(name)
+    return paths, missing
+
+
+def _verify_backup_members(backup_path: Path, members: List[Tuple[str, Optional[str]]],
+                           on_member: Callable[[int], None]) -> Tuple[int, List[str]]:
+    """
+    Leer miembros de un backup comprobando su CRC32 y, si se conoce, su SHA-256
+
+    Cada llamada abre su propio manejador del ZIP, así varios hilos pueden
+    verificar a la vez (zlib y hashlib liberan el GIL).
+
+    Returns:
+        Tuple[int, List[str]]: (bytes leídos, errores)
+    """
+    import zipfile
+    total = 0
+    errors = []
+    with zipfile.ZipFile(backup_path, 'r') as zipf:
+        for name, expected_sha256 in members:
+            hasher = hashlib.sha256() if expected_sha256 else None
+            size = 0
+            try:
+                # ZipExtFile comprueba el CRC32 al llegar al final del miembro
+                with zipf.open(name) as member:
+                    for block in iter(lambda: member.read(DOWNLOAD_CHUNK_SIZE), b''):
+                        size += len(block)
+                        if hasher:
+                            hasher.update(block)
+            except (zipfile.BadZipFile, OSError, EOFError) as e:
+                errors.append(f"{name}: {e}")
+            else:
+                if hasher and hasher.hexdigest() != expected_sha256:
+                    errors.append(f"{name}: el SHA-256 no coincide con el manifiesto")
+            total += size
+            on_member(size)
+    return total, errors
+
+
+def verify_backup(backup_file_path: str, workers: int = BACKUP_WORKERS,
+                  progress_callback: Optional[Callable[[float, str], None]] = None) -> Dict[str, Any]:
+    """
+    Verificar la integridad de un backup
+
+    Lee todos los archivos del ZIP comprobando su CRC32 y el SHA-256 del
+    manifiesto, que el manifiesto sea el registrado en el catálogo al
+    crearlo, que no falte ningún archivo del manifiesto y que estén los
+    backups anteriores de su cadena. Los archivos se reparten entre
+    `workers` hilos. El resultado se guarda en el catálogo.
+
     Args:
         backup_file_path: Ruta al archivo de backup
+        workers: Hilos de verificación
+        progress_callback: Función (fracción 0-1, mensaje) llamada por archivo
+
+    Returns:
+        Dict: ok, filename, files, bytes, seconds, throughput_mb_s y errors
+    """
+    import zipfile
+    from concurrent.futures import ThreadPoolExecutor, wait
+
+    backup_path = Path(backup_file_path)
+    started = time.monotonic()
+    result = {'ok': False, 'filename': backup_path.name, 'files': 0, 'bytes': 0,
+              'seconds': 0.0, 'throughput_mb_s': 0.0, 'errors': []}
+    errors = result['errors']
+
+    try:
+        with zipfile.ZipFile(backup_path, 'r') as zipf:
+            infos = [info for info in zipf.infolist() if not info.is_dir()]
+            names = {info.filename for info in infos}
+            metadata = json.loads(zipf.read(BACKUP_METADATA_NAME).decode('utf-8')) \
+                if BACKUP_METADATA_NAME in names else {}
+            manifest_bytes = zipf.read(BACKUP_MANIFEST_NAME) if BACKUP_MANIFEST_NAME in names else None
+    except (OSError, ValueError, zipfile.BadZipFile) as e:
+        errors.append(f"No se pudo leer el ZIP: {e}")
+        return result
+
+    if not metadata:
+        errors.append("Falta backup_metadata.json")
+
+    # Manifiesto: el mismo que se registró al crear el backup y con todos sus archivos
+    manifest_files = {}
+    if manifest_bytes is not None:
+        manifest_files = json.loads(manifest_bytes.decode('utf-8')).get('files', {})
+        with _backup_catalog_lock:
+            entry = _load_backup_catalog()['backups'].get(backup_path.name)
+        if entry and entry.get('manifest_sha256') and \
+                entry['manifest_sha256'] != hashlib.sha256(manifest_bytes).hexdigest():
+            errors.append("El manifiesto no coincide con el registrado en el catálogo")
+    own_name = (metadata.get('chain') or [backup_path.name])[-1]
+    for arcname, file_entry in manifest_files.items():
+        if file_entry.get('archive') == own_name and arcname not in names:
+            errors.append(f"{arcname}: falta en el ZIP")
+
+    _, missing = _resolve_backup_chain(backup_path, metadata)
+    errors.extend(f"Falta el backup {name} de la cadena incremental" for name in missing)
+
+    # Repartir los archivos entre los hilos en grupos de tamaño parecido
+    workers = max(1, min(workers, len(infos)))
+    groups: List[List[Tuple[str, Optional[str]]]] = [[] for _ in range(workers)]
+    group_sizes = [0] * workers
+    for info in sorted(infos, key=lambda i: i.file_size, reverse=True):
+        file_entry = manifest_files.get(info.filename) or {}
+        expected = file_entry.get('sha256') if file_entry.get('archive') == own_name else None
+        smallest = group_sizes.index(min(group_sizes))
+        groups[smallest].append((info.filename, expected))
+        group_sizes[smallest] += info.file_size
+
+    total_bytes = sum(group_sizes) or 1
+    done = {'bytes': 0, 'files': 0}
+    progress_lock = threading.Lock()
+
+    def on_member(size: int) -> None:
+        with progress_lock:
+            done['bytes'] += size
+            done['files'] += 1
+
+    def report_progress() -> None:
+        with progress_lock:
+            fraction, files = min(done['bytes'] / total_bytes, 1.0), done['files']
+        progress_callback(fraction, f"Verificando {files}/{len(infos)} archivos")
+
+    # El progreso se notifica desde el hilo que llama (Streamlit no admite
+    # actualizar la interfaz desde los hilos de trabajo)
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="backup-verify") as executor:
+        pending = {executor.submit(_verify_backup_members, backup_path, group, on_member) for group in groups}
+        while pending:
+            finished, pending = wait(pending, timeout=0.2)
+            for future in finished:
+                size, group_errors = future.result()
+                result['bytes'] += size
+                errors.extend(group_errors)
+            if progress_callback:
+                report_progress()
+
+    seconds = max(time.monotonic() - started, 1e-6)
+    result.update(
+        ok=not errors,
+        files=len(infos),
+        seconds=round(seconds, 3),
+        throughput_mb_s=round(result['bytes'] / (1024 * 1024) / seconds, 1),
+    )
+
+    # Guardar el resultado en el catálogo (solo para los backups de BACKUPS_DIR)
+    try:
+        with _backup_catalog_lock:
+            catalog = _sync_backup_catalog()
+            entry = catalog['backups'].get(backup_path.name)
+            if entry and backup_path.resolve() == (BACKUPS_DIR / backup_path.name).resolve():
+                entry['verification'] = {
+                    'ok': result['ok'],
+                    'checked_at': datetime.now().isoformat(timespec='seconds'),
+                    'errors': len(errors),
+                    'throughput_mb_s': result['throughput_mb_s'],
+                }
+                _save_backup_catalog(catalog)
+    except OSError:
+        pass
+
+    return result
+
+
+def _restore_destination(arcname: str) -> Optional[Path]:
+    """Ubicación final de un archivo del backup (None si no se restaura o la ruta no es segura)"""
+    parts = PurePosixPath(arcname).parts
+    if not parts or arcname.startswith('/') or '..' in parts or '\\' in arcname:
+        return None
+    if arcname == "generation_stats.json":
+        return GENERATION_STATS_FILE
+    if parts[0] != "historial" or len(parts) < 2:
+        return None
+    if parts[1:] == (HISTORY_FILE.name,):
+        return HISTORY_FILE
+    if parts[1] == MEDIA_DIR_NAME:
+        return HISTORY_DIR.joinpath(*parts[1:])
+    if len(parts) == 2 and PurePosixPath(parts[1]).suffix.lower() in BACKUP_MEDIA_EXTENSIONS:
+        return HISTORY_DIR / parts[1]
+    return None
+
+
+def _restored_file_matches(dest: Path, info, expected: Optional[Mapping[str, Any]] = None) -> bool:
+    """
+    Comprobar si el destino ya tiene el contenido de un archivo del backup
+
+    Los archivos del almacén de medios llevan su hash en el nombre; el resto
+    se compara con el SHA-256 del manifiesto o, en backups sin manifiesto,
+    con el CRC32 del ZIP.
+    """
+    import zlib
+    try:
+        if dest.stat().st_size != info.file_size:
+            return False
+    except OSError:
+        return False
+    if _store_file_hash(dest):
+        return True
+    if expected and expected.get('sha256'):
+        return _hash_file(dest).hexdigest() == expected['sha256']
+
+    crc = 0
+    with open(dest, 'rb') as f:
+        for block in iter(lambda: f.read(DOWNLOAD_CHUNK_SIZE), b''):
+            crc = zlib.crc32(block, crc)
+    return crc == info.CRC
+
+
+def _stream_backup_member(zipf, info, dest: Path, mtime_ns: Optional[int] = None) -> None:
+    """Escribir un archivo del ZIP en su destino (temporal en el mismo directorio + rename atómico)"""
+    dest.parent.mkdir(parents=True, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=dest.parent, prefix=".restore_", suffix=".tmp")
+    try:
+        with os.fdopen(fd, 'wb') as dst, zipf.open(info) as src:
+            shutil.copyfileobj(src, dst, DOWNLOAD_CHUNK_SIZE)
+            dst.flush()
+            os.fsync(dst.fileno())
+        if mtime_ns:
+            # Conservar la fecha del manifiesto para que el siguiente incremental no lo vuelva a copiar
+            os.utime(temp_path, ns=(mtime_ns, mtime_ns))
+        os.replace(temp_path, dest)
+    except Exception:
+        if os.path.exists(temp_path):
+            os.unlink(temp_path)
+        raise
+
+
+def _link_or_copy(source: Path, dest: Path) -> None:
+    """Enlazar con hardlink (copiar si no se puede, p. ej. en otro sistema de archivos)"""
+    dest.parent.mkdir(parents=True, exist_ok=True)
+    try:
+        os.link(source, dest)
+    except OSError:
+        shutil.copy2(source, dest)
+
+
+def create_safety_snapshot(keep: Optional[Path] = None) -> Optional[Path]:
+    """
+    Copia de seguridad rápida de los datos actuales antes de restaurar
+
+    En lugar de volver a comprimir todo, crea BACKUPS_DIR/safety_snapshot_<fecha>/
+    con la misma estructura que un backup: copia las estadísticas y el log
+    (pequeños, y el log crece en el sitio) y enlaza con hardlinks los medios
+    sueltos de historial/ y los archivos del almacén que referencia el log.
+    La restauración reemplaza con rename sin tocar el contenido enlazado, y
+    gc_media_store, que tras restaurar un backup antiguo borraría los
+    medios que solo usa el log actual, solo quita el enlace del almacén.
+    Si no se pueden crear enlaces (otro sistema de archivos) los medios se
+    copian. Se conservan los últimos SAFETY_SNAPSHOTS_KEEP (y keep, el
+    snapshot que se está restaurando). restore_backup acepta el directorio.
+
+    Returns:
+        Optional[Path]: Directorio del snapshot (None si falló)
+    """
+    snapshot_dir = BACKUPS_DIR / f"{SAFETY_SNAPSHOT_PREFIX}{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}"
+    try:
+        historial_dir = snapshot_dir / "historial"
+        historial_dir.mkdir(parents=True)
+        if GENERATION_STATS_FILE.exists():
+            shutil.copy2(GENERATION_STATS_FILE, snapshot_dir / "generation_stats.json")
+        if HISTORY_FILE.exists():
+            shutil.copy2(HISTORY_FILE, historial_dir / HISTORY_FILE.name)
+
+        if HISTORY_DIR.exists():
+            for file_path in HISTORY_DIR.iterdir():
+                if file_path.is_file() and file_path.suffix.lower() in BACKUP_MEDIA_EXTENSIONS:
+                    _link_or_copy(file_path, historial_dir / file_path.name)
+
+        if _media_dir().exists():
+            for media_hash in get_media_refcounts():
+                for file_path in media_path(media_hash).parent.glob(f"{media_hash}*"):
+                    _link_or_copy(file_path, historial_dir / file_path.relative_to(HISTORY_DIR))
+
+        snapshots = sorted(BACKUPS_DIR.glob(f"{SAFETY_SNAPSHOT_PREFIX}*"))
+        for old_snapshot in snapshots[:-SAFETY_SNAPSHOTS_KEEP]:
+            if keep is None or old_snapshot.resolve() != keep.resolve():
+                shutil.rmtree(old_snapshot, ignore_errors=True)
+        return snapshot_dir
+    except Exception:
+        shutil.rmtree(snapshot_dir, ignore_errors=True)
+        return None
+
+
+def list_safety_snapshots() -> List[Dict[str, Any]]:
+    """
+    Copias rápidas creadas antes de cada restauración (más reciente primero)
+
+    Returns:
+        List[Dict]: name, full_path, created, files y size_mb
+    """
+    snapshots = []
+    for snapshot_dir in sorted(BACKUPS_DIR.glob(f"{SAFETY_SNAPSHOT_PREFIX}*"), reverse=True):
+        if not (snapshot_dir / "historial").is_dir():
+            continue
+        files = [file_path for file_path in snapshot_dir.rglob('*') if file_path.is_file()]
+        snapshots.append({
+            "name": snapshot_dir.name,
+            "full_path": str(snapshot_dir),
+            "created": datetime.fromtimestamp(snapshot_dir.stat().st_mtime).strftime("%Y-%m-%d %H:%M:%S"),
+            "files": len(files),
+            "size_mb": round(sum(file_path.stat().st_size for file_path in files) / (1024 * 1024), 2),
+        })
+    return snapshots
+
+
+def _copy_into_place(source: Path, dest: Path) -> None:
+    """Copiar un archivo a su destino (temporal en el mismo directorio + rename atómico)"""
+    dest.parent.mkdir(parents=True, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=dest.parent, prefix=".restore_", suffix=".tmp")
+    try:
+        with os.fdopen(fd, 'wb') as dst, open(source, 'rb') as src:
+            shutil.copyfileobj(src, dst, DOWNLOAD_CHUNK_SIZE)
+            dst.flush()
+            os.fsync(dst.fileno())
+        shutil.copystat(source, temp_path)
+        os.replace(temp_path, dest)
+    except Exception:
+        if os.path.exists(temp_path):
+            os.unlink(temp_path)
+        raise
+
+
+def _restore_safety_snapshot(snapshot_dir: Path, safety_snapshot: bool,
+                             progress_callback: Optional[Callable[[float, str], None]]) -> Tuple[bool, str]:
+    """Restaurar un directorio de create_safety_snapshot (ver restore_backup)"""
+    if not snapshot_dir.name.startswith(SAFETY_SNAPSHOT_PREFIX) or not (snapshot_dir / "historial").is_dir():
+        return False, "El directorio no es una copia de seguridad previa (safety_snapshot_*)"
+
+    tasks = []
+    for file_path in snapshot_dir.rglob('*'):
+        if file_path.is_file():
+            dest = _restore_destination(file_path.relative_to(snapshot_dir).as_posix())
+            if dest is not None:
+                tasks.append((file_path, dest))
+    # Medios primero; estadísticas y log al final
+    tasks.sort(key=lambda task: task[1] in (HISTORY_FILE, GENERATION_STATS_FILE))
+
+    # El log no puede cambiar entre la copia previa y su reemplazo: un
+    # guardado en medio no estaría en ninguno de los dos
+    with _history_write_lock():
+        snapshot = None
+        if safety_snapshot:
+            snapshot = create_safety_snapshot(keep=snapshot_dir)
+            if snapshot is None:
+                return False, "No se pudo crear la copia de seguridad previa; no se restauró nada"
+
+        written = skipped = 0
+        for done, (source, dest) in enumerate(tasks):
+            if progress_callback:
+                progress_callback(done / len(tasks), f"Restaurando {dest.name}")
+            try:
+                unchanged = dest.stat().st_size == source.stat().st_size and (
+                    _store_file_hash(dest) is not None or _hash_file(dest).digest() == _hash_file(source).digest())
+            except OSError:
+                unchanged = False
+            if unchanged:
+                skipped += 1
+            else:
+                _copy_into_place(source, dest)
+                written += 1
+
+        invalidate_history_cache()
+    if progress_callback:
+        progress_callback(1.0, "Restauración completada")
+    message = (f"Copia previa {snapshot_dir.name} restaurada. "
+               f"Archivos: {written} restaurados, {skipped} sin cambios")
+    if snapshot:
+        message += f". Copia previa en {snapshot.name}"
+    return True, message
+
+
+def restore_backup(backup_file_path: str, safety_snapshot: bool = True,
+                   progress_callback: Optional[Callable[[float, str], None]] = None) -> Tuple[bool, str]:
+    """
+    Restaurar backup desde archivo ZIP (completo o incremental) o desde una
+    copia previa (directorio safety_snapshot_* de create_safety_snapshot)
+
+    Cada archivo se escribe directamente en su ubicación final (temporal en
+    el mismo directorio + rename atómico), sin extraer el ZIP completo. Los
+    archivos que ya existen con el mismo contenido no se reescriben. Los
+    medios se restauran antes que el log, así el historial nunca apunta a
+    archivos que todavía no existen.
+    
+    Args:
+        backup_file_path: Ruta al archivo de backup o al directorio de la copia previa
+        safety_snapshot: Crear antes una copia rápida de los datos actuales
+            (ver create_safety_snapshot)
+        progress_callback: Función (fracción 0-1, mensaje) llamada por archivo
         
     Returns:
         Tuple[bool, str]: (éxito, mensaje)
     """
     import zipfile
-    import shutil
+    from contextlib import ExitStack
     
     try:
         backup_path = Path(backup_file_path)
@@ -1197,72 +3780,95 @@ def restore_backup(backup_file_path: str) -> Tuple[bool, str]:
         if not backup_path.exists():
             return False, "El archivo de backup no existe"
         
+        if backup_path.is_dir():
+            return _restore_safety_snapshot(backup_path, safety_snapshot, progress_callback)
+        
         if not backup_path.suffix.lower() == '.zip':
             return False, "El archivo debe ser un ZIP válido"
         
-        # Crear backup de seguridad de los datos actuales
-        current_backup_result = create_backup()
-        if current_backup_result[0]:
-            safety_backup = current_backup_result[2]
-        
-        # Extraer y validar el backup
+        # Verificar que es un backup válido y leer metadatos y manifiesto
         with zipfile.ZipFile(backup_path, 'r') as zipf:
-            
-            # Verificar que es un backup válido
             file_list = zipf.namelist()
-            if "backup_metadata.json" not in file_list:
+            if BACKUP_METADATA_NAME not in file_list:
                 return False, "Archivo de backup inválido (falta metadata)"
+            metadata = json.loads(zipf.read(BACKUP_METADATA_NAME).decode('utf-8'))
+            manifest_files = {}
+            if BACKUP_MANIFEST_NAME in file_list:
+                manifest_files = json.loads(zipf.read(BACKUP_MANIFEST_NAME).decode('utf-8')).get('files', {})
+        
+        # Un incremental necesita los backups anteriores de su cadena
+        chain_paths, missing = _resolve_backup_chain(backup_path, metadata)
+        if missing:
+            return False, f"Faltan backups de la cadena incremental: {', '.join(missing)}"
+        
+        # Archivos a leer de cada backup: todo el propio y los medios sin cambios de los anteriores
+        plan: Dict[Path, List[str]] = {backup_path: [
+            name for name in file_list
+            if name not in (BACKUP_METADATA_NAME, BACKUP_MANIFEST_NAME) and not name.endswith('/')
+        ]}
+        for arcname, entry in manifest_files.items():
+            archive = chain_paths.get(entry.get('archive'))
+            if archive is not None and archive != backup_path:
+                plan.setdefault(archive, []).append(arcname)
+        
+        # El log no puede cambiar entre la copia previa y su reemplazo: un
+        # guardado en medio no estaría en ninguno de los dos
+        with _history_write_lock():
+            snapshot = None
+            if safety_snapshot:
+                snapshot = create_safety_snapshot()
+                if snapshot is None:
+                    return False, "No se pudo crear la copia de seguridad previa; no se restauró nada"
+        
+            written = skipped = 0
+            with ExitStack() as stack:
+                tasks = []
+                legacy_history = None
+                for archive, names in plan.items():
+                    zipf = stack.enter_context(zipfile.ZipFile(archive, 'r'))
+                    for name in names:
+                        info = zipf.getinfo(name)
+                        if name == f"historial/{LEGACY_HISTORY_FILE.name}":
+                            legacy_history = (zipf, info)
+                            continue
+                        dest = _restore_destination(name)
+                        if dest is not None:
+                            tasks.append((zipf, info, dest, manifest_files.get(name)))
             
-            # Leer metadatos
-            metadata_content = zipf.read("backup_metadata.json").decode('utf-8')
-            metadata = json.loads(metadata_content)
+                # Estadísticas y log al final
+                tasks.sort(key=lambda task: task[2] in (HISTORY_FILE, GENERATION_STATS_FILE))
+                total_bytes = sum(task[1].file_size for task in tasks) or 1
+                done_bytes = 0
+                for zipf, info, dest, entry in tasks:
+                    if progress_callback:
+                        progress_callback(done_bytes / total_bytes, f"Restaurando {dest.name}")
+                    if _restored_file_matches(dest, info, entry):
+                        skipped += 1
+                    else:
+                        _stream_backup_member(zipf, info, dest, (entry or {}).get('mtime_ns'))
+                        written += 1
+                    done_bytes += info.file_size
             
-            # Crear directorio temporal para extraer
-            temp_dir = Path("temp_restore")
-            temp_dir.mkdir(exist_ok=True)
-            
-            try:
-                # Extraer todos los archivos
-                zipf.extractall(temp_dir)
-                
-                # Restaurar generation_stats.json
-                temp_stats = temp_dir / "generation_stats.json"
-                if temp_stats.exists():
-                    shutil.copy2(temp_stats, "generation_stats.json")
-                
-                # Restaurar history.json
-                temp_history = temp_dir / "historial" / "history.json"
-                if temp_history.exists():
-                    HISTORY_DIR.mkdir(exist_ok=True)
-                    shutil.copy2(temp_history, HISTORY_FILE)
-                
-                # Restaurar archivos multimedia
-                temp_historial_dir = temp_dir / "historial"
-                if temp_historial_dir.exists():
-                    HISTORY_DIR.mkdir(exist_ok=True)
-                    for file_path in temp_historial_dir.iterdir():
-                        if file_path.is_file() and file_path.name != "history.json":
-                            dest_path = HISTORY_DIR / file_path.name
-                            shutil.copy2(file_path, dest_path)
-                
-                # Limpiar directorio temporal
-                shutil.rmtree(temp_dir)
-                
-                backup_date = metadata.get("backup_date", "desconocida")
-                files_count = sum([
-                    1 if metadata.get("files_included", {}).get("generation_stats", False) else 0,
-                    1 if metadata.get("files_included", {}).get("history_json", False) else 0,
-                    metadata.get("files_included", {}).get("media_files", 0)
-                ])
-                
-                return True, f"Backup restaurado exitosamente. Fecha: {backup_date}, Archivos: {files_count}"
-                
-            except Exception as e:
-                # Limpiar directorio temporal si hay error
-                if temp_dir.exists():
-                    shutil.rmtree(temp_dir)
-                raise e
-                
+                # Backups antiguos con history.json (array): se migra al log
+                if legacy_history and not any(task[2] == HISTORY_FILE for task in tasks):
+                    with tempfile.TemporaryDirectory() as temp_dir:
+                        temp_legacy = Path(temp_dir) / LEGACY_HISTORY_FILE.name
+                        _stream_backup_member(legacy_history[0], legacy_history[1], temp_legacy)
+                        HISTORY_DIR.mkdir(exist_ok=True)
+                        migrate_legacy_history(temp_legacy, overwrite=True)
+                    written += 1
+        
+            invalidate_history_cache()
+        if progress_callback:
+            progress_callback(1.0, "Restauración completada")
+        
+        backup_date = metadata.get("backup_date", "desconocida")
+        message = (f"Backup restaurado exitosamente. Fecha: {backup_date}, "
+                   f"Archivos: {written} restaurados, {skipped} sin cambios")
+        if snapshot:
+            message += f". Copia previa en {snapshot.name}"
+        return True, message
+        
     except Exception as e:
         return False, f"Error al restaurar backup: {str(e)}"
 
@@ -1270,46 +3876,31 @@ def restore_backup(backup_file_path: str) -> Tuple[bool, str]:
 def list_available_backups() -> List[Dict[str, Any]]:
     """
     Listar todos los backups disponibles en la carpeta backups/
+
+    Se leen del catálogo (BACKUP_CATALOG_NAME), que se actualiza al crear y
+    eliminar backups; solo se abren los ZIP que no estén catalogados.
     
     Returns:
-        List[Dict]: Lista de backups con información
+        List[Dict]: Lista de backups con información (filename, full_path,
+        size_mb, created, metadata, manifest_sha256, verification)
     """
-    backups = []
-    
-    # Buscar archivos de backup en la carpeta backups/
-    for file_path in BACKUPS_DIR.glob("ai_models_backup_*.zip"):
-        try:
-            # Obtener información del archivo
-            stat = file_path.stat()
-            size_mb = stat.st_size / (1024 * 1024)
-            modified_time = datetime.fromtimestamp(stat.st_mtime)
-            
-            # Intentar leer metadatos si es posible
-            metadata = None
-            try:
-                import zipfile
-                with zipfile.ZipFile(file_path, 'r') as zipf:
-                    if "backup_metadata.json" in zipf.namelist():
-                        metadata_content = zipf.read("backup_metadata.json").decode('utf-8')
-                        metadata = json.loads(metadata_content)
-            except:
-                pass
-            
-            backup_info = {
-                "filename": file_path.name,
-                "full_path": str(file_path),
-                "size_mb": round(size_mb, 2),
-                "created": modified_time.strftime("%Y-%m-%d %H:%M:%S"),
-                "metadata": metadata
-            }
-            
-            backups.append(backup_info)
-            
-        except Exception:
-            continue
+    try:
+        entries = _sync_backup_catalog()['backups'].values()
+    except Exception:
+        return []
+
+    backups = [{
+        "filename": entry['filename'],
+        "full_path": str(BACKUPS_DIR / entry['filename']),
+        "size_mb": round(entry['size_bytes'] / (1024 * 1024), 2),
+        "created": entry['created'],
+        "metadata": entry.get('metadata'),
+        "manifest_sha256": entry.get('manifest_sha256'),
+        "verification": entry.get('verification'),
+    } for entry in entries]
     
     # Ordenar por fecha de creación (más reciente primero)
-    backups.sort(key=lambda x: x["created"], reverse=True)
+    backups.sort(key=lambda x: (x["created"], x["filename"]), reverse=True)
     
     return backups
 
@@ -1334,10 +3925,23 @@ def delete_backup(backup_filename: str) -> Tuple[bool, str]:
         if not backup_path.exists():
             return False, "El archivo de backup no existe"
         
-        if not backup_path.name.startswith("ai_models_backup_"):
+        if not backup_path.name.startswith(BACKUP_PREFIX):
             return False, "Solo se pueden eliminar archivos de backup válidos"
         
-        backup_path.unlink()
+        # No romper la cadena de los incrementales que dependen de este backup
+        with _backup_catalog_lock:
+            catalog = _sync_backup_catalog()
+            for other in catalog['backups'].values():
+                chain = (other.get('metadata') or {}).get('chain') or []
+                if other['filename'] != backup_path.name and backup_path.name in chain[:-1]:
+                    return False, f"El backup incremental {other['filename']} depende de este backup"
+            
+            backup_path.unlink()
+            if catalog['backups'].pop(backup_path.name, None) is not None:
+                try:
+                    _save_backup_catalog(catalog)
+                except OSError:
+                    pass  # _sync_backup_catalog() quitará la entrada al listar
         return True, f"Backup {backup_path.name} eliminado exitosamente"
         
     except Exception as e: